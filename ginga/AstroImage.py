@@ -4,8 +4,9 @@
 # This is open-source software licensed under a BSD license.
 # Please see the file LICENSE.txt for details.
 #
-import sys
+import sys, os
 import math
+import tempfile
 import traceback
 
 import numpy
@@ -75,6 +76,9 @@ class AstroImage(BaseImage):
         self.revnaxis = []
         self._md_data = None
 
+        # files our memory-mapped data live in, that we must delete
+        self._data_files = []
+
     def setup_data(self, data, naxispath=None):
         # initialize data attribute to something reasonable
         if data is None:
@@ -162,15 +166,19 @@ class AstroImage(BaseImage):
     def get_mddata(self):
         return self._md_data
 
-    def set_naxispath(self, naxispath):
+    def set_naxispath(self, naxispath, update_minmax=True):
         """Choose a slice out of multidimensional data.
+
+        If `update_minmax` is False, the data range of the image is not
+        recalculated for the new slice (e.g. during playback with fixed
+        cut levels).
         """
         revnaxis = list(naxispath)
         revnaxis.reverse()
 
         # construct slice view and extract it
         view = revnaxis + [slice(None), slice(None)]
-        data = self.get_mddata()[view]
+        data = self.get_mddata()[tuple(view)]
 
         if len(data.shape) != 2:
             raise ImageError(
@@ -179,6 +187,11 @@ class AstroImage(BaseImage):
         self.naxispath = naxispath
         self.revnaxis = revnaxis
 
+        if not update_minmax:
+            self._data = data
+            self.make_callback('modified')
+            return
+
         self.set_data(data)
 
     def set_wcs(self, wcs):
@@ -426,13 +439,18 @@ class AstroImage(BaseImage):
         ## if update_wcs:
         ##     self.wcs.rotate(deg)
 
-    def mosaic_inline(self, imagelist, bg_ref=None, trim_px=None,
-                      merge=False, allow_expand=True, expand_pad_deg=0.01,
-                      max_expand_pct=None,
-                      update_minmax=True, suppress_callback=False):
-        """Drops new images into the current image (if there is room),
-        relocating them according the WCS between the two images.
+    def get_mosaic_plan(self, image, trim_px=None):
+        """Work out how the data of `image` needs to be scaled, rotated
+        and flipped to match the scale and orientation of this (mosaic)
+        image, and where its center falls in our pixel coordinates.
+
+        Returns a Bunch that can be passed to `trcalc.warp` (as keyword
+        arguments `scale_x`, `scale_y`, `rot_deg`, `flip_x` and `flip_y`)
+        and that holds the placement center (`x0`, `y0`) and the
+        predicted `shape` of the warped piece.
         """
+        name = image.get('name', 'noname')
+
         # Get our own (mosaic) rotation and scale
         header = self.get_header()
         ((xrot_ref, yrot_ref),
@@ -440,6 +458,182 @@ class AstroImage(BaseImage):
 
         scale_x, scale_y = math.fabs(cdelt1_ref), math.fabs(cdelt2_ref)
 
+        # Calculate sky position at the center of the piece
+        data_np = image._get_data()
+        ctr_x, ctr_y = trcalc.get_center(data_np)
+        ra, dec = image.pixtoradec(ctr_x, ctr_y)
+
+        ht, wd = data_np.shape[:2]
+        if trim_px:
+            wd, ht = wd - 2 * trim_px, ht - 2 * trim_px
+
+        # Get rotation and scale of piece
+        header = image.get_header()
+        ((xrot, yrot),
+         (cdelt1, cdelt2)) = wcs.get_xy_rotation_and_scale(header)
+        self.logger.debug("image(%s) xrot=%f yrot=%f cdelt1=%f "
+                          "cdelt2=%f" % (name, xrot, yrot, cdelt1, cdelt2))
+
+        # scale if necessary
+        nscale_x = nscale_y = 1.0
+        if (not numpy.isclose(math.fabs(cdelt1), scale_x) or
+                not numpy.isclose(math.fabs(cdelt2), scale_y)):
+            nscale_x = math.fabs(cdelt1) / scale_x
+            nscale_y = math.fabs(cdelt2) / scale_y
+            self.logger.debug("scaling piece by x(%f), y(%f)" % (
+                nscale_x, nscale_y))
+
+        # Rotate piece into our orientation, according to wcs
+        rot_dx, rot_dy = xrot - xrot_ref, yrot - yrot_ref
+
+        flip_x = False
+        flip_y = False
+
+        # Optomization for 180 rotations
+        if (numpy.isclose(math.fabs(rot_dx), 180.0) or
+                numpy.isclose(math.fabs(rot_dy), 180.0)):
+            flip_x = flip_y = True
+            rot_dx = 0.0
+            rot_dy = 0.0
+
+        rot_deg = 0.0
+        if not numpy.isclose(rot_dy, 0.0):
+            rot_deg = rot_dy
+            self.logger.debug("rotating %s by %f deg" % (name, rot_deg))
+
+        # Flip X due to negative CDELT1
+        if numpy.sign(cdelt1) != numpy.sign(cdelt1_ref):
+            flip_x = not flip_x
+
+        # Flip Y due to negative CDELT2
+        if numpy.sign(cdelt2) != numpy.sign(cdelt2_ref):
+            flip_y = not flip_y
+
+        shape = trcalc.get_warp_shape((ht, wd), scale_x=nscale_x,
+                                      scale_y=nscale_y, rot_deg=rot_deg)
+
+        # Find location of image piece (center) in our array
+        x0, y0 = self.radectopix(ra, dec)
+        # Unfortunately we lose a little precision rounding to the
+        # nearest pixel--can't be helped with this approach
+        x0, y0 = int(round(x0)), int(round(y0))
+
+        return Bunch.Bunch(name=name, ra=ra, dec=dec, x0=x0, y0=y0,
+                           trim_px=trim_px, shape=shape,
+                           scale_x=nscale_x, scale_y=nscale_y,
+                           rot_deg=rot_deg, flip_x=flip_x, flip_y=flip_y)
+
+    def mosaic_expand(self, xlo, ylo, xhi, yhi, expand_pad_deg=0.01,
+                      max_expand_pct=None):
+        """Enlarge our data array so that it covers the region bounded by
+        (xlo, ylo) and (xhi, yhi), given in our current pixel coordinates.
+        The WCS is adjusted for any relocation of the reference pixel.
+
+        Returns the offsets (nx1_off, ny1_off) by which existing pixel
+        positions have moved.  If our data is a memory-mapped array, the
+        enlarged array is also memory-mapped (to a new file).
+        """
+        mydata = self._get_data()
+        mywd, myht = self.get_size()
+
+        # determine amount to pad expansion by
+        header = self.get_header()
+        ((xrot_ref, yrot_ref),
+         (cdelt1_ref, cdelt2_ref)) = wcs.get_xy_rotation_and_scale(header)
+        scale_x, scale_y = math.fabs(cdelt1_ref), math.fabs(cdelt2_ref)
+        expand_x = max(int(expand_pad_deg / scale_x), 0)
+        expand_y = max(int(expand_pad_deg / scale_y), 0)
+
+        nx1_off, nx2_off = 0, 0
+        if xlo < 0:
+            nx1_off = abs(xlo) + expand_x
+        if xhi > mywd:
+            nx2_off = (xhi - mywd) + expand_x
+
+        ny1_off, ny2_off = 0, 0
+        if ylo < 0:
+            ny1_off = abs(ylo) + expand_y
+        if yhi > myht:
+            ny2_off = (yhi - myht) + expand_y
+
+        new_wd = mywd + nx1_off + nx2_off
+        new_ht = myht + ny1_off + ny2_off
+
+        # sanity check on new mosaic size
+        old_area = mywd * myht
+        new_area = new_wd * new_ht
+        expand_pct = new_area / old_area
+        if ((max_expand_pct is not None) and
+                (expand_pct > max_expand_pct)):
+            raise Exception("New area exceeds current one by %.2f %%;"
+                            "increase max_expand_pct (%.2f) to allow" %
+                            (expand_pct*100, max_expand_pct))
+
+        # go for it!
+        mmap_path = None
+        if isinstance(mydata, numpy.memmap) and mydata.filename is not None:
+            # a new file in the same directory as the old one
+            fd, mmap_path = tempfile.mkstemp(
+                prefix='mosaic', suffix='.dat',
+                dir=os.path.dirname(mydata.filename))
+            os.close(fd)
+            new_data = numpy.memmap(mmap_path, dtype=mydata.dtype,
+                                    mode='w+', shape=(new_ht, new_wd))
+        else:
+            new_data = numpy.zeros((new_ht, new_wd))
+        # place current data into new data
+        new_data[ny1_off:ny1_off+myht, nx1_off:nx1_off+mywd] = \
+            mydata
+        self._data = new_data
+        if mmap_path is not None:
+            # the old file, if it was ours, is no longer needed
+            self.own_data_file(mmap_path)
+
+        if (nx1_off > 0) or (ny1_off > 0):
+            # Adjust our WCS for relocation of the reference pixel
+            crpix1, crpix2 = self.get_keywords_list('CRPIX1', 'CRPIX2')
+            kwds = dict(CRPIX1=crpix1 + nx1_off,
+                        CRPIX2=crpix2 + ny1_off)
+            self.update_keywords(kwds)
+
+        return (nx1_off, ny1_off)
+
+    def own_data_file(self, path):
+        """Take charge of the file `path` that our data is memory-mapped
+        from: it is deleted when the data moves to another file (see
+        `mosaic_expand`) or by `release_data_files`.  Any other file we
+        were in charge of is deleted now.
+        """
+        self.release_data_files(keep=path)
+        self._data_files = [path]
+
+    def release_data_files(self, keep=None):
+        """Delete the files we are in charge of (see `own_data_file`),
+        except `keep`.  Memory-mapped data stay readable after their file
+        is deleted (on systems that allow deleting open files), but can
+        no longer be shared with other processes through it.
+        """
+        for path in self._data_files:
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.logger.warning("Couldn't remove '%s': %s" % (
+                    path, str(e)))
+        self._data_files = [path for path in self._data_files
+                            if path == keep]
+
+    def mosaic_inline(self, imagelist, bg_ref=None, trim_px=None,
+                      merge=False, allow_expand=True, expand_pad_deg=0.01,
+                      max_expand_pct=None,
+                      update_minmax=True, suppress_callback=False):
+        """Drops new images into the current image (if there is room),
+        relocating them according the WCS between the two images.
+
+        See `ginga.util.mosaic.MosaicPipeline` for a version of this that
+        processes the pieces in parallel.
+        """
         # drop each image in the right place in the new data array
         mydata = self._get_data()
 
@@ -449,11 +643,9 @@ class AstroImage(BaseImage):
             name = image.get('name', 'image%d' % (count))
             count += 1
 
-            data_np = image._get_data()
+            plan = self.get_mosaic_plan(image, trim_px=trim_px)
 
-            # Calculate sky position at the center of the piece
-            ctr_x, ctr_y = trcalc.get_center(data_np)
-            ra, dec = image.pixtoradec(ctr_x, ctr_y)
+            data_np = image._get_data()
 
             # User specified a trim?  If so, trim edge pixels from each
             # side of the array
@@ -478,72 +670,19 @@ class AstroImage(BaseImage):
                 self.maxval = max(self.maxval, maxval)
                 self.minval = min(self.minval, minval)
 
-            # Get rotation and scale of piece
-            header = image.get_header()
-            ((xrot, yrot),
-             (cdelt1, cdelt2)) = wcs.get_xy_rotation_and_scale(header)
-            self.logger.debug("image(%s) xrot=%f yrot=%f cdelt1=%f "
-                              "cdelt2=%f" % (name, xrot, yrot, cdelt1, cdelt2))
-
-            # scale if necessary
-            # TODO: combine with rotation?
-            if (not numpy.isclose(math.fabs(cdelt1), scale_x) or
-                    not numpy.isclose(math.fabs(cdelt2), scale_y)):
-                nscale_x = math.fabs(cdelt1) / scale_x
-                nscale_y = math.fabs(cdelt2) / scale_y
-                self.logger.debug("scaling piece by x(%f), y(%f)" % (
-                    nscale_x, nscale_y))
-                data_np, (ascale_x, ascale_y) = trcalc.get_scaled_cutout_basic(
-                    data_np, 0, 0, wd-1, ht-1, nscale_x, nscale_y,
-                    logger=self.logger)
-
-            # Rotate piece into our orientation, according to wcs
-            rot_dx, rot_dy = xrot - xrot_ref, yrot - yrot_ref
-
-            flip_x = False
-            flip_y = False
-
-            # Optomization for 180 rotations
-            if (numpy.isclose(math.fabs(rot_dx), 180.0) or
-                    numpy.isclose(math.fabs(rot_dy), 180.0)):
-                rotdata = trcalc.transform(data_np,
-                                           flip_x=True, flip_y=True)
-                rot_dx = 0.0
-                rot_dy = 0.0
-            else:
-                rotdata = data_np
-
-            # Finish with any necessary rotation of piece
-            if not numpy.isclose(rot_dy, 0.0):
-                rot_deg = rot_dy
-                self.logger.debug("rotating %s by %f deg" % (name, rot_deg))
-                rotdata = trcalc.rotate(rotdata, rot_deg,
-                                        #rotctr_x=ctr_x, rotctr_y=ctr_y
-                                        logger=self.logger)
-
-            # Flip X due to negative CDELT1
-            if numpy.sign(cdelt1) != numpy.sign(cdelt1_ref):
-                flip_x = True
-
-            # Flip Y due to negative CDELT2
-            if numpy.sign(cdelt2) != numpy.sign(cdelt2_ref):
-                flip_y = True
-
-            if flip_x or flip_y:
-                rotdata = trcalc.transform(rotdata,
-                                           flip_x=flip_x, flip_y=flip_y)
+            # scale, rotate and flip piece into our orientation
+            rotdata = trcalc.warp(data_np, scale_x=plan.scale_x,
+                                  scale_y=plan.scale_y,
+                                  rot_deg=plan.rot_deg,
+                                  flip_x=plan.flip_x, flip_y=plan.flip_y,
+                                  logger=self.logger)
 
             # Get size and data of new image
             ht, wd = rotdata.shape[:2]
             ctr_x, ctr_y = trcalc.get_center(rotdata)
 
-            # Find location of image piece (center) in our array
-            x0, y0 = self.radectopix(ra, dec)
-
             # Merge piece as closely as possible into our array
-            # Unfortunately we lose a little precision rounding to the
-            # nearest pixel--can't be helped with this approach
-            x0, y0 = int(round(x0)), int(round(y0))
+            x0, y0 = plan.x0, plan.y0
             self.logger.debug("Fitting image '%s' into mosaic at %d,%d" % (
                 name, x0, y0))
 
@@ -567,52 +706,12 @@ class AstroImage(BaseImage):
                                     "allow_expand=False")
 
                 # <-- Resize our data array to allow the new image
-
-                # determine amount to pad expansion by
-                expand_x = max(int(expand_pad_deg / scale_x), 0)
-                expand_y = max(int(expand_pad_deg / scale_y), 0)
-
-                nx1_off, nx2_off = 0, 0
-                if xlo < 0:
-                    nx1_off = abs(xlo) + expand_x
-                if xhi > mywd:
-                    nx2_off = (xhi - mywd) + expand_x
+                nx1_off, ny1_off = self.mosaic_expand(
+                    xlo, ylo, xhi, yhi, expand_pad_deg=expand_pad_deg,
+                    max_expand_pct=max_expand_pct)
                 xlo, xhi = xlo + nx1_off, xhi + nx1_off
-
-                ny1_off, ny2_off = 0, 0
-                if ylo < 0:
-                    ny1_off = abs(ylo) + expand_y
-                if yhi > myht:
-                    ny2_off = (yhi - myht) + expand_y
                 ylo, yhi = ylo + ny1_off, yhi + ny1_off
-
-                new_wd = mywd + nx1_off + nx2_off
-                new_ht = myht + ny1_off + ny2_off
-
-                # sanity check on new mosaic size
-                old_area = mywd * myht
-                new_area = new_wd * new_ht
-                expand_pct = new_area / old_area
-                if ((max_expand_pct is not None) and
-                        (expand_pct > max_expand_pct)):
-                    raise Exception("New area exceeds current one by %.2f %%;"
-                                    "increase max_expand_pct (%.2f) to allow" %
-                                    (expand_pct*100, max_expand_pct))
-
-                # go for it!
-                new_data = numpy.zeros((new_ht, new_wd))
-                # place current data into new data
-                new_data[ny1_off:ny1_off+myht, nx1_off:nx1_off+mywd] = \
-                    mydata
-                self._data = new_data
-                mydata = new_data
-
-                if (nx1_off > 0) or (ny1_off > 0):
-                    # Adjust our WCS for relocation of the reference pixel
-                    crpix1, crpix2 = self.get_keywords_list('CRPIX1', 'CRPIX2')
-                    kwds = dict(CRPIX1=crpix1 + nx1_off,
-                                CRPIX2=crpix2 + ny1_off)
-                    self.update_keywords(kwds)
+                mydata = self._get_data()
 
             # fit image piece into our array
             try:
@@ -677,34 +776,10 @@ class AstroImage(BaseImage):
                 lon_deg, lat_deg = self.wcs.pixtosystem(
                     args, system=system, coords='data')
 
-                if format == 'sexagesimal':
-                    if system in ('galactic', 'ecliptic'):
-                        sign, deg, min, sec = wcs.degToDms(lon_deg,
-                                                           isLatitude=False)
-                        ra_txt = '+%03d:%02d:%06.3f' % (deg, min, sec)
-                    else:
-                        deg, min, sec = wcs.degToHms(lon_deg)
-                        ra_txt = '%02d:%02d:%06.3f' % (deg, min, sec)
-
-                    sign, deg, min, sec = wcs.degToDms(lat_deg)
-                    if sign < 0:
-                        sign = '-'
-                    else:
-                        sign = '+'
-                    dec_txt = '%s%02d:%02d:%06.3f' % (sign, deg, min, sec)
-
-                else:
-                    ra_txt = '%+10.7f' % (lon_deg)
-                    dec_txt = '%+10.7f' % (lat_deg)
-
-                if system == 'galactic':
-                    ra_lbl, dec_lbl = "l", "b"
-                elif system == 'ecliptic':
-                    ra_lbl, dec_lbl = six.unichr(0x03BB), six.unichr(0x03B2)
-                elif system == 'helioprojective':
-                    ra_txt = "%+5.3f" % (lon_deg*3600)
-                    dec_txt = "%+5.3f" % (lat_deg*3600)
-                    ra_lbl, dec_lbl = "x-Solar", "y-Solar"
+                ra_txt, dec_txt, ra_lbl, dec_lbl = self._format_wcs(
+                    numpy.array([lon_deg]), numpy.array([lat_deg]),
+                    system, format)
+                ra_txt, dec_txt = str(ra_txt[0]), str(dec_txt[0])
 
         except Exception as e:
             self.logger.warning("Bad coordinate conversion: %s" % (
@@ -726,4 +801,108 @@ class AstroImage(BaseImage):
                            value=value)
         return info
 
+    def info_xys(self, data_x, data_y, settings):
+        """Like `info_xy`, for arrays of data coordinates.
+
+        Returns a `~ginga.misc.Bunch.Bunch` with the labels of the WCS
+        coordinates (``ra_lbl``, ``dec_lbl``) and a structured array
+        ``table`` with one record for each point.  Its fields are those
+        of `~ginga.BaseImage.BaseImage.info_xys`, plus ``ra_deg`` and
+        ``dec_deg`` (the WCS coordinates, NaN if there are none) and
+        ``ra_txt`` and ``dec_txt`` (their text, as in `info_xy`).  The
+        WCS is evaluated for all the points in one call.
+        """
+        data_x = numpy.asarray(data_x, dtype=numpy.float64).ravel()
+        data_y = numpy.asarray(data_y, dtype=numpy.float64).ravel()
+        # We report the value across the pixel, even though the coords
+        # change halfway across the pixel
+        value, valid = self.get_data_xys((data_x + 0.5).astype(int),
+                                         (data_y + 0.5).astype(int))
+        valid &= (data_x > -1.5) & (data_y > -1.5)
+
+        system = settings.get('wcs_coords', None)
+        format = settings.get('wcs_display', 'sexagesimal')
+        ra_lbl, dec_lbl = six.unichr(945), six.unichr(948)
+        num = len(data_x)
+        lon_deg = numpy.full(num, numpy.nan)
+        lat_deg = numpy.full(num, numpy.nan)
+
+        # Calculate WCS coords, if available
+        try:
+            if (self.wcs is None) or (self.wcs.coordsys == 'raw'):
+                ra_txt = dec_txt = numpy.full(num, 'NO WCS')
+
+            else:
+                datapt = numpy.empty((num, 2 + len(self.revnaxis)))
+                datapt[:, 0], datapt[:, 1] = data_x, data_y
+                datapt[:, 2:] = self.revnaxis
+                res = self.wcs.datapt_to_system(datapt, system=system,
+                                                coords='data')
+                lon_deg, lat_deg = res[:, 0], res[:, 1]
+
+                if self.wcs.coordsys == 'pixel':
+                    ra_txt = numpy.char.mod('%+.3f', lon_deg)
+                    dec_txt = numpy.char.mod('%+.3f', lat_deg)
+                    ra_lbl, dec_lbl = "X", "Y"
+                else:
+                    ra_txt, dec_txt, ra_lbl, dec_lbl = self._format_wcs(
+                        lon_deg, lat_deg, system, format)
+
+        except Exception as e:
+            self.logger.warning("Bad coordinate conversion: %s" % (
+                str(e)))
+            ra_txt = dec_txt = numpy.full(num, 'BAD WCS')
+
+        table = numpy.empty(num, dtype=self._get_info_dtype() + [
+            ('ra_deg', numpy.float64), ('dec_deg', numpy.float64),
+            ('ra_txt', 'U16'), ('dec_txt', 'U16')])
+        table['data_x'], table['data_y'] = data_x, data_y
+        table['value'], table['valid'] = value, valid
+        table['ra_deg'], table['dec_deg'] = lon_deg, lat_deg
+        table['ra_txt'], table['dec_txt'] = ra_txt, dec_txt
+
+        return Bunch.Bunch(itype='astro', ra_lbl=ra_lbl, dec_lbl=dec_lbl,
+                           table=table)
+
+    def _format_wcs(self, lon_deg, lat_deg, system, format):
+        # text of arrays of WCS coordinates, and their labels; points
+        # whose coordinates cannot be shown are 'BAD WCS'
+        ra_lbl, dec_lbl = six.unichr(945), six.unichr(948)
+
+        if system == 'helioprojective':
+            ra_txt = numpy.char.mod("%+5.3f", lon_deg * 3600)
+            dec_txt = numpy.char.mod("%+5.3f", lat_deg * 3600)
+            bad = ~(numpy.isfinite(lon_deg) & numpy.isfinite(lat_deg))
+
+        elif format == 'sexagesimal':
+            if system in ('galactic', 'ecliptic'):
+                ra_txt = wcs.decDegToStringArray(
+                    lon_deg, format=('%03d', '%02d', '%06.3f'),
+                    signs=('+', '+'))
+                bad = ~numpy.isfinite(lon_deg)
+            else:
+                ra_txt = wcs.raDegToStringArray(lon_deg)
+                bad = ~((lon_deg >= 0.0) & (lon_deg < 360.0))
+
+            dec_txt = wcs.decDegToStringArray(
+                lat_deg, format=('%02d', '%02d', '%06.3f'))
+            bad |= ~((lat_deg >= -90.0) & (lat_deg <= 90.0))
+
+        else:
+            ra_txt = numpy.char.mod('%+10.7f', lon_deg)
+            dec_txt = numpy.char.mod('%+10.7f', lat_deg)
+            bad = numpy.zeros(lon_deg.shape, dtype=bool)
+
+        if system == 'galactic':
+            ra_lbl, dec_lbl = "l", "b"
+        elif system == 'ecliptic':
+            ra_lbl, dec_lbl = six.unichr(0x03BB), six.unichr(0x03B2)
+        elif system == 'helioprojective':
+            ra_lbl, dec_lbl = "x-Solar", "y-Solar"
+
+        if numpy.any(bad):
+            ra_txt = numpy.where(bad, 'BAD WCS', ra_txt)
+            dec_txt = numpy.where(bad, 'BAD WCS', dec_txt)
+        return ra_txt, dec_txt, ra_lbl, dec_lbl
+
 # END
@@ -166,6 +166,20 @@ class BaseImage(ViewerObjectBase):
         view = numpy.s_[y, x]
         return self._slice(view)
 
+    def get_data_xys(self, x, y):
+        """Return the values of the data at the integer indexes in the
+        arrays `x` and `y`, and a boolean array telling which of the
+        indexes are inside the data (values of the others are those of
+        the nearest edge pixel).
+        """
+        data = self._get_data()
+        x = numpy.asarray(x, dtype=int)
+        y = numpy.asarray(y, dtype=int)
+        ht, wd = data.shape[:2]
+        valid = (x >= 0) & (x < wd) & (y >= 0) & (y < ht)
+        values = data[y.clip(0, max(ht - 1, 0)), x.clip(0, max(wd - 1, 0))]
+        return values, valid
+
     def set_data(self, data_np, metadata=None, order=None, astype=None):
         """Use this method to SHARE (not copy) the incoming array.
         """
@@ -548,6 +562,31 @@ class BaseImage(ViewerObjectBase):
                            value=value)
         return info
 
+    def info_xys(self, data_x, data_y, settings):
+        """Like `info_xy`, for arrays of data coordinates.
+
+        Returns a `~ginga.misc.Bunch.Bunch` whose ``table`` is a structured
+        array with one record for each point, with the fields ``data_x``,
+        ``data_y``, ``value`` (the value of the data there) and ``valid``
+        (False if the point is outside the data).
+        """
+        data_x = numpy.asarray(data_x, dtype=numpy.float64).ravel()
+        data_y = numpy.asarray(data_y, dtype=numpy.float64).ravel()
+        value, valid = self.get_data_xys(data_x.astype(int),
+                                         data_y.astype(int))
+        # int() truncates towards zero, as in info_xy
+        valid &= (data_x > -1) & (data_y > -1)
+
+        table = numpy.empty(len(data_x), dtype=self._get_info_dtype())
+        table['data_x'], table['data_y'] = data_x, data_y
+        table['value'], table['valid'] = value, valid
+        return Bunch.Bunch(itype='base', table=table)
+
+    def _get_info_dtype(self):
+        data = self._get_data()
+        return [('data_x', numpy.float64), ('data_y', numpy.float64),
+                ('value', data.dtype, data.shape[2:]), ('valid', bool)]
+
 
 class Header(dict):
 
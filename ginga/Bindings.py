@@ -44,6 +44,8 @@ class ImageViewBindings(object):
         self._start_scale_y = 0
         self._start_rot = 0
         self._save = {}
+        # viewer -> zoom factor not yet applied (see _zoom_by)
+        self._zoom_mult = {}
 
         if settings is None:
             # No settings passed.  Set up defaults.
@@ -799,23 +801,54 @@ class ImageViewBindings(object):
         elif direction == 'down':
             self._cut_pct(viewer, -pct, msg=msg)
 
-    def _scale_image(self, viewer, direction, factor, msg=True):
+    def _scale_image(self, viewer, direction, factor, msg=True,
+                     origin=None):
         msg = self.settings.get('msg_zoom', msg)
         rev = self.settings.get('zoom_scroll_reverse', False)
-        scale_x, scale_y = viewer.get_scale_xy()
         direction = self.get_direction(direction, rev=rev)
         mult = 1.0
         if direction == 'up':
             mult = factor
         elif direction == 'down':
             mult = 1.0 / factor
-        scale_x, scale_y = scale_x * mult, scale_y * mult
-        scale = max(scale_x, scale_y)
-        #viewer.scale_to(scale_x, scale_y)
-        viewer.scale_to(scale, scale)
-        if msg:
-            viewer.onscreen_message(viewer.get_scale_text(),
-                                       delay=0.4)
+        self._zoom_by(viewer, mult, origin=origin, msg=msg)
+
+    def _zoom_by(self, viewer, mult, origin=None, msg=True, uniform=True):
+        """Scale the image by `mult`, keeping the data point `origin`
+        (if given) at the same place in the window.  Zooms made before
+        the next frame is drawn are combined into one.  If `uniform` is
+        True, both axes get the larger of the resulting scales, otherwise
+        each axis is scaled on its own.
+        """
+        self._zoom_mult[viewer] = self._zoom_mult.get(viewer, 1.0) * mult
+        viewer.coalesce_input('zoom', self._apply_zoom, viewer, origin, msg,
+                              uniform)
+
+    def _apply_zoom(self, viewer, origin, msg, uniform):
+        mult = self._zoom_mult.pop(viewer, 1.0)
+        with viewer.suppress_redraw:
+
+            if origin is not None:
+                # get cartesian canvas coords of data item under cursor
+                data_x, data_y = origin
+                off_x, off_y = viewer.data_to_offset(data_x, data_y)
+                # set the pan position to the data item
+                viewer.set_pan(data_x, data_y)
+
+            scale_x, scale_y = viewer.get_scale_xy()
+            scale_x, scale_y = scale_x * mult, scale_y * mult
+            if uniform:
+                scale_x = scale_y = max(scale_x, scale_y)
+            viewer.scale_to(scale_x, scale_y)
+            if msg:
+                viewer.onscreen_message(viewer.get_scale_text(),
+                                        delay=0.4)
+
+            if origin is not None:
+                # now adjust the pan position to keep the offset
+                data_x2, data_y2 = viewer.offset_to_data(off_x, off_y)
+                dx, dy = data_x2 - data_x , data_y2 - data_y
+                viewer.panset_xy(data_x - dx, data_y - dy)
 
     def _zoom_xy(self, viewer, x, y, msg=True):
         win_wd, win_ht = viewer.get_window_size()
@@ -956,8 +989,11 @@ class ImageViewBindings(object):
         deg2 = math.degrees(math.atan2(ctr_y - y, x - ctr_x))
         delta_deg = deg2 - deg1
         deg = math.fmod(self._start_rot + delta_deg, 360.0)
+        self._rotate_to(viewer, deg, msg=msg)
+
+    def _rotate_to(self, viewer, deg, msg=True, delay=None):
         if msg:
-            viewer.onscreen_message("Rotate: %.2f" % (deg))
+            viewer.onscreen_message("Rotate: %.2f" % (deg), delay=delay)
         viewer.rotate(deg)
 
     def _rotate_inc(self, viewer, inc_deg, msg=True):
@@ -1539,7 +1575,7 @@ class ImageViewBindings(object):
         x, y = self.get_win_xy(viewer)
 
         if event.state == 'move':
-            self._rotate_xy(viewer, x, y)
+            viewer.coalesce_input('rotate', self._rotate_xy, viewer, x, y)
 
         elif event.state == 'down':
             if msg:
@@ -1549,6 +1585,8 @@ class ImageViewBindings(object):
             self._start_rot = viewer.get_rotation()
 
         else:
+            # apply a move still pending before the message goes
+            viewer.flush_coalesced_input('rotate')
             viewer.onscreen_message(None)
         return True
 
@@ -1575,7 +1613,8 @@ class ImageViewBindings(object):
         x, y = self.get_win_xy(viewer)
 
         if event.state == 'move':
-            self._tweak_colormap(viewer, x, y, 'preview')
+            viewer.coalesce_input('cmap', self._tweak_colormap,
+                                  viewer, x, y, 'preview')
 
         elif event.state == 'down':
             self._start_x, self._start_y = x, y
@@ -1583,6 +1622,8 @@ class ImageViewBindings(object):
                 viewer.onscreen_message("Shift and stretch colormap (drag mouse)",
                                            delay=1.0)
         else:
+            # apply a move still pending before the message goes
+            viewer.flush_coalesced_input('cmap')
             viewer.onscreen_message(None)
         return True
 
@@ -1607,7 +1648,8 @@ class ImageViewBindings(object):
         x, y = self.get_win_xy(viewer)
 
         if event.state == 'move':
-            self._rotate_colormap(viewer, x, y, 'preview')
+            viewer.coalesce_input('cmap', self._rotate_colormap,
+                                  viewer, x, y, 'preview')
 
         elif event.state == 'down':
             self._start_x, self._start_y = x, y
@@ -1615,6 +1657,8 @@ class ImageViewBindings(object):
                 viewer.onscreen_message("Rotate colormap (drag mouse L/R)",
                                            delay=1.0)
         else:
+            # apply a move still pending before the message goes
+            viewer.flush_coalesced_input('cmap')
             viewer.onscreen_message(None)
         return True
 
@@ -1640,7 +1684,7 @@ class ImageViewBindings(object):
         if event.state == 'move':
             data_x, data_y = self.get_new_pan(viewer, x, y,
                                               ptype=self._pantype)
-            viewer.panset_xy(data_x, data_y)
+            viewer.coalesce_input('pan', viewer.panset_xy, data_x, data_y)
 
         elif event.state == 'down':
             self.pan_set_origin(viewer, x, y, data_x, data_y)
@@ -1662,7 +1706,7 @@ class ImageViewBindings(object):
         if event.state == 'move':
             data_x, data_y = self.get_new_pan(viewer, x, y,
                                               ptype=self._pantype)
-            viewer.panset_xy(data_x, data_y)
+            viewer.coalesce_input('pan', viewer.panset_xy, data_x, data_y)
 
         elif event.state == 'down':
             self.pan_start(viewer, ptype=1)
@@ -1680,13 +1724,15 @@ class ImageViewBindings(object):
         x, y = self.get_win_xy(viewer)
 
         if event.state == 'move':
-            self._cutlow_xy(viewer, x, y)
+            viewer.coalesce_input('cuts', self._cutlow_xy, viewer, x, y)
 
         elif event.state == 'down':
             self._start_x, self._start_y = x, y
             self._loval, self._hival = viewer.get_cut_levels()
 
         else:
+            # apply a move still pending before the message goes
+            viewer.flush_coalesced_input('cuts')
             viewer.onscreen_message(None)
         return True
 
@@ -1699,13 +1745,15 @@ class ImageViewBindings(object):
         x, y = self.get_win_xy(viewer)
 
         if event.state == 'move':
-            self._cuthigh_xy(viewer, x, y)
+            viewer.coalesce_input('cuts', self._cuthigh_xy, viewer, x, y)
 
         elif event.state == 'down':
             self._start_x, self._start_y = x, y
             self._loval, self._hival = viewer.get_cut_levels()
 
         else:
+            # apply a move still pending before the message goes
+            viewer.flush_coalesced_input('cuts')
             viewer.onscreen_message(None)
         return True
 
@@ -1718,7 +1766,7 @@ class ImageViewBindings(object):
         x, y = self.get_win_xy(viewer)
 
         if event.state == 'move':
-            self._cutboth_xy(viewer, x, y)
+            viewer.coalesce_input('cuts', self._cutboth_xy, viewer, x, y)
 
         elif event.state == 'down':
             self._start_x, self._start_y = x, y
@@ -1727,6 +1775,8 @@ class ImageViewBindings(object):
             self._loval, self._hival = viewer.autocuts.calc_cut_levels(image)
 
         else:
+            # apply a move still pending before the message goes
+            viewer.flush_coalesced_input('cuts')
             viewer.onscreen_message(None)
         return True
 
@@ -1799,6 +1849,16 @@ class ImageViewBindings(object):
         return True
 
     def zoom_step(self, viewer, event, msg=True, origin=None, adjust=1.5):
+        # scale by the desired means
+        if self.settings.get('scroll_zoom_direct_scale', True):
+            zoom_accel = self.settings.get('scroll_zoom_acceleration', 1.0)
+            # change scale by 50%
+            amount = self._scale_adjust(adjust, event.amount, zoom_accel,
+                                        max_limit=4.0)
+            self._scale_image(viewer, event.direction, amount, msg=msg,
+                              origin=origin)
+            return
+
         with viewer.suppress_redraw:
 
             if origin is not None:
@@ -1808,27 +1868,18 @@ class ImageViewBindings(object):
                 # set the pan position to the data item
                 viewer.set_pan(data_x, data_y)
 
-            # scale by the desired means
-            if self.settings.get('scroll_zoom_direct_scale', True):
-                zoom_accel = self.settings.get('scroll_zoom_acceleration', 1.0)
-                # change scale by 50%
-                amount = self._scale_adjust(adjust, event.amount, zoom_accel,
-                                            max_limit=4.0)
-                self._scale_image(viewer, event.direction, amount, msg=msg)
+            rev = self.settings.get('zoom_scroll_reverse', False)
+            direction = self.get_direction(event.direction, rev=rev)
 
-            else:
-                rev = self.settings.get('zoom_scroll_reverse', False)
-                direction = self.get_direction(event.direction, rev=rev)
-
-                if direction == 'up':
-                    viewer.zoom_in()
+            if direction == 'up':
+                viewer.zoom_in()
 
-                elif direction == 'down':
-                    viewer.zoom_out()
+            elif direction == 'down':
+                viewer.zoom_out()
 
-                if msg:
-                    viewer.onscreen_message(viewer.get_scale_text(),
-                                            delay=0.4)
+            if msg:
+                viewer.onscreen_message(viewer.get_scale_text(),
+                                        delay=0.4)
 
             if origin is not None:
                 # now adjust the pan position to keep the offset
@@ -1973,7 +2024,7 @@ class ImageViewBindings(object):
             self._start_scale_x, self._start_scale_y = viewer.get_scale_xy()
             self._start_rot = viewer.get_rotation()
         else:
-            msg_str = None
+            zoomed = False
             if self.canzoom and ('zoom' in pinch_actions):
                 scale_accel = self.settings.get('pinch_zoom_acceleration', 1.0)
                 scale = scale * scale_accel
@@ -1983,24 +2034,20 @@ class ImageViewBindings(object):
                 # the scale on the original scale captured when the gesture starts
                 ## scale_x, scale_y = (self._start_scale_x * scale,
                 ##                     self._start_scale_y * scale)
-                scale_x, scale_y = viewer.get_scale_xy()
-                scale_x, scale_y = scale_x * scale, scale_y * scale
-
-                viewer.scale_to(scale_x, scale_y)
-                msg_str = viewer.get_scale_text()
-                msg = self.settings.get('msg_zoom', True)
+                # (factors reported before the next frame are combined)
+                self._zoom_by(viewer, scale,
+                              msg=self.settings.get('msg_zoom', True),
+                              uniform=False)
+                zoomed = True
 
             if self.canrotate and ('rotate' in pinch_actions):
                 deg = self._start_rot - rot_deg
                 rotate_accel = self.settings.get('pinch_rotate_acceleration', 1.0)
                 deg = rotate_accel * deg
-                viewer.rotate(deg)
-                if msg_str is None:
-                    msg_str = "Rotate: %.2f" % (deg)
-                    msg = self.settings.get('msg_rotate', msg)
-
-            if msg and (msg_str is not None):
-                viewer.onscreen_message(msg_str, delay=0.4)
+                # the zoom message takes precedence
+                msg = (not zoomed) and self.settings.get('msg_rotate', msg)
+                viewer.coalesce_input('rotate', self._rotate_to, viewer, deg,
+                                      msg=msg, delay=0.4)
         return True
 
     def gs_pan(self, viewer, state, dx, dy):
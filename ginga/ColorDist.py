@@ -16,8 +16,23 @@ import numpy
 class ColorDistError(Exception):
     pass
 
+def get_index_dtype(length):
+    """Return the smallest unsigned integer type that can index an
+    array of `length` elements.
+    """
+    if length <= 256:
+        return numpy.dtype(numpy.uint8)
+    if length <= 65536:
+        return numpy.dtype(numpy.uint16)
+    return numpy.dtype(numpy.uint32)
+
+
 class ColorDistBase(object):
 
+    # whether the hash is fixed by calc_hash(), rather than computed
+    # from the data passed to hash_array()
+    static_hash = True
+
     def __init__(self, hashsize, colorlen=None):
         super(ColorDistBase, self).__init__()
 
@@ -40,6 +55,18 @@ class ColorDistBase(object):
     def get_hash_size(self):
         return self.hashsize
 
+    def get_index_dtype(self):
+        """Return the type of the indexes into the hash (i.e. of the
+        arrays passed to `hash_array`).
+        """
+        return get_index_dtype(self.hashsize)
+
+    def get_color_dtype(self):
+        """Return the type of the values in the hash (color indexes in
+        the range 0..colorlen-1).
+        """
+        return get_index_dtype(self.colorlen)
+
     def set_hash_size(self, size):
         assert (size >= self.colorlen) and (size <= self.maxhashsize), \
                ColorDistError("Bad hash size!")
@@ -71,7 +98,7 @@ class LinearDist(ColorDistBase):
         base = numpy.arange(0.0, float(self.hashsize), 1.0) / self.hashsize
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint)
+        self.hash = l.astype(self.get_color_dtype())
 
         self.check_hash()
 
@@ -99,7 +126,7 @@ class LogDist(ColorDistBase):
         base = base.clip(0.0, 1.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint)
+        self.hash = l.astype(self.get_color_dtype())
 
         self.check_hash()
 
@@ -128,7 +155,7 @@ class PowerDist(ColorDistBase):
         base = base.clip(0.0, 1.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint)
+        self.hash = l.astype(self.get_color_dtype())
 
         self.check_hash()
 
@@ -156,7 +183,7 @@ class SqrtDist(ColorDistBase):
         base = base.clip(0.0, 1.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint)
+        self.hash = l.astype(self.get_color_dtype())
 
         self.check_hash()
 
@@ -183,7 +210,7 @@ class SquaredDist(ColorDistBase):
         base = (base ** 2.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint)
+        self.hash = l.astype(self.get_color_dtype())
 
         self.check_hash()
 
@@ -214,7 +241,7 @@ class AsinhDist(ColorDistBase):
         base = base.clip(0.0, 1.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint)
+        self.hash = l.astype(self.get_color_dtype())
 
         self.check_hash()
 
@@ -246,7 +273,7 @@ class SinhDist(ColorDistBase):
         base = base.clip(0.0, 1.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint)
+        self.hash = l.astype(self.get_color_dtype())
 
         self.check_hash()
 
@@ -266,6 +293,8 @@ class HistogramEqualizationDist(ColorDistBase):
     based on the frequency of each data value.
     """
 
+    static_hash = False
+
     def __init__(self, hashsize, colorlen=None):
         super(HistogramEqualizationDist, self).__init__(hashsize,
                                                          colorlen=colorlen)
@@ -292,7 +321,7 @@ class HistogramEqualizationDist(ColorDistBase):
         # normalize to color range
         l = (cdf - cdf.min()) * (self.colorlen - 1) / (
             cdf.max() - cdf.min())
-        self.hash = l.astype(numpy.uint)
+        self.hash = l.astype(self.get_color_dtype())
         self.check_hash()
 
         arr = self.hash[idx]
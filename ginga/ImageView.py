@@ -7,11 +7,13 @@
 """This module handles image viewers."""
 import numpy
 import math
+import copy
 import logging
 import threading
 import sys
 import traceback
 import time
+from collections import OrderedDict
 
 from ginga.misc import Callback, Settings
 from ginga import BaseImage, AstroImage
@@ -19,7 +21,7 @@ from ginga import RGBMap, AutoCuts, ColorDist
 from ginga import cmap, imap, colors, trcalc, version
 from ginga.canvas import coordmap, transform
 from ginga.canvas.types.layer import DrawingCanvas
-from ginga.util import rgb_cms
+from ginga.util import rgb_cms, profiler, rendercache
 from ginga.util.six.moves import map
 
 __all__ = ['ImageViewBase']
@@ -84,6 +86,8 @@ class ImageViewBase(Callback.Callbacks):
         else:
             rgbmap = RGBMap.RGBMapper(self.logger)
             self.rgbmap = rgbmap
+        # counts changes to the color mapping (see set_image)
+        self._rgbmap_serial = 0
 
         # for debugging
         self.name = str(self)
@@ -91,12 +95,13 @@ class ImageViewBase(Callback.Callbacks):
         # for color mapping
         self.t_.add_defaults(color_map='gray', intensity_map='ramp',
                              color_algorithm='linear',
-                             color_hashsize=65535)
+                             color_hashsize=65535, color_lut_bits=8)
         for name in ('color_map', 'intensity_map', 'color_algorithm',
-                     'color_hashsize'):
+                     'color_hashsize', 'color_lut_bits'):
             self.t_.get_setting(name).add_callback('set', self.cmap_changed_cb)
 
         # Initialize RGBMap
+        rgbmap.set_lut_bits(self.t_.get('color_lut_bits', 8), callback=False)
         cmap_name = self.t_.get('color_map', 'gray')
         try:
             cm = cmap.get_cmap(cmap_name)
@@ -166,9 +171,10 @@ class ImageViewBase(Callback.Callbacks):
             self.t_.get_setting(name).add_callback('set', self.transform_cb)
 
         # desired rotation angle
-        self.t_.add_defaults(rot_deg=0.0)
-        self.t_.get_setting('rot_deg').add_callback(
-            'set', self.rotation_change_cb)
+        self.t_.add_defaults(rot_deg=0.0, rotate_interpolation='basic')
+        for name in ('rot_deg', 'rotate_interpolation'):
+            self.t_.get_setting(name).add_callback(
+                'set', self.rotation_change_cb)
 
         # misc
         self.t_.add_defaults(auto_orient=False,
@@ -188,13 +194,25 @@ class ImageViewBase(Callback.Callbacks):
         # ICC profile support
         d = dict(icc_output_profile=None, icc_output_intent='perceptual',
                  icc_proof_profile=None,  icc_proof_intent='perceptual',
-                 icc_black_point_compensation=False)
+                 icc_black_point_compensation=False,
+                 # size of 3D color lookup table used for ICC conversions
+                 icc_lut_size=33)
         self.t_.add_defaults(**d)
         for key in d:
             # Note: transform_cb will redraw enough to pick up
             #       ICC profile change
             self.t_.get_setting(key).add_callback('set', self.transform_cb)
 
+        # per-stage timing of redraws (see get_profiler)
+        self.t_.add_defaults(profile_render=False, profile_history=500)
+        self.profiler = profiler.RenderProfiler(
+            name=self.name, history=self.t_['profile_history'],
+            enabled=self.t_['profile_render'])
+        self.t_.get_setting('profile_render').add_callback(
+            'set', lambda setting, value: self.profiler.enable(value))
+        self.t_.get_setting('profile_history').add_callback(
+            'set', lambda setting, value: self.profiler.set_history(value))
+
         # Object that calculates auto cut levels
         name = self.t_.get('autocut_method', 'zscale')
         klass = AutoCuts.get_autocuts(name)
@@ -250,6 +268,11 @@ class ImageViewBase(Callback.Callbacks):
         self._rgbarr = None
         self._rgbarr2 = None
         self._rgbobj = None
+        # composited image layers (see get_rgb_object)
+        self._rgbarr_base = None
+        self._layer_keys = dict(base=None, images=None)
+        # persistent window buffer (see getwin_view)
+        self._winarr = None
 
         # optimization of redrawing
         self.defer_redraw = self.t_.get('defer_redraw', True)
@@ -262,6 +285,33 @@ class ImageViewBase(Callback.Callbacks):
         self._hold_redraw_cnt = 0
         self.suppress_redraw = SuppressRedraw(self)
 
+        # coalescing of interactive input (see coalesce_input)
+        self.t_.add_defaults(coalesce_input=True)
+        self._coalesced = OrderedDict()
+        self._frame_time = 0.0
+        self._input_stats = dict(updates=0, applied=0)
+
+        # render states of the images shown recently (see set_image)
+        self.t_.add_defaults(render_states=4)
+        self._render_states = rendercache.RenderStateCache(
+            max_images=self.t_['render_states'])
+        self._render_stats = dict(restored=0, missed=0)
+        self.t_.get_setting('render_states').add_callback(
+            'set', lambda setting, value: self._render_states.set_max_images(
+                value))
+
+        # asynchronous redraws (see set_async_redraw)
+        self.t_.add_defaults(async_redraw=False, async_max_stale=0.25)
+        self._async_lock = threading.RLock()
+        self._async_view = None
+        self._async_gen = 0
+        self._async_whence = self._defer_whence_reset
+        self._async_thread = None
+        self._async_result = None
+        self._async_in_poll = False
+        self._async_poll_interval = 0.01
+        self._async_stats = dict(frames=0, shown=0, superseded=0)
+
         # last known window mouse position
         self.last_win_x = 0
         self.last_win_y = 0
@@ -294,27 +344,11 @@ class ImageViewBase(Callback.Callbacks):
         # handle to image object on the image canvas
         self._imgobj = None
         self._canvas_img_tag = '__image'
+        # image object set without adding it to the canvas?
+        self._imgobj_detached = False
 
         # set up basic transforms
-        self.tform = {
-            'canvas_to_window': transform.CanvasWindowTransform(self),
-            'cartesian_to_window': (transform.RotationTransform(self) +
-                                    transform.CartesianWindowTransform(self)),
-            'data_to_cartesian': (transform.DataCartesianTransform(self) +
-                                  transform.ScaleTransform(self)),
-            'data_to_scrollbar': (transform.DataCartesianTransform(self) +
-                                  transform.RotationTransform(self)),
-            'data_to_window': (transform.DataCartesianTransform(self) +
-                               transform.ScaleTransform(self) +
-                               transform.RotationTransform(self) +
-                               transform.CartesianWindowTransform(self)),
-            'wcs_to_data': transform.WCSDataTransform(self),
-            'wcs_to_window': (transform.WCSDataTransform(self) +
-                              transform.DataCartesianTransform(self) +
-                              transform.ScaleTransform(self) +
-                              transform.RotationTransform(self) +
-                              transform.CartesianWindowTransform(self)),
-            }
+        self.tform = self._make_transforms()
 
         self.coordmap = {
             'canvas': coordmap.CanvasMapper(self),
@@ -362,6 +396,27 @@ class ImageViewBase(Callback.Callbacks):
             self.rf_timer.add_callback('expired', self.refresh_timer_cb,
                                        self.rf_flags)
 
+    def _make_transforms(self):
+        return {
+            'canvas_to_window': transform.CanvasWindowTransform(self),
+            'cartesian_to_window': (transform.RotationTransform(self) +
+                                    transform.CartesianWindowTransform(self)),
+            'data_to_cartesian': (transform.DataCartesianTransform(self) +
+                                  transform.ScaleTransform(self)),
+            'data_to_scrollbar': (transform.DataCartesianTransform(self) +
+                                  transform.RotationTransform(self)),
+            'data_to_window': (transform.DataCartesianTransform(self) +
+                               transform.ScaleTransform(self) +
+                               transform.RotationTransform(self) +
+                               transform.CartesianWindowTransform(self)),
+            'wcs_to_data': transform.WCSDataTransform(self),
+            'wcs_to_window': (transform.WCSDataTransform(self) +
+                              transform.DataCartesianTransform(self) +
+                              transform.ScaleTransform(self) +
+                              transform.RotationTransform(self) +
+                              transform.CartesianWindowTransform(self)),
+            }
+
     def set_window_size(self, width, height):
         """Report the size of the window to display the image.
 
@@ -509,6 +564,7 @@ class ImageViewBase(Callback.Callbacks):
         canvas.ui_set_active(True)
 
         self._imgobj = None
+        self._imgobj_detached = False
 
         # private canvas set?
         if not (private_canvas is None):
@@ -666,6 +722,7 @@ class ImageViewBase(Callback.Callbacks):
     def rgbmap_cb(self, rgbmap):
         """Handle callback for when RGB map has changed."""
         self.logger.debug("RGB map has changed.")
+        self._rgbmap_serial += 1
         self.redraw(whence=2)
 
     def cmap_changed_cb(self, setting, value):
@@ -676,6 +733,9 @@ class ImageViewBase(Callback.Callbacks):
         self.logger.debug("Color settings have changed.")
 
         # Update our RGBMapper with any changes
+        lut_bits = self.t_.get('color_lut_bits', 8)
+        self.rgbmap.set_lut_bits(lut_bits, callback=False)
+
         cmap_name = self.t_.get('color_map', "gray")
         cm = cmap.get_cmap(cmap_name)
         self.rgbmap.set_cmap(cm, callback=False)
@@ -713,6 +773,7 @@ class ImageViewBase(Callback.Callbacks):
         """
         self.rgbmap = rgbmap
         rgbmap.add_callback('changed', self.rgbmap_cb)
+        self._rgbmap_serial += 1
         self.redraw(whence=2)
 
     def get_image(self):
@@ -778,18 +839,24 @@ class ImageViewBase(Callback.Callbacks):
             Image object.
 
         add_to_canvas : bool
-            Add image to canvas.
+            Add image to canvas.  If False, the image sets the limits,
+            coordinates and profile of the viewer but is not drawn.
 
         """
         canvas_img = self.get_canvas_image()
 
         old_image = canvas_img.get_image()
         self.make_callback('image-unset', old_image)
+        # remember how the old image was rendered, in case it is shown
+        # again soon
+        self._save_render_state(canvas_img, old_image)
 
         with self.suppress_redraw:
 
+            self._imgobj_detached = not add_to_canvas
             # this line should force the callback of _image_set_cb()
             canvas_img.set_image(image)
+            self._restore_render_state(canvas_img, image)
 
             if add_to_canvas:
                 try:
@@ -805,6 +872,45 @@ class ImageViewBase(Callback.Callbacks):
 
             #self.canvas.update_canvas(whence=0)
 
+    def _save_render_state(self, canvas_img, image):
+        if image is None:
+            return
+        state = self._render_states.get_state(image, create=True)
+        if state is None:
+            return
+        state.render = None
+        if self.is_redraw_pending() or (self._async_thread is not None) or \
+               not hasattr(canvas_img, 'get_render_state'):
+            # the arrays of the last frame are not up to date
+            return
+        render = canvas_img.get_render_state(self._get_frame_viewer())
+        if render is not None:
+            render.rgbmap_serial = self._rgbmap_serial
+        state.render = render
+
+    def _restore_render_state(self, canvas_img, image):
+        state = self._render_states.get_state(image)
+        if state is None or state.get('render', None) is None:
+            self._render_stats['missed'] += 1
+            return
+        self._render_stats['restored'] += 1
+        render = state.render
+        if render.rgbmap_serial != self._rgbmap_serial:
+            # the color map changed since
+            render = render.copy()
+            render.rgbarr = None
+        canvas_img.set_render_state(self._get_frame_viewer(), render)
+
+    def get_render_state_stats(self):
+        """Return a dict with the number of images whose render states
+        are kept (see the ``render_states`` setting), and the number of
+        times the render state of an image being set was found
+        (``restored``) or not (``missed``).
+        """
+        stats = dict(self._render_stats)
+        stats['images'] = self._render_states.get_num_images()
+        return stats
+
     def _image_set_cb(self, canvas_img, image):
         try:
             self.apply_profile_or_settings(image)
@@ -902,6 +1008,9 @@ class ImageViewBase(Callback.Callbacks):
 
     def _image_modified_cb(self, image):
 
+        # its render state, if we have one, is out of date
+        self._render_states.invalidate(image)
+
         canvas_img = self.get_canvas_image()
         image2 = canvas_img.get_image()
         if image is not image2:
@@ -1038,8 +1147,13 @@ class ImageViewBase(Callback.Callbacks):
 
         """
         if not self.defer_redraw:
+            whence = min(self._defer_whence, whence)
             if self._hold_redraw_cnt == 0:
+                self._defer_whence = self._defer_whence_reset
                 self.redraw_now(whence=whence)
+            else:
+                # keep the lowest level asked for while redraws are held
+                self._defer_whence = whence
             return
 
         with self._defer_lock:
@@ -1076,6 +1190,98 @@ class ImageViewBase(Callback.Callbacks):
                 self._defer_whence = whence
                 self.logger.debug("update whence=%.2f" % (whence))
 
+    def coalesce_input(self, key, method, *args, **kwdargs):
+        """Apply an interactive update ``method(*args, **kwdargs)`` just
+        before the next frame is drawn.
+
+        An update still pending under the same `key` (e.g. for the same
+        gesture) is replaced, so that however many input events arrive
+        while a frame is being drawn, only the latest state of each
+        gesture is applied and drawn: the display lags the input by at
+        most a frame instead of by the length of the event queue.  The
+        frames are paced to the measured frame time.
+
+        If the ``coalesce_input`` setting is False, or redraws are not
+        deferred (see :meth:`set_redraw_lag`), the update is applied
+        immediately.
+
+        Parameters
+        ----------
+        key : hashable
+            Identifies the gesture or value being updated.
+
+        method : callable
+            Function applying the update.
+
+        """
+        if not (self.defer_redraw and self.t_['coalesce_input']):
+            method(*args, **kwdargs)
+            return
+
+        with self._defer_lock:
+            self._input_stats['updates'] += 1
+            # latest update last
+            self._coalesced.pop(key, None)
+            self._coalesced[key] = (method, args, kwdargs)
+            if self._defer_flag:
+                # a frame is already scheduled; it will apply the update
+                return
+            self._defer_flag = True
+
+            # the next frame is due a frame time after the last one started
+            interval = max(self.defer_lagtime, self._frame_time)
+            since_start = time.time() - self.time_last_redraw + \
+                          self._frame_time
+            secs = max(0.0, interval - since_start)
+
+        self.reschedule_redraw(secs)
+
+    def get_input_stats(self):
+        """Return a dict with the number of interactive updates made
+        through :meth:`coalesce_input`, the number applied, and the
+        measured frame time (sec).
+        """
+        with self._defer_lock:
+            stats = dict(self._input_stats)
+            stats['frame_time'] = self._frame_time
+        return stats
+
+    def flush_coalesced_input(self, key):
+        """Apply the update pending under `key` (see
+        :meth:`coalesce_input`) now, if there is one.  Call this when
+        the gesture ends, before e.g. clearing its onscreen message.
+        """
+        with self._defer_lock:
+            update = self._coalesced.pop(key, None)
+            if update is not None:
+                self._input_stats['applied'] += 1
+        if update is not None:
+            method, args, kwdargs = update
+            method(*args, **kwdargs)
+
+    def _apply_coalesced_input(self):
+        # apply the pending interactive updates; returns True if there
+        # were any
+        with self._defer_lock:
+            if len(self._coalesced) == 0:
+                return False
+            pending, self._coalesced = self._coalesced, OrderedDict()
+            self._input_stats['applied'] += len(pending)
+
+        # the redraws they ask for are folded into the coming frame
+        self._hold_redraw_cnt += 1
+        try:
+            for method, args, kwdargs in pending.values():
+                try:
+                    method(*args, **kwdargs)
+
+                except Exception as e:
+                    self.logger.error("Error applying input: %s" % (
+                        str(e)))
+        finally:
+            self._hold_redraw_cnt -= 1
+        return True
+
     def is_redraw_pending(self):
         """Indicates whether a deferred redraw has been scheduled.
 
@@ -1103,7 +1309,8 @@ class ImageViewBase(Callback.Callbacks):
                 self._image_set_cb(canvas_img, canvas_img.get_image())
 
         except KeyError:
-            self._imgobj = None
+            if not self._imgobj_detached:
+                self._imgobj = None
 
         self.redraw(whence=whence)
 
@@ -1111,17 +1318,26 @@ class ImageViewBase(Callback.Callbacks):
         """Handle delayed redrawing of the canvas."""
 
         # This is the optimized redraw method
+        # apply the latest state of interactive gestures first, so that
+        # this frame shows it
+        applied = self._apply_coalesced_input()
+
         with self._defer_lock:
             # pick up the lowest necessary level of redrawing
             whence = self._defer_whence
             self._defer_whence = self._defer_whence_reset
-            flag = self._defer_flag
+            flag = (self._defer_flag or applied) and \
+                   (whence < self._defer_whence_reset)
             self._defer_flag = False
 
         if flag:
             # If a redraw was scheduled, do it now
             self.redraw_now(whence=whence)
 
+        if self._async_thread is not None:
+            # deliver an asynchronously computed frame, if one is ready
+            self._async_poll()
+
     def set_redraw_lag(self, lag_sec):
         """Set lag time for redrawing the canvas.
 
@@ -1253,23 +1469,45 @@ class ImageViewBase(Callback.Callbacks):
     def redraw_now(self, whence=0):
         """Redraw the displayed image.
 
+        If the ``async_redraw`` setting is True, the RGB frame is computed
+        on a worker thread and shown when it is ready (see
+        :meth:`set_async_redraw`).
+
         Parameters
         ----------
         whence
             See :meth:`get_rgb_object`.
 
         """
+        if self.t_['async_redraw'] and self._imgwin_set and \
+               not self._self_scaling:
+            self._async_request(whence)
+            return
+
+        if (self._async_view is not None) and (self._async_thread is None):
+            # back from asynchronous redraws: our own frame buffers are
+            # out of date
+            self._async_release_view()
+            whence = 0
+
+        self.profiler.start_frame(whence)
         try:
             time_start = time.time()
             self.redraw_data(whence=whence)
 
             # finally update the window drawable from the offscreen surface
-            self.update_image()
+            with self.profiler.stage('blit'):
+                self.update_image()
 
             time_done = time.time()
             time_delta = time_start - self.time_last_redraw
             time_elapsed = time_done - time_start
             self.time_last_redraw = time_done
+            # running average of the frame time, for pacing input
+            if self._frame_time == 0.0:
+                self._frame_time = time_elapsed
+            else:
+                self._frame_time = 0.8 * self._frame_time + 0.2 * time_elapsed
             self.logger.debug("widget '%s' redraw (whence=%d) delta=%.4f "
                               "elapsed=%.4f sec" % (
                 self.name, whence, time_delta, time_elapsed))
@@ -1285,6 +1523,9 @@ class ImageViewBase(Callback.Callbacks):
                 tb_str = "Traceback information unavailable."
                 self.logger.error(tb_str)
 
+        finally:
+            self.profiler.end_frame()
+
     def redraw_data(self, whence=0):
         """Render image from RGB map and redraw private canvas.
 
@@ -1304,9 +1545,15 @@ class ImageViewBase(Callback.Callbacks):
 
         if not self._self_scaling:
             rgbobj = self.get_rgb_object(whence=whence)
-            self.render_image(rgbobj, self._dst_x, self._dst_y)
+            with self.profiler.stage('blit'):
+                self.render_image(rgbobj, self._dst_x, self._dst_y)
+
+        self._draw_overlays(whence, self)
 
-        self.private_canvas.draw(self)
+    def _draw_overlays(self, whence, viewer):
+        # `viewer` gives the geometry to draw in (see _async_show)
+        with self.profiler.stage('canvas'):
+            self.private_canvas.draw(viewer)
 
         # TODO: see if we can deprecate this fake callback
         if whence <= 0:
@@ -1315,6 +1562,213 @@ class ImageViewBase(Callback.Callbacks):
         if whence < 2:
             self.check_cursor_location()
 
+    def set_async_redraw(self, tf, max_stale=None):
+        """Turn the asynchronous redraw mode on or off.
+
+        In this mode the RGB frame (cut levels, color mapping, overlaid
+        images, rotation and ICC conversion) is computed on a worker
+        thread, while the GUI thread keeps handling input.  The worker
+        uses a snapshot of the view state (settings, window geometry and
+        the images on the canvas) taken when the frame starts, and its
+        own buffers.  The finished frame is passed to
+        :meth:`render_image` and :meth:`update_image` on the GUI thread,
+        and the graphics canvas is drawn over it there, in the geometry
+        of the snapshot.  Only one frame is computed at a time; requests
+        made meanwhile are combined into the next one.  A frame whose
+        view state was superseded while it was computed is discarded,
+        unless nothing has been shown for `max_stale` seconds (so that
+        the display keeps up during a long drag).
+
+        The mode relies on :meth:`reschedule_redraw` calling
+        :meth:`delayed_redraw` from the GUI event loop; backends without
+        timers wait for each frame instead.
+
+        Parameters
+        ----------
+        tf : bool
+            True to compute frames off the GUI thread.
+
+        max_stale : float or None
+            If not None, sets the ``async_max_stale`` setting (sec).
+
+        """
+        if max_stale is not None:
+            self.t_.set(async_max_stale=max_stale)
+        self.t_.set(async_redraw=tf)
+
+    def get_async_stats(self):
+        """Return a dict with the number of asynchronous frames computed,
+        shown and discarded as superseded.
+        """
+        with self._async_lock:
+            return dict(self._async_stats)
+
+    def _async_request(self, whence):
+        # GUI thread: record the request and start a frame unless one
+        # is being computed
+        with self._async_lock:
+            self._async_gen += 1
+            self._async_whence = min(self._async_whence, whence)
+            if self._async_thread is not None:
+                # the request is picked up when the current frame is done
+                return
+        self._async_start()
+
+    def _async_start(self):
+        with self._async_lock:
+            whence = self._async_whence
+            self._async_whence = self._defer_whence_reset
+            gen = self._async_gen
+            self._async_result = None
+            view = self._async_snapshot()
+            self._async_thread = threading.Thread(
+                target=self._async_compute, args=(gen, whence, view))
+            self._async_thread.daemon = True
+            self._async_thread.start()
+
+        self.reschedule_redraw(self._async_poll_interval)
+
+    def _async_snapshot(self):
+        # GUI thread, with no frame being computed: bring the frame view
+        # up to date with the viewer.  The frame view is a shallow copy
+        # of the viewer that the worker renders with: it has a copy of
+        # the settings, its own transforms, window geometry and frame
+        # buffers, and the list of images to composite, so nothing the
+        # worker reads or writes changes under it.  Canvas images keep
+        # their cached cutouts and colored arrays per viewer, so the
+        # frame view has its own of those as well.
+        view = self._async_view
+        if view is None:
+            view = copy.copy(self)
+            buffers = dict(_rgbarr=None, _rgbarr2=None, _rgbarr_base=None,
+                           _rgbobj=None,
+                           _layer_keys=dict(base=None, images=None))
+        else:
+            buffers = dict([(name, getattr(view, name))
+                            for name in ('_rgbarr', '_rgbarr2',
+                                         '_rgbarr_base', '_rgbobj',
+                                         '_layer_keys')])
+            view.__dict__.update(self.__dict__)
+        view.__dict__.update(buffers)
+        view._async_view = None
+
+        t_ = Settings.SettingGroup(name=self.t_.name, logger=self.logger)
+        t_.add_settings(**self.t_.get_dict())
+        view.t_ = t_
+        view.tform = view._make_transforms()
+        layers = self._get_image_layers()
+        view._get_image_layers = lambda: layers
+        # redraws requested by canvas objects through the frame view
+        # are for us
+        view.redraw = self.redraw
+
+        self._async_view = view
+        return view
+
+    def _async_release_view(self):
+        # free the buffers of the frame view and the arrays that the
+        # canvas images keep for it
+        view, self._async_view = self._async_view, None
+        base_objs, image_objs = self._get_image_layers()
+        for obj in base_objs + image_objs:
+            if obj.in_cache(view):
+                obj.invalidate_cache(view)
+        view._rgbarr = view._rgbarr2 = view._rgbarr_base = None
+        view._rgbobj = None
+
+    def _get_frame_viewer(self):
+        # the viewer that the canvas images cache the arrays of our
+        # frames under
+        if self._async_view is not None:
+            return self._async_view
+        return self
+
+    def _async_compute(self, gen, whence, view):
+        # worker thread: build the frame from the snapshot in `view`
+        self.profiler.start_frame(whence)
+        try:
+            rgbobj = view.get_rgb_object(whence=whence)
+
+        except Exception as e:
+            self.logger.error("Error computing frame: %s" % (str(e)))
+            rgbobj = None
+
+        finally:
+            self.profiler.end_frame()
+
+        with self._async_lock:
+            self._async_result = (gen, whence, view, rgbobj)
+            self._async_stats['frames'] += 1
+
+    def _async_poll(self):
+        # GUI thread: show a finished frame and start the next one
+        with self._async_lock:
+            thread = self._async_thread
+            if thread is None:
+                return
+            res = self._async_result
+
+        if res is None:
+            if not self._async_in_poll:
+                self._async_in_poll = True
+                try:
+                    self.reschedule_redraw(self._async_poll_interval)
+                finally:
+                    self._async_in_poll = False
+                return
+            # reschedule_redraw() called back immediately (no timers),
+            # so wait for the frame
+            thread.join()
+            with self._async_lock:
+                res = self._async_result
+
+        with self._async_lock:
+            self._async_thread = None
+            self._async_result = None
+            superseded = (res[0] != self._async_gen)
+            next_whence = self._async_whence
+
+        gen, whence, view, rgbobj = res
+        stale = time.time() - self.time_last_redraw
+        if (rgbobj is not None) and ((not superseded) or
+                                     (stale > self.t_['async_max_stale'])):
+            self._async_show(view, rgbobj, whence)
+        else:
+            with self._async_lock:
+                self._async_stats['superseded'] += 1
+            self.logger.debug("discarding superseded frame")
+
+        if superseded or next_whence < self._defer_whence_reset:
+            # requests came in while the frame was computed
+            if self.t_['async_redraw']:
+                self._async_start()
+            else:
+                self._async_whence = self._defer_whence_reset
+                self.redraw_now(whence=next_whence)
+
+    def _async_show(self, view, rgbobj, whence):
+        self.profiler.start_frame(whence)
+        try:
+            # this is now the frame on the screen
+            self._rgbobj = rgbobj
+            self._dst_x, self._dst_y = view._dst_x, view._dst_y
+            with self.profiler.stage('blit'):
+                self.render_image(rgbobj, self._dst_x, self._dst_y)
+            # the canvas is drawn in the geometry of the frame, which is
+            # not the current one if the frame was superseded
+            self._draw_overlays(whence, view)
+            with self.profiler.stage('blit'):
+                self.update_image()
+            self.time_last_redraw = time.time()
+            with self._async_lock:
+                self._async_stats['shown'] += 1
+
+        except Exception as e:
+            self.logger.error("Error redrawing image: %s" % (str(e)))
+
+        finally:
+            self.profiler.end_frame()
+
     def check_cursor_location(self):
         """Check whether the data location of the last known position
         of the cursor has changed.  If so, issue a callback.
@@ -1337,7 +1791,7 @@ class ImageViewBase(Callback.Callbacks):
 
         return data_x, data_y
 
-    def getwin_array(self, order='RGB', alpha=1.0):
+    def getwin_array(self, order='RGB', alpha=1.0, out=None):
         """Get Numpy data array for display window.
 
         Parameters
@@ -1348,6 +1802,10 @@ class ImageViewBase(Callback.Callbacks):
         alpha : float
             Opacity.
 
+        out : ndarray or None
+            If given, a ``uint8`` array of the window size and depth to
+            render into; otherwise a new array is allocated.
+
         Returns
         -------
         outarr : ndarray
@@ -1360,35 +1818,79 @@ class ImageViewBase(Callback.Callbacks):
         # Prepare data array for rendering
         data = self._rgbobj.get_array(order)
 
-        # NOTE [A]
-        height, width, depth = data.shape
-
         imgwin_wd, imgwin_ht = self.get_window_size()
 
         # create RGBA array for output
-        outarr = numpy.zeros((imgwin_ht, imgwin_wd, depth), dtype='uint8')
+        if out is None:
+            outarr = numpy.empty((imgwin_ht, imgwin_wd, depth),
+                                 dtype=numpy.uint8)
+        else:
+            outarr = out
+            assert outarr.shape == (imgwin_ht, imgwin_wd, depth), \
+                   ImageViewError("Output array shape %s doesn't match "
+                                  "window" % (str(outarr.shape)))
 
-        # fill image array with the background color
+        # fill image array with the background color (in one pass)
         r, g, b = self.img_bg
         bgval = dict(A=int(255*alpha), R=int(255*r), G=int(255*g), B=int(255*b))
+        outarr[...] = numpy.array([bgval[c] for c in order],
+                                  dtype=numpy.uint8)
+
+        # overlay our data, clipped to the window
+        ht, wd = data.shape[:2]
+        dst_x, dst_y = int(round(self._dst_x)), int(round(self._dst_y))
+        x0, y0 = max(0, -dst_x), max(0, -dst_y)
+        x1, y1 = min(wd, imgwin_wd - dst_x), min(ht, imgwin_ht - dst_y)
+        if (x1 <= x0) or (y1 <= y0):
+            return outarr
+        src = data[y0:y1, x0:x1, :]
+        dst = outarr[dst_y+y0:dst_y+y1, dst_x+x0:dst_x+x1, :]
+
+        if 'A' in order:
+            # NOTE: the alpha channel of the backing image is only ever
+            # 0 (not covered) or 255 (filled by an overlay), so the
+            # window alpha blend reduces to a masked copy of the color
+            # channels, leaving the background where nothing was drawn
+            a_idx = order.index('A')
+            slc = slice(1, 4) if a_idx == 0 else slice(0, 3)
+            mask = (src[:, :, a_idx] != 0)[:, :, numpy.newaxis]
+            numpy.copyto(dst[:, :, slc], src[:, :, slc], where=mask)
+        else:
+            dst[...] = src
+
+        return outarr
 
-        for i in range(len(order)):
-            outarr[:, :, i] = bgval[order[i]]
+    def getwin_view(self, order='RGB', alpha=1.0):
+        """Like :meth:`getwin_array`, but renders into a window buffer
+        that belongs to this viewer and is only reallocated when the
+        window size or `order` changes.
 
-        # overlay our data
-        trcalc.overlay_image(outarr, (self._dst_x, self._dst_y),
-                             data, flipy=False, fill=False, copy=False)
+        The returned array is overwritten by the next call, so backends
+        should use it to update their surface right away and not keep it.
+        """
+        order = order.upper()
+        imgwin_wd, imgwin_ht = self.get_window_size()
+        shape = (imgwin_ht, imgwin_wd, len(order))
+        if (self._winarr is None) or (self._winarr.shape != shape):
+            self._winarr = numpy.empty(shape, dtype=numpy.uint8)
 
-        return outarr
+        return self.getwin_array(order=order, alpha=alpha, out=self._winarr)
 
-    def getwin_buffer(self, order='RGB'):
+    def getwin_buffer(self, order='RGB', alpha=1.0, copy=True):
         """Same as :meth:`getwin_array`, but with the output array converted
         to C-order Python bytes.
 
+        If `copy` is False, a read-only `memoryview` of the buffer from
+        :meth:`getwin_view` is returned instead, which can be handed to
+        anything that takes a buffer without copying the data.
         """
-        outarr = self.getwin_array(order=order)
+        if copy:
+            outarr = self.getwin_array(order=order, alpha=alpha)
+            return outarr.tobytes(order='C')
 
-        return outarr.tobytes(order='C')
+        outarr = self.getwin_view(order=order, alpha=alpha).view()
+        outarr.flags.writeable = False
+        return memoryview(outarr)
 
     def get_datarect(self):
         """Get the approximate bounding box of the displayed image.
@@ -1472,6 +1974,10 @@ class ImageViewBase(Callback.Callbacks):
                 2. Color mapping has changed
                 3. Graphical overlays have changed
 
+            Images on the canvas other than our own are composited
+            again whenever they are changed, added or removed, whatever
+            the value of `whence`.
+
         Returns
         -------
         rgbobj : `~ginga.RGBMap.RGBPlanes`
@@ -1494,27 +2000,66 @@ class ImageViewBase(Callback.Callbacks):
             depth = len(order)
             rgba = numpy.zeros((ht, wd, depth), dtype=numpy.uint8)
             self._rgbarr = rgba
+            self._rgbarr_base = None
+
+        # Composite the image layers: our own image over the background,
+        # then any other images on the canvas over that.  Each layer is
+        # only made again if something it depends on has changed.
+        base_objs, image_objs = self._get_image_layers()
+        composited = False
+        with self.profiler.stage('composite'):
+            key = self._get_layer_key(base_objs)
+            if ((whence <= 2.0) or (self._rgbarr_base is None) or
+                    not self._same_layer_key(key, self._layer_keys['base'])):
+                self._rgbarr_base = numpy.copy(self._rgbarr)
+                self._composite_layer(base_objs, self._rgbarr_base, whence,
+                                      self._layer_keys['base'])
+                self._layer_keys['base'] = self._get_layer_key(base_objs)
+                self._rgbarr2 = None
+
+            key = self._get_layer_key(image_objs)
+            if ((self._rgbarr2 is None) or
+                    not self._same_layer_key(key,
+                                             self._layer_keys['images'])):
+                if len(image_objs) == 0:
+                    self._rgbarr2 = self._rgbarr_base
+                else:
+                    self._rgbarr2 = numpy.copy(self._rgbarr_base)
+                    self._composite_layer(image_objs, self._rgbarr2, whence,
+                                          self._layer_keys['images'])
+                self._layer_keys['images'] = self._get_layer_key(image_objs)
+                composited = True
+        if composited:
+            self.profiler.add_bytes('composite', self._rgbarr2.nbytes)
+
+        if (whence <= 2.5) or (self._rgbobj is None) or composited:
+            rotimg = self._rgbarr2
 
-        if (whence <= 2.0) or (self._rgbarr2 is None):
-            # Apply any RGB image overlays
-            self._rgbarr2 = numpy.copy(self._rgbarr)
-            self.overlay_images(self.private_canvas, self._rgbarr2,
-                                whence=whence)
+            # Apply any viewing transformations or rotations
+            # if not applied earlier
+            with self.profiler.stage('rotate'):
+                rotimg = self.apply_transforms(rotimg,
+                                               self.t_['rot_deg'])
+                rotimg = numpy.ascontiguousarray(rotimg)
 
             # convert to output ICC profile, if one is specified
             output_profile = self.t_.get('icc_output_profile', None)
             if output_profile is not None:
-                self.convert_via_profile(self._rgbarr2, order,
-                                         'working', output_profile)
-
-        if (whence <= 2.5) or (self._rgbobj is None):
-            rotimg = self._rgbarr2
-
-            # Apply any viewing transformations or rotations
-            # if not applied earlier
-            rotimg = self.apply_transforms(rotimg,
-                                           self.t_['rot_deg'])
-            rotimg = numpy.ascontiguousarray(rotimg)
+                if numpy.may_share_memory(rotimg, self._rgbarr2):
+                    # don't convert the backing image itself
+                    rotimg = numpy.copy(rotimg)
+
+                # only the part that shows in the window is converted
+                ht, wd = rotimg.shape[:2]
+                dst_x, dst_y = int(self._dst_x), int(self._dst_y)
+                x0, y0 = max(0, -dst_x), max(0, -dst_y)
+                x1 = min(wd, win_wd - dst_x)
+                y1 = min(ht, win_ht - dst_y)
+                if (x1 > x0) and (y1 > y0):
+                    with self.profiler.stage('icc'):
+                        self.convert_via_profile(rotimg[y0:y1, x0:x1, :],
+                                                 order, 'working',
+                                                 output_profile)
 
             self._rgbobj = RGBMap.RGBPlanes(rotimg, order)
 
@@ -1523,6 +2068,66 @@ class ImageViewBase(Callback.Callbacks):
             (time_end - time_start)))
         return self._rgbobj
 
+    def _get_image_layers(self):
+        # the image objects on the canvas, in drawing order, split into
+        # our own image (if it is at the bottom) and the others
+        objs = []
+        self._collect_images(self.private_canvas, objs)
+        if len(objs) > 0 and objs[0] is self._imgobj:
+            return objs[:1], objs[1:]
+        return [], objs
+
+    def _collect_images(self, canvas, objs):
+        if not hasattr(canvas, 'objects'):
+            return
+        for obj in canvas.get_objects():
+            if hasattr(obj, 'draw_image'):
+                objs.append(obj)
+            elif obj.is_compound() and (obj != canvas):
+                self._collect_images(obj, objs)
+
+    def _get_layer_key(self, objs):
+        # Summarizes what the composited image objects `objs` depend on:
+        # their placement, and the cached cutouts and colored arrays,
+        # which the objects replace when their image or look changes.
+        # The objects and arrays themselves are kept, rather than their
+        # ids (which can be reused once they are freed), and compared by
+        # identity (see _same_layer_key).  Returns None if the layer must
+        # always be made again.
+        key = []
+        for obj in objs:
+            if not obj.optimize:
+                return None
+            cache = obj.get_cache(self)
+            geom = (obj.x, obj.y, obj.scale_x, obj.scale_y)
+            refs = (obj.image, cache.cutout, cache.get('rgbarr', None))
+            key.append((obj, geom, refs, (obj.alpha, cache.cvs_pos)))
+        return tuple(key)
+
+    def _same_layer_key(self, key, old_key):
+        # True if nothing the layer with `old_key` was made for has changed
+        if (key is None) or (old_key is None) or (len(key) != len(old_key)):
+            return False
+        for (obj, geom, refs, vals), (obj2, geom2, refs2, vals2) in zip(
+                key, old_key):
+            if ((obj is not obj2) or (geom != geom2) or (vals != vals2) or
+                    not all([ref is ref2 for ref, ref2 in zip(refs, refs2)])):
+                return False
+        return True
+
+    def _composite_layer(self, objs, dstarr, whence, old_key):
+        geoms = {}
+        if old_key is not None:
+            geoms = dict([(id(k[0]), k[1]) for k in old_key])
+        for obj in objs:
+            _whence = whence
+            geom = (obj.x, obj.y, obj.scale_x, obj.scale_y)
+            if geoms.get(id(obj), geom) != geom:
+                # moved or scaled since it was last composited: needs
+                # a new cutout
+                _whence = 0.0
+            obj.draw_image(self, dstarr, whence=_whence)
+
     def _calc_bg_dimensions(self, scale_x, scale_y,
                             pan_x, pan_y, win_wd, win_ht):
 
@@ -1644,9 +2249,9 @@ class ImageViewBase(Callback.Callbacks):
         if rot_deg != 0:
             # This is the slowest part of the rendering--install the OpenCv or pyopencl
             # packages to speed it up
-            data = numpy.ascontiguousarray(data)
-            data = trcalc.rotate_clip(data, -rot_deg, out=data,
-                                      logger=self.logger)
+            interp = self.t_.get('rotate_interpolation', 'basic')
+            data = trcalc.rotate_clip(data, -rot_deg, logger=self.logger,
+                                      interpolation=interp)
 
         split2_time = time.time()
 
@@ -1721,21 +2326,19 @@ class ImageViewBase(Callback.Callbacks):
         proof_intent = self.t_.get('icc_proof_intent', 'perceptual')
         use_black_pt = self.t_.get('icc_black_point_compensation', False)
 
-        try:
-            rgbobj = RGBMap.RGBPlanes(data_np, order)
-            arr_np = rgbobj.get_array('RGB')
-
-            arr = rgb_cms.convert_profile_fromto(arr_np, inprof_name, outprof_name,
-                                                 to_intent=to_intent,
-                                                 proof_name=proofprof_name,
-                                                 proof_intent=proof_intent,
-                                                 use_black_pt=use_black_pt)
-            ri, gi, bi = rgbobj.get_order_indexes('RGB')
+        if not rgb_cms.have_cms:
+            return
 
-            out = data_np
-            out[..., ri] = arr[..., 0]
-            out[..., gi] = arr[..., 1]
-            out[..., bi] = arr[..., 2]
+        try:
+            # the conversion is done in place through a cached 3D
+            # color lookup table
+            lut = rgb_cms.get_lut(inprof_name, outprof_name,
+                                  to_intent=to_intent,
+                                  proof_name=proofprof_name,
+                                  proof_intent=proof_intent,
+                                  use_black_pt=use_black_pt,
+                                  size=self.t_.get('icc_lut_size', 33))
+            lut.convert(data_np, order=order)
 
             self.logger.debug("Converted from '%s' to '%s' profile" % (
                 inprof_name, outprof_name))
@@ -2322,6 +2925,19 @@ class ImageViewBase(Callback.Callbacks):
     def set_name(self, name):
         """Set viewer name."""
         self.name = name
+        self.profiler.name = name
+
+    def get_profiler(self):
+        """Get the render profiler of this viewer.
+
+        Returns
+        -------
+        profiler : `~ginga.util.profiler.RenderProfiler`
+            Records per-stage redraw timings when the ``profile_render``
+            setting is True.
+
+        """
+        return self.profiler
 
     def get_scale_limits(self):
         """Get scale limits.
@@ -2604,7 +3220,15 @@ class ImageViewBase(Callback.Callbacks):
         if image is None:
             return
 
-        loval, hival = autocuts.calc_cut_levels(image)
+        # the auto cut levels of the images shown recently are remembered
+        state = self._render_states.get_state(image, create=True)
+        key = self._get_autocuts_key(image, autocuts)
+        if state is not None and state.get('autocuts_key', None) == key:
+            loval, hival = state.autocuts
+        else:
+            loval, hival = autocuts.calc_cut_levels(image)
+            if state is not None:
+                state.setvals(autocuts_key=key, autocuts=(loval, hival))
 
         # this will invoke cut_levels_cb()
         self.t_.set(cuts=(loval, hival))
@@ -2614,6 +3238,12 @@ class ImageViewBase(Callback.Callbacks):
         if self.t_['autocuts'] == 'once':
             self.t_.set(autocuts='off')
 
+    def _get_autocuts_key(self, image, autocuts):
+        params = [(param.name, getattr(autocuts, param.name, None))
+                  for param in autocuts.get_params_metadata()]
+        return (str(autocuts), params,
+                list(getattr(image, 'naxispath', [])))
+
     def auto_levels_cb(self, setting, value):
         """Handle callback related to changes in auto-cut levels."""
         # Did we change the method?
@@ -24,6 +24,16 @@ class LayerImage(object):
         self.compose_types = ('alpha', 'rgb')
         self.compose = 'alpha'
 
+        # incremental compositing state: the float32 composite buffer,
+        # the alphas that went into it and the compose type used
+        self._composite = None
+        self._composite_alphas = []
+        self._composite_type = None
+        self._incr_count = 0
+        # number of incremental alpha updates before a full recompose
+        # (bounds the accumulation of float round-off)
+        self.max_incremental = 32
+
     def _insert_layer(self, idx, image, alpha=None, name=None):
         if alpha is None:
             alpha = 1.0
@@ -32,6 +42,7 @@ class LayerImage(object):
             self.cnt += 1
         bnch = Bunch.Bunch(image=image, alpha=alpha, name=name)
         self._layer.insert(idx, bnch)
+        self._invalidate_composite()
 
     def insert_layer(self, idx, image, alpha=None, name=None,
                     compose=True):
@@ -50,6 +61,7 @@ class LayerImage(object):
 
     def delete_layer(self, idx, compose=True):
         self._layer.pop(idx)
+        self._invalidate_composite()
 
         if compose:
             self.compose_layers()
@@ -121,75 +133,130 @@ class LayerImage(object):
             return res
 
 
+    def _get_alpha(self, layer):
+        alpha = layer.alpha
+        if isinstance(alpha, BaseImage.BaseImage):
+            alpha = alpha.get_data()
+        return alpha
+
+    def _add_contribution(self, result, data, alpha):
+        """Accumulate (alpha * data) into the float32 array (result),
+        in place.  (alpha) can be a scalar or an array.
+        """
+        if numpy.ndim(alpha) == 0:
+            alpha = numpy.float32(alpha)
+        else:
+            alpha = numpy.asarray(alpha, dtype=numpy.float32)
+            if alpha.ndim == 2 and result.ndim == 3:
+                alpha = alpha[:, :, numpy.newaxis]
+        if data.ndim == 2 and result.ndim == 3:
+            # broadcast a monochrome layer to a grey color image
+            data = data[:, :, numpy.newaxis]
+        contrib = numpy.multiply(data, alpha, dtype=numpy.float32)
+        result += contrib
+
+    def _invalidate_composite(self):
+        # the layers changed: the next update composes them all again
+        self._composite = None
+        self._composite_alphas = []
+
+    def _reset_composite(self, result, alphas):
+        self._composite = result
+        self._composite_alphas = alphas
+        self._composite_type = self.compose
+        self._incr_count = 0
+
     def alpha_compose(self):
         start_time = time.time()
         shape = self.get_max_shape()
-        ## ht, wd = shape[:2]
-        ## # alpha can be a scalar or an array, prepare for the appropriate kind
-        ## ashape = self.get_max_shape(entity='alpha')
-        ## if len(ashape) == 0:
-        ##     alpha_used = 0.0
-        ## else:
-        ##     alpha_used = numpy.zeros((ht, wd))
 
         # result holds the result of the composition
-        result = numpy.zeros(shape)
+        result = self._composite
+        if (result is not None and result.shape == tuple(shape) and
+            self._composite_type == 'alpha'):
+            # reuse the existing buffer
+            result.fill(0.0)
+        else:
+            result = numpy.zeros(shape, dtype=numpy.float32)
 
-        cnt = 0
+        alphas = []
         for layer in self._layer:
-            alpha = layer.alpha
-            if isinstance(alpha, BaseImage.BaseImage):
-                alpha = alpha.get_data()
-            #alpha = numpy.clip((1.0 - alpha_used) * alpha, 0.0, 1.0)
-            #mina = numpy.min(alpha)
-            #print "cnt=%d mina=%f" % (cnt, mina)
-            data = layer.image.get_data()
-            result += self.alpha_multiply(alpha, data, shape=shape)
-            ## alpha_used += layer.alpha
-            #numpy.clip(alpha_used, 0.0, 1.0)
-            cnt += 1
+            alpha = self._get_alpha(layer)
+            self._add_contribution(result, layer.image.get_data(), alpha)
+            alphas.append(alpha)
 
+        self._reset_composite(result, alphas)
         self.set_data(result)
         end_time = time.time()
         self.logger.debug("alpha compose=%.4f sec" % (end_time - start_time))
 
-    # def rgb_compose(self):
-    #     slices = []
-    #     start_time = time.time()
-    #     for i in range(len(self._layer)):
-    #         layer = self.get_layer(i)
-    #         data = self.alpha_multiply(layer.alpha, layer.image.get_data())
-    #         slices.append(data)
-    #     split_time = time.time()
-    #     result = numpy.dstack(slices)
-    #     end_time = time.time()
-
-    #     self.set_data(result)
-    #     print "rgb_compose alpha multiply=%.4f sec  dstack=%.4f sec  sec total=%.4f sec" % (
-    #         split_time - start_time, end_time - split_time,
-    #         end_time - start_time)
-
     def rgb_compose(self):
         #num = self.num_layers()
         num = 3
         layer = self.get_layer(0)
         wd, ht = layer.image.get_size()
-        result = numpy.empty((ht, wd, num))
+        shape = (ht, wd, num)
+
+        result = self._composite
+        if (result is None or result.shape != shape or
+            self._composite_type != 'rgb'):
+            result = numpy.empty(shape, dtype=numpy.float32)
 
         start_time = time.time()
+        alphas = []
         for i in range(len(self._layer)):
             layer = self.get_layer(i)
-            alpha = layer.alpha
-            if isinstance(alpha, BaseImage.BaseImage):
-                alpha = alpha.get_data()
-            data = self.alpha_multiply(alpha, layer.image.get_data())
-            result[:, :, i] = data[:, :]
+            alpha = self._get_alpha(layer)
+            numpy.multiply(layer.image.get_data(), alpha,
+                           out=result[:, :, i], casting='unsafe')
+            alphas.append(alpha)
         end_time = time.time()
 
+        self._reset_composite(result, alphas)
         self.set_data(result)
         self.logger.debug("rgb_compose  total=%.4f sec" % (
             end_time - start_time))
 
+    def _can_update(self, lidx):
+        return (self._composite is not None and
+                self._composite_type == self.compose and
+                len(self._composite_alphas) == len(self._layer) and
+                self._incr_count < self.max_incremental and
+                (self.compose != 'rgb' or lidx < self._composite.shape[2]))
+
+    def update_layer_alpha(self, lidx):
+        """Update the composite for a change in the alpha of layer
+        (lidx) only, without recomposing the other layers.
+
+        NOTE: the composite array (our data) is updated in place; use
+        `copy_data` to keep a composite that does not change.
+        """
+        if not self._can_update(lidx):
+            self.compose_layers()
+            return
+
+        start_time = time.time()
+        layer = self._layer[lidx]
+        alpha = self._get_alpha(layer)
+        data = layer.image.get_data()
+        result = self._composite
+
+        if self.compose == 'rgb':
+            numpy.multiply(data, alpha, out=result[:, :, lidx],
+                           casting='unsafe')
+        else:
+            # add in the difference between the new and old contribution
+            delta = numpy.subtract(alpha, self._composite_alphas[lidx],
+                                   dtype=numpy.float32)
+            self._add_contribution(result, data, delta)
+            self._incr_count += 1
+        self._composite_alphas[lidx] = alpha
+
+        self.set_data(result)
+        end_time = time.time()
+        self.logger.debug("update layer alpha=%.4f sec" % (
+            end_time - start_time))
+
     def rgb_decompose(self, image):
         data = image.get_data()
 
@@ -228,7 +295,7 @@ class LayerImage(object):
         layer = self._layer[lidx]
         layer.alpha = val
 
-        self.compose_layers()
+        self.update_layer_alpha(lidx)
 
     def set_alphas(self, vals):
         for lidx in range(len(vals)):
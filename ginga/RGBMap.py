@@ -70,6 +70,13 @@ class RGBMapper(Callback.Callbacks):
     # parameter, which avoids having to allocate a new array for the
     # result
     #
+    # [B] For single band data, the color distribution, shift map,
+    # intensity map and color map are composed into one lookup table per
+    # output order, so that mapping an array is a single gather.
+    #
+
+    # subclasses that map indexes differently must turn this off
+    composite_lut = True
 
     def __init__(self, logger, dist=None):
         Callback.Callbacks.__init__(self)
@@ -84,6 +91,11 @@ class RGBMapper(Callback.Callbacks):
         self.carr = None
         self.sarr = None
         self.scale_pct = 1.0
+        # length of the lookup tables: 256, or 65536 for high dynamic
+        # range (see set_lut_bits)
+        self.lut_len = 256
+        # (key, table) for the composed lookup table, see NOTE [B]
+        self._lut_cache = (None, None)
 
         # For scaling algorithms
         hashsize = 65536
@@ -115,18 +127,85 @@ class RGBMapper(Callback.Callbacks):
         return self.cmap
 
     def calc_cmap(self):
-        clst = self.cmap.clst
-        arr = numpy.array(clst).transpose() * 255.0
-        self.carr = numpy.round(arr).astype('uint8')
+        carr = self.cmap.get_array().transpose()
+        if carr.shape[1] != self.lut_len:
+            carr = self._resample(carr, 1.0)
+        self.carr = carr.astype(numpy.uint8)
 
     def invert_cmap(self, callback=True):
         self.carr = numpy.fliplr(self.carr)
         self.recalc(callback=callback)
 
     def rotate_cmap(self, num, callback=True):
+        # `num` is in steps of a 256 color map
+        num = num * self.lut_len // 256
         self.carr = numpy.roll(self.carr, num, axis=1)
         self.recalc(callback=callback)
 
+    def _resample(self, arr, scale):
+        """Linearly interpolate the table(s) `arr` along the last axis to
+        the length of the lookup tables and multiply by `scale`.
+        """
+        xp = numpy.arange(arr.shape[-1])
+        x = numpy.linspace(0, xp[-1], self.lut_len)
+        res = [numpy.interp(x, xp, row) * scale
+               for row in arr.reshape((-1, len(xp)))]
+        res = numpy.round(numpy.array(res))
+        return res.reshape(arr.shape[:-1] + (self.lut_len, ))
+
+    def get_lut_bits(self):
+        """
+        Return the resolution of the lookup tables in bits (8, or 16 in
+        high dynamic range mode).
+        """
+        if self.lut_len > 256:
+            return 16
+        return 8
+
+    def set_lut_bits(self, bits, callback=True):
+        """
+        Set the resolution of the lookup tables.
+
+        With 8 bits the color distribution maps the data to 256 levels,
+        which are then shifted, stretched and colored.  With 16 bits
+        (high dynamic range mode) there are 65536 levels, so that heavy
+        stretching of the color map on deep images does not posterize
+        the result; the color and intensity maps are interpolated to
+        that length.  The output is 8 bits per channel in both cases.
+        """
+        if bits not in (8, 16):
+            raise RGBMapError("LUT bits must be 8 or 16 (got %s)" % (
+                str(bits)))
+        lut_len = 1 << bits
+        if lut_len == self.lut_len:
+            return
+        self.lut_len = lut_len
+
+        self._fit_dist(self.dist)
+
+        self.reset_sarr(callback=False)
+        if self.cmap is not None:
+            self.calc_cmap()
+        if self.imap is not None:
+            self.calc_imap()
+        if self.carr is not None:
+            self.recalc(callback=callback)
+
+    def get_lut_dtype(self):
+        """
+        Return the type of the indexes into the lookup tables.
+        """
+        return ColorDist.get_index_dtype(self.lut_len)
+
+    def get_index_dtype(self):
+        """
+        Return the smallest type that holds the indexes expected by
+        `get_rgbarray` (0 .. hash size - 1).  Callers should pass index
+        arrays of this type, to avoid carrying wide integers through the
+        color mapping.
+        """
+        return self.dist.get_index_dtype()
+
     def restore_cmap(self, callback=True):
         self.reset_sarr(callback=False)
         self.calc_cmap()
@@ -146,7 +225,9 @@ class RGBMapper(Callback.Callbacks):
         """
         assert (index >= 0) and (index < 256), \
                RGBMapError("Index must be in range 0-255 !")
-        index = self.sarr[index].clip(0, 255)
+        if self.lut_len != 256:
+            index = index * (self.lut_len - 1) // 255
+        index = self.sarr[index].clip(0, self.lut_len - 1)
         return (self.arr[0][index],
                 self.arr[1][index],
                 self.arr[2][index])
@@ -169,19 +250,22 @@ class RGBMapper(Callback.Callbacks):
         return self.imap
 
     def calc_imap(self):
-        arr = numpy.array(self.imap.ilst) * 255.0
-        self.iarr = numpy.round(arr).astype('uint')
+        iarr = self.imap.get_array()
+        if len(iarr) != self.lut_len:
+            iarr = self._resample(iarr, (self.lut_len - 1) / (len(iarr) - 1.0))
+        self.iarr = iarr.astype(self.get_lut_dtype())
 
     def reset_sarr(self, callback=True):
-        self.sarr = numpy.arange(256)
+        self.sarr = numpy.arange(self.lut_len, dtype=self.get_lut_dtype())
         self.scale_pct = 1.0
         if callback:
             self.make_callback('changed')
 
     def set_sarr(self, sarr, callback=True):
-        assert len(sarr) == 256, \
-               RGBMapError("shift map length %d != 256" % (len(sarr)))
-        self.sarr = sarr.astype('uint')
+        assert len(sarr) == self.lut_len, \
+               RGBMapError("shift map length %d != %d" % (
+            len(sarr), self.lut_len))
+        self.sarr = sarr.astype(self.get_lut_dtype())
         self.scale_pct = 1.0
 
         if callback:
@@ -208,6 +292,8 @@ class RGBMapper(Callback.Callbacks):
         return self.dist.get_hash_size()
 
     def set_hash_size(self, size, callback=True):
+        # the hash must have at least one entry per color level
+        size = max(size, self.lut_len)
         self.dist.set_hash_size(size)
         if callback:
             self.make_callback('changed')
@@ -224,13 +310,21 @@ class RGBMapper(Callback.Callbacks):
         """
         return self.dist
 
+    def _fit_dist(self, dist):
+        # make the distribution produce one level per LUT entry
+        if dist.colorlen != self.lut_len:
+            dist.colorlen = self.lut_len
+            dist.set_hash_size(max(dist.get_hash_size(), self.lut_len))
+
     def set_dist(self, dist, callback=True):
+        self._fit_dist(dist)
         self.dist = dist
         if callback:
             self.make_callback('changed')
 
     def set_hash_algorithm(self, name, callback=True, **kwdargs):
         hashsize = self.dist.get_hash_size()
+        kwdargs.setdefault('colorlen', self.lut_len)
         dist = ColorDist.get_dist(name)(hashsize, **kwdargs)
         self.set_dist(dist, callback=callback)
 
@@ -243,19 +337,26 @@ class RGBMapper(Callback.Callbacks):
         cs = cs.upper()
         return [ order.index(c) for c in cs ]
 
+    def _clip_index(self, idx):
+        # Clip index array `idx` in place to the range of the lookup
+        # tables, unless its type cannot hold values beyond the end
+        # (e.g. uint8 indexes into 256-entry tables)
+        maxidx = self.lut_len - 1
+        if (idx.dtype.kind != 'u') or (numpy.iinfo(idx.dtype).max > maxidx):
+            idx.clip(0, maxidx, out=idx)
+
     def _get_rgbarray(self, idx, rgbobj, image_order=''):
-        # NOTE: data is assumed to be in the range 0-255 at this point
-        # but clip as a precaution
+        # NOTE: data is assumed to be in the range 0-255 (0-65535 for
+        # 16-bit LUTs) at this point but clip as a precaution
         # See NOTE [A]: idx is always an array calculated in the caller and
         #    discarded afterwards
-        # idx = idx.clip(0, 255)
-        idx.clip(0, 255, out=idx)
+        self._clip_index(idx)
 
         # run it through the shift array and clip the result
         # See NOTE [A]
         # idx = self.sarr[idx].clip(0, 255)
         idx = self.sarr[idx]
-        idx.clip(0, 255, out=idx)
+        self._clip_index(idx)
 
         ri, gi, bi = self.get_order_indexes(rgbobj.get_order(), 'RGB')
         out = rgbobj.rgbarr
@@ -308,6 +409,13 @@ class RGBMapper(Callback.Callbacks):
 
         res = RGBPlanes(out, order)
 
+        if ((image_order is None) or (len(image_order) < 3)):
+            lut = self._get_composite_lut(order)
+            if lut is not None:
+                # See NOTE [B]
+                self._take(lut, idx, out)
+                return res
+
         # set alpha channel
         if res.hasAlpha:
             aa = res.get_slice('A')
@@ -322,6 +430,42 @@ class RGBMapper(Callback.Callbacks):
     def get_hasharray(self, idx):
         return self.dist.hash_array(idx)
 
+    def _get_composite_lut(self, order):
+        """Return a table that maps the indexes passed to `get_rgbarray`
+        straight to pixels in `order`, or None if that is not possible.
+        """
+        if (not self.composite_lut) or (not self.dist.static_hash) or \
+               (self.dist.hash is None) or (self.arr is None):
+            return None
+        # the tables are replaced (not modified) when they change
+        key = (order, self.dist.hash, self.sarr, self.arr)
+        old_key, lut = self._lut_cache
+        if (old_key is not None) and (old_key[0] == order) and \
+               all([a is b for a, b in zip(old_key[1:], key[1:])]):
+            return lut
+
+        maxidx = self.lut_len - 1
+        cidx = self.sarr[self.dist.hash.clip(0, maxidx)].clip(0, maxidx)
+        lut = numpy.empty((len(cidx), len(order)), dtype=numpy.uint8)
+        for i, c in enumerate(order.upper()):
+            if c == 'A':
+                lut[:, i] = 255
+            else:
+                lut[:, i] = self.arr['RGB'.index(c)][cidx]
+        self._lut_cache = (key, lut)
+        return lut
+
+    def _take(self, lut, idx, out):
+        # NOTE: mode='clip' also clips the indexes to the table size
+        if not numpy.can_cast(idx.dtype, numpy.intp):
+            idx = idx.astype(numpy.intp)
+        if (lut.shape[1] == 4) and out.flags.c_contiguous:
+            # gather whole pixels as 32-bit words
+            numpy.take(lut.view(numpy.uint32).reshape(-1), idx, mode='clip',
+                       out=out.view(numpy.uint32).reshape(idx.shape))
+        else:
+            numpy.take(lut, idx, axis=0, mode='clip', out=out)
+
     def _shift(self, sarr, pct, rotate=False):
         n = len(sarr)
         num = int(n * pct)
@@ -348,8 +492,8 @@ class RGBMapper(Callback.Callbacks):
 
     def shift(self, pct, rotate=False, callback=True):
         work = self._shift(self.sarr, pct, rotate=rotate)
-        assert len(work) == 256, \
-               RGBMapError("shifted shift map is != 256")
+        assert len(work) == self.lut_len, \
+               RGBMapError("shifted shift map is != %d" % (self.lut_len))
         self.sarr = work
         if callback:
             self.make_callback('changed')
@@ -357,7 +501,9 @@ class RGBMapper(Callback.Callbacks):
     def scale_and_shift(self, scale_pct, shift_pct, callback=True):
         """Stretch and/or shrink the color map via altering the shift map.
         """
-        self.sarr = numpy.arange(256)
+        lut_len = self.lut_len
+        dtype = self.get_lut_dtype()
+        self.sarr = numpy.arange(lut_len, dtype=dtype)
 
         #print "amount=%.2f location=%.2f" % (scale_pct, shift_pct)
         # limit shrinkage to 5% of original size
@@ -366,26 +512,27 @@ class RGBMapper(Callback.Callbacks):
 
         work = self._stretch(self.sarr, scale)
         n = len(work)
-        if n < 256:
+        if n < lut_len:
             # pad on the lowest and highest values of the shift map
-            m = (256 - n) // 2 + 1
-            barr = numpy.array([0]*m)
-            tarr = numpy.array([255]*m)
+            m = (lut_len - n) // 2 + 1
+            barr = numpy.zeros(m, dtype=dtype)
+            tarr = numpy.full(m, lut_len - 1, dtype=dtype)
             work = numpy.concatenate([barr, work, tarr])
-            work = work[:256]
+            work = work[:lut_len]
 
         # we are mimicing ds9's stretch and shift algorithm here.
         # ds9 seems to cut the center out of the stretched array
         # BEFORE shifting
         n = len(work) // 2
-        work = work[n-128:n+128].astype('uint')
-        assert len(work) == 256, \
-               RGBMapError("scaled shift map is != 256")
+        half = lut_len // 2
+        work = work[n-half:n+half].astype(dtype)
+        assert len(work) == lut_len, \
+               RGBMapError("scaled shift map is != %d" % (lut_len))
 
         # shift map according to the shift_pct
         work = self._shift(work, shift_pct)
-        assert len(work) == 256, \
-               RGBMapError("shifted shift map is != 256")
+        assert len(work) == lut_len, \
+               RGBMapError("shifted shift map is != %d" % (lut_len))
 
         self.sarr = work
         if callback:
@@ -399,6 +546,7 @@ class RGBMapper(Callback.Callbacks):
         self.scale_and_shift(self.scale_pct, 0.0, callback=callback)
 
     def copy_attributes(self, dst_rgbmap):
+        dst_rgbmap.set_lut_bits(self.get_lut_bits(), callback=False)
         dst_rgbmap.set_cmap(self.cmap, callback=False)
         dst_rgbmap.set_imap(self.imap, callback=False)
         dst_rgbmap.set_hash_algorithm(str(self.dist), callback=False)
@@ -419,6 +567,8 @@ class NonColorMapper(RGBMapper):
     This mapper allows changing of color distribution and contrast
     adjustment, but does no coloring.
     """
+    composite_lut = False
+
     def __init__(self, logger, dist=None):
         super(NonColorMapper, self).__init__(logger)
 
@@ -430,12 +580,12 @@ class NonColorMapper(RGBMapper):
         # but clip as a precaution
         # See NOTE [A]: idx is always an array calculated in the caller and
         #    discarded afterwards
-        idx.clip(0, 255, out=idx)
+        self._clip_index(idx)
 
         # run it through the shift array and clip the result
         # See NOTE [A]
         idx = self.sarr[idx]
-        idx.clip(0, 255, out=idx)
+        self._clip_index(idx)
 
         ri, gi, bi = self.get_order_indexes(rgbobj.get_order(), 'RGB')
         rj, gj, bj = self.get_order_indexes(image_order, 'RGB')
@@ -455,6 +605,8 @@ class PassThruRGBMapper(RGBMapper):
     coloring.  It is thus the most efficient one to use for maximum
     speed rendering of "finished" RGB data.
     """
+    composite_lut = False
+
     def __init__(self, logger, dist=None):
         super(PassThruRGBMapper, self).__init__(logger)
 
@@ -471,7 +623,7 @@ class PassThruRGBMapper(RGBMapper):
         # but clip as a precaution
         # See NOTE [A]: idx is always an array calculated in the caller and
         #    discarded afterwards
-        idx.clip(0, 255, out=idx)
+        self._clip_index(idx)
 
         # bypass the shift array and skip color mapping,
         # index is the final data
@@ -48,8 +48,13 @@ class ImageViewAgg(ImageView.ImageViewBase):
         self.logger.debug("redraw surface")
 
         # get window contents as a buffer and load it into the AGG surface
-        rgb_buf = self.getwin_buffer(order=self.rgb_order)
-        canvas.frombytes(rgb_buf)
+        # (the buffer is handed over without making a bytes copy)
+        rgb_buf = self.getwin_buffer(order=self.rgb_order, copy=False)
+        try:
+            canvas.frombytes(rgb_buf)
+        except TypeError:
+            # older aggdraw only accepts bytes
+            canvas.frombytes(rgb_buf.tobytes())
 
         # for debugging
         #self.save_rgb_image_as_file('/tmp/temp.png', format='png')
@@ -104,7 +109,8 @@ class ImageViewAgg(ImageView.ImageViewBase):
         # make a PIL image
         image = PILimage.fromarray(arr8)
 
-        image.save(obuf, format=format, quality=quality)
+        with self.profiler.stage('encode'):
+            image.save(obuf, format=format, quality=quality)
         if not (output is None):
             return None
         return obuf.getvalue()
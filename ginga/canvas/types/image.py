@@ -12,7 +12,7 @@ from ginga.canvas.CanvasObject import (CanvasObjectBase, _bool, _color,
                                        colors_plus_none)
 from ginga.misc.ParamSet import Param
 from ginga.misc import Bunch
-from ginga import trcalc
+from ginga import trcalc, colors
 
 from .mixins import OnePointMixin
 
@@ -95,7 +95,8 @@ class Image(OnePointMixin, CanvasObjectBase):
         self._zorder = zorder
         for viewer in self._cache:
             viewer.reorder_layers()
-            viewer.redraw(whence=2)
+            # the viewer recomposites the images in the new order
+            viewer.redraw(whence=3)
 
     def in_cache(self, viewer):
         return viewer in self._cache
@@ -118,12 +119,8 @@ class Image(OnePointMixin, CanvasObjectBase):
         Note that actual insertion of the image into the output is
         handled in `draw_image()`
         """
-        cache = self.get_cache(viewer)
-
-        if not cache.drawn:
-            cache.drawn = True
-            viewer.redraw(whence=2)
-
+        # (the image itself is composited by the viewer when it makes
+        # its RGB frame, see draw_image())
         cpoints = self.get_cpoints(viewer)
         cr = viewer.renderer.setup_cr(self)
 
@@ -145,70 +142,10 @@ class Image(OnePointMixin, CanvasObjectBase):
         image_order = self.image.get_order()
 
         if (whence <= 0.0) or (cache.cutout is None) or (not self.optimize):
-            # get extent of our data coverage in the window
-            ((x0, y0), (x1, y1), (x2, y2), (x3, y3)) = viewer.get_pan_rect()
-            xmin = int(min(x0, x1, x2, x3))
-            ymin = int(min(y0, y1, y2, y3))
-            xmax = int(numpy.ceil(max(x0, x1, x2, x3)))
-            ymax = int(numpy.ceil(max(y0, y1, y2, y3)))
-
-            # destination location in data_coords
-            #dst_x, dst_y = self.x, self.y + ht
-            dst_x, dst_y = self.crdmap.to_data(self.x, self.y)
-
-            a1, b1, a2, b2 = 0, 0, self.image.width, self.image.height
-
-            # calculate the cutout that we can make and scale to merge
-            # onto the final image--by only cutting out what is necessary
-            # this speeds scaling greatly at zoomed in sizes
-            ((dst_x, dst_y), (a1, b1), (a2, b2)) = \
-                 trcalc.calc_image_merge_clip((xmin, ymin), (xmax, ymax),
-                                              (dst_x, dst_y),
-                                              (a1, b1), (a2, b2))
-
-            # is image completely off the screen?
-            if (a2 - a1 <= 0) or (b2 - b1 <= 0):
-                # no overlay needed
-                return
-
-            # cutout and scale the piece appropriately by the viewer scale
-            scale_x, scale_y = viewer.get_scale_xy()
-            # scale additionally by our scale
-            _scale_x, _scale_y = scale_x * self.scale_x, scale_y * self.scale_y
-
-            res = self.image.get_scaled_cutout2((a1, b1), (a2, b2),
-                                                (_scale_x, _scale_y),
-                                                #flipy=self.flipy,
-                                                method=self.interpolation)
-
-            # don't ask for an alpha channel from overlaid image if it
-            # doesn't have one
-            ## if ('A' in dst_order) and not ('A' in image_order):
-            ##     dst_order = dst_order.replace('A', '')
-
-            ## if dst_order != image_order:
-            ##     # reorder result to match desired rgb_order by backend
-            ##     cache.cutout = trcalc.reorder_image(dst_order, res.data,
-            ##                                          image_order)
-            ## else:
-            ##     cache.cutout = res.data
-            cache.cutout = res.data
-
-            # calculate our offset from the pan position
-            pan_x, pan_y = viewer.get_pan()
-            pan_off = viewer.data_off
-            pan_x, pan_y = pan_x + pan_off, pan_y + pan_off
-            off_x, off_y = dst_x - pan_x, dst_y - pan_y
-            # scale offset
-            off_x *= scale_x
-            off_y *= scale_y
-
-            # dst position in the pre-transformed array should be calculated
-            # from the center of the array plus offsets
-            ht, wd, dp = dstarr.shape
-            cvs_x = int(round(wd / 2.0  + off_x))
-            cvs_y = int(round(ht / 2.0  + off_y))
-            cache.cvs_pos = (cvs_x, cvs_y)
+            with viewer.profiler.stage('cutout'):
+                if not self._calc_cutout(viewer, dstarr, cache):
+                    # no overlay needed
+                    return
 
         # composite the image into the destination array at the
         # calculated position
@@ -216,8 +153,89 @@ class Image(OnePointMixin, CanvasObjectBase):
                              dst_order=dst_order, src_order=image_order,
                              alpha=self.alpha, flipy=False)
 
+    def _calc_cutout(self, viewer, dstarr, cache, state=None):
+        """Cut out and scale the part of the image that is visible in
+        `viewer` into ``cache.cutout``, and calculate its position in
+        `dstarr` (``cache.cvs_pos``).  Returns False if the image is
+        completely off the screen.  If the saved render state `state`
+        (see `NormImage.get_render_state`) has a cutout of the same
+        part at the same scale, that is used instead.
+        """
+        # get extent of our data coverage in the window
+        ((x0, y0), (x1, y1), (x2, y2), (x3, y3)) = viewer.get_pan_rect()
+        xmin = int(min(x0, x1, x2, x3))
+        ymin = int(min(y0, y1, y2, y3))
+        xmax = int(numpy.ceil(max(x0, x1, x2, x3)))
+        ymax = int(numpy.ceil(max(y0, y1, y2, y3)))
+
+        # destination location in data_coords
+        #dst_x, dst_y = self.x, self.y + ht
+        dst_x, dst_y = self.crdmap.to_data(self.x, self.y)
+
+        a1, b1, a2, b2 = 0, 0, self.image.width, self.image.height
+
+        # calculate the cutout that we can make and scale to merge
+        # onto the final image--by only cutting out what is necessary
+        # this speeds scaling greatly at zoomed in sizes
+        ((dst_x, dst_y), (a1, b1), (a2, b2)) = \
+             trcalc.calc_image_merge_clip((xmin, ymin), (xmax, ymax),
+                                          (dst_x, dst_y),
+                                          (a1, b1), (a2, b2))
+
+        # is image completely off the screen?
+        if (a2 - a1 <= 0) or (b2 - b1 <= 0):
+            return False
+
+        # cutout and scale the piece appropriately by the viewer scale
+        scale_x, scale_y = viewer.get_scale_xy()
+        # scale additionally by our scale
+        _scale_x, _scale_y = scale_x * self.scale_x, scale_y * self.scale_y
+
+        cutout_params = ((a1, b1), (a2, b2), (_scale_x, _scale_y),
+                         self.interpolation)
+        if state is not None and state.cutout_params == cutout_params:
+            res = Bunch.Bunch(data=state.cutout)
+        else:
+            res = self.image.get_scaled_cutout2((a1, b1), (a2, b2),
+                                                (_scale_x, _scale_y),
+                                                #flipy=self.flipy,
+                                                method=self.interpolation)
+
+        # don't ask for an alpha channel from overlaid image if it
+        # doesn't have one
+        ## if ('A' in dst_order) and not ('A' in image_order):
+        ##     dst_order = dst_order.replace('A', '')
+
+        ## if dst_order != image_order:
+        ##     # reorder result to match desired rgb_order by backend
+        ##     cache.cutout = trcalc.reorder_image(dst_order, res.data,
+        ##                                          image_order)
+        ## else:
+        ##     cache.cutout = res.data
+        cache.cutout = res.data
+        # geometry of the cutout, for making matching ones (e.g. of the
+        # other slices of a cube during playback)
+        cache.cutout_params = cutout_params
+
+        # calculate our offset from the pan position
+        pan_x, pan_y = viewer.get_pan()
+        pan_off = viewer.data_off
+        pan_x, pan_y = pan_x + pan_off, pan_y + pan_off
+        off_x, off_y = dst_x - pan_x, dst_y - pan_y
+        # scale offset
+        off_x *= scale_x
+        off_y *= scale_y
+
+        # dst position in the pre-transformed array should be calculated
+        # from the center of the array plus offsets
+        ht, wd, dp = dstarr.shape
+        cvs_x = int(round(wd / 2.0  + off_x))
+        cvs_y = int(round(ht / 2.0  + off_y))
+        cache.cvs_pos = (cvs_x, cvs_y)
+        return True
+
     def _reset_cache(self, cache):
-        cache.setvals(cutout=None, drawn=False, cvs_pos=(0, 0))
+        cache.setvals(cutout=None, cutout_params=None, cvs_pos=(0, 0))
         return cache
 
     def reset_optimize(self):
@@ -382,58 +400,19 @@ class NormImage(Image):
             return
 
         cache = self.get_cache(viewer)
+        # a render state restored by set_render_state() is only good
+        # for the first frame
+        state, cache.state = cache.state, None
 
         if (whence <= 0.0) or (cache.cutout is None) or (not self.optimize):
-            # get extent of our data coverage in the window
-            ((x0, y0), (x1, y1), (x2, y2), (x3, y3)) = viewer.get_pan_rect()
-            xmin = int(min(x0, x1, x2, x3))
-            ymin = int(min(y0, y1, y2, y3))
-            xmax = int(numpy.ceil(max(x0, x1, x2, x3)))
-            ymax = int(numpy.ceil(max(y0, y1, y2, y3)))
-
-            # destination location in data_coords
-            dst_x, dst_y = self.crdmap.to_data(self.x, self.y)
-
-            a1, b1, a2, b2 = 0, 0, self.image.width, self.image.height
-
-            # calculate the cutout that we can make and scale to merge
-            # onto the final image--by only cutting out what is necessary
-            # this speeds scaling greatly at zoomed in sizes
-            ((dst_x, dst_y), (a1, b1), (a2, b2)) = \
-                 trcalc.calc_image_merge_clip((xmin, ymin), (xmax, ymax),
-                                              (dst_x, dst_y),
-                                              (a1, b1), (a2, b2))
-
-            # is image completely off the screen?
-            if (a2 - a1 <= 0) or (b2 - b1 <= 0):
-                # no overlay needed
-                return
-
-            # cutout and scale the piece appropriately by viewer scale
-            scale_x, scale_y = viewer.get_scale_xy()
-            # scale additionally by our scale
-            _scale_x, _scale_y = scale_x * self.scale_x, scale_y * self.scale_y
+            with viewer.profiler.stage('cutout'):
+                if not self._calc_cutout(viewer, dstarr, cache, state=state):
+                    # no overlay needed
+                    return
+            viewer.profiler.add_bytes('cutout', cache.cutout.nbytes)
 
-            res = self.image.get_scaled_cutout2((a1, b1), (a2, b2),
-                                                (_scale_x, _scale_y),
-                                                method=self.interpolation)
-            cache.cutout = res.data
-
-            # calculate our offset from the pan position
-            pan_x, pan_y = viewer.get_pan()
-            pan_off = viewer.data_off
-            pan_x, pan_y = pan_x + pan_off, pan_y + pan_off
-            off_x, off_y = dst_x - pan_x, dst_y - pan_y
-            # scale offset
-            off_x *= scale_x
-            off_y *= scale_y
-
-            # dst position in the pre-transformed array should be calculated
-            # from the center of the array plus offsets
-            ht, wd, dp = dstarr.shape
-            cvs_x = int(round(wd / 2.0  + off_x))
-            cvs_y = int(round(ht / 2.0  + off_y))
-            cache.cvs_pos = (cvs_x, cvs_y)
+        if state is not None and cache.cutout is not state.cutout:
+            state = None
 
         if self.rgbmap is not None:
             rgbmap = self.rgbmap
@@ -441,17 +420,29 @@ class NormImage(Image):
             rgbmap = viewer.get_rgbmap()
 
         if (whence <= 1.0) or (cache.prergb is None) or (not self.optimize):
-            # apply visual changes prior to color mapping (cut levels, etc)
-            vmax = rgbmap.get_hash_size() - 1
-            newdata = self.apply_visuals(viewer, cache.cutout, 0, vmax)
-
-            # result becomes an index array fed to the RGB mapper
-            if not numpy.issubdtype(newdata.dtype, numpy.dtype('uint')):
-                newdata = newdata.astype(numpy.uint)
-            idx = newdata
-
-            self.logger.debug("shape of index is %s" % (str(idx.shape)))
-            cache.prergb = idx
+            prergb_key = self._get_prergb_key(viewer, rgbmap)
+            if state is not None and state.prergb_key == prergb_key:
+                cache.prergb = state.prergb
+            else:
+                state = None
+                # apply visual changes prior to color mapping (cut
+                # levels, etc)
+                vmax = rgbmap.get_hash_size() - 1
+                with viewer.profiler.stage('cuts'):
+                    newdata = self.apply_visuals(viewer, cache.cutout, 0,
+                                                 vmax)
+
+                    # result becomes an index array fed to the RGB
+                    # mapper, of the smallest type that holds the hash
+                    # size
+                    dtype = rgbmap.get_index_dtype()
+                    if newdata.dtype != dtype:
+                        newdata = newdata.astype(dtype)
+                idx = newdata
+
+                self.logger.debug("shape of index is %s" % (str(idx.shape)))
+                cache.prergb = idx
+            cache.prergb_key = prergb_key
 
         dst_order = viewer.get_rgb_order()
         image_order = self.image.get_order()
@@ -459,11 +450,17 @@ class NormImage(Image):
         if ('A' in dst_order) and not ('A' in image_order):
             get_order = dst_order.replace('A', '')
 
-        if (whence <= 2.5) or (cache.rgbarr is None) or (not self.optimize):
+        if state is not None and state.rgbarr is not None:
+            # (the viewer drops the RGB array if the color map changed)
+            cache.rgbarr = state.rgbarr
+
+        elif (whence <= 2.5) or (cache.rgbarr is None) or (not self.optimize):
             # get RGB mapped array
-            rgbobj = rgbmap.get_rgbarray(cache.prergb, order=dst_order,
-                                         image_order=image_order)
-            cache.rgbarr = rgbobj.get_array(get_order)
+            with viewer.profiler.stage('lut'):
+                rgbobj = rgbmap.get_rgbarray(cache.prergb, order=dst_order,
+                                             image_order=image_order)
+                cache.rgbarr = rgbobj.get_array(get_order)
+            viewer.profiler.add_bytes('lut', cache.rgbarr.nbytes)
 
         # composite the image into the destination array at the
         # calculated position
@@ -471,6 +468,36 @@ class NormImage(Image):
                              dst_order=dst_order, src_order=get_order,
                              alpha=self.alpha, flipy=False)
 
+    def get_render_state(self, viewer):
+        """Return the arrays of the last frame drawn in `viewer` (a
+        `~ginga.misc.Bunch.Bunch`), or None if there are none.  They can
+        be handed back with `set_render_state` after the image was
+        changed and set again, to save making them again.
+        """
+        cache = self.get_cache(viewer)
+        if cache.cutout is None or cache.prergb is None:
+            return None
+        return Bunch.Bunch(cutout=cache.cutout,
+                           cutout_params=cache.cutout_params,
+                           prergb=cache.prergb, prergb_key=cache.prergb_key,
+                           rgbarr=cache.rgbarr)
+
+    def set_render_state(self, viewer, state):
+        """Offer the render state `state` (from `get_render_state`) for
+        the next frame drawn in `viewer`.  Its arrays are used if the
+        view, cut levels and color map still match.
+        """
+        cache = self.get_cache(viewer)
+        cache.state = state
+
+    def _get_prergb_key(self, viewer, rgbmap):
+        if self.autocuts is not None:
+            autocuts = self.autocuts
+        else:
+            autocuts = viewer.autocuts
+        return (tuple(viewer.t_['cuts']), str(autocuts),
+                rgbmap.get_hash_size())
+
     def apply_visuals(self, viewer, data, vmin, vmax):
         if self.autocuts is not None:
             autocuts = self.autocuts
@@ -484,8 +511,9 @@ class NormImage(Image):
         return newdata
 
     def _reset_cache(self, cache):
-        cache.setvals(cutout=None, prergb=None, rgbarr=None,
-                      drawn=False, cvs_pos=(0, 0))
+        cache.setvals(cutout=None, cutout_params=None, prergb=None,
+                      prergb_key=None, rgbarr=None, state=None,
+                      cvs_pos=(0, 0))
         return cache
 
     def set_image(self, image):
@@ -500,7 +528,105 @@ class NormImage(Image):
         self.reset_optimize()
 
 
+class MaskImage(Image):
+    """Draws a mask or label image on a ImageViewCanvas.
+
+    Parameters are:
+    x, y: 0-based coordinates of one corner in the data space
+    image: an image whose 2D data are the labels (0 is transparent, and
+      label N is drawn with palette entry N-1), or the data for `predicate`
+    palette: sequence of colors or (color, alpha) pairs for the labels
+    predicate: optional function called on a cutout of the data that
+      returns the labels (e.g. a threshold)
+
+    Only the part of the image that is visible in the viewer is cut out
+    and scaled; the labels and palette are applied to that cutout.
+    """
+
+    def __init__(self, x, y, image, palette=None, predicate=None,
+                 alpha=1.0, scale_x=1.0, scale_y=1.0,
+                 interpolation='basic', **kwdargs):
+        super(MaskImage, self).__init__(x, y, image, alpha=alpha,
+                                        scale_x=scale_x, scale_y=scale_y,
+                                        interpolation=interpolation,
+                                        **kwdargs)
+        self.kind = 'maskimage'
+        if palette is None:
+            palette = ['lightgreen']
+        self.predicate = predicate
+        self.set_palette(palette)
+
+    def set_palette(self, palette):
+        """Set the colors for the labels.  `palette` is a sequence of
+        color names or RGB tuples, each optionally paired with an alpha.
+        """
+        self.palette = palette
+        # RGBA lookup table for all possible uint8 labels
+        parr = numpy.zeros((256, 4), dtype=numpy.uint8)
+        for i, entry in enumerate(palette[:255]):
+            alpha = 1.0
+            if isinstance(entry, tuple) and len(entry) == 2:
+                entry, alpha = entry
+            if isinstance(entry, tuple):
+                r, g, b = entry
+            else:
+                r, g, b = colors.lookup_color(entry)
+            parr[i + 1] = (int(r * 255), int(g * 255), int(b * 255),
+                           int(alpha * self.alpha * 255))
+        self._palette_arr = parr
+        self._reset_labels()
+
+    def set_predicate(self, predicate):
+        """Set the function that calculates the labels from the data."""
+        self.predicate = predicate
+        self._reset_labels()
+
+    def get_mask(self):
+        """Return a boolean mask of the labeled pixels of the whole
+        image.
+        """
+        data = self.image.get_data()
+        if self.predicate is not None:
+            data = self.predicate(data)
+        return data != 0
+
+    def _reset_labels(self):
+        # the cutouts can be reused, only the colors need recalculating
+        for cache in self._cache.values():
+            cache.rgbarr = None
+
+    def draw_image(self, viewer, dstarr, whence=0.0):
+        if self.image is None:
+            return
+
+        cache = self.get_cache(viewer)
+
+        if (whence <= 0.0) or (cache.cutout is None) or (not self.optimize):
+            cache.rgbarr = None
+            with viewer.profiler.stage('cutout'):
+                if not self._calc_cutout(viewer, dstarr, cache):
+                    # no overlay needed
+                    return
+
+        if cache.rgbarr is None:
+            labels = cache.cutout
+            if self.predicate is not None:
+                labels = self.predicate(labels)
+            if labels.dtype != numpy.uint8:
+                labels = labels.clip(0, 255).astype(numpy.uint8)
+            cache.rgbarr = self._palette_arr[labels]
+
+        trcalc.overlay_image(dstarr, cache.cvs_pos, cache.rgbarr,
+                             dst_order=viewer.get_rgb_order(),
+                             src_order='RGBA', flipy=False)
+
+    def _reset_cache(self, cache):
+        cache.setvals(cutout=None, rgbarr=None, cvs_pos=(0, 0))
+        return cache
+
+
 # register our types
-register_canvas_types(dict(image=Image, normimage=NormImage))
+register_canvas_types(dict(image=Image, normimage=NormImage,
+                           maskimage=MaskImage))
 
 #END
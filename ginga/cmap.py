@@ -13243,10 +13243,25 @@ class ColorMapError(Exception):
 
 
 class ColorMap(object):
-    """Class to handle color maps."""
+    """Class to handle color maps.
+
+    The NumPy form of the color list is only made the first time it is
+    needed (see `get_array`), so that importing this module does not
+    convert every map.
+    """
     def __init__(self, name, clst):
         self.name = name
         self.clst = clst
+        self._carr = None
+
+    def get_array(self):
+        """Return the colors as a read-only (256, 3) uint8 array."""
+        if self._carr is None:
+            arr = numpy.asarray(self.clst, dtype=numpy.float64) * 255.0
+            carr = numpy.round(arr).astype(numpy.uint8)
+            carr.setflags(write=False)
+            self._carr = carr
+        return self._carr
 
 
 def add_cmap(name, clst):
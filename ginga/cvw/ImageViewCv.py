@@ -54,10 +54,14 @@ class ImageViewCv(ImageView.ImageViewBase):
         canvas = self.surface
         self.logger.debug("redraw surface")
 
-        # get window contents as an array and store it into the CV surface
-        rgb_arr = self.getwin_array(order=self.rgb_order)
-        # TODO: is there a faster way to copy this array in?
-        canvas[:,:,:] = rgb_arr
+        # render window contents directly into the CV surface
+        # (cv just uses numpy arrays!)
+        wd, ht = self.get_window_size()
+        if canvas.shape[:2] != (ht, wd):
+            # window size must have changed out from underneath us!
+            canvas = numpy.empty((ht, wd, len(self.rgb_order)), numpy.uint8)
+            self.surface = canvas
+        self.getwin_array(order=self.rgb_order, out=canvas)
 
         # for debugging
         #self.save_rgb_image_as_file('/tmp/temp.png', format='png')
@@ -92,7 +96,8 @@ class ImageViewCv(ImageView.ImageViewBase):
         # make a PIL image
         image = PILimage.fromarray(self.surface)
 
-        image.save(obuf, format=format, quality=quality)
+        with self.profiler.stage('encode'):
+            image.save(obuf, format=format, quality=quality)
         return obuf
 
     def update_image(self):
@@ -819,7 +819,9 @@ class TreeView(WidgetBase):
             try:
                 bnch = shadow[key]
                 item_iter = bnch.item
-                # TODO: update leaf item
+                # update leaf item
+                bnch.node = node
+                model.set_value(item_iter, 0, node)
 
             except KeyError:
                 # new item
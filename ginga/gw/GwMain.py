@@ -19,7 +19,7 @@ else:
     import queue as Queue
 
 from ginga.util.six.moves import filter
-from ginga.misc import Task, Future, Callback
+from ginga.misc import Task, Future, Callback, Scheduler
 from collections import deque
 
 class GwMain(Callback.Callbacks):
@@ -54,6 +54,10 @@ class GwMain(Callback.Callbacks):
         # For asynchronous tasks on the thread pool
         self.tag = 'master'
         self.shares = ['threadPool', 'logger']
+        # For prioritized, cancellable computations on the thread pool
+        self.scheduler = None
+        if thread_pool is not None:
+            self.scheduler = Scheduler.Scheduler(self.logger, thread_pool)
 
         self.oneshots = {}
 
@@ -215,6 +219,22 @@ class GwMain(Callback.Callbacks):
         task = Task.FuncTask(future.thaw, (), {}, logger=self.logger)
         return self.nongui_do_task(task)
 
+    def nongui_schedule(self, key, priority, method, *args, **kwdargs):
+        """Run ``method(token, *args, **kwdargs)`` on the thread pool in
+        order of `priority` (see the PRI_* values in
+        `ginga.misc.Scheduler`).  A pending or running job with the same
+        `key` is superseded: it is dropped or its cancellation `token`
+        is set.  Returns the `~ginga.misc.Scheduler.Job`.
+        """
+        return self.scheduler.submit(key, priority, method, *args, **kwdargs)
+
+    def nongui_cancel(self, key):
+        """Cancel the scheduled jobs with `key`."""
+        self.scheduler.cancel(key)
+
+    def get_scheduler_stats(self):
+        return self.scheduler.get_stats()
+
     def nongui_do_task(self, task):
         try:
             task.init_and_start(self)
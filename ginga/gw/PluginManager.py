@@ -39,35 +39,60 @@ class PluginManager(Callback.Callbacks):
             self.enable_callback(name)
 
     def load_plugin(self, name, spec, chinfo=None):
+        """Register the plugin `name` described by `spec`.
+
+        For a local plugin, the plugin module is imported and the plugin
+        object created the first time the plugin is looked up (e.g. when
+        it is started), so that plugins which are never used in a channel
+        cost nothing when the channel is created.  Global plugins are
+        created right away, because they often register for shell
+        callbacks (e.g. 'add-channel') in their constructors; only their
+        GUI is built when they are started.
+        """
+        fitsimage = None
+        if chinfo is not None:
+            # local plugin
+            fitsimage = chinfo.fitsimage
+
+        # Prepare configuration for module.  This becomes the p_info
+        # object referred to in later code.
+        opname = name.lower()
+        self.plugin[opname] = Bunch.Bunch(klass=None, obj=None,
+                                          widget=None, name=name,
+                                          is_toplevel=False,
+                                          spec=spec,
+                                          fitsimage=fitsimage,
+                                          chinfo=chinfo)
+        if chinfo is None:
+            self._instantiate(self.plugin[opname])
+
+    def _instantiate(self, p_info):
+        spec = p_info.spec
         try:
-            module = self.mm.get_module(spec.module)
+            if self.mm.is_loaded(spec.module):
+                module = self.mm.get_module(spec.module)
+            else:
+                module = self.mm.load_module(spec.module,
+                                             pfx=spec.get('pfx', None),
+                                             path=spec.get('path', None))
             className = spec.get('klass', spec.module)
             klass = getattr(module, className)
 
-            if chinfo is None:
+            if p_info.chinfo is None:
                 # global plug in
                 obj = klass(self.fv)
-                fitsimage = None
             else:
                 # local plugin
-                fitsimage = chinfo.fitsimage
-                obj = klass(self.fv, fitsimage)
+                obj = klass(self.fv, p_info.fitsimage)
 
-            # Prepare configuration for module.  This becomes the p_info
-            # object referred to in later code.
-            opname = name.lower()
-            self.plugin[opname] = Bunch.Bunch(klass=klass, obj=obj,
-                                              widget=None, name=name,
-                                              is_toplevel=False,
-                                              spec=spec,
-                                              fitsimage=fitsimage,
-                                              chinfo=chinfo)
+            p_info.klass = klass
+            p_info.obj = obj
 
-            self.logger.info("Plugin '%s' loaded." % name)
+            self.logger.info("Plugin '%s' loaded." % p_info.name)
 
         except Exception as e:
             self.logger.error("Failed to load plugin '%s': %s" % (
-                name, str(e)))
+                p_info.name, str(e)))
             try:
                 (type, value, tb) = sys.exc_info()
                 tb_str = "\n".join(traceback.format_tb(tb))
@@ -76,10 +101,10 @@ class PluginManager(Callback.Callbacks):
             except Exception as e:
                 tb_str = "Traceback information unavailable."
                 self.logger.error(tb_str)
-            #raise PluginManagerError(e)
+            raise PluginManagerError(e)
 
     def reload_plugin(self, plname, chinfo=None):
-        p_info = self.get_plugin_info(plname)
+        p_info = self.plugin[plname.lower()]
         return self.load_plugin(p_info.name, p_info.spec, chinfo=chinfo)
 
     def has_plugin(self, plname):
@@ -89,8 +114,15 @@ class PluginManager(Callback.Callbacks):
     def get_plugin_info(self, plname):
         plname = plname.lower()
         p_info = self.plugin[plname]
+        if p_info.obj is None:
+            self._instantiate(p_info)
         return p_info
 
+    def is_loaded(self, plname):
+        """Return True if the plugin object for `plname` has been made."""
+        plname = plname.lower()
+        return plname in self.plugin and self.plugin[plname].obj is not None
+
     def get_plugin(self, name):
         p_info = self.get_plugin_info(name)
         return p_info.obj
@@ -261,6 +293,11 @@ class PluginManager(Callback.Callbacks):
             self.fv.show_error("No plugin information for plugin '%s'" % (
                 opname))
             return
+
+        except PluginManagerError as e:
+            self.fv.show_error("Failed to load plugin '%s': %s" % (
+                opname, str(e)))
+            return
         if chname is not None:
             # local plugin
             plname = chname.upper() + ': ' + p_info.name
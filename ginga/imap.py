@@ -3384,8 +3384,19 @@ min_imap_len = 256
 class IntensityMap(object):
     def __init__(self, name, ilst):
         self.name = name
-        #self.arr = numpy.array(ilst)
         self.ilst = ilst
+        self._iarr = None
+
+    def get_array(self):
+        """Return the intensities as a read-only array of indexes
+        (0-255), made on first use.
+        """
+        if self._iarr is None:
+            arr = numpy.asarray(self.ilst, dtype=numpy.float64) * 255.0
+            iarr = numpy.round(arr).astype('uint')
+            iarr.setflags(write=False)
+            self._iarr = iarr
+        return self._iarr
 
 def add_imap(name, ilst):
     global imaps
@@ -88,6 +88,10 @@ class ModuleManager(object):
                 module_name, str(e)))
             raise ModuleManagerError(e)
 
+    def is_loaded(self, module_name):
+        """Return True if the module has been loaded."""
+        return module_name in self.module or module_name in sys.modules
+
     def get_module(self, module_name):
         """Return loaded module from the given name."""
         try:
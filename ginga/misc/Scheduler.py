@@ -0,0 +1,259 @@
+#
+# Scheduler.py -- priority-aware, cancellable job scheduling
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Run computations on a thread pool in priority order, with coalescing
+of requests and cooperative cancellation.
+
+Each job is submitted with a key (e.g. ``(chname, 'histogram')``).
+Submitting a new job with the same key supersedes the previous one:
+if it is still waiting it is dropped, and if it is already running its
+cancellation token is set.  Long-running jobs should call
+``token.check()`` (or test ``token.is_cancelled()``) between steps so
+that superseded work stops early.
+"""
+from __future__ import absolute_import, print_function
+
+import time
+import heapq
+import threading
+import itertools
+from collections import deque
+
+from . import Task, Future
+
+# Job priorities (lower values run first)
+PRI_INTERACTIVE = 0
+PRI_VISIBLE = 10
+PRI_BACKGROUND = 20
+
+
+class JobCancelled(Task.TaskError):
+    """Raised when a job is cancelled or superseded."""
+    pass
+
+
+class CancelToken(object):
+    """Cooperative cancellation flag for a job.
+
+    The token has the ``isSet``/``is_set`` methods of a
+    `threading.Event`, so it can be passed to functions that accept an
+    interrupt event (e.g. ``IQCalc.evaluate_peaks(ev_intr=...)``).
+    """
+
+    def __init__(self):
+        self.ev_cancel = threading.Event()
+
+    def cancel(self):
+        self.ev_cancel.set()
+
+    def is_cancelled(self):
+        return self.ev_cancel.is_set()
+
+    isSet = is_set = is_cancelled
+
+    def check(self):
+        """Raise `JobCancelled` if the job has been cancelled."""
+        if self.ev_cancel.is_set():
+            raise JobCancelled("job cancelled")
+
+
+class Job(Future.Future):
+    """A unit of work for the `Scheduler`.
+
+    The job's method is called as ``method(token, *args, **kwdargs)``
+    and the job resolves to its return value (or to the exception it
+    raised, e.g. `JobCancelled`).
+    """
+
+    def __init__(self, key, priority, method, *args, **kwdargs):
+        super(Job, self).__init__(priority=priority)
+        self.key = key
+        self.token = CancelToken()
+        self.seqnum = 0
+        self.time_submit = None
+        self.time_start = None
+        self.time_end = None
+        self.freeze(method, *args, **kwdargs)
+
+    def __lt__(self, other):
+        return (self.priority, self.seqnum) < (other.priority, other.seqnum)
+
+    def cancel(self):
+        self.token.cancel()
+
+    def is_cancelled(self):
+        return self.token.is_cancelled()
+
+
+class Scheduler(object):
+    """Priority-aware, coalescing job scheduler on top of a
+    `~ginga.misc.Task.ThreadPool`.
+
+    Parameters
+    ----------
+    logger : `logging.Logger`
+        Logger for messages.
+
+    thread_pool : `~ginga.misc.Task.ThreadPool`
+        Pool whose threads execute the jobs.
+
+    history : int
+        Number of finished jobs over which latencies are reported.
+    """
+
+    def __init__(self, logger, thread_pool, history=200):
+        self.logger = logger
+        self.threadPool = thread_pool
+
+        self.lock = threading.RLock()
+        self._heap = []
+        self._seqnum = itertools.count()
+        # key -> latest waiting job
+        self.pending = {}
+        # key -> set of running jobs
+        self.running = {}
+
+        self.counts = dict(submitted=0, completed=0, cancelled=0,
+                           superseded=0, errors=0)
+        self.wait_times = deque([], history)
+        self.run_times = deque([], history)
+
+    def submit(self, key, priority, method, *args, **kwdargs):
+        """Schedule ``method(token, *args, **kwdargs)`` to run on the
+        thread pool and return its `Job`.  If `key` is not None, any
+        earlier job with the same key is superseded.
+        """
+        job = Job(key, priority, method, *args, **kwdargs)
+        return self.submit_job(job)
+
+    def submit_job(self, job):
+        """Schedule a `Job` made by the caller (e.g. to add a 'resolved'
+        callback before it can run).
+        """
+        with self.lock:
+            job.seqnum = next(self._seqnum)
+            job.time_submit = time.time()
+            if job.key is not None:
+                self._supersede(job.key)
+                self.pending[job.key] = job
+            heapq.heappush(self._heap, job)
+            self.counts['submitted'] += 1
+
+        # each job posts one request to the pool; whichever pool thread
+        # gets it runs the highest priority job waiting at that time
+        task = Task.FuncTask(self._run_next, (), {}, logger=self.logger)
+        task.initialize(self)
+        self.threadPool.addTask(task, priority=job.priority)
+        return job
+
+    def _supersede(self, key):
+        job = self.pending.pop(key, None)
+        if job is not None:
+            self._cancel_pending(job)
+            self.counts['superseded'] += 1
+        for job in self.running.get(key, ()):
+            job.cancel()
+            self.counts['superseded'] += 1
+
+    def _cancel_pending(self, job):
+        # the job stays in the heap and is skipped when it comes up
+        job.cancel()
+        job.resolve(JobCancelled("job superseded or cancelled"))
+
+    def cancel(self, key):
+        """Cancel the waiting and running jobs with `key`."""
+        with self.lock:
+            job = self.pending.pop(key, None)
+            if job is not None:
+                self._cancel_pending(job)
+                self.counts['cancelled'] += 1
+            for job in self.running.get(key, ()):
+                job.cancel()
+
+    def cancel_all(self):
+        """Cancel all waiting and running jobs."""
+        with self.lock:
+            for job in self._heap:
+                if not job.is_cancelled():
+                    self._cancel_pending(job)
+                    self.counts['cancelled'] += 1
+            self._heap = []
+            self.pending = {}
+            for jobs in self.running.values():
+                for job in jobs:
+                    job.cancel()
+
+    def _get_next(self):
+        with self.lock:
+            while len(self._heap) > 0:
+                job = heapq.heappop(self._heap)
+                if job.is_cancelled():
+                    continue
+                if self.pending.get(job.key, None) is job:
+                    del self.pending[job.key]
+                job.time_start = time.time()
+                self.wait_times.append(job.time_start - job.time_submit)
+                self.running.setdefault(job.key, set()).add(job)
+                return job
+        return None
+
+    def _run_next(self):
+        job = self._get_next()
+        if job is None:
+            # superseded or cancelled
+            return
+
+        try:
+            job.token.check()
+            res = job.method(job.token, *job.args, **job.kwdargs)
+            count = 'completed'
+
+        except JobCancelled as e:
+            res = e
+            count = 'cancelled'
+
+        except Exception as e:
+            self.logger.error("Error running job '%s': %s" % (
+                str(job.key), str(e)))
+            res = e
+            count = 'errors'
+
+        job.time_end = time.time()
+        with self.lock:
+            jobs = self.running[job.key]
+            jobs.discard(job)
+            if len(jobs) == 0:
+                del self.running[job.key]
+            self.counts[count] += 1
+            self.run_times.append(job.time_end - job.time_start)
+
+        job.resolve(res)
+
+    def get_stats(self):
+        """Return a dict of queue depths, job counts and recent
+        latencies (in seconds).
+        """
+        with self.lock:
+            waiting = [job for job in self._heap if not job.is_cancelled()]
+            by_pri = {}
+            for job in waiting:
+                by_pri[job.priority] = by_pri.get(job.priority, 0) + 1
+            stats = dict(self.counts)
+            stats.update(dict(
+                queue_depth=len(waiting), queue_by_priority=by_pri,
+                running=sum([len(jobs) for jobs in self.running.values()])))
+            for name, times in (('wait', self.wait_times),
+                                ('run', self.run_times)):
+                times = list(times)
+                if len(times) > 0:
+                    stats[name + '_mean'] = sum(times) / len(times)
+                    stats[name + '_max'] = max(times)
+                else:
+                    stats[name + '_mean'] = stats[name + '_max'] = 0.0
+        return stats
+
+#END
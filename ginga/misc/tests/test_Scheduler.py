@@ -0,0 +1,86 @@
+#
+# Unit Tests for the Scheduler class
+#
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+import unittest
+
+from .. import Task, Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestScheduler")
+        self.ev_quit = threading.Event()
+        self.tpool = Task.ThreadPool(1, self.logger, ev_quit=self.ev_quit)
+        self.tpool.startall(wait=True)
+        self.sched = Scheduler.Scheduler(self.logger, self.tpool)
+
+        # occupy the only thread until the test releases it
+        self.ev_block = threading.Event()
+        self.blocker = self.sched.submit(None, Scheduler.PRI_INTERACTIVE,
+                                         lambda token: self.ev_block.wait())
+        while self.sched.get_stats()['running'] == 0:
+            time.sleep(0.01)
+
+    def test_priority_order(self):
+        order = []
+        jobs = [self.sched.submit(None, pri,
+                                  lambda token, pri: order.append(pri), pri)
+                for pri in (Scheduler.PRI_BACKGROUND, Scheduler.PRI_VISIBLE,
+                            Scheduler.PRI_INTERACTIVE)]
+        stats = self.sched.get_stats()
+        assert stats['queue_depth'] == 3
+        assert stats['queue_by_priority'][Scheduler.PRI_VISIBLE] == 1
+
+        self.ev_block.set()
+        for job in jobs:
+            job.wait(timeout=2.0)
+        assert order == [Scheduler.PRI_INTERACTIVE, Scheduler.PRI_VISIBLE,
+                         Scheduler.PRI_BACKGROUND]
+
+    def test_supersede_pending(self):
+        job1 = self.sched.submit('hist', Scheduler.PRI_VISIBLE,
+                                 lambda token: 1)
+        job2 = self.sched.submit('hist', Scheduler.PRI_VISIBLE,
+                                 lambda token: 2)
+        # the first job is dropped without running
+        assert isinstance(job1.wait(timeout=0.1), Scheduler.JobCancelled)
+        self.ev_block.set()
+        assert job2.wait(timeout=2.0) == 2
+
+        stats = self.sched.get_stats()
+        assert stats['superseded'] == 1
+        assert stats['completed'] == 2
+
+    def test_cancel_running(self):
+        ev_started = threading.Event()
+
+        def long_job(token):
+            ev_started.set()
+            while True:
+                token.check()
+                time.sleep(0.01)
+
+        self.ev_block.set()
+        job1 = self.sched.submit('pick', Scheduler.PRI_VISIBLE, long_job)
+        assert ev_started.wait(timeout=2.0)
+        job2 = self.sched.submit('pick', Scheduler.PRI_VISIBLE,
+                                 lambda token: 'done')
+        assert isinstance(job1.wait(timeout=2.0), Scheduler.JobCancelled)
+        assert job2.wait(timeout=2.0) == 'done'
+        assert self.sched.get_stats()['cancelled'] == 1
+
+    def tearDown(self):
+        self.ev_block.set()
+        self.tpool.stopall(wait=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
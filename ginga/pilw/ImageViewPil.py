@@ -41,19 +41,16 @@ class ImageViewPil(ImageView.ImageViewBase):
         canvas = self.surface
         self.logger.debug("redraw surface")
 
-        # get window contents as a buffer and paste it into the PIL surface
-        rgb_arr = self.getwin_array(order=self.rgb_order)
-        p_image = Image.fromarray(rgb_arr)
-
-        if p_image.size != canvas.size:
+        # get window contents as a buffer and load it straight into the
+        # PIL surface (the alpha channel is dropped by the 'RGBX' decoder)
+        width, height = self.get_window_size()
+        if canvas.size != (width, height):
             # window size must have changed out from underneath us!
-            width, height = self.get_window_size()
             canvas = Image.new("RGB", (width, height), color=0)
-            assert p_image.size == canvas.size, \
-                   ImageViewPilError("Rendered image does not match window size")
             self.surface = canvas
 
-        canvas.paste(p_image)
+        rgb_buf = self.getwin_buffer(order='RGBA', copy=False)
+        canvas.frombytes(rgb_buf, 'raw', 'RGBX')
 
     def configure_surface(self, width, height):
         # create PIL surface the size of the window
@@ -90,7 +87,8 @@ class ImageViewPil(ImageView.ImageViewBase):
         # Get PIL surface
         p_image = self.get_surface()
 
-        p_image.save(obuf, format=format, quality=quality)
+        with self.profiler.stage('encode'):
+            p_image.save(obuf, format=format, quality=quality)
         if output is not None:
             return None
         return obuf
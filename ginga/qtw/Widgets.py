@@ -706,7 +706,11 @@ class TreeView(WidgetBase):
             try:
                 bnch = shadow[key]
                 item = bnch.item
-                # TODO: update leaf item
+                # update leaf item
+                bnch.node = node
+                for i, value in enumerate(values):
+                    if self.datakeys[i] != 'icon':
+                        item.setText(i, value)
 
             except KeyError:
                 # new item
@@ -23,7 +23,7 @@ from ginga import cmap, imap
 from ginga import AstroImage, RGBImage, BaseImage
 from ginga.table import AstroTable
 from ginga.misc import Bunch, Timer, Future
-from ginga.util import catalog, iohelper, io_fits, toolbox
+from ginga.util import catalog, iohelper, io_fits, toolbox, rendercache
 from ginga.canvas.CanvasObject import drawCatalog
 from ginga.canvas.types.layer import DrawingCanvas
 from ginga.util.six.moves import map
@@ -166,6 +166,9 @@ class GingaShell(GwMain.GwMain, Widgets.Application):
         # Initialize catalog and image server bank
         self.imgsrv = catalog.ServerBank(self.logger)
 
+        # small renderings of images shared by the Pan and Thumbs plugins
+        self.render_cache = rendercache.RenderCache(self.logger)
+
         self.operations = {}
 
         # state for implementing field-info callback
@@ -204,6 +207,9 @@ class GingaShell(GwMain.GwMain, Widgets.Application):
     def get_preferences(self):
         return self.prefs
 
+    def get_render_cache(self):
+        return self.render_cache
+
     def get_timer(self):
         return self.timer_factory.timer()
 
@@ -273,11 +279,11 @@ class GingaShell(GwMain.GwMain, Widgets.Application):
         try:
             spec.setdefault('ptype', 'local')
             name = spec.setdefault('name', spec.get('klass', spec.module))
+            spec.setdefault('pfx', pluginconfpfx)
             self.local_plugins[name] = spec
 
-            pfx = spec.get('pfx', pluginconfpfx)
-            path = spec.get('path', None)
-            self.mm.load_module(spec.module, pfx=pfx, path=path)
+            # the module is imported when the plugin is first started
+            # in a channel (see PluginManager.load_plugin)
 
             hidden = spec.get('hidden', False)
             if not hidden:
@@ -301,12 +307,11 @@ class GingaShell(GwMain.GwMain, Widgets.Application):
         try:
             spec.setdefault('ptype', 'global')
             name = spec.setdefault('name', spec.get('klass', spec.module))
+            spec.setdefault('pfx', pluginconfpfx)
             self.global_plugins[name] = spec
 
-            pfx = spec.get('pfx', pluginconfpfx)
-            path = spec.get('path', None)
-            self.mm.load_module(spec.module, pfx=pfx, path=path)
-
+            # the plugin is created now, but its GUI is only built
+            # when it is first started
             self.gpmon.load_plugin(name, spec)
 
             hidden = spec.get('hidden', False)
@@ -8,6 +8,7 @@ import time
 
 from ginga import GingaPlugin
 from ginga.gw import Widgets
+from ginga.util import frameexport
 
 class Blink(GingaPlugin.LocalPlugin):
     """
@@ -35,6 +36,13 @@ class Blink(GingaPlugin.LocalPlugin):
 
     You can change the number in "Interval" and press Enter to
     dynamically change the cycle time while the cycle is running.
+
+    In local mode, "Save Sequence" saves the images of the channel, as
+    shown in the channel viewer, one frame per interval.  The format is
+    chosen by the file name: ``.gif`` or ``.apng`` (animations), ``.y4m``
+    (raw video) or a PNG or JPEG file name with a frame number format
+    such as ``blink_%03d.png`` (one file per image).  Animations are
+    limited to 500 frames.
     """
     def __init__(self, *args):
         # superclass defines some variables for us, like logger
@@ -49,7 +57,8 @@ class Blink(GingaPlugin.LocalPlugin):
 
         prefs = self.fv.get_preferences()
         self.settings = prefs.create_category('plugin_Blink')
-        self.settings.add_defaults(interval_max=30.0, interval_min=0.25)
+        self.settings.add_defaults(interval_max=30.0, interval_min=0.25,
+                                   export_workers=2, export_max_frames=8)
         self.settings.load(onError='silent')
 
         # TODO: need to deprecate the blink_channels setting
@@ -108,6 +117,17 @@ class Blink(GingaPlugin.LocalPlugin):
 
         vbox2.add_widget(w, stretch=0)
 
+        captions = (("Save Sequence", 'button'),
+                    )
+        w, b = Widgets.build_info(captions, orientation=orientation)
+        self.w.update(b)
+        b.save_sequence.add_callback('activated',
+                                     lambda w: self._save_sequence_cb())
+        b.save_sequence.set_tooltip("Save the images in the channel as an "
+                                    "animation, movie or image files")
+        b.save_sequence.set_enabled(not self.blink_channels)
+        vbox2.add_widget(w, stretch=0)
+
         fr.set_widget(vbox2)
         vbox.add_widget(fr, stretch=0)
 
@@ -190,6 +210,37 @@ class Blink(GingaPlugin.LocalPlugin):
         self.stop_blinking()
         self.start_blinking()
 
+    def _save_sequence_cb(self):
+        target = Widgets.SaveDialog(title='Save Sequence',
+                                    selectedfilter='*.gif').get_path()
+        if target:
+            self.save_sequence(target)
+
+    def save_sequence(self, target_file):
+        """Save the images loaded in the channel, in order, as frames
+        of `target_file` (see `~ginga.util.frameexport.get_sink`).
+        """
+        images = []
+        for imname in self.channel.get_image_names():
+            try:
+                images.append(self.channel.get_loaded_image(imname))
+            except KeyError:
+                # not in memory
+                continue
+
+        try:
+            sink = frameexport.get_sink(target_file, fps=1.0 / self.interval)
+            stats = frameexport.export_images(
+                self.fitsimage, images, sink,
+                num_workers=self.settings['export_workers'],
+                max_frames=self.settings['export_max_frames'])
+
+        except Exception as e:
+            self.fv.show_error("Error saving sequence: %s" % (str(e)))
+            return
+
+        self.fv.show_status("Saved %d images" % (stats['written']))
+
     def _set_blink_mode_cb(self, tf):
         self.blink_channels = tf
 
@@ -595,4 +595,45 @@ class CommandInterpreter(object):
                     x = pan_x
             viewer.set_pan(x, y)
 
+    def cmd_prof(self, op=None, whence=None, file=None, ch=None):
+        """prof [on|off|reset|dump] whence=level file=path ch=chname
+
+        Control the render profiler for the given viewer/channel.
+        `on` and `off` start and stop recording, `reset` forgets the
+        recorded redraws and `dump` writes them to `file` as JSON.
+        With no operation, reports per-stage redraw times (msec) and
+        sizes, optionally only for redraws at the given `whence` level.
+        """
+        viewer = self.get_viewer(ch)
+        if viewer is None:
+            self.log("No current viewer/channel.")
+            return
+
+        profiler = viewer.get_profiler()
+        settings = viewer.get_settings()
+        if op is None:
+            if not settings.get('profile_render', False):
+                self.log("Profiling is off; use 'prof on' to start.")
+            self.log(profiler.format_summary(whence=whence))
+
+        elif op == 'on':
+            settings.set(profile_render=True)
+
+        elif op == 'off':
+            settings.set(profile_render=False)
+
+        elif op == 'reset':
+            profiler.clear()
+
+        elif op == 'dump':
+            if file is None:
+                self.log("Please specify file=path")
+                return
+            profiler.dump_json(file)
+            self.log("Wrote %d frames to %s" % (
+                len(profiler.get_frames()), file))
+
+        else:
+            self.log("Unknown profiler operation: '%s'" % (op))
+
 #END
@@ -265,6 +265,9 @@ class Compose(GingaPlugin.LocalPlugin):
 
     def add_to_channel_cb(self):
         image = self.limage.copy()
+        # the composite is updated in place as the alphas change, so the
+        # channel gets its own copy of the data
+        image.set_data(self.limage.copy_data())
         name = "composite%d" % (self.count)
         self.count += 1
         image.set(name=name)
@@ -287,8 +290,9 @@ class Compose(GingaPlugin.LocalPlugin):
                                    vmin=vmin, vmax=vmax)
 
         # result becomes an index array fed to the RGB mapper
-        if not numpy.issubdtype(data.dtype, numpy.dtype('uint')):
-            data = data.astype(numpy.uint)
+        dtype = rgbmap.get_index_dtype()
+        if data.dtype != dtype:
+            data = data.astype(dtype)
 
         # get RGB array using settings from viewer
         rgbobj = rgbmap.get_rgbarray(data, order=order,
@@ -6,20 +6,15 @@
 #
 import os, glob
 import stat, time
+import threading
 
 from ginga.misc import Bunch
 from ginga import GingaPlugin
 from ginga import AstroImage
-from ginga.util import paths, iohelper
+from ginga.util import paths, iohelper, io_fits
 from ginga.util.six.moves import map, zip
 from ginga.gw import Widgets
 
-try:
-    from astropy.io import fits as pyfits
-    have_astropy = True
-except ImportError:
-    have_astropy = False
-
 
 class FBrowser(GingaPlugin.LocalPlugin):
     """
@@ -46,6 +41,11 @@ class FBrowser(GingaPlugin.LocalPlugin):
 
     Because it is a local plugin, FBrowser will remember its last
     directory if closed and then restarted.
+
+    If header scanning is enabled in the preferences, the primary headers
+    of FITS files are read in the background and the keyword columns fill
+    in as results arrive.  Scanned values are kept in an index under the
+    Ginga home directory, so browsing the same directory again is fast.
     """
     def __init__(self, *args):
         # superclass defines some variables for us, like logger
@@ -72,7 +72,9 @@ class FBrowser(GingaPlugin.LocalPlugin):
         self.settings = prefs.create_category('plugin_FBrowser')
         self.settings.add_defaults(home_path=paths.home,
                                    scan_fits_headers=False,
-                                   scan_limit=100,
+                                   scan_limit=10000,
+                                   scan_chunk_size=50,
+                                   scan_use_index=True,
                                    keywords=keywords,
                                    columns=columns,
                                    color_alternate_rows=True,
@@ -84,12 +86,21 @@ class FBrowser(GingaPlugin.LocalPlugin):
             homedir = paths.home
         self.curpath = os.path.join(homedir, '*')
         self.do_scanfits = self.settings.get('scan_fits_headers', False)
-        self.scan_limit = self.settings.get('scan_limit', 100)
+        self.scan_limit = self.settings.get('scan_limit', 10000)
+        self.scan_chunk_size = self.settings.get('scan_chunk_size', 50)
+        self.scan_use_index = self.settings.get('scan_use_index', True)
         self.keywords = self.settings.get('keywords', keywords)
         self.columns = self.settings.get('columns', columns)
         self.moving_cursor = False
         self.na_dict = { attrname: 'N/A' for colname, attrname in self.columns }
 
+        # state for background header scans
+        self.scan_lock = threading.RLock()
+        self.scan_gen = 0
+        self.scan_pending = 0
+        self.scan_start_time = 0.0
+        self.scan_index = None
+
         # Make icons
         icondir = self.fv.iconpath
         self.folderpb = self.fv.get_icon(icondir, 'folder.png')
@@ -360,9 +371,15 @@ class FBrowser(GingaPlugin.LocalPlugin):
         self.jumpinfo = list(map(self.get_info, filelist))
         self.curpath = path
 
+        # cancel any scan still running for the previous listing
+        with self.scan_lock:
+            self.scan_gen += 1
+
         if self.do_scanfits:
             num_files = len(self.jumpinfo)
             if num_files <= self.scan_limit:
+                # indexed values are filled in now, the rest are added
+                # to the rows as they are scanned
                 self.scan_fits()
             else:
                 self.logger.warning("Number of files (%d) is greater than scan limit (%d)--skipping header scan" % (
@@ -370,23 +387,110 @@ class FBrowser(GingaPlugin.LocalPlugin):
 
         self.makelisting(path)
 
+    def get_scan_index(self, dirname):
+        """Return the persistent header index for directory `dirname`."""
+        indexdir = os.path.join(paths.ginga_home, 'fbrowser_index')
+        indexpath = os.path.join(indexdir,
+                                 iohelper.gethex(dirname) + '.json')
+        if self.scan_index is None or \
+               self.scan_index.indexpath != indexpath:
+            self.scan_index = iohelper.FileIndex(indexpath,
+                                                 logger=self.logger)
+        return self.scan_index
+
     def scan_fits(self):
-        # Scan each FITS file and add header items
+        """Scan the FITS files in the listing and add header items.
+
+        Values found in the header index are applied immediately; the
+        remaining files are divided into chunks that are scanned on the
+        thread pool, and their rows are updated as each chunk finishes.
+        """
         self.logger.info("scanning files for header keywords...")
-        start_time = time.time()
+        with self.scan_lock:
+            self.scan_gen += 1
+            gen = self.scan_gen
+            self.scan_pending = 0
+            self.scan_start_time = time.time()
+
+        dirname = os.path.dirname(self.curpath)
+        index = None
+        if self.scan_use_index:
+            index = self.get_scan_index(dirname)
+
+        attrnames = [attrname for attrname, kwd in self.keywords]
+        todo = []
         for bnch in self.jumpinfo:
-            if (not bnch.type == 'fits') or (not have_astropy):
+            if bnch.type != 'fits':
                 continue
+            if index is not None:
+                kwds = index.get(bnch.name, bnch.st_mtime, bnch.st_size)
+                if kwds is not None and all([attrname in kwds
+                                             for attrname in attrnames]):
+                    bnch.update(kwds)
+                    continue
+            todo.append(bnch)
+
+        num_todo = len(todo)
+        self.logger.debug("%d files to scan" % (num_todo))
+        if num_todo == 0:
+            self.scan_done(gen, index)
+            return
+
+        chunk_size = max(1, self.scan_chunk_size)
+        chunks = [todo[i:i+chunk_size] for i in range(0, num_todo, chunk_size)]
+        with self.scan_lock:
+            self.scan_pending = len(chunks)
+        for chunk in chunks:
+            self.fv.nongui_do(self.scan_chunk, gen, chunk, index)
+
+    def scan_chunk(self, gen, chunk, index):
+        """Read the primary headers of the files in `chunk` (runs on a
+        worker thread).
+        """
+        kwdlist = [kwd for attrname, kwd in self.keywords]
+        results = []
+        for bnch in chunk:
+            if gen != self.scan_gen:
+                # a newer browse has superseded this scan
+                return
             try:
-                with pyfits.open(bnch.path, 'readonly') as in_f:
-                    kwds = { attrname: in_f[0].header.get(kwd, 'N/A')
-                                  for attrname, kwd in self.keywords}
-                bnch.update(kwds)
+                res = io_fits.scan_primary_header(bnch.path,
+                                                  keywords=kwdlist)
+                kwds = { attrname: res.header.get(kwd, 'N/A')
+                         for attrname, kwd in self.keywords }
             except Exception as e:
                 self.logger.warning("Error reading FITS keywords from '%s': %s" % (
                     bnch.path, str(e)))
                 continue
-        elapsed = time.time() - start_time
+
+            if index is not None:
+                index.put(bnch.name, bnch.st_mtime, bnch.st_size, kwds)
+            results.append((bnch, kwds))
+
+        self.fv.gui_do(self.scan_update, gen, results, index)
+
+    def scan_update(self, gen, results, index):
+        """Update the table rows for a finished chunk (runs in the GUI
+        thread).
+        """
+        if gen != self.scan_gen:
+            return
+        tree_dict = {}
+        for bnch, kwds in results:
+            bnch.update(kwds)
+            tree_dict[bnch.name] = bnch
+        self.treeview.add_tree(tree_dict)
+
+        with self.scan_lock:
+            self.scan_pending -= 1
+            done = (self.scan_pending <= 0)
+        if done:
+            self.scan_done(gen, index)
+
+    def scan_done(self, gen, index):
+        if index is not None:
+            self.fv.nongui_do(index.save)
+        elapsed = time.time() - self.scan_start_time
         self.logger.info("done scanning--scan time: %.2f sec" % (elapsed))
 
     def refresh(self):
@@ -427,7 +531,9 @@ class FBrowser(GingaPlugin.LocalPlugin):
         pass
 
     def stop(self):
-        pass
+        # stop any scan in progress
+        with self.scan_lock:
+            self.scan_gen += 1
 
     def redo(self, *args):
         return True
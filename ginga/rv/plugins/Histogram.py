@@ -9,6 +9,7 @@ import numpy
 from ginga.gw import Widgets, Plot
 from ginga import GingaPlugin
 from ginga import AutoCuts
+from ginga.misc import Scheduler
 from ginga.util import plots
 
 
@@ -247,6 +248,7 @@ class Histogram(GingaPlugin.LocalPlugin):
         ## except:
         ##     pass
         ##self.histtag = None
+        self.fv.nongui_cancel((self.chname, str(self)))
 
         # remove the canvas from the image
         p_canvas = self.fitsimage.get_canvas()
@@ -293,48 +295,53 @@ class Histogram(GingaPlugin.LocalPlugin):
 
         # Do histogram on the points within the rect
         image = self.fitsimage.get_image()
-        self.plot.clear()
+        if image is None:
+            return True
 
-        numbins = self.numbins
-        ## pct = 1.0
-        ## i = int(numbins * (1.0 - pct))
-        ## j = int(numbins * pct)
+        # the histogram is calculated off the GUI thread; a newer request
+        # (e.g. while the box is being dragged) supersedes this one
+        self.fv.nongui_schedule((self.chname, str(self)),
+                                Scheduler.PRI_VISIBLE, self.calc_histograms,
+                                image, int(bbox.x1), int(bbox.y1),
+                                int(bbox.x2), int(bbox.y2), self.numbins)
+        return True
 
+    def calc_histograms(self, token, image, x1, y1, x2, y2, numbins):
         depth = image.get_depth()
+        results = []
         if depth != 3:
-            res = self.histogram(image, int(bbox.x1), int(bbox.y1),
-                                 int(bbox.x2), int(bbox.y2),
-                                 pct=1.0, numbins=numbins)
+            results.append(self.histogram(image, x1, y1, x2, y2,
+                                          pct=1.0, numbins=numbins))
+        else:
+            for z in range(depth):
+                token.check()
+                results.append(self.histogram(image, x1, y1, x2, y2,
+                                              z=z, pct=1.0, numbins=numbins))
+        token.check()
+        self.fv.gui_do(self.plot_histograms, token, results)
+
+    def plot_histograms(self, token, results):
+        if token.is_cancelled() or not self.gui_up:
+            return
+        self.plot.clear()
+
+        if len(results) == 1:
+            colors, alpha = ('blue',), 1.0
+        else:
+            colors, alpha = ('red', 'green', 'blue'), 0.33
+        ymax = 0
+        for res, color in zip(results, colors):
             # used with 'steps-post' drawstyle, this x and y assignment
-                # gives correct histogram-steps
+            # gives correct histogram-steps
             x = res.bins
             y = numpy.append(res.dist, res.dist[-1])
             ## y, x = y[i:j+1], x[i:j+1]
-            ymax = y.max()
+            ymax = max(ymax, y.max())
             if self.plot.logy:
                 y = numpy.choose(y > 0, (.1, y))
             self.plot.plot(x, y, xtitle="Pixel value", ytitle="Number",
                            title="Pixel Value Distribution",
-                           color='blue', alpha=1.0, drawstyle='steps-post')
-        else:
-            colors = ('red', 'green', 'blue')
-            ymax = 0
-            for z in range(depth):
-                res = self.histogram(image, int(bbox.x1), int(bbox.y1),
-                                     int(bbox.x2), int(bbox.y2),
-                                     z=z, pct=1.0, numbins=numbins)
-                # used with 'steps-post' drawstyle, this x and y assignment
-                # gives correct histogram-steps
-                x = res.bins
-                y = numpy.append(res.dist, res.dist[-1])
-                ## y, x = y[i:j+1], x[i:j+1]
-                ymax = max(ymax, y.max())
-                if self.plot.logy:
-                    y = numpy.choose(y > 0, (.1, y))
-                self.plot.plot(x, y, xtitle="Pixel value", ytitle="Number",
-                               title="Pixel Value Distribution",
-                               color=colors[z], alpha=0.33,
-                               drawstyle='steps-post')
+                           color=color, alpha=alpha, drawstyle='steps-post')
 
         # show cut levels
         loval, hival = self.fitsimage.get_cut_levels()
@@ -15,10 +15,11 @@ import threading
 import logging
 import time
 import struct
-import array
 import re
 import string
 
+import numpy
+
 from ginga.misc import Bunch
 import ginga.util.six as six
 if six.PY2:
@@ -234,6 +235,8 @@ Where   nbytes | NB  = number of bytes expected or written
                        following the header packet.
     """
     needs_update = False
+    # minimum interval (sec) between showing partially written frames
+    update_interval = 0.5
     # these NEED to be set automatically
     # from the client interaction
     width = None
@@ -581,14 +584,10 @@ Where   nbytes | NB  = number of bytes expected or written
 
             # read the data and send back to server
             start = self.x + self.y * fb.width
-            end = start + pkt.nbytes
-            data = fb.buffer[start:end]
-            if len(data) != pkt.nbytes:
+            buf = fb.read(start, pkt.nbytes)
+            if len(buf) != pkt.nbytes:
                 self.logger.warning("buffer length/packet size mismatch: %d != %d" % (
-                        len(data), pkt.nbytes))
-            #data.reverse()
-            #self.logger.debug("DATA=%s" % str(data))
-            buf = data.tostring()
+                        len(buf), pkt.nbytes))
             pkt.dataout.write(buf)
             pkt.dataout.flush()
             self.logger.debug("end memory read")
@@ -600,27 +599,13 @@ Where   nbytes | NB  = number of bytes expected or written
             self.logger.debug("data bytes=%d needs_update=%s" % (
                 pkt.nbytes, self.needs_update))
             if (fb.width is not None) and (fb.height is not None):
-                if not self.needs_update:
-                    #del fb.buffer
-                    #fb.buffer = array.array('B', ' ' * fb.width * fb.height)
-                    if len(fb.buffer) != fb.width * fb.height:
-                        fb.buffer = array.array('B', '\000' * fb.width * fb.height)
-                        #self.needs_update = True
+                # read straight into the frame buffer
                 start = self.x + self.y * fb.width
-                end = start + pkt.nbytes
-                fb.buffer[start:end] = array.array('B', pkt.datain.read(pkt.nbytes))
+                fb.write(start, pkt.datain, pkt.nbytes)
             else:
                 self.logger.warning("uninitialized framebuffer frame=%d" % (
                         self.frame))
-                if not self.needs_update:
-                    # init the framebuffer
-                    fb.buffer.fromstring(pkt.datain.read(pkt.nbytes))
-                    fb.buffer.reverse()
-                    #self.needs_update = True
-                else:
-                    data = array.array('B', pkt.datain.read(pkt.nbytes))
-                    data.reverse()
-                    fb.buffer += data
+                fb.append(pkt.datain, pkt.nbytes)
 
             self.needs_update = True
             self.logger.debug("end memory write")
@@ -707,6 +692,7 @@ Where   nbytes | NB  = number of bytes expected or written
         This is where the action starts.
         """
         self.logger = self.server.logger
+        self.time_update = time.time()
 
         # create a packet structure
         packet = iis()
@@ -771,8 +757,8 @@ Where   nbytes | NB  = number of bytes expected or written
             elif packet.subunit077 == MEMORY:
                 self.handle_memory(packet)
                 if self.needs_update:
-                    #self.display_image()
-                    pass
+                    # show large transfers while they are coming in
+                    self.update_image()
                 # read the next packet
                 line = packet.datain.read(size)
                 n = len(line)
@@ -818,6 +804,28 @@ Where   nbytes | NB  = number of bytes expected or written
             self.needs_update = False
 
 
+    def update_image(self):
+        """Show the rows of the current frame written so far, at most
+        every `update_interval` seconds.
+        """
+        controller = self.server.controller
+        if not hasattr(controller, 'update_rows'):
+            return
+        if time.time() - self.time_update < self.update_interval:
+            return
+        try:
+            fb = controller.get_frame(self.frame)
+        except KeyError:
+            return
+        if fb.height is None:
+            # rows cannot be placed until the size is known
+            return
+
+        y1, y2 = fb.get_dirty_rows(reset=True)
+        if y2 > y1:
+            self.time_update = time.time()
+            controller.update_rows(self.frame, y1, y2)
+
     def display_image(self, reset=1):
         """Utility routine used to display an updated frame from a framebuffer.
         """
@@ -827,13 +835,15 @@ Where   nbytes | NB  = number of bytes expected or written
             # the selected frame does not exist, create it
             fb = self.server.controller.init_frame(self.frame)
 
+        fb.get_dirty_rows(reset=True)
         if not fb.height:
             width = fb.width
-            height = int(len(fb.buffer) / width)
+            nbytes = fb.get_num_bytes()
+            height = int(nbytes / width)
             fb.height = height
 
             # display the image
-            if (len(fb.buffer) > 0) and (height > 0):
+            if (nbytes > 0) and (height > 0):
                 self.server.controller.display(self.frame, width, height,
                                                 True)
         else:
@@ -949,6 +959,14 @@ class coord_tran(object):
 
 
 class framebuffer(object):
+    """A frame buffer, holding the pixels (as uint8) written by the
+    client.
+
+    Once the size is known the pixels are read from the connection
+    straight into a preallocated NumPy array (`buffer`), and the rows
+    written since the last display are tracked so that a large frame
+    can be shown while it is coming in.
+    """
 
     def __init__ (self):
         self.width = None           # width of the framebuffer
@@ -959,11 +977,115 @@ class framebuffer(object):
                                     # (see fbconfigs dictionary)
         self.wcs = None             # WCS
         self.image = None           # the image data itself
+        self.image_buffer = None    # buffer that `image` was made from
         self.bitmap = None          # the image bitmap
         self.buffer = None          # used for screen updates
         self.zoom = 1.0             # zoom level
         self.ct = coord_tran()
         self.chname = None
+        self.clear()
+
+    def clear(self):
+        """Drop the pixels.  A new buffer is made for the next frame,
+        so images made from the old one keep their data.
+        """
+        self.buffer = numpy.zeros(0, dtype=numpy.uint8)
+        # pieces written before the size was known
+        self.chunks = []
+        # rows written since the last display
+        self.dirty = None
+
+    def alloc(self):
+        """Make sure `buffer` holds a whole frame."""
+        size = self.width * self.height
+        if len(self.buffer) != size:
+            self.buffer = numpy.zeros(size, dtype=numpy.uint8)
+            self.chunks = []
+        return self.buffer
+
+    def get_num_bytes(self):
+        if len(self.chunks) > 0:
+            return sum([len(chunk) for chunk in self.chunks])
+        return len(self.buffer)
+
+    def write(self, offset, datain, nbytes):
+        """Read `nbytes` from the file `datain` into the buffer at
+        `offset`.  Returns the number of bytes read.
+        """
+        buf = self.alloc()
+        end = max(min(offset + nbytes, len(buf)), offset)
+        n = read_into(datain, buf[offset:end])
+        if end - offset < nbytes:
+            # discard what does not fit in the frame
+            datain.read(nbytes - (end - offset))
+        if n == 0:
+            return n
+
+        # mark the rows touched
+        y1 = offset // self.width
+        y2 = (offset + n + self.width - 1) // self.width
+        if self.dirty is None:
+            self.dirty = (y1, y2)
+        else:
+            self.dirty = (min(self.dirty[0], y1), max(self.dirty[1], y2))
+        return n
+
+    def append(self, datain, nbytes):
+        """Read `nbytes` from `datain` into a frame whose size is not
+        known yet."""
+        chunk = numpy.zeros(nbytes, dtype=numpy.uint8)
+        n = read_into(datain, chunk)
+        self.chunks.append(chunk[:n])
+        return n
+
+    def read(self, offset, nbytes):
+        """Return `nbytes` bytes of the frame from `offset`."""
+        return self.buffer[offset:offset + nbytes].tobytes()
+
+    def get_dirty_rows(self, reset=False):
+        """Return the range (y1, y2) of buffer rows written since the
+        last reset."""
+        dirty = self.dirty
+        if reset:
+            self.dirty = None
+        if dirty is None:
+            return (0, 0)
+        return dirty
+
+    def get_array(self):
+        """Return the frame as a 2D array in display order (a view of
+        the buffer, if possible).
+        """
+        if len(self.chunks) > 0:
+            # pieces written before the size was known come in the
+            # reverse order
+            self.buffer = numpy.concatenate(self.chunks[::-1])
+            self.chunks = []
+        data = self.buffer[:self.width * self.height]
+        data = data.reshape((self.height, self.width))
+        # image comes in from IRAF flipped for screen display
+        return data[::-1]
+
+
+def read_into(datain, arr):
+    """Fill the uint8 array `arr` from the file `datain`, without
+    intermediate copies where the file supports ``readinto``.  Returns
+    the number of bytes read (less than ``len(arr)`` only at EOF).
+    """
+    nbytes = len(arr)
+    if not hasattr(datain, 'readinto'):
+        data = datain.read(nbytes)
+        arr[:len(data)] = numpy.frombuffer(data, dtype=numpy.uint8)
+        return len(data)
+
+    mv = memoryview(arr)
+    pos = 0
+    while pos < nbytes:
+        n = datain.readinto(mv[pos:])
+        if not n:
+            break
+        pos += n
+    return pos
 
 
 # utility routines
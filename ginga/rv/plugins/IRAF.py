@@ -7,7 +7,6 @@ if six.PY2:
     import Queue
 else:
     import queue as Queue
-import array
 import numpy
 import time
 
@@ -313,7 +312,7 @@ class IRAF(GingaPlugin.GlobalPlugin):
 
         # this is just a placeholder so that IIS_RequestHandler will
         # report something in this buffer
-        fb.buffer = array.array('B', ' ')
+        fb.buffer = numpy.zeros(1, dtype=numpy.uint8)
 
         # Update IRAF "wcs" info so that IRAF can load this image
 
@@ -387,7 +386,7 @@ class IRAF(GingaPlugin.GlobalPlugin):
         fb.image = None
         fb.bitmap = None
         fb.zoom = 1.0
-        fb.buffer = array.array('B')
+        fb.clear()
         fb.ct = iis.coord_tran()
         #fb.chname = None
         return fb
@@ -413,9 +412,33 @@ class IRAF(GingaPlugin.GlobalPlugin):
         fb = self.get_frame(frame)
         self.current_frame = frame
 
-        if reverse:
-            fb.buffer.reverse()
+        image = fb.image
+        if (image is not None) and (fb.image_buffer is fb.buffer):
+            # shown while it was coming in: just update the data range
+            # and the display
+            self.fv.gui_do(image.set_data, image.get_data())
+            return
+
+        self._display_new_image(fb, frame)
+
+    def update_rows(self, frame, y1, y2):
+        """Show the frame buffer while it is being written (rows y1
+        through y2-1 of the buffer have new data).
 
+        NOTE: this is called from the IISRequestHandler
+        """
+        fb = self.get_frame(frame)
+        self.logger.debug("frame %d rows %d-%d written" % (frame, y1, y2))
+
+        image = fb.image
+        if (image is not None) and (fb.image_buffer is fb.buffer):
+            # the image shares the buffer: it only needs to be redrawn
+            self.fv.gui_do(image.make_callback, 'modified')
+            return
+
+        self._display_new_image(fb, frame)
+
+    def _display_new_image(self, fb, frame):
         # frames are indexed from 1 in IRAF
         chname = fb.chname
         if chname is None:
@@ -425,19 +448,11 @@ class IRAF(GingaPlugin.GlobalPlugin):
         self.logger.debug("display to %s" %(chname))
 
         try:
-            data = fb.buffer
-            byteswap = False
-            dims = (fb.height, fb.width)
-            dtype = numpy.uint8
             metadata = {}
 
             image = IRAF_AstroImage(logger=self.logger)
-            #image.load_buffer(fb.buffer, dims, dtype, byteswap=byteswap,
-            #                  metadata=metadata)
-            data = numpy.fromstring(fb.buffer, dtype=dtype)
-            data = data.reshape(dims)
-            # Image comes in from IRAF flipped for screen display
-            data = numpy.flipud(data)
+            # a view of the frame buffer, which IRAF may still be filling
+            data = fb.get_array()
             image.set_data(data, metadata=metadata)
             # Save coordinate transform info
             image.set(ct=fb.ct)
@@ -461,6 +476,9 @@ class IRAF(GingaPlugin.GlobalPlugin):
             self.logger.error(errmsg)
             raise GingaPlugin.PluginError(errmsg)
 
+        fb.image = image
+        fb.image_buffer = fb.buffer
+
         # Do the GUI bits as the GUI thread
         self.fv.gui_do(self._gui_display_image, fitsname, image, chname)
 
@@ -7,7 +7,8 @@
 import math
 import time
 import numpy
-import os.path
+import os
+import tempfile
 import threading
 
 from ginga.AstroImage import AstroImage
@@ -33,6 +34,13 @@ class Mosaic(GingaPlugin.LocalPlugin):
     channel.  An instance can be opened for each channel.
 
     Set the FOV and drag files onto the window.
+
+    Files are loaded on several threads, then the tiles are warped
+    (scaled and rotated) and pasted into the mosaic by a pool of worker
+    processes (see the "warp_workers" and "warp_use_processes" settings).
+    Setting "mmap_dir" builds the mosaic in a memory-mapped file, for
+    mosaics larger than memory.  Times for each stage of the processing
+    are shown when the mosaic is finished.
     """
     def __init__(self, fv, fitsimage):
         # superclass defines some variables for us, like logger
@@ -46,6 +54,7 @@ class Mosaic(GingaPlugin.LocalPlugin):
         self.lock = threading.RLock()
         self.read_elapsed = 0.0
         self.process_elapsed = 0.0
+        self.timings = None
         self.ingest_count = 0
         # holds processed images to be inserted into mosaic image
         self.images = []
@@ -71,6 +80,8 @@ class Mosaic(GingaPlugin.LocalPlugin):
         self.settings.set_defaults(annotate_images=False, fov_deg=0.2,
                                    match_bg=False, trim_px=0,
                                    merge=False, num_threads=4,
+                                   warp_workers=4, warp_use_processes=True,
+                                   mmap_dir=None,
                                    drop_creates_new_mosaic=False,
                                    mosaic_hdus=False, skew_limit=0.1,
                                    allow_expand=True, expand_pad_deg=0.01,
@@ -249,7 +260,14 @@ class Mosaic(GingaPlugin.LocalPlugin):
             self.fv.gui_do(self._prepare_mosaic1, "Creating blank image...")
 
             # GC old mosaic
-            self.img_mosaic = None
+            self._release_mosaic()
+
+            mmap_path = None
+            mmap_dir = self.settings.get('mmap_dir', None)
+            if mmap_dir is not None:
+                fd, mmap_path = tempfile.mkstemp(prefix='mosaic',
+                                                 suffix='.dat', dir=mmap_dir)
+                os.close(fd)
 
             img_mosaic = dp.create_blank_image(ra_deg, dec_deg,
                                                fov_deg, px_scale,
@@ -257,7 +275,11 @@ class Mosaic(GingaPlugin.LocalPlugin):
                                                cdbase=cdbase,
                                                logger=self.logger,
                                                pfx='mosaic',
-                                               dtype=dtype)
+                                               dtype=dtype,
+                                               mmap_path=mmap_path)
+            if mmap_path is not None:
+                # the file is deleted when the mosaic is released
+                img_mosaic.own_data_file(mmap_path)
 
             if name is not None:
                 img_mosaic.set(name=name)
@@ -323,17 +345,37 @@ class Mosaic(GingaPlugin.LocalPlugin):
         iminfo.reason_modified = 'Added {0}'.format(
             ','.join([im.get('name') for im in images]))
 
-        loc = self.img_mosaic.mosaic_inline(images,
-                                            bg_ref=bg_ref,
-                                            trim_px=trim_px,
-                                            merge=merge,
-                                            allow_expand=allow_expand,
-                                            expand_pad_deg=expand_pad_deg,
-                                            suppress_callback=True)
+        warp_workers = self.settings.get('warp_workers', 4)
+        if warp_workers > 0:
+            use_processes = self.settings.get('warp_use_processes', True)
+            pipeline = mosaic.MosaicPipeline(self.logger,
+                                             num_workers=warp_workers,
+                                             use_processes=use_processes)
+            loc = pipeline.mosaic(self.img_mosaic, images,
+                                  bg_ref=bg_ref,
+                                  trim_px=trim_px,
+                                  merge=merge,
+                                  allow_expand=allow_expand,
+                                  expand_pad_deg=expand_pad_deg,
+                                  suppress_callback=True,
+                                  ev_intr=self.ev_intr)
+            self.timings = pipeline.timings
+
+        else:
+            loc = self.img_mosaic.mosaic_inline(images,
+                                                bg_ref=bg_ref,
+                                                trim_px=trim_px,
+                                                merge=merge,
+                                                allow_expand=allow_expand,
+                                                expand_pad_deg=expand_pad_deg,
+                                                suppress_callback=True)
+            self.timings = None
 
         # annotate ingested image with its name?
         if annotate and (not allow_expand):
             for i, image in enumerate(images):
+                if loc[i] is None:
+                    continue
                 (xlo, ylo, xhi, yhi) = loc[i]
                 header = image.get_header()
                 if self.ann_fits_kwd is not None:
@@ -348,8 +390,15 @@ class Mosaic(GingaPlugin.LocalPlugin):
         time_intr2 = time.time()
         self.process_elapsed += time_intr2 - time_intr1
 
-    def close(self):
+    def _release_mosaic(self):
+        # delete any files backing the mosaic data; the data itself stays
+        # valid for as long as the channel holds on to the image
+        if self.img_mosaic is not None:
+            self.img_mosaic.release_data_files()
         self.img_mosaic = None
+
+    def close(self):
+        self._release_mosaic()
         self.fv.stop_local_plugin(self.chname, str(self))
         self.gui_up = False
         return True
@@ -374,7 +423,7 @@ class Mosaic(GingaPlugin.LocalPlugin):
         except:
             pass
         # dereference potentially large mosaic image
-        self.img_mosaic = None
+        self._release_mosaic()
         self.fv.show_status("")
 
     def pause(self):
@@ -387,7 +436,7 @@ class Mosaic(GingaPlugin.LocalPlugin):
         self.canvas.ui_set_active(True)
 
     def new_mosaic_cb(self):
-        self.img_mosaic = None
+        self._release_mosaic()
         self.fitsimage.onscreen_message("Drag new files...",
                                         delay=2.0)
 
@@ -461,7 +510,10 @@ class Mosaic(GingaPlugin.LocalPlugin):
                             self.ingest_one(image)
 
                 else:
+                    time_load = time.time()
                     image = image_loader(url)
+                    with self.lock:
+                        self.read_elapsed += time.time() - time_load
 
                     image = self.preprocess(image)
                     self.ingest_one(image)
@@ -485,8 +537,14 @@ class Mosaic(GingaPlugin.LocalPlugin):
         self.end_progress()
 
         total_elapsed = time.time() - self.start_time
-        msg = "Done. Total=%.2f Process=%.2f (sec)" % (
-            total_elapsed, self.process_elapsed)
+        msg = "Done. Total=%.2f Load=%.2f Process=%.2f (sec)" % (
+            total_elapsed, self.read_elapsed, self.process_elapsed)
+        if self.timings is not None:
+            # per-stage times; warp and paste are summed over workers
+            msg += "\nPlan=%.2f Alloc=%.2f Warp=%.2f Paste=%.2f (sec)" % (
+                self.timings.plan, self.timings.alloc, self.timings.warp,
+                self.timings.paste)
+        self.logger.info(msg)
         self.update_status(msg)
 
         self.fv.gui_do(self.fitsimage.redraw, whence=0)
@@ -506,6 +564,7 @@ class Mosaic(GingaPlugin.LocalPlugin):
         self.ingest_count = 0
         self.images = []
         self.ev_intr.clear()
+        self.read_elapsed = 0.0
         self.process_elapsed = 0.0
         self.init_progress()
         self.start_time = time.time()
@@ -6,22 +6,17 @@
 #
 import time
 import re, os
-from distutils import spawn
-from contextlib import contextmanager
 
 from ginga.gw import Widgets
 from ginga.misc import Future, Bunch
 from ginga import GingaPlugin
 from ginga.util.iohelper import get_hdu_suffix
-from ginga.util.videosink import VideoSink
+from ginga.util.playback import CubePlayer
+from ginga.util import frameexport
 
 import numpy as np
 import matplotlib.pyplot as plt
 
-have_mencoder = False
-if spawn.find_executable("mencoder"):
-    have_mencoder = True
-
 
 class MultiDim(GingaPlugin.LocalPlugin):
     """
@@ -44,6 +39,23 @@ class MultiDim(GingaPlugin.LocalPlugin):
     ----------------
     Use the controls in the lower part of the UI to select the axis and
     to step through the planes in that axis.
+
+    During playback the next few planes are prepared in the background
+    with the current pan, zoom and cut levels, and planes that cannot be
+    shown in time are skipped to keep to the chosen interval.  The
+    achieved and target frame rates are shown next to the interval.
+
+    Saving Movies
+    -------------
+    "Save Movie" renders the planes from "Start" to "End" with the current
+    pan, zoom, cut levels and color map, and saves them at the playback
+    rate.  The format is chosen by the file name: ``.y4m`` (raw video, for
+    encoding with e.g. ``ffmpeg``), ``.gif`` or ``.apng`` (animations), or
+    a PNG or JPEG file name with a frame number format such as
+    ``plane_%04d.png`` (one file per plane).  Frames are encoded in the
+    background while the next planes are rendered.  Animations are kept
+    in memory until they are saved, so they are limited to 500 frames;
+    use ``.y4m`` or image files for longer movies.
     """
     def __init__(self, fv, fitsimage):
         # superclass defines some variables for us, like logger
@@ -71,9 +83,16 @@ class MultiDim(GingaPlugin.LocalPlugin):
         # Load plugin preferences
         prefs = self.fv.get_preferences()
         self.settings = prefs.create_category('plugin_MultiDim')
-        self.settings.set_defaults(auto_start_naxis=False)
+        self.settings.set_defaults(auto_start_naxis=False,
+                                   play_prefetch=4, play_workers=2,
+                                   export_workers=2, export_max_frames=8)
         self.settings.load(onError='silent')
 
+        self.player = CubePlayer(self.logger, fitsimage,
+                                 num_workers=self.settings['play_workers'],
+                                 prefetch=self.settings['play_prefetch'])
+        self.player.add_callback('frame-shown', self._play_frame_cb)
+
         self.gui_up = False
 
     def build_gui(self, container):
@@ -155,24 +174,21 @@ class MultiDim(GingaPlugin.LocalPlugin):
         vbox.add_widget(w, stretch=0)
 
         fr = Widgets.Frame("Movie")
-        if have_mencoder:
-            captions = [("Start:", 'label', "Start Slice", 'entry',
-                         "End:", 'label', "End Slice", 'entry',
-                         'Save Movie', 'button')]
-            w, b = Widgets.build_info(captions, orientation=orientation)
-            self.w.update(b)
-            b.start_slice.set_tooltip("Starting slice")
-            b.end_slice.set_tooltip("Ending slice")
-            b.start_slice.set_length(6)
-            b.end_slice.set_length(6)
-            b.save_movie.add_callback(
-                'activated', lambda w: self.save_movie_cb())
-            b.save_movie.set_enabled(False)
-            fr.set_widget(w)
-        else:
-            infolbl = Widgets.Label()
-            infolbl.set_text("Please install 'mencoder' to save as movie")
-            fr.set_widget(infolbl)
+        captions = [("Start:", 'label', "Start Slice", 'entry',
+                     "End:", 'label', "End Slice", 'entry',
+                     'Save Movie', 'button')]
+        w, b = Widgets.build_info(captions, orientation=orientation)
+        self.w.update(b)
+        b.start_slice.set_tooltip("Starting slice")
+        b.end_slice.set_tooltip("Ending slice")
+        b.start_slice.set_length(6)
+        b.end_slice.set_length(6)
+        b.save_movie.add_callback(
+            'activated', lambda w: self.save_movie_cb())
+        b.save_movie.set_tooltip("Save slices as a movie (.y4m, .gif, "
+                                 ".apng) or images (e.g. slice_%04d.png)")
+        b.save_movie.set_enabled(False)
+        fr.set_widget(w)
         vbox.add_widget(fr, stretch=0)
 
         #spacer = Widgets.Label('')
@@ -318,8 +334,7 @@ class MultiDim(GingaPlugin.LocalPlugin):
         self.w.interval.set_enabled(is_dc)
 
         self.w.save_slice.set_enabled(is_dc)
-        if have_mencoder:
-            self.w.save_movie.set_enabled(is_dc)
+        self.w.save_movie.set_enabled(is_dc)
 
     def close(self):
         self.fv.stop_local_plugin(self.chname, str(self))
@@ -454,8 +469,18 @@ class MultiDim(GingaPlugin.LocalPlugin):
             return
         self.play_image = image
         self._isplaying = True
-        image.block_callback('modified')
         self.play_last_time = time.time()
+        # start with the plane after the current one
+        try:
+            self.player.start(image, self.naxispath, self.play_axis,
+                              self.play_idx, fps=1.0 / self.play_int_sec)
+
+        except Exception as e:
+            self._isplaying = False
+            self.play_image = None
+            self.fv.show_error("Error starting playback: %s" % (str(e)))
+            return
+
         self.play_next(self.timer)
 
     def _play_next_cb(self, timer):
@@ -473,27 +498,42 @@ class MultiDim(GingaPlugin.LocalPlugin):
             self.play_stop()
             return
 
-        time_start = time.time()
-        deadline = time_start + self.play_int_sec
-
-        # calculate fps
-        fps = 1.0 / (time_start - self.play_last_time)
-        self.play_last_time = time_start
-        if int(fps) != int(self.play_fps):
-            self.play_fps = fps
-            self.w.fps.set_text(str("%.2f fps" % fps))
+        delta = self.player.tick()
+        if delta is None:
+            # player stopped (e.g. the image was changed)
+            self.play_stop()
+            return
 
-        self.next_slice()
+        # show achieved vs. target frame rate (about once a second)
+        time_now = time.time()
+        if time_now - self.play_last_time > 1.0:
+            self.play_last_time = time_now
+            stats = self.player.get_stats()
+            self.play_fps = stats['fps']
+            self.w.fps.set_text("%.1f/%.1f fps" % (stats['fps'],
+                                                   stats['target_fps']))
 
         # set timer for next turnaround
-        delta = deadline - time.time()
-        timer.set(max(delta, 0.001))
+        timer.set(delta)
+
+    def _play_frame_cb(self, player, idx):
+        # a plane was shown by the player
+        self.play_idx = idx + 1
+        self.naxispath[self.play_axis - 2] = idx
+        if self.play_indices:
+            text = list(self.naxispath)
+        else:
+            text = idx
+        self.w.slice.set_text(str(text))
 
     def play_stop(self):
         self._isplaying = False
-        if self.play_image is not None:
-            self.play_image.unblock_callback('modified')
-            self.play_image = None
+        idx = self.player.stop()
+        image, self.play_image = self.play_image, None
+        if (idx is not None) and (image is not None) and \
+               (image is self.fitsimage.get_image()):
+            # finish on the last plane shown, with its data range
+            self.set_naxis_cb(None, idx + 1, self.play_axis)
 
     def first_slice(self):
         play_idx = 1
@@ -518,6 +558,7 @@ class MultiDim(GingaPlugin.LocalPlugin):
     def play_int_cb(self, w, val):
         # force at least play_min_sec, otherwise playback is untenable
         self.play_int_sec = max(self.play_min_sec, val)
+        self.player.set_fps(1.0 / self.play_int_sec)
 
     def prep_hdu_menu(self, w, hdu_info):
         # clear old TOC
@@ -605,34 +646,27 @@ class MultiDim(GingaPlugin.LocalPlugin):
             start = 0
 
         target = Widgets.SaveDialog(title='Save Movie',
-                                    selectedfilter='*.avi').get_path()
+                                    selectedfilter='*.y4m').get_path()
         if target:
             self.save_movie(start, end, target)
 
     def save_movie(self, start, end, target_file):
-        image = self.fitsimage.get_image()
-        loval, hival = self.fitsimage.get_cut_levels()
-        data = np.array(image.get_mddata()).clip(loval, hival)
-
-        # http://stackoverflow.com/questions/7042190/plotting-directly-to-movie-with-numpy-and-mencoder
-        data_rescaled = ((data - loval) * 255 / (hival - loval)).astype(
-            np.uint8, copy=False)
-
-        W, H = image.get_data_size()
-        with self.video_writer(VideoSink((H, W), target_file)) as video:
-            for i in range(start, end):
-                video.write(np.flipud(data_rescaled[i]))
+        self.play_stop()
+        try:
+            sink = frameexport.get_sink(target_file,
+                                        fps=1.0 / self.play_int_sec)
+            stats = frameexport.export_cube(
+                self.fitsimage, sink, axis=self.play_axis,
+                start=start, stop=end,
+                num_workers=self.settings['export_workers'],
+                max_frames=self.settings['export_max_frames'])
 
-        self.fv.show_status("Successfully saved movie")
+        except Exception as e:
+            self.fv.show_error("Error saving movie: %s" % (str(e)))
+            return
 
-    @contextmanager
-    def video_writer(self, v):
-        v.open()
-        try:
-            yield v
-        finally:
-            v.close()
-        return
+        self.fv.show_status("Successfully saved movie (%d frames)" % (
+            stats['written']))
 
     def __str__(self):
         return 'multidim'
@@ -6,7 +6,7 @@
 #
 import numpy
 
-from ginga import GingaPlugin, RGBImage, colors
+from ginga import GingaPlugin, colors
 from ginga.gw import Widgets
 
 class Overlays(GingaPlugin.LocalPlugin):
@@ -59,9 +59,6 @@ class Overlays(GingaPlugin.LocalPlugin):
         self.lo_color = 'blue'
         self.lo_value = None
         self.opacity = 0.5
-        self.arrsize = None
-        self.rgbarr = numpy.zeros((1, 1, 4), dtype=numpy.uint8)
-        self.rgbobj = RGBImage.RGBImage(self.rgbarr, logger=self.logger)
         self.canvas_img = None
 
     def build_gui(self, container):
@@ -162,8 +159,8 @@ class Overlays(GingaPlugin.LocalPlugin):
         self.fv.show_status("Enter a value for saturation limit")
 
     def stop(self):
-        self.arrsize = None
-        self.rgbobj.set_data(self.rgbarr)
+        self.canvas_img = None
+        self.canvas.delete_all_objects()
 
         # remove the canvas from the image
         p_canvas = self.fitsimage.get_canvas()
@@ -193,70 +190,49 @@ class Overlays(GingaPlugin.LocalPlugin):
 
         # look up the colors
         self.hi_color = self.colornames[self.w.hi_color.get_index()]
-        try:
-            rh, gh, bh = colors.lookup_color(self.hi_color)
-        except KeyError:
-            self.fv.show_error("No such color found: '%s'" % (self.hi_color))
-
         self.lo_color = self.colornames[self.w.lo_color.get_index()]
-        try:
-            rl, gl, bl = colors.lookup_color(self.lo_color)
-        except KeyError:
-            self.fv.show_error("No such color found: '%s'" % (self.lo_color))
+        for color in (self.hi_color, self.lo_color):
+            try:
+                colors.lookup_color(color)
+            except KeyError:
+                self.fv.show_error("No such color found: '%s'" % (color))
+                return
 
         image = self.fitsimage.get_image()
         if image is None:
             return
 
-        self.logger.debug("preparing RGB image")
-        wd, ht = image.get_size()
-        if (wd, ht) != self.arrsize:
-            rgbarr = numpy.zeros((ht, wd, 4), dtype=numpy.uint8)
-            self.arrsize = (wd, ht)
-            self.rgbobj.set_data(rgbarr)
-
-        else:
-            rgbarr = self.rgbobj.get_data()
-
-        # Set array to the desired saturation color
-        rc = self.rgbobj.get_slice('R')
-        gc = self.rgbobj.get_slice('G')
-        bc = self.rgbobj.get_slice('B')
-        ac = self.rgbobj.get_slice('A')
-
-        self.logger.debug("Calculating alpha channel")
-        # set alpha channel according to saturation limit
-        try:
-            data = image.get_data()
-            ac[:] = 0
-            if self.hi_value is not None:
-                idx = data >= self.hi_value
-                rc[idx] = int(rh * 255)
-                gc[idx] = int(gh * 255)
-                bc[idx] = int(bh * 255)
-                ac[idx] = int(self.opacity * 255)
-            if self.lo_value is not None:
-                idx = data <= self.lo_value
-                rc[idx] = int(rl * 255)
-                gc[idx] = int(gl * 255)
-                bc[idx] = int(bl * 255)
-                ac[idx] = int(self.opacity * 255)
-        except Exception as e:
-            self.logger.error("Error setting alpha channel: %s" % (str(e)))
+        # label 1 is over the high limit, label 2 under the low limit;
+        # the labels are only calculated for the visible part of the image
+        palette = [(self.hi_color, self.opacity),
+                   (self.lo_color, self.opacity)]
 
         if self.canvas_img is None:
             self.logger.debug("Adding image to canvas")
-            self.canvas_img = self.dc.Image(0, 0, self.rgbobj)
+            self.canvas_img = self.dc.MaskImage(0, 0, image, palette=palette,
+                                                predicate=self.get_labels)
             self.canvas.add(self.canvas_img)
         else:
             self.logger.debug("Updating canvas image")
-            self.canvas_img.set_image(self.rgbobj)
+            self.canvas_img.set_palette(palette)
+            self.canvas_img.set_predicate(self.get_labels)
+            if self.canvas_img.get_image() is not image:
+                self.canvas_img.set_image(image)
 
         self.logger.debug("redrawing canvas")
         self.canvas.update_canvas()
 
         self.logger.debug("redo completed")
 
+    def get_labels(self, data):
+        """Return the overlay labels for an array of image data."""
+        labels = numpy.zeros(data.shape, dtype=numpy.uint8)
+        if self.hi_value is not None:
+            labels[data >= self.hi_value] = 1
+        if self.lo_value is not None:
+            labels[data <= self.lo_value] = 2
+        return labels
+
     def clear(self, canvas, button, data_x, data_y):
         self.canvas_img = None
         self.canvas.delete_all_objects()
@@ -35,7 +35,11 @@ class Pan(GingaPlugin.GlobalPlugin):
     channel image.
 
     The color/intensity map and cut levels of the Pan image are updated
-    when they are changed in the corresponding channel image.
+    when they are changed in the corresponding channel image.  The Pan
+    image is drawn from a decimated rendering of the channel image that
+    is shared with the Thumbs plugin, and is only recomputed when the
+    image, cut levels or color map change; panning the channel image just
+    moves the rectangle.
     The Pan image also displays the World Coordinate System compass, if
     valid WCS metadata is present in the FITS HDU being viewed in the
     channel.
@@ -49,6 +53,7 @@ class Pan(GingaPlugin.GlobalPlugin):
 
         self.active = None
         self.info = None
+        self.render_cache = fv.get_render_cache()
 
         fv.add_callback('add-channel', self.add_channel)
         fv.add_callback('delete-channel', self.delete_channel)
@@ -118,14 +123,14 @@ class Pan(GingaPlugin.GlobalPlugin):
         self.nb.add_widget(iw)
         index = self.nb.index_of(iw)
         paninfo = Bunch.Bunch(panimage=panimage, widget=iw,
-                              pancompass=None, panrect=None)
+                              pancompass=None, panrect=None, panobj=None)
         channel.extdata._pan_info = paninfo
 
         # Extract RGBMap object from main image and attach it to this
         # pan image
         rgbmap = fitsimage.get_rgbmap()
         panimage.set_rgbmap(rgbmap)
-        rgbmap.add_callback('changed', self.rgbmap_cb, panimage)
+        rgbmap.add_callback('changed', self.rgbmap_cb, channel, paninfo)
 
         fitsimage.copy_attributes(panimage, ['cutlevels'])
 
@@ -172,9 +177,12 @@ class Pan(GingaPlugin.GlobalPlugin):
 
     # CALLBACKS
 
-    def rgbmap_cb(self, rgbmap, panimage):
+    def rgbmap_cb(self, rgbmap, channel, paninfo):
         # color mapping has changed in some way
-        panimage.redraw(whence=1)
+        if self.use_shared_canvas:
+            paninfo.panimage.redraw(whence=1)
+        else:
+            self.update_pan_image(channel, paninfo)
 
     def redo(self, channel, image):
         paninfo = channel.extdata._pan_info
@@ -229,6 +237,9 @@ class Pan(GingaPlugin.GlobalPlugin):
 
     def settings_cb(self, setting, value, fitsimage, channel, paninfo, whence):
         #paninfo.panimage.redraw(whence=whence)
+        if whence <= 0:
+            # transform changed: refit the pan image
+            paninfo.panimage.zoom_fit()
         self.panset(channel.fitsimage, channel, paninfo)
         return True
 
@@ -251,9 +262,11 @@ class Pan(GingaPlugin.GlobalPlugin):
             return
 
         if not self.use_shared_canvas:
-            paninfo.panimage.set_image(image)
-        else:
-            paninfo.panimage.zoom_fit()
+            # the viewer gets the image for its geometry, coordinates
+            # and WCS, but shows the shared rendering of it instead
+            paninfo.panimage.set_image(image, add_to_canvas=False)
+            self.update_pan_image(channel, paninfo)
+        paninfo.panimage.zoom_fit()
 
         p_canvas = paninfo.panimage.get_private_canvas()
         # remove old compass
@@ -291,6 +304,43 @@ class Pan(GingaPlugin.GlobalPlugin):
 
         self.panset(channel.fitsimage, channel, paninfo)
 
+    def update_pan_image(self, channel, paninfo):
+        """Show the rendering of the channel image from the shared render
+        cache in the pan image.  The rendering is only recomputed if the
+        image, cut levels or color map have changed; returns True if it was.
+        """
+        fitsimage = channel.fitsimage
+        image = fitsimage.get_image()
+        if (image is None) or not isinstance(image, BaseImage):
+            return False
+
+        autocuts = fitsimage.get_canvas_image().autocuts
+        if autocuts is None:
+            autocuts = fitsimage.autocuts
+        rgbimage = self.render_cache.get_rgb(image,
+                                             fitsimage.get_cut_levels(),
+                                             fitsimage.get_rgbmap(),
+                                             autocuts)
+        obj = paninfo.panobj
+        if (obj is not None) and (obj.get_image() is rgbimage):
+            return False
+
+        # the rendering is decimated: scale it up to the image size
+        step = self.render_cache.get_step(image)
+        panimage = paninfo.panimage
+        if obj is None:
+            obj = self.dc.Image(0, 0, rgbimage, scale_x=step, scale_y=step)
+            canvas = panimage.get_canvas()
+            canvas.add(obj, tag='_pan_image', redraw=False)
+            canvas.lower_object(obj)
+            paninfo.panobj = obj
+        else:
+            obj.set_image(rgbimage)
+            obj.set_scale(step, step)
+
+        panimage.redraw(whence=2)
+        return True
+
     def panset(self, fitsimage, channel, paninfo):
         image = fitsimage.get_image()
         if (image is None) or not isinstance(image, BaseImage):
@@ -298,6 +348,10 @@ class Pan(GingaPlugin.GlobalPlugin):
             #paninfo.panimage.clear()
             return
 
+        if not self.use_shared_canvas:
+            # picks up changes to the image data, cut levels, etc.
+            self.update_pan_image(channel, paninfo)
+
         x, y = fitsimage.get_pan()
         points = fitsimage.get_pan_rect()
 
@@ -325,7 +379,8 @@ class Pan(GingaPlugin.GlobalPlugin):
             point.x, point.y = x, y
             point.radius = radius
             bbox.points = points
-            p_canvas.update_canvas(whence=0)
+            # only the pan marks need to be redrawn
+            p_canvas.update_canvas(whence=3)
 
         except KeyError:
             paninfo.panrect = p_canvas.add(self.dc.CompoundObject(
@@ -334,8 +389,6 @@ class Pan(GingaPlugin.GlobalPlugin):
                 self.dc.Polygon(points,
                                 color=self.settings.get('pan_rectangle_color', 'red'))))
 
-        #p_canvas.update_canvas(whence=0)
-        paninfo.panimage.zoom_fit()
         return True
 
     def motion_cb(self, fitsimage, event, data_x, data_y):
@@ -11,7 +11,7 @@ from collections import OrderedDict
 import os.path
 
 from ginga.gw import Widgets, Viewers
-from ginga.misc import Bunch
+from ginga.misc import Bunch, Scheduler
 from ginga.util import iqcalc, plots, wcs
 from ginga import GingaPlugin
 from ginga.util.six.moves import map, zip, filter
@@ -228,7 +228,6 @@ class Pick(GingaPlugin.LocalPlugin):
         self.serialnum = 0
         self.lock = threading.RLock()
         self.lock2 = threading.RLock()
-        self.ev_intr = threading.Event()
 
         self.last_rpt = []
         self.rpt_dict = OrderedDict({})
@@ -998,9 +997,8 @@ class Pick(GingaPlugin.LocalPlugin):
         self.fv.show_status("")
 
     def redo_manual(self):
+        # a new search supersedes (interrupts) one in progress
         serialnum = self.bump_serial()
-        self.ev_intr.set()
-
         self._redo(serialnum)
 
     def redo(self):
@@ -1055,23 +1053,23 @@ class Pick(GingaPlugin.LocalPlugin):
             self.pickcenter.color = 'red'
 
             # Offload this task to another thread so that GUI remains
-            # responsive
-            self.fv.nongui_do(self.search, serialnum, data,
-                              x1, y1, wd, ht, pickobj)
+            # responsive; this interrupts any search already in progress
+            self.fv.nongui_schedule((self.chname, str(self)),
+                                    Scheduler.PRI_VISIBLE, self.search,
+                                    serialnum, data, x1, y1, wd, ht, pickobj)
 
         except Exception as e:
             self.logger.error("Error calculating quality metrics: %s" % (
                 str(e)))
             return True
 
-    def search(self, serialnum, data, x1, y1, wd, ht, pickobj):
+    def search(self, token, serialnum, data, x1, y1, wd, ht, pickobj):
 
         with self.lock2:
             if serialnum != self.get_serial():
                 return
 
             self.pgs_cnt = 0
-            self.ev_intr.clear()
             self.fv.gui_call(self.init_progress)
 
             msg, results, qs = None, None, None
@@ -1096,7 +1094,7 @@ class Pick(GingaPlugin.LocalPlugin):
                 objlist = self.iqcalc.evaluate_peaks(peaks, data,
                                                      fwhm_radius=self.radius,
                                                      cb_fn=cb_fn,
-                                                     ev_intr=self.ev_intr,
+                                                     ev_intr=token,
                                                      fwhm_method=self.fwhm_alg)
 
                 num_candidates = len(objlist)
@@ -1313,7 +1311,7 @@ class Pick(GingaPlugin.LocalPlugin):
         return True
 
     def eval_intr(self):
-        self.ev_intr.set()
+        self.fv.nongui_cancel((self.chname, str(self)))
 
     def draw_cb(self, canvas, tag):
         obj = canvas.get_object_by_tag(tag)
@@ -22,6 +22,11 @@ class Pipeline(GingaPlugin.LocalPlugin):
     ------------------
     Crosshair is a local plugin, which means it is associated with a channel.
     An instance can be opened for each channel.
+
+    Bias and flat images are combined from the image stack a block of
+    rows at a time (see `ginga.util.dp.combine_stack`), so memory use is
+    bounded by the "mem_budget_mb" setting rather than by the number of
+    images in the stack.
     """
     def __init__(self, fv, fitsimage):
         # superclass defines some variables for us, like logger
@@ -30,7 +35,9 @@ class Pipeline(GingaPlugin.LocalPlugin):
         # Load preferences
         prefs = self.fv.get_preferences()
         self.settings = prefs.create_category('plugin_Pipeline')
-        self.settings.set_defaults(num_threads=4)
+        self.settings.set_defaults(num_threads=4, combine_method='median',
+                                   mem_budget_mb=256, sigma=3.0,
+                                   num_reject_low=1, num_reject_high=1)
         self.settings.load(onError='silent')
 
         # For building up an image stack
@@ -119,10 +126,19 @@ class Pipeline(GingaPlugin.LocalPlugin):
         # Image list
         captions = [
             ("Append", 'button', "Prepend", 'button', "Clear", 'button'),
+            ("Combine:", 'label', "Combine method", 'combobox'),
             ]
         w, b = Widgets.build_info(captions, orientation=orientation)
         self.w.update(b)
 
+        combobox = b.combine_method
+        method = self.settings.get('combine_method', 'median')
+        for name in dp.combine_methods:
+            combobox.append_text(name)
+        combobox.set_index(dp.combine_methods.index(method))
+        combobox.add_callback('activated', self.set_combine_method_cb)
+        combobox.set_tooltip("Method for combining the stack")
+
         fr = Widgets.Frame("Image Stack")
 
         vbox = Widgets.VBox()
@@ -239,10 +255,28 @@ class Pipeline(GingaPlugin.LocalPlugin):
         self.update_stack_gui()
         self.fv.add_image(name, image, chname=chname)
 
+    def set_combine_method_cb(self, w, index):
+        method = dp.combine_methods[index]
+        self.settings.set(combine_method=method)
+
+    def get_combine_params(self):
+        """Return keyword arguments for dp.combine_stack from settings."""
+        method = self.settings.get('combine_method', 'median')
+        mem_budget = int(self.settings.get('mem_budget_mb', 256) * 1024**2)
+        kwargs = dict(method=method, mem_budget=mem_budget,
+                      num_threads=self.settings.get('num_threads', 4),
+                      logger=self.logger)
+        if method == 'sigmaclip':
+            kwargs['sigma'] = self.settings.get('sigma', 3.0)
+        elif method == 'minmax':
+            kwargs['num_low'] = self.settings.get('num_reject_low', 1)
+            kwargs['num_high'] = self.settings.get('num_reject_high', 1)
+        return kwargs
+
     # BIAS
 
     def _make_bias(self):
-        image = dp.make_bias(self.imglist)
+        image = dp.make_bias(self.imglist, **self.get_combine_params())
         self.imglist = []
         self.fv.gui_do(self.show_result, image)
         self.update_status("Made bias image.")
@@ -269,7 +303,7 @@ class Pipeline(GingaPlugin.LocalPlugin):
     # FLAT FIELDING
 
     def _make_flat_field(self):
-        result = dp.make_flat(self.imglist)
+        result = dp.make_flat(self.imglist, **self.get_combine_params())
         self.imglist = []
         self.show_result(result)
         self.update_status("Made flat field.")
@@ -91,6 +91,8 @@ class PixTable(GingaPlugin.LocalPlugin):
         self.sizes = [ 1, 2, 3, 4 ]
         self.maxdigits = 9
         self.fmt_cell = '{:> %d.%dg}'% (self.maxdigits-1, self.maxdigits // 2)
+        # same, for formatting the whole table at once
+        self.fmt_arr = '%% %d.%dg' % (self.maxdigits-1, self.maxdigits // 2)
         self.lastx = 0
         self.lasty = 0
         self.font = self.settings.get('font', 'fixed')
@@ -304,11 +306,11 @@ class PixTable(GingaPlugin.LocalPlugin):
         avgval = numpy.average(data)
         fmt_cell = self.fmt_cell
 
-        # can we do this with a numpy.vectorize() fn call and
-        # speed things up?
+        # format all the cells in one go
+        txt = numpy.char.mod(self.fmt_arr, data[:width, :height])
         for i in range(width):
             for j in range(height):
-                self.txt_arr[i][j].text = fmt_cell.format(data[i][j])
+                self.txt_arr[i][j].text = txt[i, j]
 
         ctr_txt = self.txt_arr[width // 2][height // 2]
 
@@ -441,7 +443,11 @@ class PixTable(GingaPlugin.LocalPlugin):
         if self.pixview is None:
             return
 
+        last_pt = (int(self.lastx+0.5), int(self.lasty+0.5))
         self.lastx, self.lasty = data_x, data_y
+        if (int(data_x+0.5), int(data_y+0.5)) == last_pt:
+            # still over the same pixel: the table would not change
+            return False
 
         self.redo()
         return False
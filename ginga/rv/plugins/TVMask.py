@@ -15,7 +15,7 @@ from ginga import colors
 from ginga.GingaPlugin import LocalPlugin
 from ginga.gw import Widgets
 from ginga.misc import Bunch
-from ginga.util.dp import masktorgb
+from ginga.util.dp import masktoimage
 
 # Need this for API doc to build without warning
 try:
@@ -266,7 +266,7 @@ class TVMask(LocalPlugin):
 
         try:
             # 0=False, everything else True
-            dat = fits.getdata(filename).astype(np.bool)
+            dat = fits.getdata(filename).astype(bool)
         except Exception as e:
             self.logger.error('{0}: {1}'.format(e.__class__.__name__, str(e)))
             return
@@ -287,8 +287,8 @@ class TVMask(LocalPlugin):
         self._seqno += 1
 
         # Create mask layer
-        obj = self.dc.Image(0, 0, masktorgb(
-            dat, color=self.maskcolor, alpha=self.maskalpha))
+        obj = self.dc.MaskImage(0, 0, masktoimage(dat),
+                                palette=[(self.maskcolor, self.maskalpha)])
         self._maskobjs.append(obj)
 
         self.redo()
@@ -303,9 +303,8 @@ class TVMask(LocalPlugin):
         self.treeview.set_tree(self.tree_dict)
 
     def _rgbtomask(self, obj):
-        """Convert RGB arrays from mask canvas object back to boolean mask."""
-        dat = obj.get_image().get_data()  # RGB arrays
-        return dat.sum(axis=2).astype(np.bool)  # Convert to 2D mask
+        """Get boolean mask from mask canvas object."""
+        return obj.get_mask()
 
     def hl_table2canvas(self, w, res_dict):
         """Highlight mask on canvas when user click on table."""
@@ -321,9 +320,10 @@ class TVMask(LocalPlugin):
         for sub_dict in itervalues(res_dict):
             for seqno in sub_dict:
                 mobj = self._maskobjs[int(seqno) - 1]
-                dat = self._rgbtomask(mobj)
-                obj = self.dc.Image(0, 0, masktorgb(
-                    dat, color=self.hlcolor, alpha=self.hlalpha))
+                # share the label image of the mask
+                obj = self.dc.MaskImage(0, 0, mobj.get_image(),
+                                        palette=[(self.hlcolor,
+                                                  self.hlalpha)])
                 objlist.append(obj)
 
         # Draw on canvas
@@ -7,9 +7,9 @@
 import os
 import threading
 
-from ginga import GingaPlugin
+from ginga import GingaPlugin, RGBMap
 from ginga.misc import Bunch
-from ginga.util import iohelper
+from ginga.util import iohelper, thumbsvc
 from ginga.gw import Widgets, Viewers
 
 
@@ -37,6 +37,13 @@ class Thumbs(GingaPlugin.GlobalPlugin):
 
     The "Auto Scroll" checkbox, if checked, will cause the Thumbs pan to
     scroll to the active image.
+
+    Thumbnails are generated in the background, from a decimated view of
+    the data that is read directly from the file where possible, and
+    rendered with the color map of the channel.  Rendered thumbnails are
+    kept in a cache on disk (see "cache_thumbs" and "thumb_cache_dir" in
+    the "plugin_Thumbs.cfg" configuration file), so revisiting a
+    directory of images is fast.
     """
     def __init__(self, fv):
         # superclass defines some variables for us, like logger
@@ -56,8 +63,11 @@ class Thumbs(GingaPlugin.GlobalPlugin):
 
         prefs = self.fv.get_preferences()
         self.settings = prefs.create_category('plugin_Thumbs')
-        self.settings.add_defaults(cache_thumbs=False,
-                                   cache_location='local',
+        self.settings.add_defaults(cache_thumbs=True,
+                                   thumb_cache_dir=None,
+                                   thumb_cache_max_mb=256,
+                                   thumb_workers=2,
+                                   autocut_method='zscale',
                                    auto_scroll=True,
                                    rebuild_wait=4.0,
                                    tt_keywords=tt_keywords,
@@ -78,6 +88,27 @@ class Thumbs(GingaPlugin.GlobalPlugin):
         self.lagtime = self.settings.get('rebuild_wait', 4.0)
         self.thmblock = threading.RLock()
 
+        # background thumbnail generation
+        cache = None
+        if self.settings.get('cache_thumbs', True):
+            cachedir = self.settings.get('thumb_cache_dir', None)
+            if cachedir is None:
+                cachedir = os.path.join(prefs.get_baseFolder(), 'thumbs',
+                                        'cache')
+            max_mb = self.settings.get('thumb_cache_max_mb', 256)
+            cache = thumbsvc.ThumbCache(cachedir, self.logger,
+                                        max_bytes=int(max_mb * 1024**2))
+        self.thumbsvc = thumbsvc.ThumbnailService(
+            self.logger, cache=cache,
+            num_workers=self.settings.get('thumb_workers', 2),
+            scheduler=self.fv.scheduler,
+            render_cache=self.fv.get_render_cache())
+        # thumbkey -> serial number of latest outstanding request
+        self.thumb_pending = {}
+        self.thumb_serial = 0
+        # chname -> copy of the channel's RGB mapper, for the workers
+        self.thumb_rgbmaps = {}
+
         # TODO: these maybe should be configurable by channel
         # different instruments have different keywords of interest
         self.keywords = self.settings.get('tt_keywords', tt_keywords)
@@ -102,11 +133,15 @@ class Thumbs(GingaPlugin.GlobalPlugin):
 
         thumb_len = self.settings.get('thumb_length', 192)
 
+        # Thumbnails arrive already color mapped from the thumbnail
+        # service, so this viewer only passes the RGB data through
+        # to make a native image
         tg = Viewers.ImageViewCanvas(logger=self.logger)
         tg.configure_window(thumb_len, thumb_len)
         tg.enable_autozoom('on')
-        tg.set_autocut_params('zscale')
-        tg.enable_autocuts('override')
+        tg.enable_autocuts('off')
+        tg.set_rgbmap(RGBMap.PassThruRGBMapper(self.logger))
+        tg.cut_levels(0, 255)
         tg.enable_auto_orient(True)
         tg.defer_redraw = False
         tg.set_bg(0.7, 0.7, 0.7)
@@ -183,7 +218,7 @@ class Thumbs(GingaPlugin.GlobalPlugin):
         # in the same channel
         thumbkey = self.get_thumb_key(chname, name, path)
         with self.thmblock:
-            if thumbkey in self.thumbDict:
+            if thumbkey in self.thumbDict or thumbkey in self.thumb_pending:
                 return
 
         # Get metadata for mouse-over tooltip
@@ -193,13 +228,7 @@ class Thumbs(GingaPlugin.GlobalPlugin):
             metadata[kwd] = header.get(kwd, 'N/A')
         metadata[self.settings.get('mouseover_name_key', 'NAME')] = name
 
-        thumbpath = self.get_thumbpath(path)
-
-        with self.thmblock:
-            self.copy_attrs(chinfo.fitsimage)
-            thumb_np = image.get_thumbnail(self.thumbWidth)
-            self.thumb_generator.set_data(thumb_np)
-            imgwin = self.thumb_generator.get_plain_image_as_widget()
+        mtime = self.get_file_mtime(path)
 
         label_length = self.settings.get('label_length', None)
         label_cutoff = self.settings.get('label_cutoff', 'right')
@@ -209,8 +238,82 @@ class Thumbs(GingaPlugin.GlobalPlugin):
             thumbname = iohelper.shorten_name(thumbname, label_length,
                                               side=label_cutoff)
 
-        self.insert_thumbnail(imgwin, thumbkey, thumbname, chname, name, path,
-                              thumbpath, metadata, future)
+        def _insert(imgwin, header):
+            self.insert_thumbnail(imgwin, thumbkey, thumbname, chname, name,
+                                  path, mtime, metadata, future)
+
+        self.request_thumb(thumbkey, chname, _insert, image=image)
+
+    def request_thumb(self, thumbkey, chname, ready_fn, path=None, idx=None,
+                      image=None, cuts=None, loader=None):
+        """Ask the thumbnail service for a thumbnail, from the in-memory
+        `image` or else the file `path`.  When it is ready,
+        ``ready_fn(imgwin, header)`` is called on the GUI thread with the
+        native image and the tooltip keywords.  Only the latest request
+        for a given `thumbkey` is honored.
+        """
+        with self.thmblock:
+            self.thumb_serial += 1
+            serial = self.thumb_serial
+            self.thumb_pending[thumbkey] = serial
+
+        def _ready(res):
+            # called from a thumbnail service thread
+            self.fv.gui_do(self._thumb_ready, thumbkey, serial, chname,
+                           res, ready_fn)
+
+        self.thumbsvc.request(_ready, path=path, idx=idx, image=image,
+                              length=self.thumbWidth,
+                              rgbmap=self.get_thumb_rgbmap(chname),
+                              cuts=cuts, keywords=self.keywords,
+                              autocut_method=self.settings.get(
+                                  'autocut_method', 'zscale'),
+                              loader=loader, key=thumbkey)
+
+    def _thumb_ready(self, thumbkey, serial, chname, res, ready_fn):
+        with self.thmblock:
+            if self.thumb_pending.get(thumbkey, None) != serial:
+                # superceded or cancelled
+                return
+            del self.thumb_pending[thumbkey]
+
+        if res.rgb is None:
+            # TODO: generate "broken thumb"?
+            return
+
+        imgwin = self.get_thumb_widget(chname, res.rgb)
+        if imgwin is None:
+            return
+        ready_fn(imgwin, res.header)
+
+    def get_thumb_rgbmap(self, chname):
+        """Return a copy of the RGB mapper of channel `chname` that
+        the thumbnail service can use from its threads.
+        """
+        with self.thmblock:
+            rgbmap = self.thumb_rgbmaps.get(chname, None)
+            if rgbmap is None:
+                channel = self.fv.get_channel(chname)
+                rgbmap = RGBMap.RGBMapper(self.logger)
+                channel.fitsimage.get_rgbmap().copy_attributes(rgbmap)
+                self.thumb_rgbmaps[chname] = rgbmap
+            return rgbmap
+
+    def get_thumb_widget(self, chname, rgb):
+        """Make a native image from the RGB thumbnail array `rgb`,
+        with the transforms of channel `chname` applied.
+        """
+        try:
+            channel = self.fv.get_channel(chname)
+        except KeyError:
+            # channel deleted in the meantime
+            return None
+
+        with self.thmblock:
+            channel.fitsimage.copy_attributes(self.thumb_generator,
+                                              ['transforms'])
+            self.thumb_generator.set_data(rgb)
+            return self.thumb_generator.get_plain_image_as_widget()
 
     def _add_image(self, viewer, chname, image):
         chinfo = self.fv.get_channel(chname)
@@ -242,6 +345,7 @@ class Thumbs(GingaPlugin.GlobalPlugin):
             self.clear_widget()
             del self.thumbDict[thumbkey]
             self.thumbList.remove(thumbkey)
+            self.thumb_pending.pop(thumbkey, None)
 
             # Unhighlight
             chname = thumbkey[0]
@@ -285,10 +389,12 @@ class Thumbs(GingaPlugin.GlobalPlugin):
                             image_future=image_future)
 
     def clear(self):
+        self.thumbsvc.cancel()
         with self.thmblock:
             self.clear_widget()
             self.thumbList = []
             self.thumbDict = {}
+            self.thumb_pending = {}
             self._tkf_highlight = set([])
         self.reorder_thumbs()
 
@@ -345,6 +451,9 @@ class Thumbs(GingaPlugin.GlobalPlugin):
 
     def rgbmap_cb(self, rgbmap, fitsimage):
         # color mapping has changed in some way
+        chname = self.fv.get_channel_name(fitsimage)
+        with self.thmblock:
+            self.thumb_rgbmaps.pop(chname, None)
         self.redo_delay(fitsimage)
         return True
 
@@ -357,12 +466,6 @@ class Thumbs(GingaPlugin.GlobalPlugin):
     def redo_delay_timer(self, timer):
         self.fv.gui_do(self.redo_thumbnail, timer.data.fitsimage)
 
-    def copy_attrs(self, fitsimage):
-        # Reflect transforms, colormap, etc.
-        fitsimage.copy_attributes(self.thumb_generator,
-                                  ['transforms', 'cutlevels',
-                                   'rgbmap'])
-
     def update_highlights(self, old_highlight_set, new_highlight_set):
         """Unhighlight the thumbnails represented by `old_highlight_set`
         and highlight the ones represented by new_highlight_set.
@@ -445,14 +548,12 @@ class Thumbs(GingaPlugin.GlobalPlugin):
         with self.thmblock:
             return thumbkey in self.thumbDict
 
-    def redo_thumbnail(self, fitsimage, save_thumb=None):
+    def redo_thumbnail(self, fitsimage):
         self.logger.debug("redoing thumbnail...")
         # Get the thumbnail image
         image = fitsimage.get_image()
         if image is None:
             return
-        if save_thumb is None:
-            save_thumb = self.settings.get('cache_thumbs', False)
 
         chname = self.fv.get_channel_name(fitsimage)
 
@@ -482,25 +583,12 @@ class Thumbs(GingaPlugin.GlobalPlugin):
                 self._add_image(self.fv, chname, image)
                 return
 
-            # Generate new thumbnail
-            fitsimage.copy_attributes(self.thumb_generator,
-                                      ['transforms', 'cutlevels',
-                                       'rgbmap'])
-            thumb_np = image.get_thumbnail(self.thumbWidth)
-            self.thumb_generator.set_data(thumb_np)
+        # Generate new thumbnail with the cut levels of the viewer
+        def _update(imgwin, header):
+            self.update_thumbnail(thumbkey, imgwin, name, metadata)
 
-            # Save a thumbnail for future browsing
-            if save_thumb:
-                thumbpath = self.get_thumbpath(path)
-                if thumbpath is not None:
-                    if os.path.exists(thumbpath):
-                        os.remove(thumbpath)
-                    self.thumb_generator.save_plain_image_as_file(thumbpath,
-                                                            format='jpeg')
-
-            imgwin = self.thumb_generator.get_plain_image_as_widget()
-
-        self.update_thumbnail(thumbkey, imgwin, name, metadata)
+        self.request_thumb(thumbkey, chname, _update, image=image,
+                           cuts=fitsimage.get_cut_levels())
 
     def delete_channel_cb(self, viewer, chinfo):
         """Called when a channel is deleted from the main interface.
@@ -520,66 +608,28 @@ class Thumbs(GingaPlugin.GlobalPlugin):
                     del self.thumbDict[thumbkey]
                     un_hilite_set.add(thumbkey)
             self.thumbList = newThumbList
+            for thumbkey in list(self.thumb_pending.keys()):
+                if thumbkey[0] == chname_del:
+                    del self.thumb_pending[thumbkey]
+            self.thumb_rgbmaps.pop(chname_del, None)
             self._tkf_highlight -= un_hilite_set  # Unhighlight
 
         self.reorder_thumbs()
 
-    def _make_thumb(self, chname, image, name, path, thumbkey,
-                    image_future, save_thumb=False, thumbpath=None):
-        # This is called by the make_thumbs() as a gui thread
-        with self.thmblock:
-            thumb_np = image.get_thumbnail(self.thumbWidth)
-            self.thumb_generator.set_data(thumb_np)
-
-            # Save a thumbnail for future browsing
-            if save_thumb and (thumbpath is not None):
-                self.thumb_generator.save_plain_image_as_file(thumbpath,
-                                                        format='jpeg')
-
-            imgwin = self.thumb_generator.get_plain_image_as_widget()
-
-        # Get metadata for mouse-over tooltip
-        header = image.get_header()
-        metadata = {}
-        for kwd in self.keywords:
-            metadata[kwd] = header.get(kwd, 'N/A')
-
-        thumbname = name
-        self.insert_thumbnail(imgwin, thumbkey, thumbname,
-                              chname, name, path, thumbpath, metadata,
-                              image_future)
-        self.fv.update_pending(timeout=0.001)
-
-    def get_thumbpath(self, path, makedir=True):
+    def get_file_mtime(self, path):
+        """Return the modification time of the file `path`, or None."""
         if path is None:
             return None
-
-        path = os.path.abspath(path)
-        dirpath, filename = os.path.split(path)
-        # Get thumb directory
-        cache_location = self.settings.get('cache_location', 'local')
-        if cache_location == 'ginga':
-            # thumbs in .ginga cache
-            prefs = self.fv.get_preferences()
-            thumbDir = os.path.join(prefs.get_baseFolder(), 'thumbs')
-            thumbdir = os.path.join(thumbDir, iohelper.gethex(dirpath))
-        else:
-            # thumbs in .thumbs subdirectory of image folder
-            thumbdir = os.path.join(dirpath, '.thumbs')
-
         try:
-            thumbpath = iohelper.get_thumbpath(thumbdir, path,
-                                               makedir=makedir)
+            return os.stat(path).st_mtime
 
-        except Exception as e:
-            self.logger.debug("Error getting thumb path for '%s': %s" % (
+        except OSError as e:
+            self.logger.debug("Error getting modification time of '%s': %s" % (
                 path, str(e)))
-            thumbpath = None
-
-        return thumbpath
+            return None
 
     def insert_thumbnail(self, imgwin, thumbkey, thumbname, chname, name, path,
-                         thumbpath, metadata, image_future):
+                         mtime, metadata, image_future):
 
         # make a context menu
         menu = self._mk_context_menu(thumbkey, chname, name, path, image_future)
@@ -608,7 +658,7 @@ class Thumbs(GingaPlugin.GlobalPlugin):
 
         bnch = Bunch.Bunch(widget=vbox, image=thumbw,
                            name=name, imname=name, namelbl=namelbl,
-                           chname=chname, path=path, thumbpath=thumbpath,
+                           chname=chname, path=path, mtime=mtime,
                            image_future=image_future)
 
         with self.thmblock:
@@ -707,54 +757,56 @@ class Thumbs(GingaPlugin.GlobalPlugin):
 
     def add_image_info_cb(self, viewer, channel, info):
 
-        save_thumb = self.settings.get('cache_thumbs', False)
-
         # Do we already have this thumb loaded?
         chname = channel.name
         thumbkey = self.get_thumb_key(chname, info.name, info.path)
-        thumbpath = self.get_thumbpath(info.path)
+        mtime = self.get_file_mtime(info.path)
 
         with self.thmblock:
+            if thumbkey in self.thumb_pending:
+                return
             try:
                 bnch = self.thumbDict[thumbkey]
                 # if these are not equal then the mtime must have
                 # changed on the file, better reload and regenerate
-                if bnch.thumbpath == thumbpath:
+                if bnch.mtime == mtime:
                     return
             except KeyError:
                 pass
 
-        # Is there a cached thumbnail image on disk we can use?
-        image = None
-        if (thumbpath is not None) and os.path.exists(thumbpath):
-            save_thumb = False
-            try:
-                # try to load the thumbnail image
-                image = self.fv.load_image(thumbpath)
-            except Exception as e:
-                pass
-
-        try:
-            if image is None:
-                if info.path is None:
-                    # No way to generate a thumbnail for this image
-                    return
-
-                # no luck loading thumbnail, try to load the full image
-                image = info.image_loader(info.path)
-
-            # make sure name is consistent
-            image.set(name=info.name)
+        if info.path is None:
+            # No way to generate a thumbnail for this image
+            return
 
-            self.fv.gui_do(self._make_thumb, chname, image, info.name,
-                           info.path, thumbkey, info.image_future,
-                           save_thumb=save_thumb,
-                           thumbpath=thumbpath)
+        thumbname = info.name
+        label_length = self.settings.get('label_length', None)
+        if label_length is not None:
+            thumbname = iohelper.shorten_name(
+                thumbname, label_length,
+                side=self.settings.get('label_cutoff', 'right'))
+
+        def _insert(imgwin, header):
+            # Get metadata for mouse-over tooltip
+            metadata = {}
+            for kwd in self.keywords:
+                metadata[kwd] = header.get(kwd, 'N/A')
+            metadata[self.settings.get('mouseover_name_key',
+                                       'NAME')] = info.name
 
-        except Exception as e:
-            self.logger.error("Error generating thumbnail for '%s': %s" % (
-                info.path, str(e)))
-            # TODO: generate "broken thumb"?
+            with self.thmblock:
+                if thumbkey in self.thumbDict:
+                    self.remove_thumb(thumbkey)
+            self.insert_thumbnail(imgwin, thumbkey, thumbname, chname,
+                                  info.name, info.path, mtime, metadata,
+                                  info.image_future)
+
+        # the file is read and the thumbnail rendered in the background
+        self.request_thumb(thumbkey, chname, _insert, path=info.path,
+                           idx=info.get('idx', None),
+                           loader=info.image_loader)
+
+    def stop(self):
+        self.thumbsvc.stop()
 
     def __str__(self):
         return 'thumbs'
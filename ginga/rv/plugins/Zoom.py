@@ -66,6 +66,8 @@ class Zoom(GingaPlugin.GlobalPlugin):
         self.zoomtask.set_callback('expired', self.showzoom_timer_cb)
         self.fitsimage_focus = None
         self.update_time = time.time()
+        # (image, x, y, radius) of the detail area last shown
+        self.zoom_shown = None
 
         # read preferences for this plugin
         prefs = self.fv.get_preferences()
@@ -216,6 +218,7 @@ class Zoom(GingaPlugin.GlobalPlugin):
     def update_zoomviewer(self, channel):
         fitsimage = channel.fitsimage
         self.fitsimage_focus = fitsimage
+        self.zoom_shown = None
         # Reflect transforms, colormap, etc.
         fitsimage.copy_attributes(self.zoomimage, self.copy_attrs)
 
@@ -338,6 +341,12 @@ class Zoom(GingaPlugin.GlobalPlugin):
         self.showzoom(data.image, data.data_x, data.data_y)
 
     def showzoom(self, image, data_x, data_y):
+        # cursor still over the same pixel?  nothing new to show
+        shown = (image, int(data_x), int(data_y), self.zoom_radius)
+        if shown == self.zoom_shown:
+            return
+        self.zoom_shown = shown
+
         # cut out detail area and set the zoom image
         data, x1, y1, x2, y2 = image.cutout_radius(int(data_x), int(data_y),
                                                    self.zoom_radius)
@@ -1,5 +1,6 @@
 import unittest
 import logging
+import threading
 import numpy
 
 from ginga import AstroImage
@@ -55,8 +56,310 @@ class TestImageView(unittest.TestCase):
         ## dst_x, dst_y = viewer.get_canvas_xy(x1, y2)
         ## print (x1, y2)
         ## print (dst_x, dst_y)
-        
-        
+
+
+    def test_getwin_view(self):
+        viewer = self.viewer
+        viewer.configure_surface(300, 200)
+        viewer.set_bg(0.2, 0.4, 0.6)
+        viewer.set_image(self.image)
+        # pan so that part of the window is not covered by the image
+        viewer.scale_to(1.0, 1.0)
+        viewer.set_pan(10, 10)
+        viewer.redraw_now()
+
+        arr = viewer.getwin_array(order='RGBA')
+        assert arr.shape == (200, 300, 4)
+        assert tuple(arr[0, 0]) == (51, 102, 153, 255)
+
+        view = viewer.getwin_view(order='RGBA')
+        assert numpy.array_equal(view, arr)
+        # the window buffer is reused
+        assert viewer.getwin_view(order='RGBA') is view
+
+        buf = viewer.getwin_buffer(order='RGBA', copy=False)
+        assert buf.readonly
+        assert bytes(buf) == viewer.getwin_buffer(order='RGBA')
+
+    def test_mask_image(self):
+        from ginga.canvas.types.image import MaskImage
+        viewer = self.viewer
+        viewer.configure_surface(300, 200)
+        viewer.set_image(self.image)
+        viewer.scale_to(1.0, 1.0)
+        viewer.set_pan(100, 100)
+
+        obj = MaskImage(0, 0, self.image, palette=[('red', 1.0)],
+                        predicate=lambda data: data > 0.5)
+        viewer.get_canvas().add(obj)
+        viewer.redraw_now()
+
+        # only the diagonal is labeled
+        arr = viewer.getwin_array(order='RGB')
+        red = numpy.all(arr == (255, 0, 0), axis=2)
+        assert red.sum() == 200
+        assert numpy.all(red.sum(axis=1) == 1)
+        assert numpy.array_equal(obj.get_mask(), self.data > 0.5)
+
+        obj.set_palette([('blue', 1.0)])
+        viewer.redraw_now()
+        arr = viewer.getwin_array(order='RGB')
+        assert not numpy.any(numpy.all(arr == (255, 0, 0), axis=2))
+        assert numpy.all(arr == (0, 0, 255), axis=2).sum() == 200
+
+    def test_image_layers(self):
+        from ginga.canvas.types.image import Image
+        from ginga.canvas.types.basic import Box
+        from ginga import RGBImage
+        viewer = self.viewer
+        viewer.configure_surface(300, 200)
+        viewer.set_redraw_lag(0.0)
+        viewer.set_image(self.image)
+        viewer.scale_to(1.0, 1.0)
+        viewer.set_pan(100, 100)
+        canvas = viewer.get_canvas()
+
+        rgb = RGBImage.RGBImage(logger=self.logger)
+        rgb.set_data(numpy.full((20, 20, 3), 200, dtype=numpy.uint8))
+        drawn = []
+
+        def counted(obj):
+            draw_image = obj.draw_image
+            def _draw_image(viewer, dstarr, whence=0.0):
+                drawn.append(obj)
+                draw_image(viewer, dstarr, whence=whence)
+            obj.draw_image = _draw_image
+            return obj
+
+        base = counted(viewer.get_canvas_image())
+        layers = [counted(Image(30 * i, 90, rgb)) for i in range(10)]
+        for obj in layers:
+            canvas.add(obj, redraw=False)
+        viewer.get_rgb_object(whence=0)
+        assert len(drawn) == 11
+
+        # moving a vector overlay does not composite the images again
+        del drawn[:]
+        box = Box(100, 100, 10, 10)
+        canvas.add(box)
+        box.move_to(120, 110)
+        rgbobj = viewer.get_rgb_object(whence=3)
+        assert len(drawn) == 0
+
+        # changing an overlaid image composites only the overlays
+        layers[3].set_origin(95, 95)
+        assert viewer.get_rgb_object(whence=3) is not rgbobj
+        assert base not in drawn
+        assert len(drawn) == 10
+        arr = viewer.getwin_array(order='RGB')
+        assert tuple(arr[100, 150]) == (200, 200, 200)
+
+        # as does removing one
+        del drawn[:]
+        canvas.delete_object(layers[0])
+        viewer.get_rgb_object(whence=3)
+        assert base not in drawn
+        assert len(drawn) == 9
+
+        # changes to the color map redo both layers
+        del drawn[:]
+        viewer.get_rgb_object(whence=2)
+        assert len(drawn) == 10
+
+        # a new cutout is a change, even an equal one (which could be
+        # at the address of the freed old one)
+        del drawn[:]
+        cache = layers[5].get_cache(viewer)
+        cache.cutout = cache.cutout.copy()
+        viewer.get_rgb_object(whence=3)
+        assert base not in drawn
+        assert len(drawn) == 9
+
+    def test_render_states(self):
+        viewer = self.viewer
+        viewer.configure_surface(300, 200)
+        viewer.set_redraw_lag(0.0)
+        image2 = AstroImage.AstroImage(logger=self.logger)
+        image2.set_data(numpy.random.RandomState(1).rand(500, 400))
+
+        calls = []
+        calc_cut_levels = viewer.autocuts.calc_cut_levels
+        def _calc_cut_levels(image):
+            calls.append(image)
+            return calc_cut_levels(image)
+        viewer.autocuts.calc_cut_levels = _calc_cut_levels
+
+        viewer.set_image(self.image)
+        cache = viewer.get_canvas_image().get_cache(viewer)
+        rgbarr, cuts = cache.rgbarr, viewer.get_cut_levels()
+        arr = numpy.copy(viewer.getwin_array(order='RGB'))
+        viewer.set_image(image2)
+        assert cache.rgbarr is not rgbarr
+
+        # switching back reuses the cut levels and arrays of the image
+        viewer.set_image(self.image)
+        assert calls == [self.image, image2]
+        assert viewer.get_cut_levels() == cuts
+        assert cache.rgbarr is rgbarr
+        assert numpy.array_equal(viewer.getwin_array(order='RGB'), arr)
+        stats = viewer.get_render_state_stats()
+        assert stats['restored'] == 1
+        assert stats['images'] == 2
+
+        # but not the colors if the color map has changed since
+        viewer.set_image(image2)
+        viewer.set_color_map('rainbow3')
+        viewer.set_image(self.image)
+        assert cache.rgbarr is not None
+        assert cache.rgbarr is not rgbarr
+
+        # nor anything once the image is modified
+        num_calls = len(calls)
+        self.image.set_data(self.data * 2.0)
+        assert len(calls) == num_calls + 1
+        assert cache.rgbarr is not rgbarr
+
+    def test_async_redraw(self):
+        viewer = self.viewer
+        viewer.configure_surface(300, 200)
+        viewer.set_image(self.image)
+        viewer.set_redraw_lag(0.0)
+
+        shown = []
+        viewer.render_image = lambda rgbobj, x, y: shown.append(rgbobj)
+        drawn = []
+        viewer.private_canvas.draw = lambda v: drawn.append(v.get_pan())
+        compute = self._hold_frames(viewer)
+
+        viewer.set_async_redraw(True, max_stale=10.0)
+        for i in range(5):
+            viewer.set_pan(100 + i, 100)
+        assert len(shown) == 0
+
+        # the first frame was started from the first request, and is
+        # superseded by the later ones
+        compute()
+        viewer.delayed_redraw()
+        assert len(shown) == 0
+        # ... which are combined into a second frame
+        compute()
+        viewer.delayed_redraw()
+        assert len(shown) == 1
+        assert drawn == [(104.0, 100.0)]
+        assert viewer._async_thread is None
+
+        stats = viewer.get_async_stats()
+        assert stats['frames'] == 2
+        assert stats['superseded'] == 1
+        assert stats['shown'] == 1
+
+    def test_async_redraw_snapshot(self):
+        viewer = self.viewer
+        viewer.configure_surface(300, 200)
+        viewer.set_image(self.image)
+        viewer.set_redraw_lag(0.0)
+        viewer.scale_to(1.0, 1.0)
+        viewer.set_pan(100, 100)
+        viewer.redraw_now()
+        rgbarr = viewer._rgbarr
+
+        shown = []
+        viewer.render_image = lambda rgbobj, x, y: shown.append(rgbobj)
+        drawn = []
+        viewer.private_canvas.draw = lambda v: drawn.append(
+            (v.get_pan(), v.get_scale()))
+        compute = self._hold_frames(viewer)
+
+        # a stale frame is shown with the canvas drawn in its geometry,
+        # not the one set while it was computed
+        viewer.set_async_redraw(True, max_stale=0.0)
+        viewer.set_pan(110, 100)
+        viewer.scale_to(2.0, 2.0)
+        assert viewer.get_pan() == (110.0, 100.0)
+        compute()
+        viewer.delayed_redraw()
+        assert drawn == [((110.0, 100.0), 1.0)]
+        # the frame was computed into separate buffers
+        assert viewer._rgbarr is rgbarr
+        assert viewer.get_scale() == 2.0
+
+        # the next frame shows the current state
+        compute()
+        viewer.delayed_redraw()
+        assert drawn[-1] == ((110.0, 100.0), 2.0)
+        assert len(shown) == 2
+
+        # redrawing synchronously again starts from scratch
+        viewer.set_async_redraw(False)
+        viewer.redraw_now(whence=2)
+        assert viewer._rgbarr is not rgbarr
+        assert viewer._async_view is None
+
+    def _hold_frames(self, viewer):
+        # Make the worker thread of `viewer` wait before computing each
+        # frame.  Returns a function that lets one frame be computed and
+        # waits until it is done.
+        ev_go = threading.Event()
+        ev_done = threading.Event()
+        async_compute = viewer._async_compute
+
+        def held_compute(gen, whence, view):
+            ev_go.wait(5.0)
+            ev_go.clear()
+            async_compute(gen, whence, view)
+            ev_done.set()
+        viewer._async_compute = held_compute
+
+        def compute():
+            ev_done.clear()
+            ev_go.set()
+            assert ev_done.wait(5.0)
+        return compute
+
+    def test_coalesce_input(self):
+        viewer = self.viewer
+        viewer.configure_surface(300, 200)
+        viewer.set_image(self.image)
+        viewer.set_redraw_lag(0.025)
+        viewer.redraw_now()
+
+        # only the latest of a burst of updates is applied, when the
+        # next frame is drawn
+        for i in range(10):
+            viewer.coalesce_input('pan', viewer.set_pan, 100 + i, 100)
+        assert viewer.get_pan()[0] != 109
+        viewer.delayed_redraw()
+        assert viewer.get_pan() == (109, 100)
+        stats = viewer.get_input_stats()
+        assert stats['updates'] == 10
+        assert stats['applied'] == 1
+        assert stats['frame_time'] >= 0.0
+
+        # zooms in between frames are combined
+        bd = viewer.get_bindings()
+        viewer.scale_to(1.0, 1.0)
+        bd._zoom_by(viewer, 2.0, msg=False)
+        bd._zoom_by(viewer, 1.5, msg=False)
+        viewer.delayed_redraw()
+        assert viewer.get_scale() == 3.0
+
+        # pinch zooms scale each axis on its own
+        viewer.scale_to(1.0, 2.0)
+        bd._zoom_by(viewer, 2.0, msg=False, uniform=False)
+        viewer.delayed_redraw()
+        assert viewer.get_scale_xy() == (2.0, 4.0)
+
+        # a pending update can be applied before the next frame
+        viewer.coalesce_input('pan', viewer.set_pan, 70, 80)
+        viewer.flush_coalesced_input('pan')
+        assert viewer.get_pan() == (70, 80)
+        viewer.flush_coalesced_input('pan')
+
+        # without deferred redraws updates are applied immediately
+        viewer.set_redraw_lag(0.0)
+        viewer.coalesce_input('pan', viewer.set_pan, 50, 60)
+        assert viewer.get_pan() == (50, 60)
+
     def tearDown(self):
         pass
 
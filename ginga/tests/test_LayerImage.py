@@ -0,0 +1,84 @@
+import unittest
+import logging
+import numpy
+
+from ginga import RGBImage, LayerImage, AstroImage
+
+
+class LImage(RGBImage.RGBImage, LayerImage.LayerImage):
+    def __init__(self, *args, **kwdargs):
+        RGBImage.RGBImage.__init__(self, *args, **kwdargs)
+        LayerImage.LayerImage.__init__(self)
+
+
+class TestLayerImage(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestLayerImage")
+        self.layers = []
+        for i in range(3):
+            data = numpy.random.randint(0, 1000, size=(20, 30)).astype(
+                numpy.int16)
+            self.layers.append(AstroImage.AstroImage(data_np=data,
+                                                     logger=self.logger))
+
+    def _make(self, compose):
+        limage = LImage(logger=self.logger)
+        limage.compose = compose
+        for i, image in enumerate(self.layers):
+            limage.insert_layer(i, image, alpha=0.5, compose=False)
+        limage.compose_layers()
+        return limage
+
+    def test_alpha_incremental(self):
+        limage = self._make('alpha')
+        result = limage.get_data()
+        assert result.dtype == numpy.float32
+
+        for val in numpy.linspace(0.0, 1.0, 50):
+            limage.set_alpha(1, val)
+        expected = sum([layer.get_data() * alpha for layer, alpha in
+                        zip(self.layers, (0.5, 1.0, 0.5))])
+        assert numpy.allclose(limage.get_data(), expected, rtol=1e-4)
+        # buffer was reused
+        assert limage.get_data() is result
+
+    def test_layers_changed(self):
+        limage = self._make('alpha')
+        other = AstroImage.AstroImage(
+            data_np=numpy.full((20, 30), 7, dtype=numpy.int16),
+            logger=self.logger)
+        # same number of layers, but not the ones composed
+        limage.set_layer(1, other, alpha=0.5, compose=False)
+        limage.set_alpha(1, 1.0)
+        expected = (self.layers[0].get_data() * 0.5 + 7.0 +
+                    self.layers[2].get_data() * 0.5)
+        assert numpy.allclose(limage.get_data(), expected, rtol=1e-4)
+
+        limage.delete_layer(2, compose=False)
+        limage.insert_layer(0, other, alpha=0.0, compose=False)
+        limage.set_alpha(0, 1.0)
+        expected = 7.0 + self.layers[0].get_data() * 0.5 + 7.0
+        assert numpy.allclose(limage.get_data(), expected, rtol=1e-4)
+
+    def test_rgb_incremental(self):
+        limage = self._make('rgb')
+        limage.set_alpha(2, 0.25)
+        data = limage.get_data()
+        assert data.shape == (20, 30, 3)
+        assert numpy.allclose(data[:, :, 0], self.layers[0].get_data() * 0.5)
+        assert numpy.allclose(data[:, :, 2], self.layers[2].get_data() * 0.25)
+
+    def test_compose_type_change(self):
+        limage = self._make('alpha')
+        limage.compose = 'rgb'
+        limage.set_alpha(0, 1.0)
+        data = limage.get_data()
+        assert data.shape == (20, 30, 3)
+        assert numpy.allclose(data[:, :, 0], self.layers[0].get_data())
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,73 @@
+import unittest
+import logging
+import numpy
+
+from ginga import RGBMap, cmap, imap
+
+
+class TestRGBMap(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestRGBMap")
+        self.rgbmap = RGBMap.RGBMapper(self.logger)
+        self.rgbmap.set_cmap(cmap.get_cmap('rainbow3'))
+        self.rgbmap.set_imap(imap.get_imap('log'))
+        self.rgbmap.scale_and_shift(0.7, 0.1)
+
+        rng = numpy.random.RandomState(1)
+        self.data = rng.uniform(0, self.rgbmap.get_hash_size() - 1,
+                                (50, 60))
+
+    def test_index_types(self):
+        rgbmap = self.rgbmap
+        assert rgbmap.get_index_dtype() == numpy.uint16
+        assert rgbmap.get_lut_dtype() == numpy.uint8
+        assert rgbmap.get_dist().hash.dtype == numpy.uint8
+        assert rgbmap.get_sarr().dtype == numpy.uint8
+
+        rgbmap.set_hash_size(256)
+        assert rgbmap.get_index_dtype() == numpy.uint8
+
+    def test_composite_lut(self):
+        rgbmap = self.rgbmap
+        idx = self.data.astype(rgbmap.get_index_dtype())
+        for order in ('RGB', 'RGBA', 'BGRA', 'ARGB'):
+            res1 = rgbmap.get_rgbarray(idx.copy(), order=order)
+            rgbmap.composite_lut = False
+            res2 = rgbmap.get_rgbarray(idx.copy(), order=order)
+            rgbmap.composite_lut = True
+            assert numpy.array_equal(res1.get_array(order),
+                                     res2.get_array(order))
+
+        # wide and out of range indexes are handled too
+        idx = self.data.astype(numpy.uint)
+        idx[0, 0] = 10**6
+        res = rgbmap.get_rgbarray(idx, order='RGB')
+        assert tuple(res.get_array('RGB')[0, 0]) == rgbmap.get_rgbval(255)
+
+    def test_lut_bits(self):
+        rgbmap = self.rgbmap
+        rgbmap.set_imap(imap.get_imap('ramp'))
+        rgbmap.reset_sarr(callback=False)
+        idx = self.data.astype(rgbmap.get_index_dtype())
+        res8 = rgbmap.get_rgbarray(idx, order='RGB').get_array('RGB')
+
+        rgbmap.set_lut_bits(16)
+        assert rgbmap.get_lut_bits() == 16
+        assert rgbmap.get_hash_size() == 65536
+        assert rgbmap.get_dist().hash.dtype == numpy.uint16
+        assert len(rgbmap.get_sarr()) == 65536
+        res16 = rgbmap.get_rgbarray(idx, order='RGB').get_array('RGB')
+        # finer tables, but the same colors to within interpolation
+        diff = numpy.abs(res8.astype(int) - res16)
+        assert diff.mean() < 2.0
+
+        rgbmap.set_lut_bits(8)
+        assert len(rgbmap.get_sarr()) == 256
+        self.assertRaises(RGBMap.RGBMapError, rgbmap.set_lut_bits, 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,38 @@
+import json
+import unittest
+
+from ginga.util import bench
+
+
+class TestBench(unittest.TestCase):
+
+    def test_run(self):
+        names = bench.get_names('^(render.whence2|trcalc.overlay|'
+                                'io.datasrc_churn)$')
+        assert len(names) == 3
+        res = bench.run(names=names, sizes=(64, 128), window=(100, 80),
+                        repeat=2, min_time=0.0)
+        # results must be serializable as JSON
+        res = json.loads(json.dumps(res))
+        assert res['meta']['sizes'] == [64, 128]
+
+        results = res['results']
+        # sized benchmarks run for each size, the others once
+        assert [(r['name'], r['size']) for r in results] == [
+            ('render.whence2', 64), ('render.whence2', 128),
+            ('trcalc.overlay', 64), ('trcalc.overlay', 128),
+            ('io.datasrc_churn', None)]
+        for r in results:
+            assert 'error' not in r, r['error']
+            assert len(r['times']) == 2
+            assert r['min'] <= r['median']
+
+        rows = bench.compare(res, res)
+        assert len(rows) == 5
+        assert rows[0][-1] == 1.0
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -41,6 +41,18 @@ class TestCmap(unittest.TestCase):
         actual = test_color_map.clst[-1]
         assert np.allclose(expected, actual)
 
+    def test_ColorMap_get_array(self):
+        test_clst = tuple([(x, x, x)
+                           for x in np.linspace(0, 1, ginga.cmap.min_cmap_len)])
+        test_color_map = ColorMap('test-name', test_clst)
+
+        arr = test_color_map.get_array()
+        assert arr.shape == (ginga.cmap.min_cmap_len, 3)
+        assert arr.dtype == np.uint8
+        assert tuple(arr[-1]) == (255, 255, 255)
+        # the array is made once and cached
+        assert test_color_map.get_array() is arr
+
     def test_ColorMap_init_exception(self):
         self.assertRaises(TypeError, ColorMap, 'test-name')
 
@@ -0,0 +1,76 @@
+import unittest
+import logging
+import numpy
+
+from ginga.util import dp
+
+
+class TestError(Exception):
+    pass
+
+
+class TestCombine(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestCombine")
+        rng = numpy.random.RandomState(42)
+        self.stack = [rng.normal(100.0, 5.0, (37, 23)) for i in range(7)]
+        # one frame with a cosmic ray
+        self.stack[3][10, 10] = 1.0e5
+        self.arr = numpy.array(self.stack)
+
+    def test_median_blocks(self):
+        expected = numpy.median(self.arr, axis=0)
+        # a tiny budget forces one row per block
+        for mem_budget, num_threads in ((1, 1), (1, 3), (10**8, 1)):
+            result = dp.combine_stack(self.stack, method='median',
+                                      mem_budget=mem_budget,
+                                      num_threads=num_threads,
+                                      dtype=numpy.float64)
+            assert numpy.allclose(result, expected), \
+                   TestError("Median differs (budget=%d, threads=%d)" % (
+                mem_budget, num_threads))
+
+    def test_mean(self):
+        result = dp.combine_stack(self.stack, method='mean', mem_budget=1,
+                                  dtype=numpy.float64)
+        assert numpy.allclose(result, numpy.mean(self.arr, axis=0))
+
+    def test_minmax(self):
+        result = dp.combine_stack(self.stack, method='minmax', mem_budget=1,
+                                  num_low=1, num_high=2,
+                                  dtype=numpy.float64)
+        srt = numpy.sort(self.arr, axis=0)
+        assert numpy.allclose(result, numpy.mean(srt[1:-2], axis=0))
+
+    def test_sigmaclip(self):
+        result = dp.combine_stack(self.stack, method='sigmaclip',
+                                  sigma=2.0, dtype=numpy.float64)
+        # the cosmic ray is rejected
+        assert abs(result[10, 10] - 100.0) < 20.0
+        assert numpy.all(numpy.isfinite(result))
+
+    def test_dtype(self):
+        stack = [numpy.full((4, 5), 1.0e8 + i + 0.123) for i in range(3)]
+        result = dp.combine_stack(stack, method='median')
+        assert result.dtype == numpy.float64
+        assert numpy.all(result == 1.0e8 + 1.123)
+        # narrowed only on request
+        result = dp.combine_stack(stack, method='median',
+                                  dtype=numpy.float32)
+        assert result.dtype == numpy.float32
+
+        ints = [numpy.full((4, 5), i, dtype=numpy.int16) for i in range(3)]
+        assert dp.combine_stack(ints).dtype == numpy.float32
+        result = dp.combine_stack(ints, scaling=[(0.1, 0.0)] * 3)
+        assert result.dtype == numpy.float64
+
+    def test_shape_mismatch(self):
+        with self.assertRaises(ValueError):
+            dp.combine_stack(self.stack + [numpy.zeros((3, 3))])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
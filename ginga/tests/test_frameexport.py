@@ -0,0 +1,175 @@
+import time
+import threading
+import unittest
+import logging
+from io import BytesIO
+
+import numpy
+
+from ginga import AstroImage
+from ginga.mockw.ImageViewCanvasMock import ImageViewCanvas
+from ginga.util import frameexport
+
+
+class ListSink(frameexport.FrameSink):
+    # keeps the frames, encoding them slowly and out of order
+
+    def __init__(self):
+        self.frames = []
+        self.lock = threading.Lock()
+        self.encoding = 0
+        self.max_encoding = 0
+
+    def encode(self, seq, rgb):
+        with self.lock:
+            self.encoding += 1
+            self.max_encoding = max(self.max_encoding, self.encoding)
+        time.sleep(0.01 * (seq % 3))
+        with self.lock:
+            self.encoding -= 1
+        return (seq, rgb.copy())
+
+    def write(self, seq, encoded):
+        assert encoded[0] == seq
+        self.frames.append(encoded[1])
+
+
+class TestFrameExport(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestFrameExport")
+        self.viewer = ImageViewCanvas(logger=self.logger)
+        self.viewer.configure_surface(80, 60)
+        self.viewer.set_redraw_lag(0.0)
+
+        rng = numpy.random.RandomState(1)
+        cube = rng.rand(6, 100, 120).astype(numpy.float32)
+        cube += numpy.arange(6).reshape(-1, 1, 1)
+        self.image = AstroImage.AstroImage(logger=self.logger)
+        self.image.load_data(cube)
+        self.viewer.set_image(self.image)
+        self.viewer.cut_levels(0.0, 6.0)
+
+    def test_exporter_order(self):
+        sink = ListSink()
+        frames = [numpy.full((10, 12, 4), i, dtype=numpy.uint8)
+                  for i in range(20)]
+        with frameexport.FrameExporter(self.logger, sink, num_workers=3,
+                                       max_frames=4) as exporter:
+            for frame in frames:
+                exporter.put(frame)
+        stats = exporter.get_stats()
+        assert stats['frames'] == stats['written'] == 20
+        assert sink.max_encoding <= 3
+        assert [frame[0, 0, 0] for frame in sink.frames] == list(range(20))
+        assert sink.frames[0].shape == (10, 12, 3)
+
+        self.assertRaises(frameexport.FrameExportError, exporter.put,
+                          frames[0])
+
+    def test_exporter_error(self):
+        class BadSink(ListSink):
+            def encode(self, seq, rgb):
+                if seq == 2:
+                    raise ValueError("bad frame")
+                return (seq, rgb)
+
+        sink = BadSink()
+        exporter = frameexport.FrameExporter(self.logger, sink,
+                                             max_frames=2)
+        frame = numpy.zeros((5, 5, 3), dtype=numpy.uint8)
+
+        def put_all():
+            for i in range(10):
+                exporter.put(frame)
+
+        # later frames are not written and putting them does not block
+        self.assertRaises(frameexport.FrameExportError, put_all)
+        self.assertRaises(frameexport.FrameExportError, exporter.close)
+        assert len(sink.frames) == 2
+
+    def test_export_cube(self):
+        viewer, image = self.viewer, self.image
+        sink = ListSink()
+        stats = frameexport.export_cube(viewer, sink, start=1, stop=5)
+        assert stats['written'] == 4
+        means = [frame.mean() for frame in sink.frames]
+        # the cut levels are locked, so the slices get brighter
+        assert means == sorted(means) and means[0] < means[-1]
+        assert sink.frames[0].shape == (60, 80, 3)
+        # the viewer shows the original slice again
+        assert image.naxispath == [0]
+        assert viewer.get_cut_levels() == (0.0, 6.0)
+
+        self.assertRaises(frameexport.FrameExportError,
+                          frameexport.export_cube, viewer, sink, axis=3)
+
+    def test_export_cube_async(self):
+        # frames are rendered synchronously even in the asynchronous
+        # redraw mode, which is restored afterwards
+        viewer = self.viewer
+        viewer.set_async_redraw(True)
+        sink = ListSink()
+        frameexport.export_cube(viewer, sink, start=1, stop=5)
+        means = [frame.mean() for frame in sink.frames]
+        assert len(means) == 4
+        assert all(means[i] < means[i + 1] for i in range(3))
+        assert viewer.get_settings().get('async_redraw') is True
+
+    def test_export_images(self):
+        images = []
+        for i in range(3):
+            image = AstroImage.AstroImage(logger=self.logger)
+            image.load_data(numpy.full((50, 50), i, dtype=numpy.float32))
+            images.append(image)
+
+        sink = ListSink()
+        frameexport.export_images(self.viewer, images, sink)
+        assert len(sink.frames) == 3
+        assert self.viewer.get_image() is self.image
+
+    def test_y4m(self):
+        out = BytesIO()
+        sink = frameexport.Y4MSink(out, fps=25)
+        frames = [numpy.zeros((4, 6, 3), dtype=numpy.uint8),
+                  numpy.full((4, 6, 3), 255, dtype=numpy.uint8)]
+        with frameexport.FrameExporter(self.logger, sink) as exporter:
+            for frame in frames:
+                exporter.put(frame)
+
+        header = b"YUV4MPEG2 W6 H4 F25:1 Ip A1:1 C444\n"
+        size = 4 * 6 * 3
+        res = out.getvalue()
+        assert res.startswith(header)
+        res = res[len(header):]
+        assert len(res) == 2 * (len(b'FRAME\n') + size)
+        # black and white in video range
+        black = numpy.frombuffer(res[6:6 + size], dtype=numpy.uint8)
+        assert list(black[::24]) == [16, 128, 128]
+        white = numpy.frombuffer(res[-size:], dtype=numpy.uint8)
+        assert list(white[::24]) == [235, 128, 128]
+
+    @unittest.skipIf(not frameexport.have_pil, "PIL is not installed")
+    def test_animation_limit(self):
+        sink = frameexport.AnimationSink('anim.gif', max_frames=2)
+        frame = numpy.zeros((5, 5, 3), dtype=numpy.uint8)
+
+        def put_all():
+            with frameexport.FrameExporter(self.logger, sink) as exporter:
+                for i in range(3):
+                    exporter.put(frame)
+
+        self.assertRaises(frameexport.FrameExportError, put_all)
+        assert sink.frames == []
+
+    def test_get_sink(self):
+        assert isinstance(frameexport.get_sink('movie.y4m'),
+                          frameexport.Y4MSink)
+        self.assertRaises(frameexport.FrameExportError,
+                          frameexport.get_sink, 'frame.png')
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,108 @@
+import io
+import socket
+import struct
+import unittest
+import logging
+import numpy
+
+from ginga.misc import Bunch
+from ginga.rv.plugins import IIS_DataListener as iis
+
+
+class Controller(object):
+    """Stands in for the IRAF plugin."""
+
+    def __init__(self):
+        self.fb = {}
+        self.updates = []
+        self.displayed = []
+
+    def init_frame(self, n):
+        fb = self.fb.setdefault(n, iis.framebuffer())
+        fb.clear()
+        return fb
+
+    def get_frame(self, n):
+        return self.fb[n]
+
+    def set_frame(self, n):
+        pass
+
+    def update_rows(self, frame, y1, y2):
+        self.updates.append((y1, y2))
+
+    def display(self, frame, width, height, reverse=False):
+        self.displayed.append(numpy.copy(self.fb[frame].get_array()))
+
+
+class TestIIS(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestIIS")
+
+    def test_framebuffer(self):
+        fb = iis.framebuffer()
+        fb.width, fb.height = 8, 4
+        data = numpy.arange(32, dtype=numpy.uint8)
+        assert fb.write(8, io.BytesIO(data[:12].tobytes()), 12) == 12
+        buf = fb.buffer
+        assert fb.get_dirty_rows(reset=True) == (1, 3)
+        assert fb.get_dirty_rows() == (0, 0)
+        # writes beyond the end of the frame are dropped
+        fb.write(24, io.BytesIO(data[:12].tobytes()), 12)
+        assert fb.buffer is buf
+        assert fb.read(8, 12) == data[:12].tobytes()
+
+        arr = fb.get_array()
+        assert arr.shape == (4, 8)
+        # a flipped view of the buffer
+        assert numpy.may_share_memory(arr, fb.buffer)
+        assert numpy.array_equal(arr[2, :4], data[:4])
+
+        # pieces that come before the size is known
+        fb = iis.framebuffer()
+        fb.width = 4
+        for i in range(2):
+            fb.append(io.BytesIO(data[i*8:(i+1)*8].tobytes()), 8)
+        assert fb.get_num_bytes() == 16
+        fb.height = 4
+        expected = numpy.concatenate((data[8:16], data[:8])).reshape(4, 4)
+        assert numpy.array_equal(fb.get_array(), expected[::-1])
+
+    def test_memory_write(self):
+        controller = Controller()
+        fb = controller.init_frame(0)
+        fb.width, fb.height = 64, 32
+        server = Bunch.Bunch(controller=controller, logger=self.logger)
+
+        data = numpy.random.randint(0, 256, 64 * 32).astype(numpy.uint8)
+        msg = b''
+        for y in range(0, 32, 8):
+            # write 8 rows at a time to frame 1
+            nbytes = 64 * 8
+            msg += struct.pack('8h', iis.PACKED, -nbytes, iis.MEMORY, 0,
+                               0, y, 1, 0)
+            msg += data[y * 64:(y + 8) * 64].tobytes()
+
+        sock1, sock2 = socket.socketpair()
+        update_interval = iis.IIS_RequestHandler.update_interval
+        try:
+            iis.IIS_RequestHandler.update_interval = 0.0
+            sock1.sendall(msg)
+            sock1.close()
+            iis.IIS_RequestHandler(sock2, None, server)
+        finally:
+            iis.IIS_RequestHandler.update_interval = update_interval
+            sock2.close()
+
+        # the frame was shown as it came in, and then completely
+        assert controller.updates == [(0, 8), (8, 16), (16, 24), (24, 32)]
+        assert len(controller.displayed) == 1
+        assert numpy.array_equal(controller.displayed[0],
+                                 data.reshape(32, 64)[::-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import unittest
+import logging
+import numpy
+
+from ginga.util import io_fits, iohelper
+
+
+class TestError(Exception):
+    pass
+
+
+class TestIOFits(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestIOFits")
+        self.tmpdir = tempfile.mkdtemp()
+
+    def _make_fits(self, name, header):
+        from astropy.io import fits as pyfits
+        path = os.path.join(self.tmpdir, name)
+        hdu = pyfits.PrimaryHDU(numpy.zeros((10, 20), dtype=numpy.int16))
+        for kwd, val in header.items():
+            hdu.header[kwd] = val
+        hdu.writeto(path)
+        return path
+
+    def test_scan_primary_header(self):
+        path = self._make_fits('test.fits',
+                               {'OBJECT': "M31 'core'", 'EXPTIME': 30.5,
+                                'DATE-OBS': '2017-04-01', 'GAIN': 2,
+                                'DITHER': True})
+        res = io_fits.scan_primary_header(path)
+        hdr = res.header
+        assert hdr['OBJECT'] == "M31 'core'", \
+               TestError("Unexpected OBJECT value: %s" % (hdr['OBJECT']))
+        assert hdr['EXPTIME'] == 30.5
+        assert hdr['DATE-OBS'] == '2017-04-01'
+        assert hdr['GAIN'] == 2
+        assert hdr['DITHER'] is True
+        assert hdr['NAXIS1'] == 20 and hdr['NAXIS2'] == 10
+        assert res.data_offset % io_fits.FITS_BLOCK_SIZE == 0
+
+        # data should start right at the offset
+        with open(path, 'rb') as in_f:
+            in_f.seek(res.data_offset)
+            data = numpy.frombuffer(in_f.read(400), dtype='>i2')
+        assert numpy.all(data == 0)
+
+    def test_scan_primary_header_keywords(self):
+        path = self._make_fits('test.fits', {'OBJECT': 'M31'})
+        res = io_fits.scan_primary_header(path, keywords=['OBJECT'])
+        assert list(res.header.keys()) == ['OBJECT']
+
+    def test_scan_header(self):
+        from astropy.io import fits as pyfits
+        path = os.path.join(self.tmpdir, 'mef.fits')
+        hdus = [pyfits.PrimaryHDU()]
+        for i in range(2):
+            hdu = pyfits.ImageHDU(numpy.full((5, 7), i, dtype=numpy.int16),
+                                  name='SCI', ver=i + 1)
+            hdu.header['OBJECT'] = 'M%d' % (i)
+            hdus.append(hdu)
+        pyfits.HDUList(hdus).writeto(path)
+
+        assert io_fits.scan_header(path, numhdu=2).header['OBJECT'] == 'M1'
+        res = io_fits.scan_header(path, numhdu=('SCI', 2),
+                                  keywords=['OBJECT'])
+        assert res.header == {'OBJECT': 'M1'}
+        with open(path, 'rb') as in_f:
+            in_f.seek(res.data_offset)
+            data = numpy.frombuffer(in_f.read(70), dtype='>i2')
+        assert numpy.all(data == 1)
+        # by default, the first HDU with data
+        res = io_fits.scan_header(path, numhdu=None)
+        assert res.header['OBJECT'] == 'M0'
+        with self.assertRaises(io_fits.FITSError):
+            io_fits.scan_header(path, numhdu=3)
+
+    def test_scan_not_fits(self):
+        path = os.path.join(self.tmpdir, 'notfits.fits')
+        with open(path, 'wb') as out_f:
+            out_f.write(b'\0' * io_fits.FITS_BLOCK_SIZE)
+        with self.assertRaises(io_fits.FITSError):
+            io_fits.scan_primary_header(path)
+
+    def test_memmap_primary(self):
+        from astropy.io import fits as pyfits
+        path = os.path.join(self.tmpdir, 'scaled.fits')
+        data = numpy.arange(200, dtype=numpy.uint16).reshape((10, 20))
+        pyfits.PrimaryHDU(data).writeto(path)
+        res = io_fits.memmap_primary(path)
+        assert res.data.shape == (10, 20)
+        # unsigned data are stored with an offset
+        assert numpy.array_equal(res.data * res.bscale + res.bzero, data)
+
+    def test_file_index(self):
+        indexpath = os.path.join(self.tmpdir, 'idx', 'index.json')
+        index = iohelper.FileIndex(indexpath, logger=self.logger)
+        index.put('a.fits', 100.0, 2880, dict(object='M31'))
+        assert index.get('a.fits', 100.0, 2880) == dict(object='M31')
+        # stale entries are not returned
+        assert index.get('a.fits', 101.0, 2880) is None
+        assert index.get('a.fits', 100.0, 5760) is None
+        index.save()
+
+        index2 = iohelper.FileIndex(indexpath, logger=self.logger)
+        assert index2.get('a.fits', 100.0, 2880) == dict(object='M31')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+import logging
+import numpy
+
+from ginga.util import dp, mosaic
+
+
+class TestError(Exception):
+    pass
+
+
+class TestMosaic(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestMosaic")
+        px_scale = 2.0 / 3600.0
+        self.px_scale = px_scale
+        # non-overlapping pieces, one of them upside down
+        self.pieces = []
+        for i, rot_deg in enumerate((0.0, 180.0, 0.0)):
+            image = dp.create_blank_image(10.0 + i * 0.06, 20.0,
+                                          100 * px_scale, px_scale,
+                                          rot_deg, logger=self.logger)
+            data = image.get_data()
+            data[:] = numpy.arange(data.size).reshape(data.shape) + 1
+            self.pieces.append(image)
+
+    def _new_mosaic(self):
+        return dp.create_blank_image(10.06, 20.0, 0.05, self.px_scale, 0.0,
+                                     logger=self.logger)
+
+    def _check(self, use_processes):
+        img1 = self._new_mosaic()
+        loc1 = img1.mosaic_inline(self.pieces)
+
+        img2 = self._new_mosaic()
+        pipeline = mosaic.MosaicPipeline(self.logger, num_workers=2,
+                                         use_processes=use_processes,
+                                         tile_size=32)
+        loc2 = pipeline.mosaic(img2, self.pieces)
+
+        assert len(loc2) == len(loc1)
+        for (x1, y1, x2, y2), (a1, b1, a2, b2) in zip(loc1, loc2):
+            assert (x2 - x1, y2 - y1) == (a2 - a1, b2 - b1), \
+                   TestError("Piece sizes differ")
+            piece1 = img1.get_data()[y1:y2, x1:x2]
+            piece2 = img2.get_data()[b1:b2, a1:a2]
+            assert numpy.array_equal(piece1, piece2), \
+                   TestError("Mosaic pieces differ")
+
+        for key in ('plan', 'alloc', 'warp', 'paste', 'total'):
+            assert pipeline.timings[key] >= 0.0
+
+    def test_pipeline_threads(self):
+        self._check(False)
+
+    def test_pipeline_processes(self):
+        self._check(True)
+
+    def test_pipeline_processes_twice(self):
+        # the first call moves the mosaic to a shared file, the second
+        # expands it and the third reuses the file
+        def new_mosaic():
+            return dp.create_blank_image(10.0, 20.0, 100 * self.px_scale,
+                                         self.px_scale, 0.0,
+                                         logger=self.logger)
+        img1 = new_mosaic()
+        img1.mosaic_inline(self.pieces[:1])
+        img1.mosaic_inline(self.pieces[1:])
+        img1.mosaic_inline(self.pieces[:1])
+
+        shm_dir = tempfile.mkdtemp()
+        try:
+            img2 = new_mosaic()
+            pipeline = mosaic.MosaicPipeline(self.logger, num_workers=2,
+                                             use_processes=True,
+                                             tile_size=32, shm_dir=shm_dir)
+            pipeline.mosaic(img2, self.pieces[:1])
+            assert len(os.listdir(shm_dir)) == 1
+            pipeline.mosaic(img2, self.pieces[1:])
+            # the file of the smaller mosaic was replaced
+            assert len(os.listdir(shm_dir)) == 1
+            pipeline.mosaic(img2, self.pieces[:1])
+            assert len(os.listdir(shm_dir)) == 1
+
+            assert numpy.array_equal(img1.get_data(), img2.get_data()), \
+                   TestError("Mosaics differ")
+
+            img2.release_data_files()
+            assert os.listdir(shm_dir) == []
+            # the data are still there
+            assert numpy.array_equal(img1.get_data(), img2.get_data())
+        finally:
+            shutil.rmtree(shm_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,77 @@
+import time
+import unittest
+import logging
+import numpy
+
+from ginga import AstroImage
+from ginga.mockw.ImageViewCanvasMock import ImageViewCanvas
+from ginga.util import playback
+
+
+class TestPlayback(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestPlayback")
+        self.viewer = ImageViewCanvas(logger=self.logger)
+        self.viewer.configure_surface(200, 150)
+        self.viewer.set_redraw_lag(0.0)
+
+        rng = numpy.random.RandomState(1)
+        cube = rng.rand(12, 300, 400).astype(numpy.float32)
+        cube += numpy.arange(12).reshape(-1, 1, 1)
+        self.image = AstroImage.AstroImage(logger=self.logger)
+        self.image.load_data(cube)
+        self.viewer.set_image(self.image)
+        self.viewer.zoom_to(-2)
+
+    def _wait_prepared(self, player, num):
+        for i in range(500):
+            if player.get_stats()['prepared'] >= num:
+                return
+            time.sleep(0.01)
+        raise AssertionError("slices were not prepared")
+
+    def test_playback(self):
+        viewer, image = self.viewer, self.image
+        player = playback.CubePlayer(self.logger, viewer, prefetch=3)
+        shown = []
+        player.add_callback('frame-shown',
+                            lambda player, idx: shown.append(idx))
+
+        player.start(image, [0], 2, 5, fps=1.0)
+        # the first frame is due, but not prepared yet
+        delay = player.tick()
+        assert 0.0 < delay <= 1.0
+        assert len(shown) == 0
+        self._wait_prepared(player, 3)
+
+        # two frame intervals later the third frame is shown and the
+        # second one is dropped
+        player.t_start -= 2.0
+        player.tick()
+        assert shown == [7]
+        stats = player.get_stats()
+        assert stats['late'] == 1
+        assert stats['dropped'] == 2
+        assert stats['target_fps'] == 1.0
+
+        # the frame looks the same as the slice drawn normally, with the
+        # cut levels locked
+        assert image.naxispath == [7]
+        rgb = numpy.copy(viewer.getwin_array(order='RGB'))
+        viewer.redraw_now(whence=0)
+        assert numpy.array_equal(rgb, viewer.getwin_array(order='RGB'))
+
+        # changing the view discards the prepared frames
+        gen = player.gen
+        viewer.set_pan(100, 100)
+        player.tick()
+        assert player.gen > gen
+
+        assert player.stop() == 7
+        assert not player.is_playing()
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
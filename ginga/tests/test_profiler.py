@@ -0,0 +1,81 @@
+import json
+import time
+import unittest
+import logging
+import numpy
+
+from ginga import AstroImage
+from ginga.mockw.ImageViewCanvasMock import ImageViewCanvas
+from ginga.util import profiler
+from ginga.util.six import StringIO
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestProfiler")
+
+    def test_exclusive_stages(self):
+        prof = profiler.RenderProfiler(history=3, enabled=True)
+        for i in range(5):
+            prof.start_frame(i)
+            with prof.stage('outer'):
+                time.sleep(0.01)
+                with prof.stage('inner'):
+                    time.sleep(0.02)
+                prof.add_bytes('inner', 100)
+            prof.end_frame()
+
+        frames = prof.get_frames()
+        # ring buffer keeps the most recent frames
+        assert [frame['whence'] for frame in frames] == [2, 3, 4]
+        frame = frames[-1]
+        assert frame['stages']['inner'] >= 0.02
+        assert 0.01 <= frame['stages']['outer'] < 0.02
+        assert frame['bytes'] == dict(inner=100)
+
+        summary = prof.get_summary()
+        assert summary['total']['count'] == 3
+        assert summary['inner']['bytes'] == 100
+        assert summary['inner']['p50'] <= summary['inner']['max']
+        assert len(prof.get_frames(whence=3)) == 1
+
+    def test_disabled(self):
+        prof = profiler.RenderProfiler()
+        prof.start_frame(0)
+        with prof.stage('cutout'):
+            pass
+        prof.end_frame()
+        assert len(prof.get_frames()) == 0
+
+    def test_viewer(self):
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.configure_surface(300, 200)
+        image = AstroImage.AstroImage(logger=self.logger)
+        image.set_data(numpy.random.rand(500, 500))
+        viewer.set_image(image)
+
+        viewer.get_settings().set(profile_render=True)
+        viewer.redraw_now(whence=0)
+        viewer.redraw_now(whence=2)
+
+        prof = viewer.get_profiler()
+        frames = prof.get_frames()
+        assert [frame['whence'] for frame in frames] == [0, 2]
+        for name in ('cutout', 'cuts', 'lut', 'composite', 'rotate'):
+            assert name in frames[0]['stages']
+        # only the color mapping is redone at level 2
+        assert 'cutout' not in frames[1]['stages']
+        assert 'lut' in frames[1]['stages']
+
+        buf = StringIO()
+        prof.dump_json(buf)
+        d = json.loads(buf.getvalue())
+        assert len(d['frames']) == 2
+        assert d['summary']['total']['count'] == 2
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import unittest
+import logging
+from io import StringIO
+
+import numpy
+
+from ginga.util import quicklook
+from ginga.util.io_fits import pyfits
+
+
+class TestQuicklook(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestQuicklook")
+        self.tmpdir = tempfile.mkdtemp()
+        rng = numpy.random.RandomState(1)
+        self.paths = []
+        for i in range(3):
+            data = rng.normal(100.0 * (i + 1), 10.0, (300, 400))
+            # a bright column on the left, to check the orientation
+            data[:, :20] = 1e4
+            path = os.path.join(self.tmpdir, 'frame%d.fits' % (i))
+            pyfits.PrimaryHDU(data.astype(numpy.float32)).writeto(path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _read_ppm(self, path):
+        with open(path, 'rb') as in_f:
+            buf = in_f.read()
+        header = buf.split(b'\n', 3)
+        assert header[0] == b'P6'
+        wd, ht = [int(n) for n in header[1].split()]
+        return numpy.frombuffer(header[3], dtype=numpy.uint8).reshape(
+            ht, wd, 3)
+
+    def test_render(self):
+        renderer = quicklook.QuicklookRenderer(logger=self.logger,
+                                               width=100, height=80,
+                                               format='ppm')
+        outpath = renderer.save_file(self.paths[0], outdir=self.tmpdir)
+        assert outpath == os.path.join(self.tmpdir, 'frame0.ppm')
+        rgb = self._read_ppm(outpath)
+        assert rgb.shape == (80, 100, 3)
+        # the image fills the width, so the bright column is at the left
+        assert rgb[40, 1].mean() > 250
+        assert rgb[40, 50].mean() < 200
+        # rows above and below the image are background
+        assert rgb[0].max() == 0 and rgb[-1].max() == 0
+
+        # the same viewer and buffer are used for the next image
+        viewer = renderer.viewer
+        rgb2 = renderer.render_file(self.paths[1])
+        assert rgb2 is renderer.rgbarr
+        assert renderer.viewer is viewer
+
+    def test_sampled_cuts(self):
+        renderer = quicklook.QuicklookRenderer(logger=self.logger,
+                                               sample_size=5000,
+                                               format='ppm')
+        data = numpy.random.RandomState(2).normal(0.0, 1.0, (1000, 1000))
+        loval, hival = renderer.calc_cut_levels(data)
+        assert renderer.sample_image.get_data().size <= 5000
+        assert -4.0 < loval < -0.5 and 0.5 < hival < 4.0
+
+    def test_iter_files(self):
+        other = os.path.join(self.tmpdir, 'notes.txt')
+        with open(other, 'w') as out_f:
+            out_f.write('not an image')
+
+        assert list(quicklook.iter_files([self.tmpdir])) == self.paths
+        pattern = os.path.join(self.tmpdir, 'frame[12].fits')
+        assert list(quicklook.iter_files([pattern])) == self.paths[1:]
+        stdin = StringIO(u"%s\n\n# comment\n%s\n" % (self.paths[2], other))
+        assert list(quicklook.iter_files(['-', 'x.fits'], stdin=stdin)) == \
+            [self.paths[2], other, 'x.fits']
+
+    def test_render_files(self):
+        # the output directory is made as needed
+        outdir = os.path.join(self.tmpdir, 'ql', 'out')
+        paths = self.paths + [os.path.join(self.tmpdir, 'missing.fits')]
+        for num_procs in (1, 2):
+            results = list(quicklook.render_files(
+                paths, outdir=outdir, num_procs=num_procs, width=64,
+                height=64, format='ppm'))
+            assert len(results) == 4
+            errors = [res.path for res in results if res.error is not None]
+            assert errors == [paths[3]]
+            outpaths = sorted([res.outpath for res in results
+                               if res.error is None])
+            assert outpaths == [os.path.join(outdir, 'frame%d.ppm' % (i))
+                                for i in range(3)]
+            for outpath in outpaths:
+                assert self._read_ppm(outpath).shape == (64, 64, 3)
+
+    def test_render_files_clash(self):
+        # files of the same name in different directories
+        subdir = os.path.join(self.tmpdir, 'sub')
+        os.mkdir(subdir)
+        other = os.path.join(subdir, 'frame0.fits.gz')
+        shutil.copy(self.paths[1], other)
+        outdir = os.path.join(self.tmpdir, 'ql')
+        for num_procs in (1, 2):
+            results = list(quicklook.render_files(
+                [self.paths[0], other], outdir=outdir, num_procs=num_procs,
+                width=64, height=64, format='ppm'))
+            assert len(results) == 2
+            res = [res for res in results if res.error is not None]
+            assert len(res) == 1 and res[0].path == other
+            assert 'overwrite' in res[0].error
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
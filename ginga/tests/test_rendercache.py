@@ -0,0 +1,116 @@
+import gc
+import unittest
+import logging
+import numpy
+
+from ginga import AstroImage, AutoCuts, RGBMap, cmap, imap
+from ginga.mockw.ImageViewCanvasMock import ImageViewCanvas
+from ginga.canvas.types.image import Image
+from ginga.util import rendercache, thumbsvc
+
+
+class TestRenderCache(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestRenderCache")
+        self.rgbmap = RGBMap.RGBMapper(self.logger)
+        self.rgbmap.set_cmap(cmap.get_cmap('gray'), callback=False)
+        self.rgbmap.set_imap(imap.get_imap('ramp'), callback=False)
+        self.autocuts = AutoCuts.get_autocuts('zscale')(self.logger)
+        self.cache = rendercache.RenderCache(self.logger, length=100,
+                                             max_images=2)
+
+        data = numpy.linspace(0.0, 1.0, 300 * 250).reshape((250, 300))
+        self.image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+
+    def test_renderings(self):
+        cache, image = self.cache, self.image
+        data, step = cache.get_decimated(image)
+        assert step == 3
+        assert data.shape == (84, 100)
+        assert not numpy.may_share_memory(data, image.get_data())
+
+        rgb1 = cache.get_rgb(image, (0.0, 1.0), self.rgbmap, self.autocuts)
+        assert rgb1.get_data().shape == (84, 100, 3)
+        # nothing changed: the same rendering
+        assert cache.get_rgb(image, (0.0, 1.0), self.rgbmap,
+                             self.autocuts) is rgb1
+        # a copy of the color map renders the same
+        rgbmap2 = RGBMap.RGBMapper(self.logger)
+        self.rgbmap.copy_attributes(rgbmap2)
+        assert cache.get_rgb(image, (0.0, 1.0), rgbmap2,
+                             self.autocuts) is rgb1
+
+        idx = cache.get_index(image, (0.0, 1.0), self.autocuts, 256,
+                              numpy.uint8)
+        rgb2 = cache.get_rgb(image, (0.0, 0.5), self.rgbmap, self.autocuts)
+        assert rgb2 is not rgb1
+        # the index array is remade for the new cut levels
+        assert cache.get_index(image, (0.0, 0.5), self.autocuts, 256,
+                               numpy.uint8) is not idx
+
+        self.rgbmap.set_cmap(cmap.get_cmap('rainbow3'))
+        rgb3 = cache.get_rgb(image, (0.0, 0.5), self.rgbmap, self.autocuts)
+        assert rgb3 is not rgb2
+        assert numpy.array_equal(rgb3.get_data(), thumbsvc.render_thumbnail(
+            data, 100, self.rgbmap, cuts=(0.0, 0.5), logger=self.logger))
+
+        # modifying the image drops its renderings
+        image.set_data(image.get_data() * 2.0)
+        data2, step = cache.get_decimated(image)
+        assert data2.max() > 1.5
+        assert cache.get_rgb(image, (0.0, 0.5), self.rgbmap,
+                             self.autocuts) is not rgb3
+
+    def test_lru(self):
+        cache = self.cache
+        images = [AstroImage.AstroImage(data_np=numpy.zeros((10, 10)),
+                                        logger=self.logger)
+                  for i in range(3)]
+        for image in images:
+            cache.get_decimated(image)
+        assert cache.get_stats()['images'] == 2
+        assert id(images[0]) not in cache.entries
+
+        # entries go away with their images
+        del images[1:], image
+        gc.collect()
+        assert cache.get_stats()['images'] == 0
+
+    def test_thumbnail(self):
+        svc = thumbsvc.ThumbnailService(self.logger,
+                                        render_cache=self.cache)
+        job = dict(path=None, idx=None, image=self.image, length=50,
+                   rgbmap=self.rgbmap, cuts=(0.0, 1.0),
+                   autocut_method='zscale', keywords=[], loader=None,
+                   use_cache=False)
+        res = svc.make_thumb(thumbsvc.Bunch.Bunch(job))
+        assert res.error is None
+        assert res.rgb.shape == (42, 50, 3)
+        # made from the shared rendering
+        assert self.cache.get_stats()['images'] == 1
+
+    def test_pan_image(self):
+        # draw the rendering the way the Pan plugin does
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.configure_surface(100, 100)
+        viewer.set_image(self.image, add_to_canvas=False)
+        viewer.zoom_fit()
+        assert viewer.get_limits() == [(0.0, 0.0), (300.0, 250.0)]
+
+        rgbimage = self.cache.get_rgb(self.image, (0.0, 1.0),
+                                      viewer.get_rgbmap(), self.autocuts)
+        step = self.cache.get_step(self.image)
+        obj = Image(0, 0, rgbimage, scale_x=step, scale_y=step)
+        viewer.get_canvas().add(obj)
+        rgbobj = viewer.get_rgb_object(whence=0)
+        arr = rgbobj.get_array('RGB')
+        # ramp increases to the right
+        ht, wd = arr.shape[:2]
+        assert arr[ht // 2, wd // 2 - 20, 0] < arr[ht // 2, wd // 2 + 20, 0]
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
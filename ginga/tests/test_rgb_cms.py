@@ -0,0 +1,64 @@
+import unittest
+import numpy
+
+from ginga.util import rgb_cms
+
+
+class TestRGBCms(unittest.TestCase):
+
+    def _make_lut(self, size, fn):
+        vals = rgb_cms.get_lut_tables(size)[0].astype(numpy.float32)
+        r, g, b = numpy.meshgrid(vals, vals, vals, indexing='ij')
+        return fn(numpy.stack((r, g, b), axis=-1))
+
+    def setUp(self):
+        self.data = numpy.random.randint(0, 256, size=(50, 70, 4)).astype(
+            numpy.uint8)
+
+    def test_identity(self):
+        for size in (17, 33):
+            lut = self._make_lut(size, lambda rgb: rgb)
+            data = numpy.copy(self.data)
+            rgb_cms.apply_lut(data, lut, order='RGBA', chunk_size=1000)
+            assert numpy.array_equal(data, self.data)
+
+    def test_linear_mix(self):
+        # a linear transform is reproduced exactly by trilinear interpolation
+        mat = numpy.array([[0.8, 0.1, 0.1],
+                           [0.0, 0.5, 0.5],
+                           [0.2, 0.0, 0.8]], dtype=numpy.float32)
+        lut = self._make_lut(33, lambda rgb: rgb.dot(mat.T))
+        data = numpy.copy(self.data)
+        rgb_cms.apply_lut(data, lut, order='BGRA')
+
+        rgb = self.data[..., [2, 1, 0]].astype(numpy.float32)
+        expected = numpy.floor(rgb.dot(mat.T) + 0.5)
+        diff = numpy.abs(data[..., [2, 1, 0]] - expected)
+        assert diff.max() <= 1
+        # alpha is untouched
+        assert numpy.array_equal(data[..., 3], self.data[..., 3])
+
+    def test_color_lut(self):
+        lut = self._make_lut(33, lambda rgb: 255.0 * (rgb / 255.0)**0.5)
+        clut = rgb_cms.ColorLUT(lut)
+        expected = numpy.copy(self.data)
+        rgb_cms.apply_lut(expected, lut, order='ARGB')
+        for i in range(2):
+            # second time through, colors come from the memo
+            data = numpy.copy(self.data)
+            clut.convert(data, order='ARGB')
+            assert numpy.array_equal(data, expected)
+
+        # a table too small for all the colors gives the same result
+        clut = rgb_cms.ColorLUT(lut, memo_bits=8)
+        for i in range(2):
+            data = numpy.copy(self.data)
+            clut.convert(data, order='ARGB')
+            assert numpy.array_equal(data, expected)
+        assert clut.memo_keys.nbytes == 4 * 256
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
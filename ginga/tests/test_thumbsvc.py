@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import logging
+import numpy
+
+from ginga import RGBMap, cmap, imap
+from ginga.util import thumbsvc
+
+
+class TestThumbSvc(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("TestThumbSvc")
+        self.tmpdir = tempfile.mkdtemp()
+        self.rgbmap = RGBMap.RGBMapper(self.logger)
+        self.rgbmap.set_cmap(cmap.get_cmap('gray'), callback=False)
+        self.rgbmap.set_imap(imap.get_imap('ramp'), callback=False)
+
+    def _make_fits(self, name, shape=(400, 600)):
+        from astropy.io import fits as pyfits
+        path = os.path.join(self.tmpdir, name)
+        data = numpy.arange(shape[0] * shape[1],
+                            dtype=numpy.float32).reshape(shape)
+        hdu = pyfits.PrimaryHDU(data)
+        hdu.header['OBJECT'] = 'M31'
+        hdu.writeto(path)
+        return path
+
+    def test_read_decimated(self):
+        path = self._make_fits('test.fits')
+        res = thumbsvc.read_decimated(path, 100, keywords=['OBJECT'])
+        assert res.data.shape == (134, 200)
+        assert res.header == dict(OBJECT='M31')
+        assert res.data[1, 1] == 3 * 600 + 3
+
+    def test_render_thumbnail(self):
+        data = numpy.linspace(0.0, 1.0, 200 * 100).reshape((100, 200))
+        rgb = thumbsvc.render_thumbnail(data, 50, self.rgbmap,
+                                        cuts=(0.0, 1.0), logger=self.logger)
+        assert rgb.shape == (25, 50, 3)
+        assert rgb.dtype == numpy.uint8
+        assert rgb[0, 0, 0] == 0 and rgb[-1, -1, 0] > 240
+
+    def test_cache_lru(self):
+        cachedir = os.path.join(self.tmpdir, 'cache')
+        data = numpy.zeros((50, 50, 3), dtype=numpy.uint8)
+        cache = thumbsvc.ThumbCache(cachedir, self.logger, max_bytes=20000)
+        path = self._make_fits('a.fits')
+        keys = [cache.make_key(path, None, 'params%d' % i) for i in range(3)]
+        assert len(set(keys)) == 3
+
+        cache.put(keys[0], data)
+        cache.put(keys[1], data)
+        # touch the first, so that the second is evicted next
+        assert numpy.array_equal(cache.get(keys[0]), data)
+        cache.put(keys[2], data)
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) is not None
+        assert cache.get(keys[2]) is not None
+
+        # a new instance picks up the entries on disk
+        cache2 = thumbsvc.ThumbCache(cachedir, self.logger, max_bytes=20000)
+        assert cache2.get(keys[2]) is not None
+
+    def test_service(self):
+        path = self._make_fits('test.fits')
+        cache = thumbsvc.ThumbCache(os.path.join(self.tmpdir, 'cache'),
+                                    self.logger)
+        svc = thumbsvc.ThumbnailService(self.logger, cache=cache)
+        results = []
+        done = threading.Event()
+
+        def callback(res):
+            results.append(res)
+            if len(results) == 2:
+                done.set()
+
+        for i in range(2):
+            svc.request(callback, path=path, length=60, rgbmap=self.rgbmap,
+                        keywords=['OBJECT'])
+        done.wait(10.0)
+        svc.stop()
+
+        assert len(results) == 2
+        for res in results:
+            assert res.error is None
+            assert res.rgb.shape == (40, 60, 3)
+            assert res.header['OBJECT'] == 'M31'
+
+    def test_cached_extension_header(self):
+        from astropy.io import fits as pyfits
+        path = os.path.join(self.tmpdir, 'mef.fits')
+        prihdu = pyfits.PrimaryHDU()
+        prihdu.header['OBJECT'] = 'M31'
+        hdu = pyfits.ImageHDU(numpy.ones((40, 60), dtype=numpy.float32))
+        hdu.header['OBJECT'] = 'M31 SCI'
+        pyfits.HDUList([prihdu, hdu]).writeto(path)
+
+        cache = thumbsvc.ThumbCache(os.path.join(self.tmpdir, 'cache'),
+                                    self.logger)
+        svc = thumbsvc.ThumbnailService(self.logger, cache=cache)
+        job = dict(path=path, idx=1, image=None, length=30,
+                   rgbmap=self.rgbmap, cuts=(0.0, 2.0),
+                   autocut_method='zscale', keywords=['OBJECT'],
+                   loader=None, use_cache=True)
+        for from_cache in (False, True):
+            res = svc.make_thumb(thumbsvc.Bunch.Bunch(job))
+            assert res.from_cache == from_cache
+            # the header of the HDU the thumbnail is made from
+            assert res.header['OBJECT'] == 'M31 SCI'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
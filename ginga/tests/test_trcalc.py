@@ -0,0 +1,121 @@
+import unittest
+import numpy
+
+from ginga import trcalc
+
+
+class TestTrcalc(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(1)
+        self.data = rng.rand(101, 120).astype(numpy.float32)
+        self.rgba = rng.randint(0, 256, (90, 90, 4)).astype(numpy.uint8)
+        trcalc.clear_rotate_cache()
+        trcalc.clear_resample_cache()
+
+    def _rotate_ref(self, data, theta_deg, ctr_x, ctr_y):
+        # straightforward nearest neighbor rotation
+        ht, wd = data.shape[:2]
+        yi, xi = numpy.mgrid[0:ht, 0:wd]
+        xi, yi = xi - ctr_x, yi - ctr_y
+        cos_t = numpy.cos(numpy.radians(theta_deg))
+        sin_t = numpy.sin(numpy.radians(theta_deg))
+        ap = numpy.rint(xi * cos_t - yi * sin_t + ctr_x).astype(int)
+        bp = numpy.rint(xi * sin_t + yi * cos_t + ctr_y).astype(int)
+        return data[bp.clip(0, ht-1), ap.clip(0, wd-1)]
+
+    def test_rotate_clip(self):
+        for data in (self.data, self.rgba):
+            ht, wd = data.shape[:2]
+            expected = self._rotate_ref(data, 33.0, wd // 2, ht // 2)
+            res = trcalc.rotate_clip(data, 33.0)
+            assert numpy.array_equal(res, expected)
+            # the second rotation uses the cached gather map
+            assert len(trcalc._rotate_cache) > 0
+            assert numpy.array_equal(trcalc.rotate_clip(data, 33.0),
+                                     expected)
+
+        # rotation into the source array itself
+        expected = self._rotate_ref(self.data, -70.0, 10, 80)
+        data = self.data.copy()
+        res = trcalc.rotate_clip(data, -70.0, rotctr_x=10, rotctr_y=80,
+                                 out=data)
+        assert res is data
+        assert numpy.array_equal(res, expected)
+
+    def test_rotate_clip_strips(self):
+        cache_size = trcalc.rotate_cache_size
+        try:
+            # too large to cache: rotated strip-wise
+            trcalc.rotate_cache_size = 0
+            expected = self._rotate_ref(self.data, 120.0, 60, 50)
+            res = trcalc.rotate_clip(self.data, 120.0)
+            assert len(trcalc._rotate_cache) == 0
+            assert numpy.array_equal(res, expected)
+        finally:
+            trcalc.rotate_cache_size = cache_size
+
+    def test_rotate_clip_linear(self):
+        # bilinear interpolation reproduces a linear ramp away from
+        # the edges
+        yi, xi = numpy.mgrid[0:100, 0:100]
+        data = (xi + 2.0 * yi)
+        res = trcalc.rotate_clip(data, 30.0, interpolation='linear')
+        ap, bp = trcalc.rotate_pt(xi, yi, 30.0, xoff=50, yoff=50)
+        inner = (ap >= 0) & (ap <= 99) & (bp >= 0) & (bp <= 99)
+        assert numpy.allclose(res[inner], (ap + 2.0 * bp)[inner],
+                              atol=1e-3)
+
+        res = trcalc.rotate_clip(self.rgba, 30.0, interpolation='linear')
+        assert res.dtype == numpy.uint8
+
+    def test_resample_nearest(self):
+        # same pixels as the fancy indexed view
+        for x1, y1, x2, y2, wd, ht in ((10, 20, 110, 90, 37, 51),
+                                       (0, 0, 119, 100, 300, 250),
+                                       (5, 5, 64, 64, 60, 200)):
+            view, scales = trcalc.get_scaled_cutout_wdht_view(
+                self.data.shape, x1, y1, x2, y2, wd, ht)
+            res, scales2 = trcalc.get_scaled_cutout_wdht(
+                self.data, x1, y1, x2, y2, wd, ht)
+            assert numpy.array_equal(res, self.data[view])
+            assert scales == scales2
+
+    def test_resample_area(self):
+        # integer factor area averaging is the block mean
+        data = self.data[:100, :120]
+        res, scales = trcalc.get_scaled_cutout_basic(
+            data, 0, 0, 119, 99, 0.25, 0.25, interpolation='area')
+        assert scales == (0.25, 0.25)
+        expected = data.reshape(25, 4, 30, 4).mean(axis=3).mean(axis=1)
+        assert numpy.allclose(res, expected, atol=1e-5)
+        # the weight tables are cached
+        assert (120, 30, 'area') in trcalc._resample_cache
+
+        res, scales = trcalc.get_scaled_cutout_wdht(
+            self.rgba, 0, 0, 89, 89, 31, 29, interpolation='linear')
+        assert res.shape == (29, 31, 4)
+        assert res.dtype == numpy.uint8
+
+    def test_resample_filters(self):
+        # the interpolating kernels reproduce a linear ramp away from
+        # the edges
+        yi, xi = numpy.mgrid[0:50, 0:50]
+        data = (xi + 2.0 * yi)
+        yo, xo = numpy.mgrid[0:150, 0:150]
+        expected = ((xo + 0.5) / 3.0 - 0.5) + 2.0 * ((yo + 0.5) / 3.0 - 0.5)
+        for method in ('linear', 'bicubic'):
+            res, scales = trcalc.get_scaled_cutout_basic(
+                data, 0, 0, 49, 49, 3.0, 3.0, interpolation=method)
+            assert res.shape == (150, 150)
+            assert numpy.allclose(res[10:-10, 10:-10],
+                                  expected[10:-10, 10:-10], atol=1e-3)
+
+        self.assertRaises(ValueError, trcalc.get_scaled_cutout_basic,
+                          data, 0, 0, 49, 49, 2.0, 2.0, interpolation='foo')
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
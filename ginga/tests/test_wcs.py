@@ -4,7 +4,7 @@ import logging
 import numpy
 
 from ginga import AstroImage
-from ginga.util import wcsmod
+from ginga.util import wcs, wcsmod
 
 class TestImageView(unittest.TestCase):
 
@@ -262,6 +262,44 @@ class TestImageView(unittest.TestCase):
         if not self.radectopix_scalar_runtest('astropy'):
             print("WCS '%s' not available--skipping test" % ('astropy'))
 
+    def test_info_xys_astropy(self):
+        if not wcsmod.use('astropy', raise_err=False):
+            print("WCS '%s' not available--skipping test" % ('astropy'))
+            return
+        wcsobj = wcsmod.WCS(self.logger)
+        wcsobj.load_header(self.header)
+        img = AstroImage.AstroImage(logger=self.logger)
+        data = numpy.arange(50 * 60, dtype=numpy.float32).reshape(50, 60)
+        img.set_data(data)
+        img.wcs = wcsobj
+
+        yi, xi = numpy.mgrid[-2:53:5, -2:63:7]
+        x, y = xi + 0.3, yi - 0.4
+        for system in ('fk5', 'galactic', 'ecliptic'):
+            for fmt in ('sexagesimal', 'degrees'):
+                settings = dict(wcs_coords=system, wcs_display=fmt)
+                res = img.info_xys(x, y, settings)
+                for i, rec in enumerate(res.table):
+                    info = img.info_xy(rec['data_x'], rec['data_y'], settings)
+                    assert rec['ra_txt'] == info.ra_txt
+                    assert rec['dec_txt'] == info.dec_txt
+                    assert (res.ra_lbl, res.dec_lbl) == (info.ra_lbl,
+                                                         info.dec_lbl)
+                    if info.value is None:
+                        assert not rec['valid']
+                    else:
+                        assert rec['valid']
+                        assert rec['value'] == info.value
+
+    def test_deg_to_string_array(self):
+        ra = numpy.array([0.0, 0.001, 14.99999, 123.456789, 359.9999])
+        dec = numpy.array([-89.99, -0.5, -0.0001, 0.0, 22.6876944, 89.0])
+        res = wcs.raDegToStringArray(ra, format=('%02d', '%02d', '%06.3f'))
+        assert list(res) == [wcs.raDegToString(d, format='%02d:%02d:%06.3f')
+                             for d in ra]
+        res = wcs.decDegToStringArray(dec)
+        assert list(res) == [wcs.decDegToString(d) for d in dec]
+
     def tearDown(self):
         pass
 
@@ -7,8 +7,13 @@
 import math
 import numpy
 import time
+import threading
+from collections import OrderedDict
 
-interpolation_methods = ['basic']
+# 'basic' is nearest neighbor; the others are also supported by the
+# built-in NumPy resampler (see resample_cutout)
+interpolation_methods = ['area', 'basic', 'bicubic', 'lanczos', 'linear',
+                         'nearest']
 def use(pkgname):
     global have_opencv, cv2, cv2_resize
     global have_opencl, trcalc_cl
@@ -109,8 +114,147 @@ def rotate_coord(coord, theta_deg, offsets):
     arr = numpy.column_stack((x_arr, y_arr))
     return arr
 
+# Cache of the gather maps used by the NumPy rotation:
+# (ht, wd, theta_deg, rotctr_x, rotctr_y) -> flat index array
+_rotate_cache = OrderedDict()
+_rotate_cache_lock = threading.Lock()
+# maximum total size (in bytes) of the cached maps; larger rotations
+# are done strip-wise
+rotate_cache_size = 64 * 1024 * 1024
+# number of rows done at a time when rotating strip-wise
+rotate_strip_rows = 128
+
+
+def _rotate_coords(wd, ctr_x, ctr_y, y1, y2, theta_deg):
+    # source coordinates of output rows y1..y2-1 (nearest pixels are
+    # found by rounding)
+    cos_t = numpy.cos(numpy.radians(theta_deg))
+    sin_t = numpy.sin(numpy.radians(theta_deg))
+    xi = (numpy.arange(0, wd, dtype=numpy.float64) - ctr_x).reshape(1, -1)
+    yi = (numpy.arange(y1, y2, dtype=numpy.float64) - ctr_y).reshape(-1, 1)
+    ap = (xi * cos_t) - (yi * sin_t) + ctr_x
+    bp = (xi * sin_t) + (yi * cos_t) + ctr_y
+    return ap, bp
+
+
+def _rotate_map(ht, wd, ctr_x, ctr_y, y1, y2, theta_deg):
+    # flat indexes of the nearest source pixels for output rows y1..y2-1
+    ap, bp = _rotate_coords(wd, ctr_x, ctr_y, y1, y2, theta_deg)
+    numpy.rint(ap, out=ap)
+    ap.clip(0, wd-1, out=ap)
+    numpy.rint(bp, out=bp)
+    bp.clip(0, ht-1, out=bp)
+    bp *= wd
+    bp += ap
+    return bp.astype(numpy.intp)
+
+
+def _get_rotate_map(ht, wd, ctr_x, ctr_y, theta_deg):
+    """Return the cached gather map for the rotation, or None if it
+    would be too large to cache.
+    """
+    nbytes = ht * wd * numpy.dtype(numpy.intp).itemsize
+    if nbytes > rotate_cache_size:
+        return None
+    key = (ht, wd, theta_deg, ctr_x, ctr_y)
+    with _rotate_cache_lock:
+        idx = _rotate_cache.pop(key, None)
+        if idx is not None:
+            # move to the end (most recently used)
+            _rotate_cache[key] = idx
+            return idx
+
+    idx = _rotate_map(ht, wd, ctr_x, ctr_y, 0, ht, theta_deg)
+    idx.setflags(write=False)
+    with _rotate_cache_lock:
+        _rotate_cache[key] = idx
+        total = sum([arr.nbytes for arr in _rotate_cache.values()])
+        while total > rotate_cache_size:
+            _key, arr = _rotate_cache.popitem(last=False)
+            total -= arr.nbytes
+    return idx
+
+
+def clear_rotate_cache():
+    """Free the gather maps cached by `rotate_clip`."""
+    with _rotate_cache_lock:
+        _rotate_cache.clear()
+
+
+def _take_pixels(flat, idx, out):
+    # gather the pixels of `flat` (first axis) at `idx` into `out`
+    if (flat.ndim == 2) and (flat.shape[1] * flat.itemsize == 4) and \
+           flat.flags.c_contiguous and out.flags.c_contiguous:
+        # e.g. RGBA uint8: gather whole pixels as 32-bit words
+        numpy.take(flat.view(numpy.uint32).reshape(-1), idx,
+                   out=out.view(numpy.uint32).reshape(idx.shape))
+    else:
+        numpy.take(flat, idx, axis=0, out=out)
+
+
+def _rotate_clip_np(data_np, theta_deg, ctr_x, ctr_y, interpolation,
+                    out=None):
+    ht, wd = data_np.shape[:2]
+    flat = numpy.ascontiguousarray(data_np).reshape((ht * wd, ) +
+                                                    data_np.shape[2:])
+    if (out is not None) and (out.dtype == data_np.dtype) and \
+           not numpy.may_share_memory(out, data_np):
+        newdata = out
+    else:
+        # NOTE: the result cannot be written over the source
+        newdata = numpy.empty(data_np.shape, dtype=data_np.dtype)
+
+    if interpolation in ('basic', 'nearest'):
+        idx = _get_rotate_map(ht, wd, ctr_x, ctr_y, theta_deg)
+        if idx is not None:
+            _take_pixels(flat, idx, newdata)
+            return newdata
+
+        # map is too large to cache: do it in strips of rows
+        for y1 in range(0, ht, rotate_strip_rows):
+            y2 = min(y1 + rotate_strip_rows, ht)
+            idx = _rotate_map(ht, wd, ctr_x, ctr_y, y1, y2, theta_deg)
+            _take_pixels(flat, idx, newdata[y1:y2])
+        return newdata
+
+    if interpolation not in ('linear', 'bilinear'):
+        raise ValueError("Interpolation method not supported: '%s'" % (
+            interpolation))
+
+    # bilinear interpolation, strip-wise
+    is_int = numpy.issubdtype(data_np.dtype, numpy.integer)
+    for y1 in range(0, ht, rotate_strip_rows):
+        y2 = min(y1 + rotate_strip_rows, ht)
+        ap, bp = _rotate_coords(wd, ctr_x, ctr_y, y1, y2, theta_deg)
+        ap.clip(0, wd-1, out=ap)
+        bp.clip(0, ht-1, out=bp)
+        x0 = numpy.floor(ap).astype(numpy.intp).clip(0, max(wd-2, 0))
+        y0 = numpy.floor(bp).astype(numpy.intp).clip(0, max(ht-2, 0))
+        # single precision weights are plenty for display
+        fx = (ap - x0).astype(numpy.float32)
+        fy = (bp - y0).astype(numpy.float32)
+        i00 = y0 * wd + x0
+        x_step = 1 if wd > 1 else 0
+        y_step = wd if ht > 1 else 0
+        if flat.ndim > 1:
+            fx = fx.reshape(fx.shape + (1, ) * (flat.ndim - 1))
+            fy = fy.reshape(fy.shape + (1, ) * (flat.ndim - 1))
+        ftype = numpy.promote_types(flat.dtype, numpy.float32)
+        top = numpy.take(flat, i00, axis=0).astype(ftype)
+        top += (numpy.take(flat, i00 + x_step, axis=0) - top) * fx
+        bot = numpy.take(flat, i00 + y_step, axis=0).astype(ftype)
+        bot += (numpy.take(flat, i00 + y_step + x_step, axis=0) - bot) * fx
+        res = top
+        res += (bot - top) * fy
+        if is_int:
+            numpy.rint(res, out=res)
+        newdata[y1:y2] = res
+    return newdata
+
+
 def rotate_clip(data_np, theta_deg, rotctr_x=None, rotctr_y=None,
-                out=None, use_opencl=True, logger=None):
+                out=None, use_opencl=True, logger=None,
+                interpolation='basic'):
     """
     Rotate numpy array `data_np` by `theta_deg` around rotation center
     (rotctr_x, rotctr_y).  If the rotation center is omitted it defaults
@@ -119,6 +263,11 @@ def rotate_clip(data_np, theta_deg, rotctr_x=None, rotctr_y=None,
     No adjustment is done to the data array beforehand, so the result will
     be clipped according to the size of the array (the output array will be
     the same size as the input array).
+
+    `interpolation` is 'basic' (nearest neighbor) or 'linear'.  Without
+    OpenCv or OpenCL the nearest neighbor gather maps are cached per
+    (shape, angle, center), so that repeated rotations by the same angle
+    (e.g. while panning) only cost the gather.
     """
 
     # If there is no rotation, then we are done
@@ -137,19 +286,23 @@ def rotate_clip(data_np, theta_deg, rotctr_x=None, rotctr_y=None,
             logger.debug("rotating with OpenCv")
         # opencv is fastest
         M = cv2.getRotationMatrix2D((rotctr_y, rotctr_x), theta_deg, 1)
+        flags = cv2_resize['nearest']
+        if interpolation in ('linear', 'bilinear'):
+            flags = cv2_resize['linear']
         if out is not None:
-            out[:, :, ...] = cv2.warpAffine(data_np, M, (wd, ht))
+            out[:, :, ...] = cv2.warpAffine(data_np, M, (wd, ht),
+                                            flags=flags)
             newdata = out
 
         else:
-            newdata = cv2.warpAffine(data_np, M, (wd, ht))
+            newdata = cv2.warpAffine(data_np, M, (wd, ht), flags=flags)
             new_ht, new_wd = newdata.shape[:2]
 
             assert (wd == new_wd) and (ht == new_ht), \
                    Exception("rotated cutout is %dx%d original=%dx%d" % (
                 new_wd, new_ht, wd, ht))
 
-    elif have_opencl and use_opencl:
+    elif have_opencl and use_opencl and (interpolation == 'basic'):
         if logger is not None:
             logger.debug("rotating with OpenCL")
         # opencl is very close, sometimes better, sometimes worse
@@ -166,39 +319,11 @@ def rotate_clip(data_np, theta_deg, rotctr_x=None, rotctr_y=None,
     else:
         if logger is not None:
             logger.debug("rotating with numpy")
-        yi, xi = numpy.mgrid[0:ht, 0:wd]
-        xi -= rotctr_x
-        yi -= rotctr_y
-        cos_t = numpy.cos(numpy.radians(theta_deg))
-        sin_t = numpy.sin(numpy.radians(theta_deg))
-
-        if have_numexpr:
-            ap = ne.evaluate("(xi * cos_t) - (yi * sin_t) + rotctr_x")
-            bp = ne.evaluate("(xi * sin_t) + (yi * cos_t) + rotctr_y")
-        else:
-            ap = (xi * cos_t) - (yi * sin_t) + rotctr_x
-            bp = (xi * sin_t) + (yi * cos_t) + rotctr_y
-
-        #ap = numpy.rint(ap).astype('int').clip(0, wd-1)
-        #bp = numpy.rint(bp).astype('int').clip(0, ht-1)
-        # Optomizations to reuse existing intermediate arrays
-        numpy.rint(ap, out=ap)
-        ap = ap.astype('int')
-        ap.clip(0, wd-1, out=ap)
-        numpy.rint(bp, out=bp)
-        bp = bp.astype('int')
-        bp.clip(0, ht-1, out=bp)
-
-        if out is not None:
-            out[:, :, ...] = data_np[bp, ap]
+        newdata = _rotate_clip_np(data_np, theta_deg, rotctr_x, rotctr_y,
+                                  interpolation, out=out)
+        if (out is not None) and (newdata is not out):
+            out[:, :, ...] = newdata
             newdata = out
-        else:
-            newdata = data_np[bp, ap]
-            new_ht, new_wd = newdata.shape[:2]
-
-            assert (wd == new_wd) and (ht == new_ht), \
-                   Exception("rotated cutout is %dx%d original=%dx%d" % (
-                new_wd, new_ht, wd, ht))
 
     return newdata
 
@@ -249,6 +374,45 @@ def rotate(data_np, theta_deg, rotctr_x=None, rotctr_y=None, pad=20,
     return newdata
 
 
+def warp(data_np, scale_x=1.0, scale_y=1.0, rot_deg=0.0,
+         flip_x=False, flip_y=False, pad=20, logger=None):
+    """
+    Scale `data_np` by (scale_x, scale_y), rotate it by `rot_deg` into
+    a padded square (see `rotate`) and finally flip it as requested.
+    Returns the new array.
+    """
+    if scale_x != 1.0 or scale_y != 1.0:
+        ht, wd = data_np.shape[:2]
+        data_np, scales = get_scaled_cutout_basic(data_np, 0, 0,
+                                                  wd-1, ht-1,
+                                                  scale_x, scale_y,
+                                                  logger=logger)
+
+    if rot_deg != 0.0:
+        data_np = rotate(data_np, rot_deg, pad=pad, logger=logger)
+
+    if flip_x or flip_y:
+        data_np = transform(data_np, flip_x=flip_x, flip_y=flip_y)
+
+    return data_np
+
+
+def get_warp_shape(shape, scale_x=1.0, scale_y=1.0, rot_deg=0.0, pad=20):
+    """
+    Predict the (height, width) of the array produced by `warp` for an
+    input of the given `shape`.
+    """
+    ht, wd = shape[:2]
+    if scale_x != 1.0 or scale_y != 1.0:
+        wd = int(round(scale_x * wd))
+        ht = int(round(scale_y * ht))
+
+    if math.fmod(rot_deg, 360.0) != 0.0:
+        wd = ht = int(math.sqrt(wd**2 + ht**2) + pad)
+
+    return (ht, wd)
+
+
 def get_scaled_cutout_wdht_view(shp, x1, y1, x2, y2, new_wd, new_ht):
     """
     Like get_scaled_cutout_wdht, but returns the view/slice to extract
@@ -344,6 +508,206 @@ def get_scaled_cutout_wdhtdp_view(shp, p1, p2, new_dims):
     return (view, (scale_x, scale_y, scale_z))
 
 
+# Cache of the per-axis weight tables used by the NumPy resampler:
+# (old_len, new_len, method) -> (index array, weight array)
+_resample_cache = OrderedDict()
+_resample_cache_lock = threading.Lock()
+# maximum number of cached weight tables
+resample_cache_entries = 64
+
+
+def _kernel_linear(x):
+    x = numpy.abs(x)
+    return numpy.clip(1.0 - x, 0.0, None)
+
+
+def _kernel_bicubic(x, a=-0.5):
+    # Keys cubic convolution kernel
+    x = numpy.abs(x)
+    x2, x3 = x * x, x * x * x
+    return numpy.where(x <= 1.0, (a + 2.0) * x3 - (a + 3.0) * x2 + 1.0,
+                       numpy.where(x < 2.0,
+                                   a * x3 - 5.0 * a * x2 + 8.0 * a * x - 4.0 * a,
+                                   0.0))
+
+
+def _kernel_lanczos(x, a=4.0):
+    x = numpy.abs(x)
+    return numpy.where(x < a, numpy.sinc(x) * numpy.sinc(x / a), 0.0)
+
+
+# method -> (kernel, support in pixels)
+_resample_kernels = {
+    'linear': (_kernel_linear, 1.0),
+    'bicubic': (_kernel_bicubic, 2.0),
+    'lanczos': (_kernel_lanczos, 4.0),
+    }
+
+
+def _calc_resample_weights(old_len, new_len, method):
+    """Calculate the table of source indexes and weights that resamples
+    an axis of length `old_len` to `new_len` with `method`.
+
+    Returns a tuple (idx, wts) of arrays of shape (new_len, taps).
+    """
+    iscale = float(old_len) / float(new_len)
+    # source coordinates of the output pixel centers
+    ctr = (numpy.arange(new_len, dtype=numpy.float64) + 0.5) * iscale - 0.5
+
+    if (method == 'area') or (method == 'linear' and iscale > 1.0):
+        # average over the area of the source pixels covered by each
+        # output pixel (antialiased downsampling)
+        lo = numpy.arange(new_len, dtype=numpy.float64) * iscale
+        hi = lo + iscale
+        taps = int(math.ceil(iscale)) + 1
+        idx = numpy.floor(lo).astype(numpy.intp).reshape(-1, 1) + \
+              numpy.arange(taps).reshape(1, -1)
+        wts = (numpy.minimum(hi.reshape(-1, 1), idx + 1.0) -
+               numpy.maximum(lo.reshape(-1, 1), idx))
+        wts.clip(0.0, None, out=wts)
+
+    else:
+        kernel, support = _resample_kernels[method]
+        # stretch the kernel when downsampling, to filter out the
+        # frequencies that cannot be represented
+        kscale = max(iscale, 1.0)
+        support *= kscale
+        taps = int(math.ceil(2.0 * support)) + 1
+        idx = numpy.floor(ctr - support).astype(numpy.intp).reshape(-1, 1) + \
+              numpy.arange(1, taps + 1).reshape(1, -1)
+        wts = kernel((idx - ctr.reshape(-1, 1)) / kscale)
+
+    # pixels beyond the edges repeat the edge pixels
+    idx = idx.clip(0, old_len - 1)
+    total = wts.sum(axis=1).reshape(-1, 1)
+    total[total == 0.0] = 1.0
+    wts = (wts / total).astype(numpy.float32)
+
+    # drop the taps that have no weight in any output pixel
+    keep = numpy.any(wts != 0.0, axis=0)
+    return idx[:, keep], wts[:, keep]
+
+
+def _get_resample_weights(old_len, new_len, method):
+    key = (old_len, new_len, method)
+    with _resample_cache_lock:
+        res = _resample_cache.pop(key, None)
+        if res is not None:
+            # move to the end (most recently used)
+            _resample_cache[key] = res
+            return res
+
+    res = _calc_resample_weights(old_len, new_len, method)
+    with _resample_cache_lock:
+        _resample_cache[key] = res
+        while len(_resample_cache) > resample_cache_entries:
+            _resample_cache.popitem(last=False)
+    return res
+
+
+def clear_resample_cache():
+    """Free the weight tables cached by `resample_cutout`."""
+    with _resample_cache_lock:
+        _resample_cache.clear()
+
+
+def _resample_axis(data, axis, idx, wts, ftype):
+    # one pass of the separable resampling: weighted sum of whole rows
+    # or columns of `data`
+    shp = [1] * data.ndim
+    shp[axis] = idx.shape[0]
+    res = None
+    for k in range(idx.shape[1]):
+        w = wts[:, k].reshape(shp)
+        arr = numpy.take(data, idx[:, k], axis=axis)
+        if res is None:
+            res = arr.astype(ftype)
+            res *= w
+        else:
+            res += arr * w
+    return res
+
+
+def _resample_nearest(data_np, x1, y1, x2, y2, new_wd, new_ht):
+    # nearest neighbor, by taking rows and then columns
+    old_wd, old_ht = x2 - x1 + 1, y2 - y1 + 1
+    max_x, max_y = data_np.shape[1] - 1, data_np.shape[0] - 1
+    if new_wd == old_wd:
+        xi = numpy.arange(x1, x2 + 1)
+    else:
+        iscale_x = float(old_wd) / float(new_wd)
+        xi = (x1 + numpy.arange(new_wd) * iscale_x).clip(0, max_x)
+    if new_ht == old_ht:
+        yi = numpy.arange(y1, y2 + 1)
+    else:
+        iscale_y = float(old_ht) / float(new_ht)
+        yi = (y1 + numpy.arange(new_ht) * iscale_y).clip(0, max_y)
+    xi, yi = xi.astype(numpy.intp), yi.astype(numpy.intp)
+
+    # take the fewest pixels first
+    if len(yi) * data_np.shape[1] <= data_np.shape[0] * len(xi):
+        return data_np.take(yi, axis=0).take(xi, axis=1)
+    return data_np.take(xi, axis=1).take(yi, axis=0)
+
+
+def resample_cutout(data_np, x1, y1, x2, y2, new_wd, new_ht,
+                    interpolation='linear'):
+    """Resample the region of `data_np` from (x1, y1) to (x2, y2)
+    (inclusive) to dimensions (new_wd, new_ht) with NumPy.
+
+    `interpolation` is one of 'basic' or 'nearest' (nearest neighbor),
+    'linear', 'area', 'bicubic' or 'lanczos'.  The filtered methods are
+    done in two separable passes, with per-axis weight tables that are
+    cached by (size, new size, method).  When downsampling, 'linear' and
+    'area' average over the area of the source pixels and the bicubic
+    and lanczos kernels are widened, so that the result is antialiased.
+
+    Integer data are rounded and clipped to the range of their type.
+    """
+    if interpolation in ('basic', 'nearest'):
+        return _resample_nearest(data_np, x1, y1, x2, y2, new_wd, new_ht)
+
+    if interpolation != 'area' and interpolation not in _resample_kernels:
+        raise ValueError("Interpolation method not supported: '%s'" % (
+            interpolation))
+
+    data = data_np[y1:y2+1, x1:x2+1]
+    old_ht, old_wd = data.shape[:2]
+    if min(old_wd, old_ht, new_wd, new_ht) <= 0:
+        return numpy.zeros((max(new_ht, 0), max(new_wd, 0)) + data.shape[2:],
+                           dtype=data.dtype)
+
+    if data.dtype == numpy.float64:
+        ftype = numpy.float64
+    else:
+        # single precision is plenty for display
+        ftype = numpy.float32
+
+    passes = []
+    if new_wd != old_wd:
+        passes.append((1, _get_resample_weights(old_wd, new_wd,
+                                                interpolation)))
+    if new_ht != old_ht:
+        passes.append((0, _get_resample_weights(old_ht, new_ht,
+                                                interpolation)))
+    if len(passes) == 0:
+        return data.copy()
+
+    # do the pass that leaves the smaller intermediate result first
+    if len(passes) == 2 and new_ht * old_wd < old_ht * new_wd:
+        passes.reverse()
+
+    res = data
+    for axis, (idx, wts) in passes:
+        res = _resample_axis(res, axis, idx, wts, ftype)
+
+    if numpy.issubdtype(data.dtype, numpy.integer):
+        info = numpy.iinfo(data.dtype)
+        numpy.rint(res, out=res)
+        res.clip(info.min, info.max, out=res)
+    return res.astype(data.dtype, copy=False)
+
+
 def get_scaled_cutout_wdht(data_np, x1, y1, x2, y2, new_wd, new_ht,
                            interpolation='basic', logger=None):
 
@@ -377,17 +741,15 @@ def get_scaled_cutout_wdht(data_np, x1, y1, x2, y2, new_wd, new_ht,
                                                                         x1, y1, x2, y2,
                                                                         scale_x, scale_y)
 
-    elif interpolation not in ('basic', 'nearest'):
-        raise ValueError("Interpolation method not supported: '%s'" % (
-            interpolation))
-
     else:
         if logger is not None:
-            logger.debug('resizing by slicing')
-        view, (scale_x, scale_y) = get_scaled_cutout_wdht_view(data_np.shape,
-                                                               x1, y1, x2, y2,
-                                                               new_wd, new_ht)
-        newdata = data_np[view]
+            logger.debug("resizing with NumPy (%s)" % (interpolation))
+        newdata = resample_cutout(data_np, x1, y1, x2, y2, new_wd, new_ht,
+                                  interpolation=interpolation)
+
+        old_wd, old_ht = max(x2 - x1 + 1, 1), max(y2 - y1 + 1, 1)
+        ht, wd = newdata.shape[:2]
+        scale_x, scale_y = float(wd) / old_wd, float(ht) / old_ht
 
     return newdata, (scale_x, scale_y)
 
@@ -453,18 +815,18 @@ def get_scaled_cutout_basic(data_np, x1, y1, x2, y2, scale_x, scale_y,
                                                                         x1, y1, x2, y2,
                                                                         scale_x, scale_y)
 
-    elif interpolation not in ('basic', 'nearest'):
-        raise ValueError("Interpolation method not supported: '%s'" % (
-            interpolation))
-
     else:
+        old_wd, old_ht = x2 - x1 + 1, y2 - y1 + 1
+        new_wd = int(round(scale_x * old_wd))
+        new_ht = int(round(scale_y * old_ht))
         if logger is not None:
-            logger.debug('resizing by slicing')
-        view, scales = get_scaled_cutout_basic_view(data_np.shape,
-                                                    (x1, y1), (x2, y2),
-                                                    (scale_x, scale_y))
-        scale_x, scale_y = scales
-        newdata = data_np[view]
+            logger.debug("resizing with NumPy (%s)" % (interpolation))
+        newdata = resample_cutout(data_np, x1, y1, x2, y2, new_wd, new_ht,
+                                  interpolation=interpolation)
+
+        old_wd, old_ht = max(old_wd, 1), max(old_ht, 1)
+        ht, wd = newdata.shape[:2]
+        scale_x, scale_y = float(wd) / old_wd, float(ht) / old_ht
 
     return newdata, (scale_x, scale_y)
 
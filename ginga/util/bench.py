@@ -0,0 +1,534 @@
+#
+# bench.py -- headless benchmarks of the rendering and data handling paths
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Benchmark suite for Ginga's hot paths.
+
+The benchmarks run headless on the mock, PIL or Agg viewer backends with
+synthetic images, and the results are written as JSON so that runs from
+different releases or machines can be compared::
+
+    $ python -m ginga.util.bench --sizes=1024,4096 -o bench-2.6.4.json
+    $ python -m ginga.util.bench --compare=bench-2.6.3.json bench-2.6.4.json
+
+Use ``--list`` to see the benchmark names and ``--filter`` to run a
+subset of them.
+"""
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import logging
+import subprocess
+from collections import OrderedDict
+
+import numpy
+
+from ginga import AstroImage, AutoCuts, ColorDist, RGBMap, trcalc, version
+from ginga import cmap, imap
+from ginga.misc import Datasrc, log
+from ginga.canvas.CanvasObject import get_canvas_types
+
+# name -> function(ctx) returning the callable to time, or None to skip
+benchmarks = OrderedDict()
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def benchmark(name, sized=True):
+    """Decorator that registers a benchmark.
+
+    The decorated function is called with a context
+    `~ginga.misc.Bunch.Bunch` (``size``, ``logger``, ``backend``,
+    ``window``, ``tmpdir``) to set up the benchmark outside of the
+    timing, and returns the zero argument callable that is timed.
+    Benchmarks that do not depend on the image size are registered with
+    ``sized=False`` and run once per suite.
+    """
+    def _register(fn):
+        fn.sized = sized
+        benchmarks[name] = fn
+        return fn
+    return _register
+
+
+def get_names(pattern=None):
+    names = list(benchmarks.keys())
+    if pattern is not None:
+        regex = re.compile(pattern)
+        names = [name for name in names if regex.search(name)]
+    return names
+
+
+# --- helpers ---
+
+def make_data(size, dtype=numpy.float32, seed=1):
+    """Make a synthetic `size` x `size` image: a smooth sky with noise
+    and some stars.
+    """
+    rng = numpy.random.RandomState(seed)
+    data = rng.normal(1000.0, 20.0, (size, size)).astype(dtype)
+    n = max(10, size // 10)
+    ys, xs = rng.randint(2, size - 2, n), rng.randint(2, size - 2, n)
+    data[ys, xs] += rng.uniform(1000.0, 30000.0, n).astype(dtype)
+    return data
+
+
+def make_image(ctx):
+    image = AstroImage.AstroImage(logger=ctx.logger)
+    image.set_data(make_data(ctx.size))
+    return image
+
+
+def get_viewer_class(backend):
+    if backend == 'mock':
+        from ginga.mockw.ImageViewCanvasMock import ImageViewCanvas
+    elif backend == 'pil':
+        from ginga.pilw.ImageViewPil import CanvasView as ImageViewCanvas
+    elif backend == 'agg':
+        from ginga.aggw.ImageViewCanvasAgg import ImageViewCanvas
+    else:
+        raise BenchmarkError("Unknown backend '%s'" % (backend))
+    return ImageViewCanvas
+
+
+def make_viewer(ctx, image=None):
+    klass = get_viewer_class(ctx.backend)
+    viewer = klass(logger=ctx.logger)
+    wd, ht = ctx.window
+    viewer.configure_surface(wd, ht)
+    # draw immediately instead of on a timer
+    viewer.set_redraw_lag(0.0)
+    if image is None:
+        image = make_image(ctx)
+    viewer.set_image(image)
+    return viewer
+
+
+def time_fn(fn, repeat=5, min_time=0.2):
+    """Time `fn`.  It is called enough times per repeat to take at
+    least `min_time` sec, and the per-call times are returned.
+    """
+    fn()
+    number = 1
+    while True:
+        t1 = time.time()
+        for i in range(number):
+            fn()
+        elapsed = time.time() - t1
+        if elapsed >= min_time or number >= 1000:
+            break
+        number *= 2
+
+    times = [elapsed / number]
+    for i in range(repeat - 1):
+        t1 = time.time()
+        for i in range(number):
+            fn()
+        times.append((time.time() - t1) / number)
+    return times, number
+
+
+# --- rendering ---
+
+def _make_redraw(whence):
+    def _bench(ctx):
+        viewer = make_viewer(ctx)
+        return lambda: viewer.redraw_now(whence=whence)
+    return _bench
+
+for _whence in (0, 1, 2, 3):
+    benchmark('render.whence%d' % (_whence))(_make_redraw(_whence))
+
+
+@benchmark('render.pan_zoom_rotate')
+def bench_pan_zoom_rotate(ctx):
+    viewer = make_viewer(ctx)
+    ctr = ctx.size / 2.0
+    steps = [(ctr + ctx.size * 0.1 * i, ctr, 2.0 ** (i - 2), 15.0 * i)
+             for i in range(5)]
+
+    def _bench():
+        for pan_x, pan_y, scale, rot in steps:
+            with viewer.suppress_redraw:
+                viewer.set_pan(pan_x, pan_y)
+                viewer.scale_to(scale, scale)
+                viewer.rotate(rot)
+            viewer.redraw_now(whence=0)
+    return _bench
+
+
+# --- cut levels and color distributions ---
+
+def _make_autocuts(name):
+    def _bench(ctx):
+        autocuts = AutoCuts.get_autocuts(name)(ctx.logger)
+        image = make_image(ctx)
+        return lambda: autocuts.calc_cut_levels(image)
+    return _bench
+
+for _name in AutoCuts.autocut_methods:
+    benchmark('autocuts.%s' % (_name))(_make_autocuts(_name))
+
+
+def _make_dist(name):
+    def _bench(ctx):
+        hashsize = 65536
+        dist = ColorDist.get_dist(name)(hashsize)
+        data = make_data(ctx.size)
+        idx = ((data - data.min()) / (data.max() - data.min()) *
+               (hashsize - 1)).astype(dist.get_index_dtype())
+        return lambda: dist.hash_array(idx)
+    return _bench
+
+for _name in ColorDist.get_dist_names():
+    benchmark('colordist.%s' % (_name))(_make_dist(_name))
+
+
+# --- trcalc ---
+
+@benchmark('trcalc.scale_down')
+def bench_scale_down(ctx):
+    data = make_data(ctx.size)
+    return lambda: trcalc.get_scaled_cutout_basic(data, 0, 0, ctx.size - 1,
+                                                  ctx.size - 1, 0.25, 0.25)
+
+
+@benchmark('trcalc.scale_up')
+def bench_scale_up(ctx):
+    data = make_data(ctx.size)
+    side = max(2, ctx.size // 8)
+    return lambda: trcalc.get_scaled_cutout_basic(data, 0, 0, side - 1,
+                                                  side - 1, 8.0, 8.0)
+
+
+def _make_resample(method, scale):
+    def _bench(ctx):
+        data = make_data(ctx.size)
+        return lambda: trcalc.get_scaled_cutout_basic(
+            data, 0, 0, ctx.size - 1, ctx.size - 1, scale, scale,
+            interpolation=method)
+    return _bench
+
+for _name in ('area', 'linear', 'bicubic', 'lanczos'):
+    benchmark('trcalc.scale_down_%s' % (_name))(_make_resample(_name, 0.25))
+    benchmark('trcalc.scale_up_%s' % (_name))(_make_resample(_name, 2.0))
+
+
+@benchmark('trcalc.rotate')
+def bench_rotate(ctx):
+    data = make_data(ctx.size)
+    return lambda: trcalc.rotate_clip(data, 30.0)
+
+
+@benchmark('trcalc.rotate_linear')
+def bench_rotate_linear(ctx):
+    data = make_data(ctx.size)
+    return lambda: trcalc.rotate_clip(data, 30.0, interpolation='linear')
+
+
+@benchmark('trcalc.overlay')
+def bench_overlay(ctx):
+    dstarr = numpy.zeros((ctx.size, ctx.size, 4), dtype=numpy.uint8)
+    side = ctx.size // 2
+    srcarr = numpy.random.randint(0, 256, (side, side, 4)).astype(numpy.uint8)
+    pos = (ctx.size // 4, ctx.size // 4)
+    return lambda: trcalc.overlay_image(dstarr, pos, srcarr,
+                                        dst_order='RGBA', src_order='RGBA',
+                                        alpha=0.5)
+
+
+# --- canvas ---
+
+def _make_canvas(num):
+    def _bench(ctx):
+        viewer = make_viewer(ctx)
+        canvas = viewer.get_canvas()
+        dc = get_canvas_types()
+        rng = numpy.random.RandomState(2)
+        xs = rng.uniform(0, ctx.size, num)
+        ys = rng.uniform(0, ctx.size, num)
+        objs = [dc.Circle(x, y, 5.0, color='green')
+                for x, y in zip(xs, ys)]
+        canvas.add(dc.CompoundObject(*objs), redraw=False)
+        return lambda: viewer.redraw_now(whence=3)
+    return _bench
+
+for _num in (1000, 10000, 100000):
+    benchmark('canvas.draw%d' % (_num), sized=False)(_make_canvas(_num))
+
+
+# --- data handling ---
+
+@benchmark('io.fits_load')
+def bench_fits_load(ctx):
+    try:
+        from astropy.io import fits
+    except ImportError:
+        return None
+    path = os.path.join(ctx.tmpdir, 'bench_%d.fits' % (ctx.size))
+    if not os.path.exists(path):
+        fits.PrimaryHDU(make_data(ctx.size)).writeto(path)
+
+    def _bench():
+        image = AstroImage.AstroImage(logger=ctx.logger)
+        image.load_file(path)
+        # make sure the data are actually read
+        image.get_data().sum()
+    return _bench
+
+
+@benchmark('io.datasrc_churn', sized=False)
+def bench_datasrc_churn(ctx):
+    datasrc = Datasrc.Datasrc(length=20)
+    items = [('image%d' % (i), object()) for i in range(1000)]
+
+    def _bench():
+        for key, value in items:
+            datasrc[key] = value
+            if key in datasrc:
+                datasrc[key]
+    return _bench
+
+
+# --- startup ---
+
+def _make_startup(stmt):
+    def _bench(ctx):
+        # import from the same ginga that is being benchmarked
+        topdir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [topdir] + [path for path in [env.get('PYTHONPATH', None)]
+                        if path])
+        cmd = [sys.executable, '-c', stmt]
+        return lambda: subprocess.check_call(cmd, env=env)
+    return _bench
+
+# each import is timed in a fresh interpreter; 'startup.python' is the
+# cost of starting the interpreter itself
+for _name, _stmt in (('python', 'pass'),
+                     ('cmap', 'import ginga.cmap, ginga.imap'),
+                     ('viewer', 'import ginga.ImageView'),
+                     ('reference_viewer', 'import ginga.rv.main')):
+    benchmark('startup.%s' % (_name), sized=False)(_make_startup(_stmt))
+
+
+@benchmark('startup.cmap_switch', sized=False)
+def bench_cmap_switch(ctx):
+    rgbmap = RGBMap.RGBMapper(ctx.logger)
+    cmaps = [cmap.get_cmap(name) for name in cmap.get_names()]
+    imaps = [imap.get_imap(name) for name in imap.get_names()]
+
+    def _bench():
+        for cm in cmaps:
+            rgbmap.set_cmap(cm, callback=False)
+        for im in imaps:
+            rgbmap.set_imap(im, callback=False)
+    return _bench
+
+
+# --- running ---
+
+def get_meta():
+    return OrderedDict(ginga=version.version, numpy=numpy.__version__,
+                       python=platform.python_version(),
+                       platform=platform.platform(),
+                       time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+
+def run(names=None, sizes=(1024,), backend='mock', window=(800, 600),
+        repeat=5, min_time=0.2, logger=None, progress=None):
+    """Run benchmarks and return the results as a dict that can be
+    written out as JSON.
+
+    Parameters
+    ----------
+    names : list of str or None
+        Benchmarks to run (default: all).
+
+    sizes : sequence of int
+        Sizes (width = height) of the synthetic images.
+
+    backend : {'mock', 'pil', 'agg'}
+        Viewer backend for the rendering benchmarks.
+
+    window : tuple of int
+        Viewer window size (width, height).
+
+    repeat : int
+        Number of timings for each benchmark.
+
+    min_time : float
+        Minimum time (sec) of each timing.
+
+    logger : `logging.Logger` or None
+        Logger for the viewers (default: a null logger).
+
+    progress : callable or None
+        Called with each result as it is made.
+    """
+    from ginga.misc import Bunch
+
+    if names is None:
+        names = get_names()
+    if logger is None:
+        logger = log.get_logger(null=True)
+
+    meta = get_meta()
+    meta.update(dict(backend=backend, window=list(window),
+                     sizes=list(sizes), repeat=repeat))
+    results = []
+    tmpdir = tempfile.mkdtemp(prefix='ginga-bench-')
+    try:
+        for name in names:
+            fn = benchmarks[name]
+            for size in (sizes if fn.sized else [None]):
+                ctx = Bunch.Bunch(size=(size or sizes[0]), logger=logger,
+                                  backend=backend, window=window,
+                                  tmpdir=tmpdir)
+                res = OrderedDict(name=name, size=size)
+                try:
+                    bench_fn = fn(ctx)
+                    if bench_fn is None:
+                        res['skipped'] = True
+                    else:
+                        times, number = time_fn(bench_fn, repeat=repeat,
+                                                min_time=min_time)
+                        res.update(OrderedDict(
+                            number=number, min=min(times),
+                            median=float(numpy.median(times)),
+                            mean=float(numpy.mean(times)), times=times))
+                except Exception as e:
+                    res['error'] = str(e)
+                results.append(res)
+                if progress is not None:
+                    progress(res)
+                bench_fn = ctx = None
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return OrderedDict(meta=meta, results=results)
+
+
+def compare(old, new):
+    """Compare two sets of results (as returned by `run`).  Returns a
+    list of (name, size, old median, new median, ratio) for the
+    benchmarks in both.
+    """
+    def _key(res):
+        return (res['name'], res['size'])
+
+    old_d = dict([(_key(res), res) for res in old['results']
+                  if 'median' in res])
+    rows = []
+    for res in new['results']:
+        key = _key(res)
+        if 'median' in res and key in old_d:
+            t_old, t_new = old_d[key]['median'], res['median']
+            ratio = t_new / t_old if t_old > 0 else float('nan')
+            rows.append((res['name'], res['size'], t_old, t_new, ratio))
+    return rows
+
+
+def format_result(res):
+    size = '' if res['size'] is None else res['size']
+    if 'error' in res:
+        return "%-26s %6s  error: %s" % (res['name'], size, res['error'])
+    if res.get('skipped', False):
+        return "%-26s %6s  skipped" % (res['name'], size)
+    return "%-26s %6s %10.3f ms" % (res['name'], size, res['median'] * 1000)
+
+
+def main(options, args):
+
+    if options.list:
+        for name in get_names(options.filter):
+            print(name)
+        return 0
+
+    if options.compare:
+        with open(options.compare, 'r') as in_f:
+            old = json.load(in_f)
+        with open(args[0], 'r') as in_f:
+            new = json.load(in_f)
+        for name, size, t_old, t_new, ratio in compare(old, new):
+            size = '' if size is None else size
+            print("%-26s %6s %10.3f %10.3f ms %6.2fx" % (
+                name, size, t_old * 1000, t_new * 1000, ratio))
+        return 0
+
+    logger = log.get_logger(name="bench", options=options)
+    sizes = [int(size) for size in options.sizes.split(',')]
+    window = tuple([int(n) for n in options.window.split('x')])
+
+    res = run(names=get_names(options.filter), sizes=sizes,
+              backend=options.backend, window=window,
+              repeat=options.repeat, min_time=options.min_time,
+              logger=logger,
+              progress=lambda res: print(format_result(res)))
+
+    if options.outfile:
+        with open(options.outfile, 'w') as out_f:
+            json.dump(res, out_f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+
+    # Parse command line options with nifty optparse module
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options] [results.json]"
+    optprs = OptionParser(usage=usage, version=('%%prog'))
+
+    optprs.add_option("--backend", dest="backend", metavar="NAME",
+                      default='mock',
+                      help="Viewer backend to use: mock|pil|agg")
+    optprs.add_option("--compare", dest="compare", metavar="FILE",
+                      help="Compare the results file argument to FILE")
+    optprs.add_option("--filter", dest="filter", metavar="REGEX",
+                      help="Only run benchmarks with names matching REGEX")
+    optprs.add_option("--list", dest="list", default=False,
+                      action="store_true",
+                      help="List the benchmarks")
+    optprs.add_option("--log", dest="logfile", metavar="FILE",
+                      help="Write logging output to FILE")
+    optprs.add_option("--loglevel", dest="loglevel", metavar="LEVEL",
+                      type='int', default=logging.WARNING,
+                      help="Set logging level to LEVEL")
+    optprs.add_option("--min-time", dest="min_time", metavar="SEC",
+                      type='float', default=0.2,
+                      help="Time each repeat for at least SEC seconds")
+    optprs.add_option("-o", "--outfile", dest="outfile", metavar="FILE",
+                      help="Write the results as JSON to FILE")
+    optprs.add_option("--repeat", dest="repeat", metavar="N",
+                      type='int', default=5,
+                      help="Time each benchmark N times")
+    optprs.add_option("--sizes", dest="sizes", metavar="N,N,...",
+                      default='1024,4096',
+                      help="Sizes of the synthetic images (up to 16384)")
+    optprs.add_option("--stderr", dest="logstderr", default=False,
+                      action="store_true",
+                      help="Copy logging also to stderr")
+    optprs.add_option("--window", dest="window", metavar="WDxHT",
+                      default='800x600',
+                      help="Size of the viewer window")
+
+    (options, args) = optprs.parse_args(sys.argv[1:])
+
+    sys.exit(main(options, args))
+
+#END
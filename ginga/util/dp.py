@@ -8,12 +8,14 @@
 # Please see the file LICENSE.txt for details.
 #
 import numpy
+from multiprocessing.pool import ThreadPool
 
 from collections import OrderedDict
 
 from ginga import AstroImage, colors
 from ginga.RGBImage import RGBImage
-from ginga.util import wcs
+from ginga.BaseImage import BaseImage
+from ginga.util import wcs, io_fits
 
 # counter used to name anonymous images
 prefixes = dict(dp=0)
@@ -136,12 +138,164 @@ def recycle_image(image, ra_deg, dec_deg, fov_deg, px_scale, rot_deg,
     return new_image
 
 
-def make_flat(imglist, bias=None):
+# methods available for combine_stack()
+combine_methods = ('median', 'mean', 'sigmaclip', 'minmax')
 
+
+def _combine_block(stack, method, sigma=3.0, iterations=3,
+                   num_low=1, num_high=1):
+    """Combine a (N, rows, cols) block along the first axis.
+    `stack` is used as scratch space and is overwritten.
+    """
+    if method == 'median':
+        return numpy.median(stack, axis=0, overwrite_input=True)
+
+    elif method == 'mean':
+        return numpy.mean(stack, axis=0)
+
+    elif method == 'sigmaclip':
+        # iteratively reject pixels more than `sigma` standard deviations
+        # from the median, then average the rest
+        for i in range(iterations):
+            med = numpy.nanmedian(stack, axis=0)
+            std = numpy.nanstd(stack, axis=0)
+            with numpy.errstate(invalid='ignore'):
+                bad = numpy.abs(stack - med) > sigma * std
+            if not numpy.any(bad):
+                break
+            stack[bad] = numpy.nan
+        return numpy.nanmean(stack, axis=0)
+
+    elif method == 'minmax':
+        # reject the `num_low` lowest and `num_high` highest values
+        n = stack.shape[0]
+        if num_low + num_high >= n:
+            raise ValueError("Can't reject %d values from a stack of %d" % (
+                num_low + num_high, n))
+        stack.sort(axis=0)
+        return numpy.mean(stack[num_low:n - num_high], axis=0)
+
+    raise ValueError("Unknown combine method '%s'" % (method))
+
+
+def combine_stack(datalist, method='median', mem_budget=256*1024*1024,
+                  num_threads=1, dtype=None, scaling=None,
+                  logger=None, **kwargs):
+    """Combine a stack of 2D arrays pixel by pixel.
+
+    The arrays are processed in blocks of rows, so that only one block of
+    the stack is in memory at a time (per thread).  The arrays can be
+    memory-mapped (see `io_fits.memmap_primary`), in which case the whole
+    stack is never read into memory.
+
+    Parameters
+    ----------
+    datalist : list of ndarray
+        Arrays to combine; they must all have the same shape.
+
+    method : str
+        One of 'median', 'mean', 'sigmaclip' (iterative sigma-clipped
+        mean; keywords `sigma` and `iterations`) or 'minmax' (mean after
+        rejecting the lowest `num_low` and highest `num_high` values).
+
+    mem_budget : int
+        Approximate number of bytes of working memory to use.
+
+    num_threads : int
+        Number of blocks to combine at the same time.
+
+    dtype : numpy dtype or None
+        Data type used for the combination and the result.  By default
+        this is the type the input types promote to, but at least
+        float32, and float64 if the arrays are scaled by a `bscale`
+        other than 1.  Pass e.g. float32 to save memory on float64 or
+        integer stacks, at the cost of precision.
+
+    scaling : list of (bscale, bzero) or None
+        Scaling to apply to each array as it is read.
+
+    Returns
+    -------
+    result : ndarray
+        Combined array.
+    """
+    if method not in combine_methods:
+        raise ValueError("Unknown combine method '%s'" % (method))
+    num = len(datalist)
+    if num == 0:
+        raise ValueError("No data to combine")
+    shape = datalist[0].shape
+    for data in datalist:
+        if data.shape != shape:
+            raise ValueError("Shape mismatch in stack: %s vs. %s" % (
+                str(data.shape), str(shape)))
+
+    if dtype is None:
+        dtypes = [data.dtype for data in datalist]
+        if scaling is not None and \
+               any([bscale != 1.0 for bscale, bzero in scaling]):
+            dtypes.append(numpy.float64)
+        dtype = numpy.result_type(numpy.float32, *dtypes)
+
+    ht, wd = shape[:2]
+    itemsize = numpy.dtype(dtype).itemsize
+    num_threads = max(1, num_threads)
+    # each thread holds its block of the stack plus about as much again
+    # for temporaries
+    row_bytes = 2 * num * wd * itemsize * num_threads
+    rows = int(max(1, min(ht, mem_budget // max(row_bytes, 1))))
+    if logger is not None:
+        logger.debug("combining %d frames in blocks of %d rows" % (
+            num, rows))
+
+    result = numpy.empty(shape, dtype=dtype)
+
+    def _do_block(y1):
+        y2 = min(y1 + rows, ht)
+        stack = numpy.empty((num, y2 - y1) + shape[1:], dtype=dtype)
+        for i, data in enumerate(datalist):
+            stack[i] = data[y1:y2]
+            if scaling is not None:
+                bscale, bzero = scaling[i]
+                if bscale != 1.0:
+                    stack[i] *= bscale
+                if bzero != 0.0:
+                    stack[i] += bzero
+        result[y1:y2] = _combine_block(stack, method, **kwargs)
+
+    blocks = list(range(0, ht, rows))
+    if num_threads == 1 or len(blocks) == 1:
+        for y1 in blocks:
+            _do_block(y1)
+    else:
+        pool = ThreadPool(num_threads)
+        try:
+            pool.map(_do_block, blocks)
+        finally:
+            pool.close()
+            pool.join()
+
+    return result
+
+
+def combine_files(paths, method='median', logger=None, **kwargs):
+    """Like `combine_stack`, for the primary HDUs of a list of FITS
+    files, which are memory-mapped rather than loaded.
+    """
+    mmaps = [io_fits.memmap_primary(path) for path in paths]
+    datalist = [res.data for res in mmaps]
+    scaling = [(res.bscale, res.bzero) for res in mmaps]
+    return combine_stack(datalist, method=method, scaling=scaling,
+                         logger=logger, **kwargs)
+
+
+def make_flat(imglist, bias=None, method='median', **kwargs):
+    """Make a normalized flat field from the images in `imglist`.
+    Extra keyword arguments are passed to `combine_stack`.
+    """
     flats = [ image.get_data() for image in imglist ]
-    flatarr = numpy.array(flats)
-    # Take the median of the individual frames
-    flat = numpy.median(flatarr, axis=0)
+    # Combine the individual frames
+    flat = combine_stack(flats, method=method, **kwargs)
 
     # Normalize flat
     # mean or median?
@@ -154,12 +308,13 @@ def make_flat(imglist, bias=None):
     img_flat = make_image(flat, imglist[0], {}, pfx='flat')
     return img_flat
 
-def make_bias(imglist):
-
+def make_bias(imglist, method='median', **kwargs):
+    """Make a bias image from the images in `imglist`.
+    Extra keyword arguments are passed to `combine_stack`.
+    """
     biases = [ image.get_data() for image in imglist ]
-    biasarr = numpy.array(biases)
-    # Take the median of the individual frames
-    bias = numpy.median(biasarr, axis=0)
+    # Combine the individual frames
+    bias = combine_stack(biases, method=method, **kwargs)
 
     img_bias = make_image(bias, imglist[0], {}, pfx='bias')
     return img_bias
@@ -243,6 +398,34 @@ def masktorgb(mask, color='lightgreen', alpha=1.0):
 
     return rgbobj
 
+def masktoimage(mask):
+    """Convert boolean mask to a compact label image for a canvas
+    MaskImage object.  Unlike `masktorgb`, colors are only applied to
+    the visible part of the mask when it is drawn.
+
+    Parameters
+    ----------
+    mask : ndarray
+        Boolean mask to overlay. 2D image only.
+
+    Returns
+    -------
+    image : BaseImage
+        Image of uint8 labels (0=unmasked, 1=masked).
+
+    Raises
+    ------
+    ValueError
+        Invalid mask dimension.
+
+    """
+    mask = numpy.asarray(mask)
+
+    if mask.ndim != 2:
+        raise ValueError('ndim={0} is not supported'.format(mask.ndim))
+
+    return BaseImage(data_np=(mask != 0).astype(numpy.uint8))
+
 def split_n(lst, sz):
     n = len(lst)
     k, m = n // sz, n % sz
@@ -0,0 +1,531 @@
+#
+# frameexport.py -- export sequences of rendered viewer frames
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Export sequences of frames rendered by a viewer as animations or video.
+
+`FrameExporter` takes RGB frames as they are rendered and encodes them on
+worker threads, so that encoding the frames runs in parallel with
+rendering the next ones.  At most `max_frames` frames are held at any
+time (queued, being encoded or waiting for an earlier frame to be
+written); rendering blocks until there is room, so memory use does not
+depend on the length of the sequence (except for animations, see
+`AnimationSink`).
+
+Frames are encoded and written by a sink:
+
+* `ImageSequenceSink` writes each frame to its own PNG or JPEG file,
+* `AnimationSink` writes an animated GIF or APNG file,
+* `Y4MSink` writes a raw YUV4MPEG2 stream, which can be encoded later
+  with e.g. ``ffmpeg -i movie.y4m movie.mp4``.
+
+`get_sink` chooses one from the name of the output file.
+
+`export_cube` and `export_images` render the slices of a data cube or a
+list of images in a viewer and export them; `render_frames` does the
+same for any sequence of changes to a viewer.  The frames are those of
+`~ginga.ImageView.ImageViewBase.getwin_array`, so the viewer does not
+have to be shown on the screen.
+
+Example::
+
+    from ginga.util import frameexport
+
+    sink = frameexport.get_sink('/data/night/frame_%05d.png')
+    stats = frameexport.export_cube(viewer, sink, num_workers=4)
+"""
+import os
+import time
+import threading
+from fractions import Fraction
+
+import numpy
+
+from ginga.util.six.moves import queue as Queue
+
+try:
+    import PIL.Image as PILimage
+    have_pil = True
+except ImportError:
+    have_pil = False
+
+__all__ = ['FrameExportError', 'FrameSink', 'ImageSequenceSink',
+           'AnimationSink', 'Y4MSink', 'FrameExporter', 'get_sink',
+           'render_frames', 'export_cube', 'export_images']
+
+
+class FrameExportError(Exception):
+    pass
+
+
+class FrameSink(object):
+    """Base class of the encoders and writers of frames.
+
+    `encode` is called on the worker threads of a `FrameExporter`, for
+    several frames at once and in any order; `write` is then called for
+    each frame in sequence order, one at a time.
+    """
+
+    def open(self, width, height):
+        """Called with the size of the frames before the first one."""
+        self.width, self.height = width, height
+
+    def encode(self, seq, rgb):
+        """Encode frame number `seq` (0-based), an RGB array of type
+        uint8, and return the result that is passed to `write`.
+        """
+        return rgb
+
+    def write(self, seq, encoded):
+        """Write the encoded frame number `seq`."""
+        pass
+
+    def close(self):
+        """Called after the last frame is written."""
+        pass
+
+
+def _pil_format(filepath, format):
+    if not have_pil:
+        raise FrameExportError("Install PIL to be able to save frames "
+                               "in this format")
+    if format is None:
+        ext = os.path.splitext(filepath)[1].lower()
+        format = dict(jpg='JPEG', jpeg='JPEG', apng='PNG').get(ext[1:],
+                                                                ext[1:])
+    return format.upper()
+
+
+class ImageSequenceSink(FrameSink):
+    """Write each frame to a separate image file.
+
+    Parameters
+    ----------
+    pattern : str
+        Path of the files, with a ``%d`` style format for the frame
+        number (e.g. ``'frame_%05d.png'``).
+
+    format : str or None
+        Format of the files (e.g. ``'png'`` or ``'jpeg'``); by default
+        the one of the file extension.
+
+    quality : int
+        Quality of lossy compressed formats.
+
+    first : int
+        Number of the first frame.
+    """
+
+    def __init__(self, pattern, format=None, quality=90, first=0):
+        self.pattern = pattern
+        self.format = _pil_format(pattern, format)
+        self.quality = quality
+        self.first = first
+
+    def encode(self, seq, rgb):
+        # each frame is independent, so the files are written here,
+        # in parallel
+        path = self.pattern % (self.first + seq)
+        img = PILimage.fromarray(rgb)
+        img.save(path, format=self.format, quality=self.quality)
+        return path
+
+
+class AnimationSink(FrameSink):
+    """Write the frames as an animated GIF or APNG file.
+
+    The file is written when the sink is closed, so all the encoded
+    frames are kept in memory until then (as 8-bit color mapped images
+    for GIF).  To bound that memory, at most `max_frames` frames are
+    accepted; save longer sequences with a `Y4MSink` or an
+    `ImageSequenceSink`.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the file.
+
+    fps : float
+        Frame rate.
+
+    loop : int
+        Number of times to play the animation (0 is forever).
+
+    format : str or None
+        ``'gif'`` or ``'png'`` (APNG); by default the one of the file
+        extension.
+
+    max_frames : int
+        Maximum number of frames; writing more raises a
+        `FrameExportError`.
+    """
+
+    def __init__(self, filepath, fps=10.0, loop=0, format=None,
+                 max_frames=500):
+        self.filepath = filepath
+        self.format = _pil_format(filepath, format)
+        if self.format not in ('GIF', 'PNG'):
+            raise FrameExportError("Animations can be GIF or APNG, not %s" % (
+                self.format))
+        self.fps = float(fps)
+        self.loop = loop
+        self.max_frames = max_frames
+        self.frames = []
+
+    def encode(self, seq, rgb):
+        img = PILimage.fromarray(rgb)
+        if self.format == 'GIF':
+            img = img.convert('P', palette=PILimage.ADAPTIVE)
+        return img
+
+    def write(self, seq, encoded):
+        if len(self.frames) >= self.max_frames:
+            # do not write a truncated animation
+            self.frames = []
+            raise FrameExportError("Animations are limited to %d frames; "
+                                   "save longer sequences as .y4m or "
+                                   "image files" % (self.max_frames))
+        self.frames.append(encoded)
+
+    def close(self):
+        frames, self.frames = self.frames, []
+        if len(frames) == 0:
+            return
+        frames[0].save(self.filepath, format=self.format, save_all=True,
+                       append_images=frames[1:], loop=self.loop,
+                       duration=int(round(1000.0 / self.fps)))
+
+
+class Y4MSink(FrameSink):
+    """Write the frames as a YUV4MPEG2 (``.y4m``) stream, with 4:4:4
+    chroma and BT.601 colors, for encoding with other tools.
+
+    Parameters
+    ----------
+    filepath : str or file-like
+        Path of the file, or an open binary file.
+
+    fps : float
+        Frame rate.
+    """
+
+    # RGB to Y'CbCr (BT.601, video range)
+    rgb2yuv = numpy.array([[65.481, 128.553, 24.966],
+                           [-37.797, -74.203, 112.0],
+                           [112.0, -93.786, -18.214]]) / 255.0
+    yuv_offset = numpy.array([16.0, 128.0, 128.0])
+
+    def __init__(self, filepath, fps=10.0):
+        self.filepath = filepath
+        self.fps = Fraction(fps).limit_denominator(1001)
+        self.fh = None
+
+    def open(self, width, height):
+        super(Y4MSink, self).open(width, height)
+        if hasattr(self.filepath, 'write'):
+            self.fh, self.own_fh = self.filepath, False
+        else:
+            self.fh, self.own_fh = open(self.filepath, 'wb'), True
+        header = "YUV4MPEG2 W%d H%d F%d:%d Ip A1:1 C444\n" % (
+            width, height, self.fps.numerator, self.fps.denominator)
+        self.fh.write(header.encode('ascii'))
+
+    def encode(self, seq, rgb):
+        yuv = numpy.dot(rgb.astype(numpy.float32), self.rgb2yuv.T)
+        yuv += self.yuv_offset
+        yuv = numpy.rint(yuv).clip(0, 255).astype(numpy.uint8)
+        # planar: all of Y, then Cb, then Cr
+        return b'FRAME\n' + numpy.ascontiguousarray(
+            yuv.transpose(2, 0, 1)).tobytes()
+
+    def write(self, seq, encoded):
+        self.fh.write(encoded)
+
+    def close(self):
+        if self.fh is not None and self.own_fh:
+            self.fh.close()
+        self.fh = None
+
+
+def get_sink(filepath, fps=10.0, **kwdargs):
+    """Return a sink for `filepath`, chosen by its extension: ``.y4m``
+    for a `Y4MSink`, ``.gif`` or ``.apng`` for an `AnimationSink`, and
+    other image formats (with a ``%d`` style frame number in the name)
+    for an `ImageSequenceSink`.  Other keyword arguments are passed to
+    the sink.
+    """
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.y4m':
+        return Y4MSink(filepath, fps=fps, **kwdargs)
+    if ext in ('.gif', '.apng'):
+        return AnimationSink(filepath, fps=fps, **kwdargs)
+    if '%' not in filepath:
+        raise FrameExportError("Image sequence file name needs a frame "
+                               "number format (e.g. 'frame_%%05d%s')" % (
+                                   ext))
+    return ImageSequenceSink(filepath, **kwdargs)
+
+
+class FrameExporter(object):
+    """Encode and write frames on worker threads.
+
+    Parameters
+    ----------
+    logger : `logging.Logger`
+        Logger for messages.
+
+    sink : `FrameSink`
+        Encoder and writer of the frames.
+
+    num_workers : int
+        Number of threads encoding frames.
+
+    max_frames : int
+        Maximum number of frames held (queued, being encoded or waiting
+        to be written); `put` blocks while there are this many.
+
+    An exporter can be used as a context manager, which closes it.
+    """
+
+    def __init__(self, logger, sink, num_workers=2, max_frames=8):
+        self.logger = logger
+        self.sink = sink
+        self.num_workers = max(1, num_workers)
+        self.max_frames = max(1, max_frames)
+
+        self.lock = threading.RLock()
+        self.slots = threading.Semaphore(self.max_frames)
+        self.queue = Queue.Queue()
+        self.workers = []
+
+        self.size = None
+        self.num_frames = 0
+        # sequence number -> encoded frame waiting for earlier ones
+        # (None if it is not to be written)
+        self.pending = {}
+        self.next_seq = 0
+        self.error = None
+        self.closed = False
+        self.stats = dict(frames=0, written=0, encode_time=0.0,
+                          write_time=0.0, wait_time=0.0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.close()
+        except Exception:
+            if exc_type is None:
+                raise
+        return False
+
+    def put(self, rgb):
+        """Add the next frame, an RGB (or RGBA) array of type uint8.
+        The array must not be modified afterwards.
+        """
+        self._check_error()
+        if self.closed:
+            raise FrameExportError("Exporter is closed")
+
+        rgb = numpy.asarray(rgb)
+        if rgb.ndim != 3 or rgb.shape[2] not in (3, 4):
+            raise FrameExportError("Frames must be RGB arrays")
+        if rgb.shape[2] == 4:
+            rgb = rgb[:, :, :3]
+        rgb = numpy.ascontiguousarray(rgb, dtype=numpy.uint8)
+        ht, wd = rgb.shape[:2]
+
+        with self.lock:
+            if self.size is None:
+                self.sink.open(wd, ht)
+                self.size = (wd, ht)
+                self._start_workers()
+            elif self.size != (wd, ht):
+                raise FrameExportError(
+                    "Frame size %dx%d differs from %dx%d" % (
+                        wd, ht, self.size[0], self.size[1]))
+
+        # wait for room
+        t1 = time.time()
+        self.slots.acquire()
+        with self.lock:
+            self.stats['wait_time'] += time.time() - t1
+            seq = self.num_frames
+            self.num_frames += 1
+            self.stats['frames'] += 1
+        self.queue.put((seq, rgb))
+
+    def close(self):
+        """Wait for all the frames to be written and close the sink.
+        Returns the statistics of `get_stats`.
+        """
+        with self.lock:
+            if self.closed:
+                return self.get_stats()
+            self.closed = True
+            workers, self.workers = self.workers, []
+
+        for thread in workers:
+            self.queue.put(None)
+        for thread in workers:
+            thread.join()
+
+        if self.size is not None:
+            try:
+                self.sink.close()
+            except Exception as e:
+                self._set_error(e)
+        self._check_error()
+        return self.get_stats()
+
+    def get_stats(self):
+        """Return a dict with the number of frames put and written, and
+        the time spent encoding and writing them and waiting for room.
+        """
+        with self.lock:
+            return dict(self.stats)
+
+    def _check_error(self):
+        with self.lock:
+            error = self.error
+        if error is not None:
+            raise FrameExportError("Error exporting frames: %s" % (
+                str(error)))
+
+    def _set_error(self, e):
+        self.logger.error("Error exporting frames: %s" % (str(e)))
+        with self.lock:
+            if self.error is None:
+                self.error = e
+
+    def _start_workers(self):
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker,
+                                      name='frameexport-%d' % (i))
+            thread.daemon = True
+            thread.start()
+            self.workers.append(thread)
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            seq, rgb = item
+            encoded = None
+            if self.error is None:
+                try:
+                    t1 = time.time()
+                    encoded = self.sink.encode(seq, rgb)
+                    with self.lock:
+                        self.stats['encode_time'] += time.time() - t1
+
+                except Exception as e:
+                    self._set_error(e)
+
+            with self.lock:
+                self.pending[seq] = encoded
+                self._write_ready()
+
+    def _write_ready(self):
+        # write the frames that are next in sequence (with the lock
+        # held, so that they are written one at a time and in order)
+        while self.next_seq in self.pending:
+            seq = self.next_seq
+            encoded = self.pending.pop(seq)
+            self.next_seq += 1
+            if self.error is None:
+                try:
+                    t1 = time.time()
+                    self.sink.write(seq, encoded)
+                    self.stats['write_time'] += time.time() - t1
+                    self.stats['written'] += 1
+
+                except Exception as e:
+                    self._set_error(e)
+            self.slots.release()
+
+
+def render_frames(viewer, steps, exporter):
+    """Render a frame of `viewer` after each item of `steps` (a callable
+    that changes what the viewer shows) and put it to `exporter`.
+    Returns the number of frames rendered.
+
+    The frames are rendered synchronously: the ``async_redraw`` setting
+    of the viewer is turned off meanwhile (see
+    `~ginga.ImageView.ImageViewBase.set_async_redraw`).
+    """
+    async_redraw = viewer.get_settings().get('async_redraw', False)
+    viewer.set_async_redraw(False)
+    num = 0
+    try:
+        for step in steps:
+            step()
+            viewer.redraw_now(whence=0)
+            exporter.put(viewer.getwin_array(order='RGB'))
+            num += 1
+    finally:
+        viewer.set_async_redraw(async_redraw)
+    return num
+
+
+def export_cube(viewer, sink, axis=2, start=0, stop=None, step=1,
+                num_workers=2, max_frames=8):
+    """Export the slices along axis `axis` (0-based, so 2 is NAXIS3) of
+    the data cube shown in `viewer`, from slice `start` up to but not
+    including `stop` (by default the last one), with the current pan,
+    zoom, cut levels and color map.  Returns the export statistics.
+    """
+    image = viewer.get_image()
+    mddata = None if image is None else image.get_mddata()
+    if mddata is None or axis < 2 or axis >= mddata.ndim:
+        raise FrameExportError("Image has no axis %d to export" % (axis + 1))
+
+    num_slices = mddata.shape[mddata.ndim - axis - 1]
+    if stop is None:
+        stop = num_slices
+    orig_path = list(image.naxispath)
+    naxispath = list(orig_path) + [0] * (mddata.ndim - 2 - len(orig_path))
+
+    def set_slice(idx):
+        naxispath[axis - 2] = idx
+        image.set_naxispath(list(naxispath), update_minmax=False)
+
+    steps = (lambda idx=idx: set_slice(idx)
+             for idx in range(max(start, 0), min(stop, num_slices), step))
+
+    # new slices must not reset the viewer (auto cuts, etc.)
+    image.block_callback('modified')
+    try:
+        with FrameExporter(viewer.logger, sink, num_workers=num_workers,
+                           max_frames=max_frames) as exporter:
+            render_frames(viewer, steps, exporter)
+    finally:
+        image.set_naxispath(orig_path, update_minmax=False)
+        image.unblock_callback('modified')
+        viewer.redraw(whence=0)
+    return exporter.get_stats()
+
+
+def export_images(viewer, images, sink, num_workers=2, max_frames=8):
+    """Export the images `images` (e.g. a blink sequence) as shown in
+    `viewer` one after the other.  The image shown before is shown again
+    afterwards.  Returns the export statistics.
+    """
+    orig_image = viewer.get_image()
+    steps = (lambda image=image: viewer.set_image(image)
+             for image in images)
+    try:
+        with FrameExporter(viewer.logger, sink, num_workers=num_workers,
+                           max_frames=max_frames) as exporter:
+            render_frames(viewer, steps, exporter)
+    finally:
+        if orig_image is not None:
+            viewer.set_image(orig_image)
+    return exporter.get_stats()
+
+#END
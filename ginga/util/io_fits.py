@@ -557,4 +557,220 @@ if not fits_configured:
 def get_fitsloader(kind=None, logger=None):
     return fitsLoaderClass(logger)
 
+
+# size of a FITS logical record and of a header card, in bytes
+FITS_BLOCK_SIZE = 2880
+FITS_CARD_SIZE = 80
+
+
+def _parse_card_value(valstr):
+    """Parse the value portion of a FITS header card (columns 11-80)."""
+    valstr = valstr.strip()
+    if valstr.startswith("'"):
+        # string value; embedded quotes are doubled
+        i, res = 1, []
+        while i < len(valstr):
+            ch = valstr[i]
+            if ch == "'":
+                if valstr[i+1:i+2] == "'":
+                    res.append("'")
+                    i += 2
+                    continue
+                break
+            res.append(ch)
+            i += 1
+        return ''.join(res).rstrip()
+
+    # strip the comment, if any
+    valstr = valstr.split('/', 1)[0].strip()
+    if valstr == 'T':
+        return True
+    if valstr == 'F':
+        return False
+    try:
+        return int(valstr)
+    except ValueError:
+        pass
+    try:
+        return float(valstr.replace('D', 'E'))
+    except ValueError:
+        return valstr
+
+
+# keywords needed to find the HDUs in a file
+_structure_kwds = set(['BITPIX', 'NAXIS', 'PCOUNT', 'GCOUNT', 'EXTNAME',
+                       'EXTVER'])
+
+
+def _scan_header_unit(in_f, filepath, keywords=None):
+    # Read the header that starts at the current position of `in_f`,
+    # up to its END card; returns the header (`keywords` and the
+    # structural keywords) and the number of bytes read, or None at the
+    # end of the file
+    header = {}
+    nbytes = 0
+    while True:
+        block = in_f.read(FITS_BLOCK_SIZE)
+        if len(block) == 0 and nbytes == 0:
+            return None
+        if len(block) < FITS_BLOCK_SIZE:
+            raise FITSError("Premature end of header in '%s'" % (
+                filepath))
+        nbytes += FITS_BLOCK_SIZE
+
+        block = block.decode('ascii', 'replace')
+        for i in range(0, FITS_BLOCK_SIZE, FITS_CARD_SIZE):
+            card = block[i:i+FITS_CARD_SIZE]
+            kwd = card[:8].strip()
+            if kwd == 'END':
+                return header, nbytes
+
+            if card[8:10] != '= ' or len(kwd) == 0:
+                # commentary card
+                continue
+            if (keywords is not None and kwd not in keywords and
+                    kwd not in _structure_kwds and
+                    not kwd.startswith('NAXIS')):
+                continue
+            # first occurrence wins, like most FITS readers
+            if kwd not in header:
+                header[kwd] = _parse_card_value(card[10:])
+
+
+def _get_data_size(header):
+    # size in bytes of the data unit described by `header`, padded to
+    # whole blocks
+    naxis = header.get('NAXIS', 0)
+    if naxis == 0:
+        return 0
+    size = 1
+    for i in range(1, naxis + 1):
+        size *= header.get('NAXIS%d' % (i), 0)
+    size = (abs(header.get('BITPIX', 8)) // 8 * header.get('GCOUNT', 1) *
+            (header.get('PCOUNT', 0) + size))
+    return -(-size // FITS_BLOCK_SIZE) * FITS_BLOCK_SIZE
+
+
+def _match_hdu(i, header, numhdu):
+    if numhdu is None:
+        # the first HDU with data, like `get_hdu`
+        return _get_data_size(header) > 0
+    if isinstance(numhdu, int):
+        return i == numhdu
+    if isinstance(numhdu, tuple):
+        name, extver = numhdu
+    else:
+        name, extver = numhdu, None
+    if str(header.get('EXTNAME', '')).upper() != str(name).upper():
+        return False
+    return extver is None or header.get('EXTVER', 1) == extver
+
+
+def scan_header(filepath, numhdu=0, keywords=None):
+    """Read only the header of one HDU of a FITS file.
+
+    This reads the file a block at a time until the END card of the
+    header is encountered, without opening the file with a FITS package
+    or reading any data (the data units of preceding HDUs are skipped).
+    It is much faster than a full open when all that is needed is a
+    handful of keyword values from many files.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the FITS file.
+
+    numhdu : int, str, tuple or None
+        Index of the HDU, or its EXTNAME or (EXTNAME, EXTVER).  If None,
+        the first HDU with data (or else the primary one).
+
+    keywords : sequence of str or None
+        If given, only these keywords are returned.
+
+    Returns
+    -------
+    res : `~ginga.misc.Bunch.Bunch`
+        ``res.header`` is a dict of keyword values and ``res.data_offset``
+        is the byte offset of the data unit of the HDU in the file.
+    """
+    if keywords is not None:
+        keywords = set(keywords)
+
+    offset = 0
+    primary = None
+    with open(filepath, 'rb') as in_f:
+        if not in_f.read(9) == b'SIMPLE  =':
+            raise FITSError("'%s' does not look like a FITS file" % (
+                filepath))
+        in_f.seek(0)
+
+        i = 0
+        while True:
+            res = _scan_header_unit(in_f, filepath, keywords=keywords)
+            if res is None:
+                if numhdu is None:
+                    header, offset = primary
+                    break
+                raise FITSError("No HDU %s in '%s'" % (str(numhdu),
+                                                       filepath))
+            header, nbytes = res
+            offset += nbytes
+            if i == 0:
+                primary = (header, offset)
+            if _match_hdu(i, header, numhdu):
+                break
+
+            offset += _get_data_size(header)
+            in_f.seek(offset)
+            i += 1
+
+    if keywords is not None:
+        header = dict([(kwd, header[kwd]) for kwd in keywords
+                       if kwd in header])
+    return Bunch.Bunch(header=header, data_offset=offset)
+
+
+def scan_primary_header(filepath, keywords=None):
+    """Read only the primary header of a FITS file (see `scan_header`).
+
+    Returns a `~ginga.misc.Bunch.Bunch` with the ``header`` and the
+    ``data_offset`` of the primary data unit.
+    """
+    return scan_header(filepath, numhdu=0, keywords=keywords)
+
+
+# numpy data types for FITS BITPIX values (FITS data are big-endian)
+bitpix_dtypes = {8: '>u1', 16: '>i2', 32: '>i4', 64: '>i8',
+                 -32: '>f4', -64: '>f8'}
+
+
+def memmap_primary(filepath):
+    """Memory map the data array of the primary HDU of a FITS file.
+
+    Only the primary header is read (see `scan_primary_header`); the data
+    are mapped read-only, so pixels are only read from disk when they are
+    accessed.
+
+    Returns a `~ginga.misc.Bunch.Bunch` with the mapped raw array
+    (``data``) and the ``bscale`` and ``bzero`` values that should be
+    applied to it.  Raises `FITSError` if the primary HDU has no data.
+    """
+    res = scan_primary_header(filepath)
+    header = res.header
+    naxis = header.get('NAXIS', 0)
+    if naxis == 0:
+        raise FITSError("No data in primary HDU of '%s'" % (filepath))
+
+    bitpix = header['BITPIX']
+    if bitpix not in bitpix_dtypes:
+        raise FITSError("Unsupported BITPIX (%s) in '%s'" % (
+            str(bitpix), filepath))
+
+    # FITS axis order is the reverse of numpy's
+    shape = tuple([header['NAXIS%d' % (i)] for i in range(naxis, 0, -1)])
+    data = numpy.memmap(filepath, dtype=bitpix_dtypes[bitpix], mode='r',
+                        offset=res.data_offset, shape=shape)
+    return Bunch.Bunch(data=data, bscale=header.get('BSCALE', 1.0),
+                       bzero=header.get('BZERO', 0.0), header=header)
+
 # END
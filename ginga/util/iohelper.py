@@ -6,8 +6,10 @@
 #
 import os
 import re
+import json
 import hashlib
 import mimetypes
+import threading
 
 from ginga.misc import Bunch
 from ginga.util.six.moves import urllib_parse
@@ -225,3 +227,76 @@ def get_thumbpath(thumbdir, path, makedir=True):
     thumb_fname = gethex("%s.%s" % (filename, modtime))
     thumbpath = os.path.join(thumbdir, thumb_fname + ".jpg")
     return thumbpath
+
+
+class FileIndex(object):
+    """A small persistent index of values derived from files.
+
+    Entries are keyed by file path and are only considered valid while
+    the file's modification time and size are unchanged, so stale entries
+    are simply recomputed by the caller.  The index is kept in memory and
+    written as JSON to `indexpath` by `save`.  Methods are thread-safe.
+    """
+
+    def __init__(self, indexpath, logger=None):
+        self.indexpath = indexpath
+        self.logger = logger
+        self.lock = threading.RLock()
+        self.db = {}
+        self.changed = False
+
+        self.load()
+
+    def load(self):
+        with self.lock:
+            self.db = {}
+            self.changed = False
+            if not os.path.exists(self.indexpath):
+                return
+            try:
+                with open(self.indexpath, 'r') as in_f:
+                    self.db = json.load(in_f)
+
+            except Exception as e:
+                # a corrupt index is just discarded
+                if self.logger is not None:
+                    self.logger.warning("Error reading index '%s': %s" % (
+                        self.indexpath, str(e)))
+
+    def get(self, path, mtime, size):
+        """Return the values stored for `path`, or None if there is no
+        entry or the entry is stale with respect to (`mtime`, `size`).
+        """
+        with self.lock:
+            rec = self.db.get(path, None)
+        if rec is None or rec['mtime'] != mtime or rec['size'] != size:
+            return None
+        return rec['values']
+
+    def put(self, path, mtime, size, values):
+        with self.lock:
+            self.db[path] = dict(mtime=mtime, size=size, values=values)
+            self.changed = True
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            dirpath = os.path.dirname(self.indexpath)
+            try:
+                if not os.path.isdir(dirpath):
+                    os.makedirs(dirpath)
+                # write to a temp file and rename, so that readers never
+                # see a partially written index
+                tmppath = self.indexpath + '.tmp'
+                with open(tmppath, 'w') as out_f:
+                    json.dump(self.db, out_f)
+                if os.name == 'nt' and os.path.exists(self.indexpath):
+                    os.remove(self.indexpath)
+                os.rename(tmppath, self.indexpath)
+                self.changed = False
+
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.warning("Error writing index '%s': %s" % (
+                        self.indexpath, str(e)))
@@ -15,15 +15,277 @@ Usage:
 from __future__ import print_function
 import sys, os
 import math
+import time
+import tempfile
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 import numpy
 
-from ginga import AstroImage
-from ginga.util import wcs, io_fits, dp
-from ginga.misc import log
+from ginga import AstroImage, trcalc
+from ginga.util import wcs, io_fits, dp, iqcalc
+from ginga.misc import log, Bunch
+
+
+class _PasteContext(object):
+    """Destination array and per-tile locks shared by mosaic workers."""
+
+    def __init__(self, dst, locks, tile_size):
+        self.dst = dst
+        self.locks = locks
+        self.tile_size = tile_size
+        ht, wd = dst.shape[:2]
+        self.num_tiles_x = (wd + tile_size - 1) // tile_size
+
+    def paste(self, data_np, xlo, ylo, merge=False):
+        """Paste `data_np` into the destination with its lower left
+        corner at (xlo, ylo), one tile at a time under that tile's lock.
+        """
+        dst_ht, dst_wd = self.dst.shape[:2]
+        ht, wd = data_np.shape[:2]
+        # clip to destination
+        x1, y1 = max(xlo, 0), max(ylo, 0)
+        x2, y2 = min(xlo + wd, dst_wd), min(ylo + ht, dst_ht)
+
+        ts = self.tile_size
+        for ty in range(y1 // ts, (y2 - 1) // ts + 1):
+            for tx in range(x1 // ts, (x2 - 1) // ts + 1):
+                a1, b1 = max(x1, tx * ts), max(y1, ty * ts)
+                a2, b2 = min(x2, (tx + 1) * ts), min(y2, (ty + 1) * ts)
+                if a2 <= a1 or b2 <= b1:
+                    continue
+                src = data_np[b1-ylo:b2-ylo, a1-xlo:a2-xlo, ...]
+                lock = self.locks[ty * self.num_tiles_x + tx]
+                with lock:
+                    dst = self.dst[b1:b2, a1:a2, ...]
+                    if merge:
+                        dst += src
+                    else:
+                        idx = (dst == 0.0)
+                        dst[idx] = src[idx]
+
+
+def warp_paste(ctx, job):
+    """Prepare, warp and paste one mosaic piece.
+
+    `job` is a dict with the piece data (`data_np`), its destination
+    center (`x0`, `y0`), the `trim_px`, `bg_ref` and `merge` options and
+    the `warp` parameters from its plan (see `AstroImage.get_mosaic_plan`).
+    Returns a dict with the piece placement, its min/max values and the
+    warp and paste times.  (Plain dicts are used because they are passed
+    between processes.)
+    """
+    time_start = time.time()
+    data_np = job['data_np']
+
+    trim_px = job['trim_px']
+    if trim_px:
+        ht, wd = data_np.shape[:2]
+        data_np = data_np[trim_px:ht-trim_px, trim_px:wd-trim_px, ...]
+
+    if job['bg_ref'] is not None:
+        bg = iqcalc.get_median(data_np)
+        data_np = data_np + (job['bg_ref'] - bg)
+
+    maxval = numpy.nanmax(data_np)
+    minval = numpy.nanmin(data_np)
+
+    rotdata = trcalc.warp(data_np, **job['warp'])
+    time_warp = time.time()
+
+    ht, wd = rotdata.shape[:2]
+    ctr_x, ctr_y = trcalc.get_center(rotdata)
+    xlo, ylo = job['x0'] - ctr_x, job['y0'] - ctr_y
+    ctx.paste(rotdata, xlo, ylo, merge=job['merge'])
+    time_paste = time.time()
+
+    return dict(index=job['index'],
+                loc=(xlo, ylo, xlo + wd, ylo + ht),
+                minval=minval, maxval=maxval,
+                warp_time=time_warp - time_start,
+                paste_time=time_paste - time_warp)
+
+
+# worker process state, set up by _init_worker()
+_proc_ctx = None
+
+
+def _init_worker(mmap_info, locks, tile_size):
+    global _proc_ctx
+    filename, dtype, shape, offset = mmap_info
+    dst = numpy.memmap(filename, dtype=dtype, mode='r+', shape=shape,
+                       offset=offset)
+    _proc_ctx = _PasteContext(dst, locks, tile_size)
+
+
+def _proc_warp_paste(job):
+    return warp_paste(_proc_ctx, job)
 
 
-def mosaic(logger, itemlist, fov_deg=None):
+class MosaicPipeline(object):
+    """Mosaic a set of images into a mosaic image in parallel.
+
+    Pieces are planned in the calling thread, the mosaic is enlarged
+    once to hold all of them, and then each piece is trimmed, background
+    matched, scaled, rotated and pasted by a pool of workers.  Pasting
+    is done tile by tile, each tile of the destination having its own
+    lock.
+
+    With `use_processes` the workers are separate processes, which
+    avoids contention for the GIL.  The destination must then be
+    shared: a memory-mapped mosaic (see `dp.create_blank_image`) is
+    used directly, otherwise the mosaic data is moved to a memory-mapped
+    file in `shm_dir` (/dev/shm by default, if it exists).  The mosaic
+    keeps that file for later calls, and deletes it when its data move
+    again or it is released (see `AstroImage.own_data_file` and
+    `AstroImage.release_data_files`).
+
+    After `mosaic` returns, `timings` holds the elapsed time for each
+    stage ('plan', 'alloc', 'warp', 'paste', 'total'; the 'warp' and
+    'paste' values are summed over workers).
+    """
+
+    def __init__(self, logger, num_workers=4, use_processes=True,
+                 tile_size=1024, shm_dir=None):
+        self.logger = logger
+        self.num_workers = num_workers
+        self.use_processes = use_processes
+        self.tile_size = tile_size
+        if shm_dir is None and os.path.isdir('/dev/shm'):
+            shm_dir = '/dev/shm'
+        self.shm_dir = shm_dir
+        self.timings = Bunch.Bunch(plan=0.0, alloc=0.0, warp=0.0,
+                                   paste=0.0, total=0.0)
+
+    def mosaic(self, img_mosaic, imagelist, bg_ref=None, trim_px=None,
+               merge=False, allow_expand=True, expand_pad_deg=0.01,
+               max_expand_pct=None, update_minmax=True,
+               suppress_callback=False, ev_intr=None):
+        """Like `AstroImage.mosaic_inline`, for `img_mosaic`.
+
+        Returns a list of the placements (xlo, ylo, xhi, yhi) of the
+        images in `imagelist`, in the same order (None for any piece not
+        processed because the operation was interrupted via `ev_intr`).
+        """
+        time_start = time.time()
+        timings = Bunch.Bunch(plan=0.0, alloc=0.0, warp=0.0, paste=0.0,
+                              total=0.0)
+        self.timings = timings
+        if len(imagelist) == 0:
+            return []
+
+        # plan all pieces and find the area they will cover
+        plans = [img_mosaic.get_mosaic_plan(image, trim_px=trim_px)
+                 for image in imagelist]
+        xlo = min([plan.x0 - plan.shape[1] // 2 for plan in plans])
+        ylo = min([plan.y0 - plan.shape[0] // 2 for plan in plans])
+        xhi = max([plan.x0 + plan.shape[1] - plan.shape[1] // 2
+                   for plan in plans])
+        yhi = max([plan.y0 + plan.shape[0] - plan.shape[0] // 2
+                   for plan in plans])
+        time_plan = time.time()
+        timings.plan = time_plan - time_start
+
+        # enlarge the mosaic once to hold all of the pieces
+        off_x = off_y = 0
+        mywd, myht = img_mosaic.get_size()
+        if xlo < 0 or xhi > mywd or ylo < 0 or yhi > myht:
+            if not allow_expand:
+                raise Exception("New pieces don't fit on image and "
+                                "allow_expand=False")
+            off_x, off_y = img_mosaic.mosaic_expand(
+                xlo, ylo, xhi, yhi, expand_pad_deg=expand_pad_deg,
+                max_expand_pct=max_expand_pct)
+
+        dst = img_mosaic._get_data()
+        if self.use_processes and not (isinstance(dst, numpy.memmap) and
+                                       dst.filename is not None and
+                                       os.path.exists(dst.filename)):
+            # move the data to shared memory so the workers can paste
+            # into it directly
+            fd, shm_path = tempfile.mkstemp(prefix='mosaic', suffix='.dat',
+                                            dir=self.shm_dir)
+            os.close(fd)
+            try:
+                shm = numpy.memmap(shm_path, dtype=dst.dtype, mode='w+',
+                                   shape=dst.shape)
+                shm[...] = dst
+            except Exception:
+                os.remove(shm_path)
+                raise
+            # our data now lives in the shared copy
+            img_mosaic._data = shm
+            img_mosaic.own_data_file(shm_path)
+            dst = shm
+        timings.alloc = time.time() - time_plan
+
+        jobs = [dict(index=i, data_np=image._get_data(),
+                     x0=plan.x0 + off_x, y0=plan.y0 + off_y,
+                     trim_px=trim_px, bg_ref=bg_ref, merge=merge,
+                     warp=dict(scale_x=plan.scale_x, scale_y=plan.scale_y,
+                               rot_deg=plan.rot_deg, flip_x=plan.flip_x,
+                               flip_y=plan.flip_y))
+                for i, (image, plan) in enumerate(zip(imagelist, plans))]
+
+        ht, wd = dst.shape[:2]
+        ts = self.tile_size
+        num_tiles = ((wd + ts - 1) // ts) * ((ht + ts - 1) // ts)
+        results = [None] * len(jobs)
+        if self.use_processes:
+            dst.flush()
+            locks = [multiprocessing.Lock() for i in range(num_tiles)]
+            mmap_info = (dst.filename, dst.dtype, dst.shape, dst.offset)
+            pool = multiprocessing.Pool(self.num_workers,
+                                        initializer=_init_worker,
+                                        initargs=(mmap_info, locks, ts))
+            fn = _proc_warp_paste
+        else:
+            locks = [threading.Lock() for i in range(num_tiles)]
+            ctx = _PasteContext(dst, locks, ts)
+            pool = ThreadPool(self.num_workers)
+            fn = lambda job: warp_paste(ctx, job)
+
+        interrupted = False
+        try:
+            for res in pool.imap_unordered(fn, jobs):
+                results[res['index']] = res
+                timings.warp += res['warp_time']
+                timings.paste += res['paste_time']
+                if ev_intr is not None and ev_intr.is_set():
+                    self.logger.info("mosaic interrupted")
+                    interrupted = True
+                    break
+        finally:
+            if interrupted:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+        res = []
+        for r in results:
+            if r is None:
+                # piece was not processed (interrupted)
+                res.append(None)
+                continue
+            if update_minmax:
+                img_mosaic.maxval = max(img_mosaic.maxval, r['maxval'])
+                img_mosaic.minval = min(img_mosaic.minval, r['minval'])
+            res.append(r['loc'])
+
+        timings.total = time.time() - time_start
+        self.logger.debug("mosaic timings: %s" % (str(timings)))
+
+        # Notify watchers that our data has changed
+        if not suppress_callback:
+            img_mosaic.make_callback('modified')
+
+        return res
+
+
+def mosaic(logger, itemlist, fov_deg=None, num_workers=None,
+           mmap_path=None):
     """
     Parameters
     ----------
@@ -31,6 +293,11 @@ def mosaic(logger, itemlist, fov_deg=None):
         a logger object passed to created AstroImage instances
     itemlist : sequence like
         a sequence of either filenames or AstroImage instances
+    num_workers : int or None
+        if given, warp and paste the pieces using a `MosaicPipeline`
+        with this many worker processes
+    mmap_path : str or None
+        if given, build the mosaic in a memory-mapped file at this path
     """
 
     if isinstance(itemlist[0], AstroImage.AstroImage):
@@ -60,7 +327,8 @@ def mosaic(logger, itemlist, fov_deg=None):
     img_mosaic = dp.create_blank_image(ra_deg, dec_deg,
                                        fov_deg, px_scale, rot_deg,
                                        cdbase=cdbase,
-                                       logger=logger)
+                                       logger=logger,
+                                       mmap_path=mmap_path)
     header = img_mosaic.get_header()
     (rot, cdelt1, cdelt2) = wcs.get_rotation_and_scale(header)
     logger.debug("mosaic rot=%f cdelt1=%f cdelt2=%f" % (rot, cdelt1, cdelt2))
@@ -70,6 +338,7 @@ def mosaic(logger, itemlist, fov_deg=None):
                                    allow_expand=expand)
     logger.debug("placement %s" % (str(tup)))
 
+    images = []
     count = 1
     for item in itemlist[1:]:
         if isinstance(item, AstroImage.AstroImage):
@@ -82,11 +351,20 @@ def mosaic(logger, itemlist, fov_deg=None):
             image = AstroImage.AstroImage(logger=logger)
             image.load_file(filepath)
 
-        logger.debug("Inlining '%s' ..." % (name))
-        tup = img_mosaic.mosaic_inline([ image ])
-        logger.debug("placement %s" % (str(tup)))
+        if num_workers is not None:
+            images.append(image)
+        else:
+            logger.debug("Inlining '%s' ..." % (name))
+            tup = img_mosaic.mosaic_inline([ image ])
+            logger.debug("placement %s" % (str(tup)))
         count += 1
 
+    if num_workers is not None:
+        pipeline = MosaicPipeline(logger, num_workers=num_workers)
+        tup = pipeline.mosaic(img_mosaic, images)
+        logger.debug("placement %s" % (str(tup)))
+        logger.info("timings: %s" % (str(pipeline.timings)))
+
     logger.info("Done.")
     return img_mosaic
 
@@ -95,7 +373,9 @@ def main(options, args):
 
     logger = log.get_logger(name="mosaic", options=options)
 
-    img_mosaic = mosaic(logger, args, fov_deg=options.fov)
+    img_mosaic = mosaic(logger, args, fov_deg=options.fov,
+                        num_workers=options.num_workers,
+                        mmap_path=options.mmap_path)
 
     if options.outfile:
         outfile = options.outfile
@@ -109,6 +389,9 @@ def main(options, args):
 
         img_mosaic.save_as_file(outfile)
 
+    # delete any shared memory files of the mosaic
+    img_mosaic.release_data_files()
+
 
 if __name__ == "__main__":
 
@@ -125,9 +408,14 @@ if __name__ == "__main__":
                       help="Set output field of view")
     optprs.add_option("--log", dest="logfile", metavar="FILE",
                       help="Write logging output to FILE")
+    optprs.add_option("--mmap", dest="mmap_path", metavar="FILE",
+                      help="Build the mosaic in a memory-mapped FILE")
     optprs.add_option("--loglevel", dest="loglevel", metavar="LEVEL",
                       type='int',
                       help="Set logging level to LEVEL")
+    optprs.add_option("-n", "--workers", dest="num_workers", metavar="N",
+                      type='int', default=None,
+                      help="Use N worker processes to warp the pieces")
     optprs.add_option("-o", "--outfile", dest="outfile", metavar="FILE",
                       help="Write mosaic output to FILE")
     optprs.add_option("--stderr", dest="logstderr", default=False,
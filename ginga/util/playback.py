@@ -0,0 +1,345 @@
+#
+# playback.py -- playback of the slices of a data cube
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Play the slices of a data cube in a viewer at a fixed frame rate.
+
+Stepping through a cube with ``AstroImage.set_naxispath`` recomputes
+the data range of each slice and redraws the viewer from scratch.
+`CubePlayer` instead prepares the next few slices on worker threads:
+each slice is cut out with the geometry (pan, scale and window) the
+viewer is currently using, and mapped to an index array with the cut
+levels locked at the start of playback.  On the GUI thread a frame then
+only needs to be color mapped and composited.  Slices are read through
+views of the cube data, so for a memory mapped file only the part of
+each slice that is visible is read.
+
+Frames that are not ready when they are due are dropped, so that
+playback keeps to the requested rate; the achieved rate and the number
+of dropped frames are reported by `CubePlayer.get_stats`.
+"""
+import time
+import threading
+from collections import deque
+
+from ginga import trcalc
+from ginga.misc import Bunch, Callback, Scheduler
+from ginga.util.six.moves import queue as Queue
+
+__all__ = ['CubePlayer']
+
+
+class CubePlayer(Callback.Callbacks):
+    """Play the slices along one axis of a data cube in a viewer.
+
+    Parameters
+    ----------
+    logger : `logging.Logger`
+        Logger for messages.
+
+    viewer : `~ginga.ImageView.ImageViewBase`
+        Viewer showing the cube (an `~ginga.AstroImage.AstroImage`).
+
+    num_workers : int
+        Number of worker threads preparing slices.
+
+    prefetch : int
+        Number of slices prepared ahead of the one being shown.
+
+    scheduler : `~ginga.misc.Scheduler.Scheduler` or None
+        If given, slices are prepared as jobs of this scheduler instead
+        of on our own worker threads.
+
+    Callbacks
+    ---------
+    ``frame-shown(player, idx)`` is called on the GUI thread after the
+    slice `idx` (0-based) is shown.
+    """
+
+    def __init__(self, logger, viewer, num_workers=2, prefetch=4,
+                 scheduler=None):
+        Callback.Callbacks.__init__(self)
+
+        self.logger = logger
+        self.viewer = viewer
+        self.num_workers = max(1, num_workers)
+        self.prefetch = max(1, prefetch)
+        self.scheduler = scheduler
+
+        self.lock = threading.RLock()
+        self.queue = Queue.Queue()
+        self.workers = []
+
+        self.image = None
+        self.playing = False
+        self.fps = 10.0
+        # frames prepared for a different viewer state are dropped
+        self.gen = 0
+        self.state = None
+        # sequence number -> prepared frame (or None while in progress)
+        self.frames = {}
+        self.show_times = deque([], 100)
+        self.stats = dict(shown=0, dropped=0, late=0, prepared=0)
+
+        self.enable_callback('frame-shown')
+
+    # --- control ---
+
+    def start(self, image, naxispath, axis, idx, fps=None):
+        """Start playing `image` from slice `idx` (0-based) of axis
+        `axis` (0-based, so 2 is NAXIS3).  `naxispath` gives the indexes
+        of the slice in the other (higher) axes.
+        """
+        self.stop()
+        if fps is not None:
+            self.set_fps(fps)
+
+        mddata = image.get_mddata()
+        if mddata is None or axis < 2 or axis >= mddata.ndim:
+            raise ValueError("Image has no axis %d to play" % (axis + 1))
+
+        with self.lock:
+            self.image = image
+            self.mddata = mddata
+            self.naxispath = list(naxispath)
+            self.axis = axis
+            self.num_slices = mddata.shape[mddata.ndim - axis - 1]
+            self.start_idx = idx % self.num_slices
+            self.last_seq = -1
+            self.last_idx = None
+            self.show_times.clear()
+            self.stats = dict(shown=0, dropped=0, late=0, prepared=0)
+            self.t_start = time.time()
+            self.playing = True
+            self._reset_frames()
+
+        # new slices must not reset the viewer (auto cuts, etc.)
+        image.block_callback('modified')
+
+        if self.scheduler is None:
+            self._start_workers()
+
+    def stop(self):
+        """Stop playing.  Returns the index of the last slice shown, or
+        None if none was.
+        """
+        with self.lock:
+            if not self.playing:
+                return None
+            self.playing = False
+            self.gen += 1
+            self.frames = {}
+            image, self.image = self.image, None
+            workers, self.workers = self.workers, []
+            last_idx = self.last_idx
+
+        image.unblock_callback('modified')
+        for thread in workers:
+            self.queue.put(None)
+        return last_idx
+
+    def is_playing(self):
+        return self.playing
+
+    def set_fps(self, fps):
+        """Set the target frame rate."""
+        with self.lock:
+            fps = max(float(fps), 0.01)
+            if self.playing:
+                # keep the current position in the sequence
+                now = time.time()
+                seq = (now - self.t_start) * self.fps
+                self.t_start = now - seq / fps
+            self.fps = fps
+
+    def get_stats(self):
+        """Return a dict with the target and achieved frame rates and
+        the number of frames shown, dropped and prepared.
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            times = list(self.show_times)
+            stats['target_fps'] = self.fps
+        if len(times) > 1 and times[-1] > times[0]:
+            stats['fps'] = (len(times) - 1) / (times[-1] - times[0])
+        else:
+            stats['fps'] = 0.0
+        return stats
+
+    # --- GUI thread ---
+
+    def tick(self):
+        """Show the frame that is due now, if it is ready, and queue the
+        following slices.  Called from the GUI thread (e.g. by a timer);
+        returns the number of seconds until the next frame is due, or
+        None if playback is stopped.
+        """
+        if not self.playing:
+            return None
+        if self.viewer.get_image() is not self.image:
+            # a different image was loaded in the viewer
+            self.stop()
+            return None
+
+        state = self._get_state()
+        with self.lock:
+            if state != self.state:
+                # view changed: frames prepared so far are no use
+                self.state = state
+                self._reset_frames()
+
+            now = time.time()
+            due = int((now - self.t_start) * self.fps)
+            # most recent ready frame that is due
+            ready = [seq for seq, frame in self.frames.items()
+                     if frame is not None and self.last_seq < seq <= due]
+            frame = None
+            if len(ready) > 0:
+                seq = max(ready)
+                frame = self.frames[seq]
+                self.stats['dropped'] += seq - self.last_seq - 1
+                self.last_seq = seq
+            elif due > self.last_seq:
+                self.stats['late'] += 1
+
+            # forget frames that can no longer be shown
+            for seq in list(self.frames.keys()):
+                if seq <= self.last_seq:
+                    del self.frames[seq]
+
+            self._queue_frames(max(due, self.last_seq + 1))
+
+        if frame is not None:
+            self._show_frame(frame)
+
+        next_time = self.t_start + (due + 1) / self.fps
+        return max(next_time - time.time(), 0.001)
+
+    def _get_state(self):
+        # the viewer state the frames are prepared for
+        viewer = self.viewer
+        cache = viewer.get_canvas_image().get_cache(viewer)
+        if cache.get('cutout_params', None) is None:
+            # nothing cut out yet
+            viewer.redraw_now(whence=0)
+        rgbmap = viewer.get_rgbmap()
+        return (cache.get('cutout_params', None),
+                tuple(viewer.get_cut_levels()),
+                rgbmap.get_hash_size(), rgbmap.get_index_dtype())
+
+    def _reset_frames(self):
+        # jobs of an earlier generation are skipped by the workers
+        self.gen += 1
+        self.frames = {}
+
+    def _queue_frames(self, seq_first):
+        for seq in range(seq_first, seq_first + self.prefetch):
+            if seq in self.frames:
+                continue
+            self.frames[seq] = None
+            job = Bunch.Bunch(gen=self.gen, seq=seq, state=self.state,
+                              idx=(self.start_idx + seq) % self.num_slices)
+            if self.scheduler is not None:
+                self.scheduler.submit(None, Scheduler.PRI_INTERACTIVE,
+                                      lambda token, job: self._do_job(job),
+                                      job)
+            else:
+                self.queue.put(job)
+
+    def _show_frame(self, frame):
+        image = self.image
+        if image is None:
+            return
+        viewer = self.viewer
+        # the image data follows the slice (for pixel readouts, etc.),
+        # but its data range is not recalculated
+        self.naxispath[self.axis - 2] = frame.idx
+        image.set_naxispath(self.naxispath, update_minmax=False)
+
+        canvas_img = viewer.get_canvas_image()
+        cache = canvas_img.get_cache(viewer)
+        cache.cutout = frame.cutout
+        cache.prergb = frame.prergb
+        viewer.redraw(whence=2)
+
+        with self.lock:
+            self.last_idx = frame.idx
+            self.show_times.append(time.time())
+            self.stats['shown'] += 1
+
+        self.make_callback('frame-shown', frame.idx)
+
+    # --- workers ---
+
+    def _start_workers(self):
+        with self.lock:
+            if len(self.workers) > 0:
+                return
+            for i in range(self.num_workers):
+                thread = threading.Thread(target=self._worker,
+                                          name='playback-%d' % (i))
+                thread.daemon = True
+                thread.start()
+                self.workers.append(thread)
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            self._do_job(job)
+
+    def _do_job(self, job):
+        with self.lock:
+            if job.gen != self.gen or job.seq <= self.last_seq:
+                return
+            mddata, naxispath = self.mddata, list(self.naxispath)
+        try:
+            frame = self.prepare_frame(mddata, naxispath, job)
+
+        except Exception as e:
+            self.logger.error("Error preparing slice %d: %s" % (
+                job.idx, str(e)))
+            return
+
+        with self.lock:
+            if job.gen == self.gen and job.seq in self.frames:
+                self.frames[job.seq] = frame
+                self.stats['prepared'] += 1
+
+    def prepare_frame(self, mddata, naxispath, job):
+        """Cut out slice ``job.idx`` with the viewer geometry in
+        ``job.state`` and map it to an index array.
+        """
+        cutout_params, (loval, hival), hashsize, dtype = job.state
+        (x1, y1), (x2, y2), (scale_x, scale_y), method = cutout_params
+
+        naxispath[self.axis - 2] = job.idx
+        view = list(reversed(naxispath)) + [slice(None), slice(None)]
+        # a view: nothing is read yet if the cube is memory mapped
+        data = mddata[tuple(view)]
+
+        if method == 'basic':
+            cview, scales = trcalc.get_scaled_cutout_basic_view(
+                data.shape, (x1, y1), (x2, y2), (scale_x, scale_y))
+            cutout = data[cview]
+        else:
+            cutout, scales = trcalc.get_scaled_cutout_basic(
+                data, x1, y1, x2, y2, scale_x, scale_y,
+                interpolation=method)
+
+        canvas_img = self.viewer.get_canvas_image()
+        autocuts = canvas_img.autocuts
+        if autocuts is None:
+            autocuts = self.viewer.autocuts
+        prergb = autocuts.cut_levels(cutout, loval, hival,
+                                     vmin=0, vmax=hashsize - 1)
+        prergb = prergb.astype(dtype, copy=False)
+
+        return Bunch.Bunch(idx=job.idx, seq=job.seq, cutout=cutout,
+                           prergb=prergb)
+
+#END
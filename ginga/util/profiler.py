@@ -0,0 +1,240 @@
+#
+# profiler.py -- per-stage timing of the rendering pipeline
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Lightweight instrumentation of viewer redraws.
+
+A `RenderProfiler` records one *frame* per redraw, holding the time
+spent in each pipeline stage (cutout, cuts, lut, composite, rotate,
+icc, canvas, blit, encode, ...), the `whence` level and the number of
+bytes produced by stages that report them.  Stage times are
+*exclusive*: time spent in a stage nested inside another one is only
+counted for the inner stage, so the stages of a frame add up to (about)
+its total.  Frames are kept in a ring buffer, from which percentile
+summaries can be calculated or the whole record dumped to JSON.
+
+When the profiler is disabled the instrumentation costs one attribute
+lookup per stage.
+"""
+from __future__ import absolute_import, print_function
+
+import time
+import json
+import threading
+from collections import deque, OrderedDict
+
+import numpy
+
+from ginga.util import six
+
+__all__ = ['RenderProfiler']
+
+
+class _NullStage(object):
+    """Stage context used when profiling is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_stage = _NullStage()
+
+
+class _Stage(object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._push(self.name)
+        return self
+
+    def __exit__(self, *args):
+        self.profiler._pop()
+        return False
+
+
+class RenderProfiler(object):
+    """Record per-stage timings of redraws in a ring buffer.
+
+    Parameters
+    ----------
+    name : str
+        Name of the viewer (used in reports).
+
+    history : int
+        Maximum number of frames kept.
+
+    enabled : bool
+        Whether to record timings.
+    """
+
+    def __init__(self, name='', history=500, enabled=False):
+        self.name = name
+        self.enabled = enabled
+        self.lock = threading.RLock()
+        self.frames = deque([], history)
+        self._local = threading.local()
+
+    def enable(self, tf):
+        self.enabled = tf
+
+    def set_history(self, history):
+        with self.lock:
+            self.frames = deque(self.frames, history)
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+
+    # --- recording ---
+
+    def _get_frame(self):
+        return getattr(self._local, 'frame', None)
+
+    def start_frame(self, whence):
+        """Start recording a frame (one redraw at level `whence`).
+        Nested calls are counted as part of the outer frame.
+        """
+        if not self.enabled:
+            return
+        frame = self._get_frame()
+        if frame is not None:
+            frame['depth'] += 1
+            return
+        self._local.frame = dict(time=time.time(), whence=whence,
+                                 stages=OrderedDict(), bytes=OrderedDict(),
+                                 depth=0, stack=[])
+
+    def end_frame(self):
+        """Finish the frame begun by `start_frame` and store it."""
+        frame = self._get_frame()
+        if frame is None:
+            return
+        if frame['depth'] > 0:
+            frame['depth'] -= 1
+            return
+        self._local.frame = None
+        record = dict(time=frame['time'], whence=frame['whence'],
+                      total=time.time() - frame['time'],
+                      stages=frame['stages'], bytes=frame['bytes'])
+        with self.lock:
+            self.frames.append(record)
+
+    def stage(self, name):
+        """Return a context manager that times the stage `name`.
+
+        Stages used outside of a frame are recorded as frames of their
+        own (e.g. encoding the window contents for saving).
+        """
+        if not self.enabled:
+            return _null_stage
+        return _Stage(self, name)
+
+    def _push(self, name):
+        if self._get_frame() is None:
+            self.start_frame(None)
+            implicit = True
+        else:
+            implicit = False
+        frame = self._get_frame()
+        # [name, start time, time spent in nested stages, implicit frame]
+        frame['stack'].append([name, time.time(), 0.0, implicit])
+
+    def _pop(self):
+        frame = self._get_frame()
+        if frame is None:
+            return
+        name, t_start, t_nested, implicit = frame['stack'].pop()
+        elapsed = time.time() - t_start
+        stages = frame['stages']
+        stages[name] = stages.get(name, 0.0) + elapsed - t_nested
+        if len(frame['stack']) > 0:
+            frame['stack'][-1][2] += elapsed
+        if implicit:
+            self.end_frame()
+
+    def add_bytes(self, name, nbytes):
+        """Add `nbytes` to the count of bytes produced by stage `name` in
+        the current frame.
+        """
+        frame = self._get_frame()
+        if frame is None:
+            return
+        frame['bytes'][name] = frame['bytes'].get(name, 0) + int(nbytes)
+
+    # --- reporting ---
+
+    def get_frames(self, whence=None):
+        """Return a list of the recorded frames, optionally only those
+        redrawn at level `whence`.
+        """
+        with self.lock:
+            frames = list(self.frames)
+        if whence is not None:
+            frames = [frame for frame in frames if frame['whence'] == whence]
+        return frames
+
+    def get_summary(self, whence=None, percentiles=(50, 90, 99)):
+        """Summarize the recorded frames.
+
+        Returns a dict keyed by stage name (plus 'total') of dicts with
+        the count, mean, max and requested percentiles of the time
+        (in seconds) and the mean bytes produced per frame.
+        """
+        frames = self.get_frames(whence=whence)
+        times = OrderedDict(total=[])
+        nbytes = {}
+        for frame in frames:
+            times['total'].append(frame['total'])
+            for name, secs in frame['stages'].items():
+                times.setdefault(name, []).append(secs)
+            for name, n in frame['bytes'].items():
+                nbytes.setdefault(name, []).append(n)
+
+        res = OrderedDict()
+        for name, arr in times.items():
+            if len(arr) == 0:
+                continue
+            arr = numpy.array(arr)
+            d = dict(count=len(arr), mean=float(arr.mean()),
+                     max=float(arr.max()))
+            for pct in percentiles:
+                d['p%d' % (pct)] = float(numpy.percentile(arr, pct))
+            if name in nbytes:
+                d['bytes'] = float(numpy.mean(nbytes[name]))
+            res[name] = d
+        return res
+
+    def format_summary(self, whence=None):
+        """Return the summary as a table of milliseconds."""
+        summary = self.get_summary(whence=whence)
+        lines = ["%-10s %6s %8s %8s %8s %8s %10s" % (
+            'stage', 'count', 'mean', 'p50', 'p90', 'p99', 'bytes')]
+        for name, d in summary.items():
+            lines.append("%-10s %6d %8.2f %8.2f %8.2f %8.2f %10s" % (
+                name, d['count'], d['mean'] * 1000, d['p50'] * 1000,
+                d['p90'] * 1000, d['p99'] * 1000,
+                int(d['bytes']) if 'bytes' in d else ''))
+        return '\n'.join(lines)
+
+    def dump_json(self, path_or_file):
+        """Write the recorded frames and their summary as JSON to a file
+        path or an open (text) file.
+        """
+        d = dict(viewer=self.name, frames=self.get_frames(),
+                 summary=self.get_summary())
+        if isinstance(path_or_file, six.string_types):
+            with open(path_or_file, 'w') as out_f:
+                json.dump(d, out_f, indent=1)
+        else:
+            json.dump(d, path_or_file, indent=1)
+
+#END
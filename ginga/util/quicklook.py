@@ -0,0 +1,466 @@
+#
+# quicklook.py -- headless batch rendering of quicklook images
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Render quicklook PNG or JPEG images of many image files, without a GUI.
+
+`QuicklookRenderer` renders any number of images with one viewer, so
+that the viewer, its color mapper and the window buffer are made once.
+For each file it reads a decimated view of the data (only the pixels in
+the view are read from the primary HDU of a FITS file, which is memory
+mapped), calculates the cut levels from a sample of about `sample_size`
+pixels, fits the image in the window and encodes the result.
+
+`render_files` runs renderers in a pool of processes, each of which
+renders the files given to it with its own renderer.  `iter_files`
+expands directories, glob patterns and ``-`` (file names read from
+standard input) into file names.  The ``ggquicklook`` command puts these
+together::
+
+    $ ggquicklook -n 8 -o /data/quicklook /data/incoming/*.fits
+    $ find /data/night -name '*.fits' | ggquicklook -o /data/ql -f jpeg -
+
+Example::
+
+    from ginga.util import quicklook
+
+    renderer = quicklook.QuicklookRenderer(width=400, height=400,
+                                           cmap='gray')
+    for path in quicklook.iter_files(['/data/incoming']):
+        renderer.save_file(path, outdir='/data/quicklook')
+"""
+import os
+import sys
+import glob
+import time
+import multiprocessing
+
+import numpy
+
+from ginga import AstroImage, ImageView
+from ginga.misc import Bunch
+from ginga.misc import log
+from ginga.util import thumbsvc
+# registers the canvas types the viewer draws the image with
+import ginga.canvas.types.all  # noqa
+
+try:
+    import PIL.Image as PILimage
+    have_pil = True
+except ImportError:
+    have_pil = False
+
+__all__ = ['QuicklookError', 'QuicklookView', 'QuicklookRenderer',
+           'get_output_path', 'iter_files', 'render_files']
+
+# file name extensions of the files found in directories
+image_exts = ('.fits', '.fit', '.fts', '.fits.gz', '.fit.gz', '.fts.gz')
+
+
+class QuicklookError(Exception):
+    pass
+
+
+def get_output_path(path, format='png', outdir=None):
+    """Return the path of the quicklook image in `format` of the file
+    `path`, in `outdir` (by default the directory of `path`): the name
+    of the file without its extension (and ``.gz``), with that of the
+    format.
+    """
+    dirname, filename = os.path.split(path)
+    if filename.lower().endswith('.gz'):
+        filename = filename[:-3]
+    name = os.path.splitext(filename)[0]
+    format = format.lower()
+    ext = dict(jpeg='jpg', pnm='ppm').get(format, format)
+    if outdir is None:
+        outdir = dirname
+    return os.path.join(outdir, '%s.%s' % (name, ext))
+
+
+class QuicklookView(ImageView.ImageViewBase):
+    """A viewer that renders only when it is redrawn and has no widget.
+    The rendering is read with `getwin_array`.
+    """
+
+    def __init__(self, logger=None, rgbmap=None, settings=None):
+        ImageView.ImageViewBase.__init__(self, logger=logger,
+                                         rgbmap=rgbmap,
+                                         settings=settings)
+        self.rgb_order = 'RGB'
+
+    def configure_surface(self, width, height):
+        self.configure(width, height)
+
+    def render_image(self, rgbobj, dst_x, dst_y):
+        # nothing to show it on
+        pass
+
+    def update_image(self):
+        pass
+
+    def set_cursor(self, cursor):
+        pass
+
+    def reschedule_redraw(self, time_sec):
+        self.delayed_redraw()
+
+
+class QuicklookRenderer(object):
+    """Render images to quicklook images of a fixed size, reusing one
+    viewer.
+
+    Parameters
+    ----------
+    logger : `logging.Logger` or None
+        Logger for messages (by default, one that discards them).
+
+    width, height : int
+        Size of the quicklook images; images are fit in them, centered
+        on the background color.
+
+    cmap, imap : str
+        Names of the color map and intensity map.
+
+    autocut_method : str
+        Name of the auto cuts method (see `~ginga.AutoCuts`).
+
+    autocut_params : dict or None
+        Parameters of the auto cuts method.
+
+    sample_size : int
+        Approximate number of pixels that the cut levels are calculated
+        from.
+
+    format : str
+        Format of the files written by `save_file` (``'png'``,
+        ``'jpeg'``, or ``'ppm'``, which does not need PIL).
+
+    quality : int
+        Quality of JPEG files.
+
+    bg : tuple of float
+        Background color (red, green and blue, from 0 to 1).
+    """
+
+    def __init__(self, logger=None, width=512, height=512, cmap='gray',
+                 imap='ramp', autocut_method='zscale', autocut_params=None,
+                 sample_size=100000, format='png', quality=90,
+                 bg=(0.0, 0.0, 0.0)):
+        if logger is None:
+            logger = log.get_logger(null=True)
+        self.logger = logger
+        self.width, self.height = int(width), int(height)
+        self.sample_size = max(1, int(sample_size))
+        self.format = format.lower()
+        self.quality = quality
+        if self.format not in ('ppm', 'pnm') and not have_pil:
+            raise QuicklookError("Install PIL to be able to save %s "
+                                 "files" % (format))
+
+        viewer = QuicklookView(logger=logger)
+        # the cut levels and zoom are set for each image; states of the
+        # images are not kept, as none is shown twice
+        viewer.enable_autocuts('off')
+        viewer.enable_autozoom('off')
+        viewer.t_.set(render_states=0)
+        viewer.set_redraw_lag(0.0)
+        viewer.set_color_map(cmap)
+        viewer.set_intensity_map(imap)
+        viewer.set_bg(*bg)
+        viewer.configure_surface(self.width, self.height)
+        if autocut_params is None:
+            autocut_params = {}
+        viewer.set_autocut_params(autocut_method, **autocut_params)
+        self.viewer = viewer
+
+        # for the sampled data the cut levels are calculated from
+        self.sample_image = AstroImage.AstroImage(logger=logger)
+        # window buffer, rendered into for each image
+        self.rgbarr = numpy.zeros((self.height, self.width, 3),
+                                  dtype=numpy.uint8)
+
+    def calc_cut_levels(self, data):
+        """Calculate cut levels for `data` from a strided sample of about
+        `sample_size` of its pixels.
+        """
+        ht, wd = data.shape[:2]
+        step = int(numpy.ceil(numpy.sqrt(wd * ht / float(self.sample_size))))
+        self.sample_image.set_data(data[::max(step, 1), ::max(step, 1)])
+        return self.viewer.autocuts.calc_cut_levels(self.sample_image)
+
+    def render_image(self, image):
+        """Render `image` and return the RGB array.  The array is reused
+        for the next image, so copy it to keep it.
+        """
+        viewer = self.viewer
+        loval, hival = self.calc_cut_levels(image.get_data())
+        with viewer.suppress_redraw:
+            viewer.set_image(image)
+            viewer.cut_levels(loval, hival, no_reset=True)
+            viewer.zoom_fit(no_reset=True)
+        # the viewer is drawn when leaving the block above
+        return viewer.getwin_array(order='RGB', out=self.rgbarr)
+
+    def render_file(self, path, idx=None):
+        """Render image `idx` (HDU) of the file `path` and return the RGB
+        array (see `render_image`).
+        """
+        length = max(self.width, self.height)
+        rd = thumbsvc.read_decimated(path, length, idx=idx, keywords=[])
+        image = AstroImage.AstroImage(logger=self.logger)
+        image.load_data(rd.data)
+        return self.render_image(image)
+
+    def get_output_path(self, path, outdir=None):
+        """Return the path of the quicklook image of `path`, in `outdir`
+        (by default the directory of `path`; see `get_output_path`).
+        """
+        return get_output_path(path, format=self.format, outdir=outdir)
+
+    def save_file(self, path, outpath=None, outdir=None, idx=None):
+        """Render image `idx` (HDU) of the file `path` and save it as
+        `outpath` (by default, see `get_output_path`).  Returns the path
+        of the quicklook image.
+        """
+        if outpath is None:
+            outpath = self.get_output_path(path, outdir=outdir)
+        rgb = self.render_file(path, idx=idx)
+        self.write_rgb(rgb, outpath)
+        return outpath
+
+    def write_rgb(self, rgb, outpath):
+        """Write the RGB array `rgb` to `outpath` in our format."""
+        if self.format in ('ppm', 'pnm'):
+            ht, wd = rgb.shape[:2]
+            with open(outpath, 'wb') as out_f:
+                out_f.write(("P6\n%d %d\n255\n" % (wd, ht)).encode('ascii'))
+                out_f.write(numpy.ascontiguousarray(rgb).tobytes())
+            return
+
+        img = PILimage.fromarray(rgb)
+        img.save(outpath, format=self.format, quality=self.quality)
+
+
+def iter_files(specs, stdin=None):
+    """Yield the file names given by `specs`: each is a file name, a
+    glob pattern, a directory (for the FITS files in it) or ``'-'`` for
+    the file names in `stdin` (by default standard input), one per
+    line.
+    """
+    for spec in specs:
+        if spec == '-':
+            if stdin is None:
+                stdin = sys.stdin
+            for line in stdin:
+                line = line.strip()
+                if len(line) > 0 and not line.startswith('#'):
+                    yield line
+
+        elif os.path.isdir(spec):
+            for filename in sorted(os.listdir(spec)):
+                if filename.lower().endswith(image_exts):
+                    yield os.path.join(spec, filename)
+
+        elif glob.has_magic(spec):
+            for path in sorted(glob.glob(spec)):
+                yield path
+
+        else:
+            yield spec
+
+
+# the renderer of a worker process
+_renderer = None
+
+
+def _init_worker(params):
+    global _renderer
+    _renderer = QuicklookRenderer(**params)
+
+
+def _render_job(job):
+    path, outpath, idx = job
+    res = Bunch.Bunch(path=path, outpath=None, error=None)
+    t1 = time.time()
+    try:
+        res.outpath = _renderer.save_file(path, outpath=outpath, idx=idx)
+
+    except Exception as e:
+        res.error = str(e)
+    res.time = time.time() - t1
+    return res
+
+
+def render_files(paths, outdir=None, idx=None, num_procs=None,
+                 chunksize=4, **params):
+    """Render quicklook images of the files `paths` (any iterable of
+    file names) in a pool of `num_procs` processes (by default, one per
+    CPU; 1 renders them in this process).  `outdir` is created if it
+    does not exist.  Other keyword arguments are passed to
+    `QuicklookRenderer`.
+
+    Yields, as they are done and in no particular order, a
+    `~ginga.misc.Bunch.Bunch` for each file with its ``path``, the
+    ``outpath`` of its quicklook image, the ``error`` message if it
+    could not be rendered (otherwise None) and the ``time`` taken.
+
+    A file whose quicklook image would overwrite that of an earlier file
+    (see `get_output_path`; e.g. files of the same name in different
+    directories, with an `outdir`) is not rendered, and has an error.
+    """
+    global _renderer
+    if num_procs is None:
+        num_procs = multiprocessing.cpu_count()
+    if outdir is not None and not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    fmt = params.get('format', 'png')
+    # output path -> file it is rendered from
+    outpaths = {}
+    # results of the files that are not rendered
+    clashes = []
+
+    def make_jobs():
+        for path in paths:
+            outpath = get_output_path(path, format=fmt, outdir=outdir)
+            key = os.path.normcase(os.path.abspath(outpath))
+            if key in outpaths:
+                clashes.append(Bunch.Bunch(
+                    path=path, outpath=None, time=0.0,
+                    error="Quicklook image %s would overwrite that of %s" % (
+                        outpath, outpaths[key])))
+                continue
+            outpaths[key] = path
+            yield (path, outpath, idx)
+
+    jobs = make_jobs()
+
+    if num_procs <= 1:
+        saved, _renderer = _renderer, None
+        try:
+            _init_worker(params)
+            for job in jobs:
+                yield _render_job(job)
+        finally:
+            _renderer = saved
+        for res in clashes:
+            yield res
+        return
+
+    pool = multiprocessing.Pool(num_procs, initializer=_init_worker,
+                                initargs=(params,))
+    try:
+        for res in pool.imap_unordered(_render_job, jobs,
+                                       chunksize=chunksize):
+            yield res
+        pool.close()
+        for res in clashes:
+            yield res
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def main(options, args):
+
+    logger = log.get_logger("ggquicklook", options=options)
+    if len(args) == 0:
+        args = ['-']
+
+    params = dict(width=options.width, height=options.height,
+                  cmap=options.cmap, imap=options.imap,
+                  autocut_method=options.autocuts,
+                  sample_size=options.samples, format=options.format,
+                  quality=options.quality)
+    # fail early on bad parameters, rather than in each process
+    QuicklookRenderer(**params)
+
+    t1 = time.time()
+    num_done = num_errors = 0
+    for res in render_files(iter_files(args), outdir=options.outdir,
+                            idx=options.hdu, num_procs=options.procs,
+                            **params):
+        if res.error is not None:
+            num_errors += 1
+            logger.error("Error rendering %s: %s" % (res.path, res.error))
+            continue
+        num_done += 1
+        print(res.outpath)
+        sys.stdout.flush()
+
+    elapsed = time.time() - t1
+    logger.info("Rendered %d files in %.2f sec (%.1f/sec), %d errors" % (
+        num_done, elapsed, num_done / max(elapsed, 1e-6), num_errors))
+    return 0 if num_errors == 0 else 1
+
+
+def _main():
+    """Run from command line."""
+    from optparse import OptionParser
+    try:
+        from ginga.version import version
+    except ImportError:
+        version = 'unknown'
+
+    usage = "usage: %prog [options] [file|dir|pattern|-] ..."
+    optprs = OptionParser(usage=usage, version=version)
+
+    optprs.add_option("--debug", dest="debug", default=False,
+                      action="store_true",
+                      help="Enter the pdb debugger on main()")
+    optprs.add_option("-o", "--outdir", dest="outdir", metavar="DIR",
+                      default=None,
+                      help="Write quicklook images to DIR (default: "
+                      "next to each file)")
+    optprs.add_option("-n", "--procs", dest="procs", type="int",
+                      default=None, metavar="NUM",
+                      help="Render in NUM processes (default: one per CPU)")
+    optprs.add_option("-f", "--format", dest="format", default='png',
+                      metavar="FORMAT",
+                      help="Write images in FORMAT (png, jpeg or ppm)")
+    optprs.add_option("--quality", dest="quality", type="int", default=90,
+                      metavar="NUM", help="Quality of JPEG images")
+    optprs.add_option("--width", dest="width", type="int", default=512,
+                      metavar="NUM", help="Width of the images")
+    optprs.add_option("--height", dest="height", type="int", default=512,
+                      metavar="NUM", help="Height of the images")
+    optprs.add_option("--cmap", dest="cmap", default='gray',
+                      metavar="NAME", help="Use color map NAME")
+    optprs.add_option("--imap", dest="imap", default='ramp',
+                      metavar="NAME", help="Use intensity map NAME")
+    optprs.add_option("--autocuts", dest="autocuts", default='zscale',
+                      metavar="NAME", help="Use auto cuts method NAME")
+    optprs.add_option("--samples", dest="samples", type="int",
+                      default=100000, metavar="NUM",
+                      help="Calculate cut levels from about NUM pixels")
+    optprs.add_option("--hdu", dest="hdu", type="int", default=None,
+                      metavar="NUM", help="Render HDU NUM of each file")
+    optprs.add_option("--profile", dest="profile", action="store_true",
+                      default=False,
+                      help="Run the profiler on main()")
+    log.addlogopts(optprs)
+
+    (options, args) = optprs.parse_args(sys.argv[1:])
+
+    # Are we debugging this?
+    if options.debug:
+        import pdb
+
+        pdb.run('main(options, args)')
+
+    # Are we profiling this?
+    elif options.profile:
+        import profile
+
+        print("%s profile:" % sys.argv[0])
+        profile.run('main(options, args)')
+
+    else:
+        sys.exit(main(options, args))
+
+#END
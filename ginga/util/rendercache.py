@@ -0,0 +1,284 @@
+#
+# rendercache.py -- renderings derived from images, shared between viewers
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Share small renderings of images between the auxiliary viewers.
+
+The Pan and Thumbs plugins both show a whole image at a small size, with
+the cut levels and color map of the channel viewer.  `RenderCache` keeps,
+per image, a decimated copy of the data, its index array under the last
+cut levels asked for and its RGB rendering under the last color map, so
+that each of these is made once and then reused until the image, the cut
+levels or the color map change.
+
+Entries are dropped when their image is modified (its ``'modified'``
+callback) or garbage collected, and the least recently used images are
+forgotten when more than `max_images` are cached.
+
+`RenderStateCache` is the counterpart for a channel viewer: it remembers
+how the last few images shown in the viewer were rendered (their auto cut
+levels, and the cutout, index and RGB arrays of the last frame), so that
+switching back to one of them does not start from scratch.
+"""
+import weakref
+import threading
+from collections import OrderedDict
+
+import numpy
+
+from ginga import RGBImage, trcalc
+from ginga.misc import Bunch
+from ginga.util import thumbsvc
+
+__all__ = ['RenderCache', 'RenderStateCache']
+
+
+class RenderCache(object):
+    """A cache of decimated data, index arrays and RGB renderings of
+    images.
+
+    Parameters
+    ----------
+    logger : `logging.Logger`
+        Logger for messages.
+
+    length : int
+        Images are decimated so that their long side is no more than
+        this many pixels.
+
+    max_images : int
+        Maximum number of images to keep renderings for.
+    """
+
+    def __init__(self, logger, length=512, max_images=10):
+        self.logger = logger
+        self.length = max(1, int(length))
+        self.max_images = max(1, int(max_images))
+
+        self.lock = threading.RLock()
+        # id(image) -> entry, least recently used first
+        self.entries = OrderedDict()
+        self.stats = dict(hits=0, misses=0)
+
+    def get_step(self, image):
+        """Return the decimation step of the renderings of `image`."""
+        return self._get_entry(image).step
+
+    def get_decimated(self, image):
+        """Return the decimated data of `image` (a copy, not to be
+        modified) and the decimation step.
+        """
+        entry = self._get_entry(image)
+        return entry.data, entry.step
+
+    def get_index(self, image, cuts, autocuts, hashsize, dtype):
+        """Return the decimated data of `image` mapped to an index array
+        of type `dtype`, with the cut levels `cuts` applied by `autocuts`
+        into the range ``[0, hashsize)``, as the channel viewer does.
+        """
+        key = (tuple(cuts), str(autocuts), hashsize, numpy.dtype(dtype))
+        with self.lock:
+            entry = self._get_entry(image)
+            if entry.idx_key == key:
+                self.stats['hits'] += 1
+                return entry.idx
+
+            self.stats['misses'] += 1
+            idx = autocuts.cut_levels(entry.data, cuts[0], cuts[1],
+                                      vmin=0, vmax=hashsize - 1)
+            entry.idx = idx.astype(dtype, copy=False)
+            entry.idx_key = key
+            # the RGB rendering depends on the index array
+            entry.rgb = None
+            entry.rgb_key = None
+            return entry.idx
+
+    def get_rgb(self, image, cuts, rgbmap, autocuts):
+        """Return an `~ginga.RGBImage.RGBImage` rendering the decimated
+        data of `image` with the cut levels `cuts` and the color map of
+        `rgbmap`.  The same object is returned as long as the image and
+        the rendering parameters do not change.
+        """
+        with self.lock:
+            entry = self._get_entry(image)
+            if entry.is_rgb:
+                # already RGB
+                key = None
+            else:
+                key = (thumbsvc.get_render_key(rgbmap, cuts=tuple(cuts)),
+                       str(autocuts))
+            if entry.rgb is not None and entry.rgb_key == key:
+                self.stats['hits'] += 1
+                return entry.rgb
+
+            if entry.is_rgb:
+                rgb = trcalc.reorder_image('RGB', entry.data,
+                                           image.get_order())
+            else:
+                idx = self.get_index(image, cuts, autocuts,
+                                     rgbmap.get_hash_size(),
+                                     rgbmap.get_index_dtype())
+                self.stats['misses'] += 1
+                rgbobj = rgbmap.get_rgbarray(idx, order='RGB')
+                rgb = rgbobj.get_array('RGB')
+
+            entry.rgb = RGBImage.RGBImage(data_np=rgb, logger=self.logger)
+            entry.rgb_key = key
+            return entry.rgb
+
+    def invalidate(self, image):
+        """Forget the renderings of `image`."""
+        with self.lock:
+            entry = self.entries.get(id(image), None)
+            if entry is not None and entry.ref() is image:
+                self._reset_entry(entry)
+
+    def clear(self):
+        """Forget all renderings."""
+        with self.lock:
+            for key in list(self.entries.keys()):
+                self._remove(key)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['images'] = len(self.entries)
+        return stats
+
+    def _get_entry(self, image):
+        with self.lock:
+            key = id(image)
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry.ref() is not image:
+                # an image that was collected and whose id was reused
+                self._unwatch(entry)
+                entry = None
+
+            if entry is None:
+                entry = Bunch.Bunch(ref=weakref.ref(image, self._collected_cb))
+                self._reset_entry(entry)
+                # renderings become stale when the data change
+                image.add_callback('modified', self._modified_cb)
+
+            # most recently used last
+            self.entries[key] = entry
+            while len(self.entries) > self.max_images:
+                self._remove(next(iter(self.entries)))
+
+            if entry.data is None:
+                self._decimate(image, entry)
+            return entry
+
+    def _decimate(self, image, entry):
+        data = image.get_data()
+        entry.is_rgb = (data.ndim == 3)
+        ht, wd = data.shape[:2]
+        step = max(1, int(numpy.ceil(max(wd, ht) / float(self.length))))
+        # a copy, so that it is not affected by changes to the data
+        # that have not been signalled yet
+        entry.data = numpy.array(data[::step, ::step])
+        entry.step = step
+
+    def _reset_entry(self, entry):
+        entry.setvals(data=None, step=1, is_rgb=False,
+                      idx=None, idx_key=None, rgb=None, rgb_key=None)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self._unwatch(entry)
+
+    def _unwatch(self, entry):
+        image = entry.ref()
+        if image is not None:
+            image.remove_callback('modified', self._modified_cb)
+
+    def _modified_cb(self, image):
+        self.invalidate(image)
+        return False
+
+    def _collected_cb(self, ref):
+        with self.lock:
+            for key, entry in list(self.entries.items()):
+                if entry.ref is ref:
+                    del self.entries[key]
+
+
+class RenderStateCache(object):
+    """The render states of the images recently shown in a viewer,
+    least recently used first.
+
+    A state is a `~ginga.misc.Bunch.Bunch` that the viewer fills in as
+    it likes; the cache only keeps it while the image is alive and
+    unmodified (the viewer calls :meth:`invalidate` when an image that
+    it has shown is modified).
+
+    Parameters
+    ----------
+    max_images : int
+        Maximum number of images to keep states for (0 keeps none).
+    """
+
+    def __init__(self, max_images=4):
+        self.max_images = max(0, int(max_images))
+
+        self.lock = threading.RLock()
+        # id(image) -> (weakref to image, state)
+        self.entries = OrderedDict()
+
+    def set_max_images(self, max_images):
+        with self.lock:
+            self.max_images = max(0, int(max_images))
+            self._trim()
+
+    def get_state(self, image, create=False):
+        """Return the state of `image`, or None if there is none and
+        `create` is False (otherwise a new, empty state).
+        """
+        with self.lock:
+            key = id(image)
+            ref, state = self.entries.pop(key, (None, None))
+            if ref is not None and ref() is not image:
+                # an image that was collected and whose id was reused
+                state = None
+
+            if state is None:
+                if not create or self.max_images == 0:
+                    return None
+                ref = weakref.ref(image, self._collected_cb)
+                state = Bunch.Bunch()
+
+            # most recently used last
+            self.entries[key] = (ref, state)
+            self._trim()
+            return state
+
+    def invalidate(self, image):
+        """Forget the state of `image`."""
+        with self.lock:
+            ref, state = self.entries.get(id(image), (None, None))
+            if ref is not None and ref() is image:
+                del self.entries[id(image)]
+
+    def clear(self):
+        """Forget all states."""
+        with self.lock:
+            self.entries.clear()
+
+    def get_num_images(self):
+        with self.lock:
+            return len(self.entries)
+
+    def _trim(self):
+        while len(self.entries) > self.max_images:
+            self.entries.popitem(last=False)
+
+    def _collected_cb(self, ref):
+        with self.lock:
+            for key, (_ref, state) in list(self.entries.items()):
+                if _ref is ref:
+                    del self.entries[key]
+
+#END
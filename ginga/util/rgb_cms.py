@@ -8,10 +8,14 @@ from __future__ import print_function
 import os
 import glob
 import hashlib
+import threading
+
+import numpy
 
 # How about color management (ICC profile) support?
 try:
     import PIL.ImageCms as ImageCms
+    from PIL import Image as PILimage
     have_cms = True
 except ImportError:
     have_cms = False
@@ -35,6 +39,8 @@ intents = dict(perceptual=0)
 
 # Holds transforms
 icc_transform = {}
+# Holds 3D color lookup tables made from transforms
+icc_lut = {}
 
 
 class ColorManager(object):
@@ -239,6 +245,173 @@ def convert_profile_fromto(image_np, from_name, to_name,
         return image_np
 
 
+def get_lut_tables(size):
+    """Return, for each of the 256 uint8 levels, the index of the LUT
+    grid point at or below it and the fractional distance to the next
+    grid point.
+    """
+    vals = numpy.round(numpy.linspace(0, 255, size))
+    levels = numpy.arange(256)
+    i0 = numpy.searchsorted(vals, levels, side='right') - 1
+    i0 = i0.clip(0, size - 2)
+    frac = (levels - vals[i0]) / (vals[i0 + 1] - vals[i0])
+    return vals.astype(numpy.uint8), i0.astype(numpy.intp), \
+           frac.astype(numpy.float32)
+
+def build_lut(transform, size=33):
+    """Build a 3D color lookup table of shape (size, size, size, 3)
+    by running a grid of RGB values through the ImageCms `transform`.
+    """
+    vals, i0, frac = get_lut_tables(size)
+    r, g, b = numpy.meshgrid(vals, vals, vals, indexing='ij')
+    grid = numpy.dstack((r.reshape((1, -1)), g.reshape((1, -1)),
+                         b.reshape((1, -1))))
+    image_pil = PILimage.fromarray(numpy.ascontiguousarray(grid), 'RGB')
+    out_pil = ImageCms.applyTransform(image_pil, transform)
+    lut = numpy.asarray(out_pil, dtype=numpy.float32)
+    return lut.reshape((size, size, size, 3))
+
+class ColorLUT(object):
+    """A 3D color lookup table for a profile transform.
+
+    Colors are converted with `apply_lut` the first time they are seen,
+    and the result is remembered in a hash table of ``2**memo_bits``
+    entries, so that the images of a viewer, which usually contain few
+    distinct colors, are converted with a table lookup per pixel.  The
+    table takes ``8 * 2**memo_bits`` bytes (2 MB by default), allocated
+    on first use.  Colors that hash to the same entry replace each
+    other, and are converted again when they are seen next.
+    """
+
+    def __init__(self, lut, memo_bits=18):
+        self.lut = lut
+        self.memo_bits = memo_bits
+        self.memo_keys = None
+        self.memo_vals = None
+        self.lock = threading.Lock()
+
+    def convert(self, data_np, order='RGB'):
+        """Convert the uint8 array `data_np` in place.  `order` gives
+        the order of the channels (e.g. "BGRA"); any alpha channel is
+        left untouched.
+        """
+        with self.lock:
+            return self._convert(data_np, order)
+
+    def _convert(self, data_np, order):
+        order = order.upper()
+        ri, gi, bi = [order.index(c) for c in 'RGB']
+        if self.memo_keys is None:
+            # NOTE: colors are stored with bit 24 set, so that zero
+            # marks an empty entry
+            size = 1 << self.memo_bits
+            self.memo_keys = numpy.zeros(size, dtype=numpy.uint32)
+            self.memo_vals = numpy.zeros(size, dtype=numpy.uint32)
+
+        key = data_np[..., ri].astype(numpy.uint32)
+        key <<= 8
+        key |= data_np[..., gi]
+        key <<= 8
+        key |= data_np[..., bi]
+        key |= (1 << 24)
+        # multiplicative hash of the color to a table entry
+        slot = key * numpy.uint32(2654435761)
+        slot >>= (32 - self.memo_bits)
+
+        val = self.memo_vals.take(slot)
+        miss = (self.memo_keys.take(slot) != key)
+        if miss.any():
+            ukey, inv = numpy.unique(key[miss], return_inverse=True)
+            rgb = numpy.empty((len(ukey), 1, 3), dtype=numpy.uint8)
+            rgb[:, 0, 0] = ukey >> 16
+            rgb[:, 0, 1] = ukey >> 8
+            rgb[:, 0, 2] = ukey
+            apply_lut(rgb, self.lut, order='RGB')
+            rgb = rgb.reshape((-1, 3)).astype(numpy.uint32)
+            uval = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+            uslot = ukey * numpy.uint32(2654435761)
+            uslot >>= (32 - self.memo_bits)
+            self.memo_keys[uslot] = ukey
+            self.memo_vals[uslot] = uval
+            val[miss] = uval[inv.ravel()]
+
+        # assignment keeps the low byte
+        data_np[..., ri] = val >> 16
+        data_np[..., gi] = val >> 8
+        data_np[..., bi] = val
+        return data_np
+
+def get_lut(from_name, to_name, to_intent='perceptual',
+            proof_name=None, proof_intent=None,
+            use_black_pt=False, size=33):
+    """Like `get_transform`, but returns a (cached) `ColorLUT` for
+    the transform.
+    """
+    global icc_lut
+
+    transform = get_transform(from_name, to_name, to_intent=to_intent,
+                              proof_name=proof_name,
+                              proof_intent=proof_intent,
+                              use_black_pt=use_black_pt)
+    key = (from_name, to_name, to_intent, proof_name, proof_intent,
+           use_black_pt, size)
+    try:
+        lut = icc_lut[key]
+
+    except KeyError:
+        lut = ColorLUT(build_lut(transform, size=size))
+        icc_lut[key] = lut
+
+    return lut
+
+def _lerp(c0, c1, f):
+    # c0 + f * (c1 - c0), computed in place in c1
+    c1 -= c0
+    c1 *= f
+    c1 += c0
+    return c1
+
+def apply_lut(data_np, lut, order='RGB', chunk_size=65536):
+    """Convert the uint8 RGB(A) array `data_np` in place with the 3D
+    color lookup table `lut`, using trilinear interpolation.  `order`
+    gives the order of the channels in `data_np` (e.g. "BGRA"); any
+    alpha channel is left untouched.  The work is done on blocks of
+    about `chunk_size` pixels to limit the size of temporaries.
+    """
+    size = lut.shape[0]
+    i0_tab, f_tab = get_lut_tables(size)[1:]
+    flat = lut.reshape((-1, 3))
+    d_r, d_g, d_b = size * size, size, 1
+
+    order = order.upper()
+    ri, gi, bi = [order.index(c) for c in 'RGB']
+    ht, wd = data_np.shape[:2]
+    rows = max(1, chunk_size // max(1, wd))
+
+    for y in range(0, ht, rows):
+        blk = data_np[y:y+rows]
+        r, g, b = blk[..., ri], blk[..., gi], blk[..., bi]
+        fr = f_tab[r][..., numpy.newaxis]
+        fg = f_tab[g][..., numpy.newaxis]
+        fb = f_tab[b][..., numpy.newaxis]
+        base = i0_tab[r] * d_r + i0_tab[g] * d_g + i0_tab[b] * d_b
+
+        # interpolate along blue, then green, then red
+        c00 = _lerp(flat[base], flat[base + d_b], fb)
+        c01 = _lerp(flat[base + d_g], flat[base + d_g + d_b], fb)
+        c10 = _lerp(flat[base + d_r], flat[base + d_r + d_b], fb)
+        c11 = _lerp(flat[base + d_r + d_g],
+                    flat[base + d_r + d_g + d_b], fb)
+        res = _lerp(_lerp(c00, c01, fg), _lerp(c10, c11, fg), fr)
+        res += 0.5
+
+        blk[..., ri] = res[..., 0]
+        blk[..., gi] = res[..., 1]
+        blk[..., bi] = res[..., 2]
+
+    return data_np
+
+
 def set_rendering_intent(intent):
     """
     Sets the color management attribute rendering intent.
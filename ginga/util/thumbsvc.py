@@ -0,0 +1,454 @@
+#
+# thumbsvc.py -- background thumbnail generation service
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Generate thumbnails off the GUI thread.
+
+Thumbnails are made from a decimated view of the data that is read
+directly from the file where possible (strided access into a memory
+mapped FITS primary HDU), so the full image is never loaded.  The data
+are color mapped with the caller's `~ginga.RGBMap.RGBMapper` and cut
+levels, and the resulting RGB arrays are kept in a content-addressed
+disk cache with LRU eviction.
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy
+
+from ginga import AstroImage, AutoCuts, trcalc
+from ginga.misc import Bunch, Scheduler
+from ginga.util import io_fits
+from ginga.util.six.moves import queue as Queue
+
+
+class ThumbCache(object):
+    """A content-addressed cache of rendered thumbnails on disk.
+
+    Entries are keyed on a hash of the file path, its modification time
+    and size, the HDU and the rendering parameters, so a stale entry is
+    simply never looked up again; the least recently used entries are
+    removed when the cache grows beyond `max_bytes`.
+    """
+
+    def __init__(self, cachedir, logger, max_bytes=256 * 1024**2):
+        self.cachedir = cachedir
+        self.logger = logger
+        self.max_bytes = max_bytes
+
+        self.lock = threading.RLock()
+        # key -> size in bytes, least recently used first
+        self.entries = None
+        self.total_bytes = 0
+
+    def make_key(self, path, idx, params):
+        """Make a cache key for the thumbnail of HDU `idx` of the file
+        `path`, rendered with `params` (a string).
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        s = "%s|%f|%d|%s|%s" % (path, st.st_mtime, st.st_size, str(idx),
+                                params)
+        return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.cachedir, key[:2], key + '.npy')
+
+    def _load_entries(self):
+        # Build the LRU list from the files on disk, oldest access first
+        entries = []
+        if os.path.isdir(self.cachedir):
+            for dirpath, dirnames, filenames in os.walk(self.cachedir):
+                for filename in filenames:
+                    if not filename.endswith('.npy'):
+                        continue
+                    st = os.stat(os.path.join(dirpath, filename))
+                    entries.append((st.st_mtime, filename[:-4], st.st_size))
+        entries.sort()
+
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        for mtime, key, size in entries:
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def get(self, key):
+        """Return the cached thumbnail array for `key`, or None."""
+        with self.lock:
+            if self.entries is None:
+                self._load_entries()
+            if key not in self.entries:
+                return None
+            size = self.entries.pop(key)
+            self.entries[key] = size
+
+        path = self._get_path(key)
+        try:
+            data = numpy.load(path)
+            # record the access for the LRU order of future sessions
+            os.utime(path, None)
+            return data
+
+        except Exception as e:
+            self.logger.debug("Error reading cached thumb '%s': %s" % (
+                path, str(e)))
+            with self.lock:
+                if key in self.entries:
+                    self.total_bytes -= self.entries.pop(key)
+            return None
+
+    def put(self, key, data):
+        """Add the thumbnail array `data` to the cache under `key`."""
+        path = self._get_path(key)
+        try:
+            dirpath = os.path.dirname(path)
+            if not os.path.isdir(dirpath):
+                os.makedirs(dirpath)
+            tmppath = path + '.%d.tmp' % (threading.current_thread().ident)
+            with open(tmppath, 'wb') as out_f:
+                numpy.save(out_f, data)
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(tmppath, path)
+            size = os.path.getsize(path)
+
+        except (IOError, OSError) as e:
+            self.logger.warning("Error caching thumb '%s': %s" % (
+                path, str(e)))
+            return
+
+        with self.lock:
+            if self.entries is None:
+                self._load_entries()
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)
+            self.entries[key] = size
+            self.total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self._get_path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self.lock:
+            if self.entries is None:
+                self._load_entries()
+            for key in list(self.entries.keys()):
+                try:
+                    os.remove(self._get_path(key))
+                except OSError:
+                    pass
+            self.entries = OrderedDict()
+            self.total_bytes = 0
+
+
+def decimate(data, length):
+    """Take a strided view of `data` so that its long side is no more
+    than about twice `length`.  Leading axes of a cube are reduced to
+    their first plane; RGB data (a trailing depth of 3 or 4) is kept.
+    """
+    is_rgb = (data.ndim == 3 and data.dtype == numpy.uint8 and
+              data.shape[-1] in (3, 4))
+    ndim = 3 if is_rgb else 2
+    while data.ndim > ndim:
+        data = data[0]
+    ht, wd = data.shape[:2]
+    step = max(1, max(wd, ht) // (length * 2))
+    return data[::step, ::step]
+
+
+def read_decimated(path, length, idx=None, loader=None, keywords=None):
+    """Read a decimated view of image `idx` of the file `path`.
+
+    The primary HDU of a FITS file is memory mapped, so that only the
+    pixels in the view are read.  Other files and HDUs are loaded with
+    `loader` (``loader(path, idx=idx)``, which should return an image).
+
+    Returns a `~ginga.misc.Bunch.Bunch` with the decimated ``data`` and
+    the values of `keywords` from the header (``header``).
+    """
+    if idx in (None, 0):
+        try:
+            res = io_fits.memmap_primary(path)
+            data = decimate(res.data, length)
+            # NOTE: bscale/bzero are only applied to the decimated data
+            data = data.astype(numpy.float32)
+            if res.bscale != 1.0:
+                data *= res.bscale
+            if res.bzero != 0.0:
+                data += res.bzero
+            header = res.header
+            if keywords is not None:
+                header = dict([(kwd, header[kwd]) for kwd in keywords
+                               if kwd in header])
+            return Bunch.Bunch(data=data, header=header)
+
+        except (io_fits.FITSError, IOError, ValueError):
+            # not a FITS file, no data in the primary HDU, etc.
+            pass
+
+    if loader is None:
+        image = AstroImage.AstroImage()
+        image.load_file(path, numhdu=idx)
+    else:
+        image = loader(path, idx=idx)
+
+    data = decimate(image.get_data(), length)
+    header = image.get_header()
+    if keywords is None:
+        keywords = list(header.keys())
+    header = dict([(kwd, header[kwd]) for kwd in keywords
+                   if kwd in header])
+    return Bunch.Bunch(data=data, header=header)
+
+
+def get_thumb_size(wd, ht, length):
+    if wd > ht:
+        return length, max(1, int(length * float(ht) / wd))
+    return max(1, int(length * float(wd) / ht)), length
+
+
+def render_thumbnail(data, length, rgbmap, cuts=None,
+                     autocut_method='zscale', logger=None):
+    """Render `data` to an RGB thumbnail with long side `length`.
+
+    Parameters
+    ----------
+    data : ndarray
+        The (decimated) image data.
+
+    length : int
+        Length of the long side of the thumbnail.
+
+    rgbmap : `~ginga.RGBMap.RGBMapper`
+        Color mapper to use; it is only read from.
+
+    cuts : tuple of (loval, hival) or None
+        Cut levels; if None they are calculated with `autocut_method`.
+
+    Returns
+    -------
+    rgb : ndarray
+        ``uint8`` array of shape ``(ht, wd, 3)``.
+    """
+    ht, wd = data.shape[:2]
+    new_wd, new_ht = get_thumb_size(wd, ht, length)
+    data, scales = trcalc.get_scaled_cutout_wdht(data, 0, 0, wd - 1, ht - 1,
+                                                 new_wd, new_ht,
+                                                 logger=logger)
+
+    if data.ndim == 3:
+        # already RGB
+        return numpy.ascontiguousarray(data[..., :3])
+
+    autocuts = AutoCuts.get_autocuts(autocut_method)(logger)
+    if cuts is None:
+        image = AstroImage.AstroImage(data_np=data, logger=logger)
+        cuts = autocuts.calc_cut_levels(image)
+
+    data = numpy.nan_to_num(data)
+    vmax = rgbmap.get_hash_size() - 1
+    idx = autocuts.cut_levels(data, cuts[0], cuts[1], vmin=0, vmax=vmax)
+    idx = idx.astype(rgbmap.get_index_dtype())
+    rgbobj = rgbmap.get_rgbarray(idx, order='RGB')
+    return rgbobj.get_array('RGB')
+
+
+def get_render_key(rgbmap, cuts=None, autocut_method='zscale', length=None):
+    """Return a string identifying the rendering parameters, for use as
+    part of a cache key.
+    """
+    m = hashlib.sha1()
+    m.update(numpy.ascontiguousarray(rgbmap.arr).tobytes())
+    m.update(numpy.ascontiguousarray(rgbmap.sarr).tobytes())
+    if cuts is None:
+        cuts = autocut_method
+    return "%s|%s|%d|%s|%s" % (m.hexdigest(), str(rgbmap.dist),
+                               rgbmap.get_hash_size(), str(cuts),
+                               str(length))
+
+
+class ThumbnailService(object):
+    """Make thumbnails on a set of background threads.
+
+    Parameters
+    ----------
+    logger : `logging.Logger`
+        Logger for messages.
+
+    cache : `ThumbCache` or None
+        Disk cache for rendered thumbnails.
+
+    num_workers : int
+        Number of worker threads.
+
+    scheduler : `~ginga.misc.Scheduler.Scheduler` or None
+        If given, thumbnails are made as background priority jobs of
+        this scheduler instead of on our own worker threads.
+
+    render_cache : `~ginga.util.rendercache.RenderCache` or None
+        If given, thumbnails of in-memory images are made from the
+        decimated data and renderings in this cache, which are shared
+        with other viewers (e.g. the Pan plugin).
+    """
+
+    def __init__(self, logger, cache=None, num_workers=2, scheduler=None,
+                 render_cache=None):
+        self.logger = logger
+        self.cache = cache
+        self.render_cache = render_cache
+        self.num_workers = max(1, num_workers)
+        self.scheduler = scheduler
+
+        self.queue = Queue.Queue()
+        self.lock = threading.RLock()
+        # requests made before the last cancel() are dropped
+        self.gen = 0
+        self.workers = []
+
+    def start(self):
+        with self.lock:
+            if len(self.workers) > 0 or self.scheduler is not None:
+                return
+            for i in range(self.num_workers):
+                thread = threading.Thread(target=self._worker,
+                                          name='thumbsvc-%d' % (i))
+                thread.daemon = True
+                thread.start()
+                self.workers.append(thread)
+
+    def stop(self):
+        with self.lock:
+            self.gen += 1
+            workers, self.workers = self.workers, []
+        for thread in workers:
+            self.queue.put(None)
+
+    def cancel(self):
+        """Drop all pending requests."""
+        with self.lock:
+            self.gen += 1
+
+    def request(self, callback, path=None, idx=None, image=None,
+                length=150, rgbmap=None, cuts=None, autocut_method='zscale',
+                keywords=None, loader=None, use_cache=True, key=None):
+        """Queue a request for a thumbnail.
+
+        The thumbnail is made either from the file `path` (HDU `idx`,
+        read with `read_decimated`) or from the in-memory `image`.
+        ``callback(res)`` is called from a worker thread with a
+        `~ginga.misc.Bunch.Bunch` having the fields ``rgb`` (the RGB
+        array, or None on error), ``header``, ``path``, ``idx``,
+        ``from_cache`` and ``error``.
+
+        With a scheduler, a new request with the same `key` supersedes
+        an earlier one that has not started yet.
+        """
+        with self.lock:
+            gen = self.gen
+        job = Bunch.Bunch(callback=callback, path=path, idx=idx, image=image,
+                          length=length, rgbmap=rgbmap, cuts=cuts,
+                          autocut_method=autocut_method, keywords=keywords,
+                          loader=loader, use_cache=use_cache, gen=gen)
+        if self.scheduler is not None:
+            if key is not None:
+                key = ('thumb', key)
+            self.scheduler.submit(key, Scheduler.PRI_BACKGROUND,
+                                  lambda token, job: self._do_job(job), job)
+            return
+
+        self.start()
+        self.queue.put(job)
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            self._do_job(job)
+
+    def _do_job(self, job):
+        with self.lock:
+            if job.gen != self.gen:
+                return
+        res = self.make_thumb(job)
+        try:
+            job.callback(res)
+        except Exception as e:
+            self.logger.error("Error in thumbnail callback: %s" % (
+                str(e)))
+
+    def make_thumb(self, job):
+        res = Bunch.Bunch(path=job.path, idx=job.idx, rgb=None, header={},
+                          from_cache=False, error=None)
+        try:
+            key = None
+            # in-memory images may differ from their files
+            use_cache = (self.cache is not None and job.use_cache and
+                         job.image is None and job.path is not None)
+            if use_cache:
+                params = get_render_key(job.rgbmap, cuts=job.cuts,
+                                        autocut_method=job.autocut_method,
+                                        length=job.length)
+                key = self.cache.make_key(job.path, job.idx, params)
+                rgb = self.cache.get(key)
+                if rgb is not None:
+                    res.setvals(rgb=rgb, from_cache=True)
+                    try:
+                        res.header = io_fits.scan_header(
+                            job.path, numhdu=job.idx,
+                            keywords=job.keywords).header
+                    except (io_fits.FITSError, IOError):
+                        pass
+                    return res
+
+            if job.image is not None:
+                if self.render_cache is None:
+                    data = decimate(job.image.get_data(), job.length)
+                elif job.cuts is not None:
+                    # scale down the shared rendering of the image
+                    autocuts = AutoCuts.get_autocuts(job.autocut_method)(
+                        self.logger)
+                    rgbimage = self.render_cache.get_rgb(job.image, job.cuts,
+                                                         job.rgbmap, autocuts)
+                    data = rgbimage.get_data()
+                else:
+                    data, step = self.render_cache.get_decimated(job.image)
+                header = job.image.get_header()
+                keywords = job.keywords
+                if keywords is None:
+                    keywords = list(header.keys())
+                res.header = dict([(kwd, header[kwd]) for kwd in keywords
+                                   if kwd in header])
+            else:
+                rd = read_decimated(job.path, job.length, idx=job.idx,
+                                    loader=job.loader, keywords=job.keywords)
+                data, res.header = rd.data, rd.header
+
+            res.rgb = render_thumbnail(data, job.length, job.rgbmap,
+                                       cuts=job.cuts,
+                                       autocut_method=job.autocut_method,
+                                       logger=self.logger)
+            if key is not None:
+                self.cache.put(key, res.rgb)
+
+        except Exception as e:
+            self.logger.error("Error making thumbnail for '%s': %s" % (
+                str(job.path), str(e)))
+            res.error = str(e)
+
+        return res
+
+#END
@@ -17,7 +17,9 @@ from ginga.misc import Bunch
 
 __all__ = ['hmsToDeg', 'dmsToDeg', 'decTimeToDeg', 'degToHms', 'degToDms',
            'arcsecToDeg', 'hmsStrToDeg', 'dmsStrToDeg', 'raDegToString',
-           'decDegToString', 'trans_coeff', 'eqToEq2000',
+           'decDegToString', 'degToHmsArray', 'degToDmsArray',
+           'raDegToStringArray', 'decDegToStringArray', 'trans_coeff',
+           'eqToEq2000',
            'get_xy_rotation_and_scale', 'get_rotation_and_scale',
            'get_relative_orientation', 'simple_wcs', 'deg2fmt', 'dispos',
            'deltaStarsRaDecDeg1', 'deltaStarsRaDecDeg2', 'get_starsep_RaDecDeg',
@@ -101,6 +103,29 @@ def degToDms(dec, isLatitude=True):
     return (int(sign), int(deg), int(mnt), sec)
 
 
+def degToHmsArray(ra):
+    """Like `degToHms`, for an array of RAs (in degrees).  Returns
+    arrays of hours and minutes (integer) and seconds (float).
+    """
+    ra = numpy.asarray(ra, dtype=numpy.float64)
+    rah   = (ra / degPerHMSHour).astype(int)
+    ramin = ((ra % degPerHMSHour) * HMSMinPerDeg).astype(int)
+    rasec = (ra % degPerHMSMin)  * HMSSecPerDeg
+    return (rah, ramin, rasec)
+
+
+def degToDmsArray(dec):
+    """Like `degToDms`, for an array of angles (in degrees).  Returns
+    arrays of signs (-1 or 1), degrees and minutes (integer) and seconds
+    (float).
+    """
+    dec = numpy.asarray(dec, dtype=numpy.float64)
+    sign = numpy.where(dec < 0.0, -1, 1)
+    mnt, sec = numpy.divmod(dec * sign * 3600, 60)
+    deg, mnt = numpy.divmod(mnt, 60)
+    return (sign, deg.astype(int), mnt.astype(int), sec)
+
+
 def arcsecToDeg(arcsec):
     """Convert numeric arcseconds (aka DMS seconds) to degrees of arc.
     """
@@ -144,6 +169,40 @@ def decDegToString(dec_deg, format='%s%02d:%02d:%05.2f'):
     return format % (sign_sym, int(dec_degree), int(dec_min), dec_sec)
 
 
+def raDegToStringArray(ra_deg, format=('%02d', '%02d', '%06.3f')):
+    """Format an array of RAs (in degrees, 0 <= RA < 360) as
+    ``H:M:S`` text.  `format` gives the formats of the three fields.
+    Returns an array of strings.
+    """
+    ra_hour, ra_min, ra_sec = degToHmsArray(ra_deg)
+    return _join_fields(':', [numpy.char.mod(format[0], ra_hour),
+                              numpy.char.mod(format[1], ra_min),
+                              numpy.char.mod(format[2], ra_sec)])
+
+
+def decDegToStringArray(dec_deg, format=('%02d', '%02d', '%05.2f'),
+                        signs=('-', '+')):
+    """Format an array of angles (in degrees) as ``[sign]D:M:S`` text.
+    `format` gives the formats of the three fields, and `signs` the
+    prefixes of negative and positive angles.  Returns an array of
+    strings.
+    """
+    sign, dec_degree, dec_min, dec_sec = degToDmsArray(dec_deg)
+    sign_sym = numpy.where(sign < 0, signs[0], signs[1])
+    return numpy.char.add(sign_sym,
+                          _join_fields(':', [
+                              numpy.char.mod(format[0], dec_degree),
+                              numpy.char.mod(format[1], dec_min),
+                              numpy.char.mod(format[2], dec_sec)]))
+
+
+def _join_fields(sep, fields):
+    res = fields[0]
+    for field in fields[1:]:
+        res = numpy.char.add(numpy.char.add(res, sep), field)
+    return res
+
+
 def trans_coeff (eq, x, y, z):
     """This function is provided by MOKA2 Development Team (1996.xx.xx)
     and used in SOSS system."""
@@ -404,6 +404,37 @@ class BaseWCS(object):
         """
         pass
 
+    def datapt_to_system(self, datapt, system=None, coords='data'):
+        """
+        Map many data (pixel) coordinates into a named system at once.
+
+        Parameters
+        ----------
+        datapt : array-like
+            An array of shape (N, naxis), each row a data coordinate
+            as for `pixtosystem`
+
+        system : str or None
+            A string naming a coordinate system
+
+        coords : 'data' or None, optional, default to 'data'
+            Expresses whether the data coordinate is indexed from zero
+
+        Returns
+        -------
+        An array of shape (N, 2) of the values that `pixtosystem` returns
+        for each row.
+
+        This implementation calls `pixtosystem` for each row; wrappers
+        whose WCS package can convert arrays override it.
+        """
+        datapt = numpy.asarray(datapt, dtype=numpy.float64)
+        res = numpy.empty((len(datapt), 2), dtype=numpy.float64)
+        for i, idxs in enumerate(datapt):
+            res[i] = self.pixtosystem(list(idxs), system=system,
+                                      coords=coords)
+        return res
+
     def get_keyword(self, key):
         return self.header[key]
 
@@ -811,6 +842,42 @@ class AstropyWCS(BaseWCS):
 
         return coord
 
+    def datapt_to_system(self, datapt, system=None, coords='data'):
+        if (not self.new_coords) or (self.coordsys == 'raw'):
+            return super(AstropyWCS, self).datapt_to_system(
+                datapt, system=system, coords=coords)
+
+        if coords == 'data':
+            origin = 0
+        else:
+            origin = 1
+        datapt = numpy.asarray(datapt, dtype=numpy.float64)
+        try:
+            sky = self.wcs.all_pix2world(datapt, origin)
+
+        except Exception as e:
+            self.logger.error("Error calculating datapt_to_system: %s" % (
+                str(e)))
+            raise WCSError(e)
+
+        if self.coordsys == 'pixel':
+            return sky[:, :2]
+
+        if system is None:
+            system = 'icrs'
+
+        # one coordinate object for all the points
+        frameClass = coordinates.frame_transform_graph.lookup_name(
+            self.coordsys)
+        coord = frameClass(sky[:, 0] * units.degree, sky[:, 1] * units.degree)
+        toClass = coordinates.frame_transform_graph.lookup_name(system)
+        if toClass != frameClass:
+            coord = coord.transform_to(toClass)
+
+        r = coord.data
+        return numpy.array([self._deg(getattr(r, component))
+                            for component in r.components[:2]]).T
+
     def _deg(self, coord):
         # AstroPy changed the API so now we have to support more
         # than one--we don't know what version the user has installed!